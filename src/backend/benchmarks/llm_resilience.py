@@ -0,0 +1,169 @@
+"""
+ResilientProvider against a local fake LLM: no network and no API key.
+The same seeded workload runs under four policies:
+
+  baseline   one provider, called directly (no deadline, retry or hedge)
+  retries    deadline + jittered retries + circuit breaker
+  hedged     retries + a hedged second request after the recent p95
+  failover   retries + breaker, with a healthy second provider
+
+The fake primary has lognormal latency, a share of stalled calls (they
+hang for --stall seconds), a share of 503 errors and a full outage
+between --outage START,END seconds into the run.
+
+    python -m benchmarks.llm_resilience
+    python -m benchmarks.llm_resilience --calls 600 --rate 50 --error-rate 0.1 --outage 2,5
+
+Calls arrive at a fixed --rate (open loop), the way user requests do, so
+an outage affects the calls arriving during it rather than draining the
+whole workload.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+from llm_providers import LatencyModel, LLMProvider
+from llm_resilience import ResilientProvider
+
+STAGE = "generate_sql"
+
+
+class FakeAPIError(Exception):
+    # looks like an SDK status error to llm_resilience.is_retryable
+    def __init__(self, status_code: int):
+        super().__init__(f"fake provider returned {status_code}")
+        self.status_code = status_code
+
+
+class FakeProvider(LLMProvider):
+    """
+    Answers "SELECT 1" after a simulated delay, failing or stalling at the
+    configured rates.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        latency: str,
+        error_rate: float = 0.0,
+        stall_rate: float = 0.0,
+        stall_s: float = 0.0,
+        outage: Optional[Tuple[float, float]] = None,
+        seed: int = 0,
+    ):
+        self.name = name
+        self.model = f"{name}-fake"
+        self.latency = LatencyModel(latency, seed=seed)
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall_s = stall_s
+        self.outage = outage
+        self.rng = random.Random(seed)
+        self.t0 = time.monotonic()
+        self.calls = 0
+
+    async def generate_async(self, prompt: str, stage: Optional[str] = None) -> Dict:
+        self.calls += 1
+        elapsed = time.monotonic() - self.t0
+        if self.outage and self.outage[0] <= elapsed < self.outage[1]:
+            await asyncio.sleep(0.02)
+            raise FakeAPIError(503)
+        roll = self.rng.random()
+        if roll < self.error_rate:
+            await asyncio.sleep(self.latency.sample() / 4)
+            raise FakeAPIError(503)
+        delay = self.stall_s if roll < self.error_rate + self.stall_rate else self.latency.sample()
+        await asyncio.sleep(delay)
+        return {"text": "SELECT 1", "prompt_tokens": 100, "completion_tokens": 5}
+
+
+def percentile(xs: List[float], p: float) -> float:
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p * (len(xs) - 1))))] if xs else 0.0
+
+
+async def run(provider: LLMProvider, calls: int, rate: float) -> Tuple[List[float], int]:
+    latencies: List[float] = []
+    failed = 0
+
+    async def one(i: int) -> None:
+        nonlocal failed
+        await asyncio.sleep(i / rate)
+        t0 = time.perf_counter()
+        try:
+            await provider.generate_async(f"question {i}", stage=STAGE)
+        except Exception:
+            failed += 1
+        latencies.append(time.perf_counter() - t0)
+
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    return latencies, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--rate", type=float, default=50.0, help="calls started per second")
+    parser.add_argument("--latency", default="lognormal:0.2,0.4", help="primary latency (llm_providers.LatencyModel spec)")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="share of calls failing with 503")
+    parser.add_argument("--stall-rate", type=float, default=0.05, help="share of calls that hang for --stall seconds")
+    parser.add_argument("--stall", type=float, default=10.0)
+    parser.add_argument("--outage", default="3,5", help="START,END seconds of a full primary outage ('' for none)")
+    parser.add_argument("--deadline", type=float, default=4.0, help="stage deadline for the resilient policies")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    outage = tuple(float(x) for x in args.outage.split(",")) if args.outage else None
+
+    def primary() -> FakeProvider:
+        return FakeProvider("primary", args.latency, args.error_rate, args.stall_rate, args.stall, outage, args.seed)
+
+    def resilient(providers: List[LLMProvider], hedge: bool) -> ResilientProvider:
+        return ResilientProvider(
+            providers,
+            stage_deadlines_s={STAGE: args.deadline},
+            backoff_s=(0.05, 0.5),
+            hedge=hedge,
+            hedge_min_samples=20,
+            hedge_min_delay_s=0.05,
+            breaker_failures=3,
+            breaker_cooldown_s=1.0,
+            seed=args.seed,
+        )
+
+    print(
+        f"{args.calls} calls at {args.rate:g}/s, primary latency {args.latency}, "
+        f"{args.error_rate:.0%} errors, {args.stall_rate:.0%} stalls of {args.stall:g}s, outage {args.outage or 'none'}"
+    )
+    print(
+        f"{'policy':<10} {'ok':>5} {'failed':>6} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'max s':>7} "
+        f"{'LLM reqs':>8} {'retries':>7} {'hedges':>6} {'failovers':>9} {'opens':>5}"
+    )
+    for policy in ("baseline", "retries", "hedged", "failover"):
+        main_provider = primary()
+        providers: List[FakeProvider] = [main_provider]
+        if policy == "baseline":
+            provider: LLMProvider = main_provider
+        elif policy == "failover":
+            backup = FakeProvider("backup", args.latency + " x1.5", seed=args.seed + 1)
+            providers.append(backup)
+            provider = resilient(providers, hedge=False)
+        else:
+            provider = resilient(providers, hedge=policy == "hedged")
+
+        with contextlib.redirect_stdout(io.StringIO()):  # breaker trips are printed
+            latencies, failed = asyncio.run(run(provider, args.calls, args.rate))
+        counts = provider.stats() if isinstance(provider, ResilientProvider) else {}
+        print(
+            f"{policy:<10} {len(latencies) - failed:>5} {failed:>6} {percentile(latencies, 0.5):7.2f} "
+            f"{percentile(latencies, 0.95):7.2f} {percentile(latencies, 0.99):7.2f} {max(latencies):7.2f} "
+            f"{sum(p.calls for p in providers):>8} {counts.get('retries', 0):>7} {counts.get('hedges', 0):>6} "
+            f"{counts.get('failovers', 0):>9} {counts.get('breaker_opens', 0):>5}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Compare pipeline modes (sequential / two_call / fused) on the eval questions.
+
+For every question in data/*.csv and every mode this records wall-clock
+latency of the LLM part, provider-reported prompt/completion tokens, and
+accuracy: whether the predicted SQL returns the same rows as the gold SQL
+(execution match, needs the DB) and normalized exact match.
+
+Caching is disabled so every mode pays for its own LLM calls.
+
+Run from src/backend (needs a live LLM key):
+    python -m benchmarks.pipeline_modes
+    python -m benchmarks.pipeline_modes --modes sequential fused --no-exec
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import re
+import statistics
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from config import PIPELINE_MODES
+from db_utils import run_sql
+from llm_utils import get_llm_usage, reset_llm_usage
+from sql_service import SQLService
+
+
+def normalize_sql(sql: str) -> str:
+    s = (sql or "").strip().rstrip(";")
+    s = re.sub(r"\s+", " ", s).replace("`", "")
+    return s.lower().strip()
+
+
+def result_fingerprint(sql: str) -> Counter:
+    # Order- and column-name-insensitive: multiset of row value tuples.
+    rows, _ = run_sql(sql, limit=100000)
+    return Counter(tuple(str(v) for v in row.values()) for row in rows)
+
+
+def load_questions(pattern: str) -> List[Dict[str, str]]:
+    items = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                items.append(
+                    {
+                        "source_file": os.path.basename(path),
+                        "user_query": row["user_query"],
+                        "gold_sql": row["sql_query"],
+                    }
+                )
+    return items
+
+
+def run_mode(service: SQLService, mode: str, items: List[Dict], execute: bool, gold_results: Dict) -> List[Dict]:
+    out = []
+    for item in items:
+        reset_llm_usage()
+        error: Optional[str] = None
+        pred, tables = "", []
+
+        t0 = time.perf_counter()
+        try:
+            pred, tables = service.generate_sql(item["user_query"], mode=mode)
+        except Exception as e:
+            error = str(e)
+        latency = time.perf_counter() - t0
+        usage = get_llm_usage()
+
+        exec_match = None
+        if execute and not error and item["gold_sql"] in gold_results:
+            try:
+                exec_match = result_fingerprint(pred) == gold_results[item["gold_sql"]]
+            except Exception as e:
+                exec_match = False
+                error = f"execution: {e}"
+
+        out.append(
+            {
+                "mode": mode,
+                "source_file": item["source_file"],
+                "user_query": item["user_query"],
+                "pred_sql": pred,
+                "relevant_tables": json.dumps(tables),
+                "error": error,
+                "latency_s": latency,
+                "llm_calls": usage["calls"],
+                "prompt_tokens": usage["prompt_tokens"],
+                "completion_tokens": usage["completion_tokens"],
+                "normalized_exact_match": normalize_sql(pred) == normalize_sql(item["gold_sql"]),
+                "execution_match": exec_match,
+            }
+        )
+        print(f"[{mode}] {latency:5.2f}s {usage['prompt_tokens']:6d} tok  {item['user_query'][:60]}")
+    return out
+
+
+def summarize(rows: List[Dict]) -> Dict:
+    ok = [r for r in rows if not r["error"]]
+    executed = [r for r in rows if r["execution_match"] is not None]
+    latencies = [r["latency_s"] for r in rows]
+    return {
+        "n": len(rows),
+        "success_rate": len(ok) / len(rows) if rows else 0.0,
+        "avg_latency_s": statistics.mean(latencies) if latencies else None,
+        "p50_latency_s": statistics.median(latencies) if latencies else None,
+        "avg_llm_calls": statistics.mean(r["llm_calls"] for r in rows) if rows else None,
+        "avg_prompt_tokens": statistics.mean(r["prompt_tokens"] for r in rows) if rows else None,
+        "avg_completion_tokens": statistics.mean(r["completion_tokens"] for r in rows) if rows else None,
+        "normalized_exact_match_rate": statistics.mean(float(r["normalized_exact_match"]) for r in rows) if rows else None,
+        "execution_accuracy": (
+            statistics.mean(float(r["execution_match"]) for r in executed) if executed else None
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default="../../data/*.csv")
+    parser.add_argument("--modes", nargs="+", default=list(PIPELINE_MODES), choices=PIPELINE_MODES)
+    parser.add_argument("--no-exec", action="store_true", help="skip execution accuracy (no DB needed)")
+    parser.add_argument("--out-dir", default="../../results")
+    args = parser.parse_args()
+
+    items = load_questions(args.data)
+    if not items:
+        raise SystemExit(f"No questions found in {args.data}")
+
+    service = SQLService()
+    service.cache_enabled = False
+
+    gold_results = {}
+    if not args.no_exec:
+        for item in items:
+            try:
+                gold_results[item["gold_sql"]] = result_fingerprint(item["gold_sql"])
+            except Exception as e:
+                print(f"gold SQL failed, skipping execution match: {e}")
+
+    rows: List[Dict] = []
+    summary = {}
+    for mode in args.modes:
+        mode_rows = run_mode(service, mode, items, not args.no_exec, gold_results)
+        rows.extend(mode_rows)
+        summary[mode] = summarize(mode_rows)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    ts = time.strftime("%Y%m%d_%H%M%S")
+    csv_path = os.path.join(args.out_dir, f"pipeline_modes_{ts}.csv")
+    json_path = os.path.join(args.out_dir, f"pipeline_modes_summary_{ts}.json")
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+
+    print("\n=== SUMMARY ===")
+    print(json.dumps(summary, indent=2))
+    print(f"\nSaved:\n- {csv_path}\n- {json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+SQLService throughput against recorded LLM answers: no network, no API
+key, and the same answers and (seeded) latencies on every run, so changes
+to the pipeline's concurrency can be compared reproducibly.
+
+1. Record once (live key needed; appends to the cassette):
+       python -m benchmarks.replay_throughput --record
+2. Replay as often as needed:
+       python -m benchmarks.replay_throughput --latency recorded --concurrency 1 4 16
+       python -m benchmarks.replay_throughput --latency lognormal:0.8,0.5 --path threads --mode fused
+
+Each question goes through generate_sql (LLM stages only, no DB) with the
+stage caches and request coalescing off, so every request pays for its own
+LLM calls. "async" runs generate_sql_async under a semaphore; "threads"
+runs the sync generate_sql on a thread pool, as the sync endpoints do.
+Record with the same --mode and schema settings you replay with: the
+cassette is keyed by the exact prompt text.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from benchmarks.pipeline_modes import load_questions
+from config import LLM_CASSETTE_PATH, LLM_REPLAY_SEED, PIPELINE_MODE, PIPELINE_MODES
+from llm_utils import create_provider, get_llm_usage, reset_llm_usage, set_provider
+from llm_providers import LatencyModel
+from sql_service import SQLService
+
+
+def make_service() -> SQLService:
+    service = SQLService()
+    service.cache_enabled = False
+    service.inflight_pipelines.enabled = False
+    return service
+
+
+def timed_call(fn, question: str, mode: str) -> Dict:
+    t0 = time.perf_counter()
+    error = None
+    try:
+        fn(question, mode=mode)
+    except Exception as e:
+        error = str(e)
+    return {"latency_s": time.perf_counter() - t0, "error": error}
+
+
+async def run_async(service: SQLService, questions: List[str], mode: str, concurrency: int) -> List[Dict]:
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(q: str) -> Dict:
+        async with limit:
+            t0 = time.perf_counter()
+            error = None
+            try:
+                await service.generate_sql_async(q, mode=mode)
+            except Exception as e:
+                error = str(e)
+            return {"latency_s": time.perf_counter() - t0, "error": error}
+
+    return await asyncio.gather(*(one(q) for q in questions))
+
+
+def run_threads(service: SQLService, questions: List[str], mode: str, concurrency: int) -> List[Dict]:
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(lambda q: timed_call(service.generate_sql, q, mode), questions))
+
+
+def percentile(xs: List[float], p: float) -> float:
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p * (len(xs) - 1))))] if xs else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default="../../data/*.csv")
+    parser.add_argument("--cassette", default=LLM_CASSETTE_PATH)
+    parser.add_argument("--record", action="store_true", help="call the live LLM and record answers")
+    parser.add_argument("--mode", default=PIPELINE_MODE, choices=PIPELINE_MODES)
+    parser.add_argument("--latency", default="recorded", help="replay latency spec (see llm_providers.LatencyModel)")
+    parser.add_argument("--seed", type=int, default=LLM_REPLAY_SEED)
+    parser.add_argument("--path", default="async", choices=["async", "threads"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--limit", type=int, help="use only the first N questions")
+    args = parser.parse_args()
+
+    questions = [item["user_query"] for item in load_questions(args.data)][: args.limit]
+    if not questions:
+        raise SystemExit(f"No questions found in {args.data}")
+    service = make_service()
+
+    if args.record:
+        provider = create_provider("record", args.cassette)
+        if provider is None:
+            raise SystemExit("Recording needs GEMINI_API_KEY or OPENAI_API_KEY")
+        set_provider(provider)
+        failed = sum(timed_call(service.generate_sql, q, args.mode)["error"] is not None for q in questions)
+        print(f"Recorded {len(provider.cassette)} answers to {args.cassette} ({failed} questions failed)")
+        return
+
+    provider = create_provider("replay", args.cassette)
+    if not len(provider.cassette):
+        raise SystemExit(f"{args.cassette} is empty; record it first with --record")
+    print(f"{len(questions)} questions, mode {args.mode}, {args.path}, latency {args.latency}, {len(provider.cassette)} recorded answers")
+    print(f"{'concurrency':>11} {'wall s':>8} {'q/s':>7} {'p50 s':>7} {'p95 s':>7} {'LLM calls':>9} {'errors':>6}")
+    for concurrency in args.concurrency:
+        # fresh seeded latencies per level, so levels see the same draws
+        provider.latency = LatencyModel(args.latency, seed=args.seed)
+        set_provider(provider)
+        reset_llm_usage()
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):  # SQLService prints every stage
+            if args.path == "async":
+                results = asyncio.run(run_async(service, questions, args.mode, concurrency))
+            else:
+                results = run_threads(service, questions, args.mode, concurrency)
+        wall = time.perf_counter() - t0
+        latencies = [r["latency_s"] for r in results]
+        errors = [r["error"] for r in results if r["error"]]
+        print(
+            f"{concurrency:>11} {wall:8.2f} {len(results) / wall:7.2f} {statistics.median(latencies):7.2f}"
+            f" {percentile(latencies, 0.95):7.2f} {get_llm_usage()['calls']:>9} {len(errors):>6}"
+        )
+        if errors:
+            print(f"{'':>11} first error: {errors[0][:200]}")
+
+
+if __name__ == "__main__":
+    main()
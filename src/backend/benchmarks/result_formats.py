@@ -0,0 +1,112 @@
+"""
+Payload size, encode time and client decode time of one query result in
+each response format /query can negotiate:
+
+- json-records: the default body ("rows" as [{column: value}])
+- json-columns: "result_layout": "columns"
+- arrow:        Accept: application/vnd.apache.arrow.stream
+- parquet:      Accept: application/vnd.apache.parquet
+
+Decode is what a client does to get a DataFrame: json.loads +
+pd.DataFrame for JSON, pyarrow + to_pandas(types_mapper=pd.ArrowDtype)
+(zero-copy, as the Streamlit app does) for Arrow and Parquet. The last
+column shows what the DECIMAL column SubTotal decodes to.
+
+Two synthetic SalesOrderHeader-like shapes are measured: "long" (few
+columns, many rows) and "wide" (the same ten columns repeated --wide-repeat
+times, fewer rows). Needs pyarrow.
+
+Run from src/backend:
+    python -m benchmarks.result_formats
+    python -m benchmarks.result_formats --long-rows 500000 --wide-rows 5000 --wide-repeat 20
+"""
+import argparse
+import io
+import json
+import statistics
+import time
+
+import pandas as pd
+from pymysql.constants import FIELD_TYPE
+
+from benchmarks.result_serialization import SYNTHETIC_DESCRIPTION, synthetic_rows
+from columnar import ColumnarResult, arrow_available, arrow_ipc_payload, parquet_payload, query_payload
+
+
+def build_result(n_rows: int, repeat: int) -> ColumnarResult:
+    # DECIMAL(19, 4) money columns, described the way pymysql does
+    # (precision = display length)
+    description = [
+        (f"{name}_{i}" if i else name, code, None, None, *((21, 4) if code == FIELD_TYPE.NEWDECIMAL else (None, None)), True)
+        for i in range(repeat)
+        for name, code in SYNTHETIC_DESCRIPTION
+    ]
+    rows = [r * repeat for r in synthetic_rows(n_rows)]
+    return ColumnarResult.from_rows(description, rows)
+
+
+def decode_json_records(body: bytes) -> pd.DataFrame:
+    return pd.DataFrame(json.loads(body)["rows"])
+
+
+def decode_json_columns(body: bytes) -> pd.DataFrame:
+    payload = json.loads(body)
+    return pd.DataFrame(dict(zip(payload["columns"], payload["data"])))
+
+
+def decode_arrow(body: bytes) -> pd.DataFrame:
+    import pyarrow as pa
+    return pa.ipc.open_stream(body).read_all().to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def decode_parquet(body: bytes) -> pd.DataFrame:
+    import pyarrow.parquet as pq
+    return pq.read_table(io.BytesIO(body)).to_pandas(types_mapper=pd.ArrowDtype)
+
+
+FORMATS = {
+    "json-records": (lambda r: query_payload("SELECT ...", ["SalesOrderHeader"], r), decode_json_records),
+    "json-columns": (lambda r: query_payload("SELECT ...", ["SalesOrderHeader"], r, layout="columns"), decode_json_columns),
+    "arrow": (arrow_ipc_payload, decode_arrow),
+    "parquet": (parquet_payload, decode_parquet),
+}
+
+
+def timed(fn, arg, repeat: int):
+    out, times = None, []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(arg)
+        times.append(time.perf_counter() - t0)
+    return out, statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--long-rows", type=int, default=200_000)
+    parser.add_argument("--wide-rows", type=int, default=2_000)
+    parser.add_argument("--wide-repeat", type=int, default=10, help="copies of the 10 columns in the wide result")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if not arrow_available():
+        raise SystemExit("pyarrow is not installed: pip install pyarrow")
+
+    shapes = {
+        "long": build_result(args.long_rows, 1),
+        "wide": build_result(args.wide_rows, args.wide_repeat),
+    }
+    print(f"{'shape':>5} {'format':>13} {'body KiB':>10} {'encode ms':>10} {'decode ms':>10}  SubTotal dtype")
+    for shape, result in shapes.items():
+        print(f"{shape:>5} {len(result)} rows x {len(result.columns)} columns")
+        for fmt, (encode, decode) in FORMATS.items():
+            body, encode_s = timed(encode, result, args.repeat)
+            df, decode_s = timed(decode, body, args.repeat)
+            print(
+                f"{'':>5} {fmt:>13} {len(body) / 1024:10.1f} {encode_s * 1000:10.1f} {decode_s * 1000:10.1f}"
+                f"  {df['SubTotal'].dtype}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Client memory of the old buffered run_sql vs the unbuffered, paged one.
+
+Creates (once) a large table in a local MySQL database you can write to,
+then for each strategy runs "SELECT * FROM <table>" and reports the
+Python heap peak (tracemalloc) and wall time:
+
+- buffered:  DictCursor + fetchmany(500), the previous run_sql; the whole
+             result set is read into client memory before fetchmany runs
+- run_sql:   run_sql(query, limit=500) on an unbuffered server-side cursor
+- pages:     the first --pages pages via run_sql_page, as a client
+             following next_page_token would cause (memory stays at one page)
+
+Run from src/backend against a local server (not the shared read-only DB):
+    python -m benchmarks.result_memory --host localhost --user root --password ... --database bench
+    python -m benchmarks.result_memory --rows 2000000 --pages 50
+"""
+import argparse
+import time
+import tracemalloc
+
+from pymysql.cursors import DictCursor
+
+import db_utils
+
+
+def ensure_table(conn, table: str, n_rows: int) -> None:
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) AS n FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s", (table,))
+        if cur.fetchone()["n"]:
+            cur.execute(f"SELECT COUNT(*) AS n FROM `{table}`")
+            if cur.fetchone()["n"] == n_rows:
+                return
+            cur.execute(f"DROP TABLE `{table}`")
+
+        print(f"creating {table} with {n_rows} rows ...")
+        cur.execute(
+            f"""
+            CREATE TABLE `{table}` (
+                id INT PRIMARY KEY,
+                order_id INT NOT NULL,
+                product_id INT NOT NULL,
+                qty SMALLINT NOT NULL,
+                unit_price DECIMAL(19, 4) NOT NULL,
+                carrier_tracking VARCHAR(25),
+                modified TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+        batch = 10000
+        for start in range(0, n_rows, batch):
+            values = [
+                (i, i // 4, i % 500, 1 + i % 7, (i % 1000) / 3.0, f"TRK-{i:012d}")
+                for i in range(start, min(start + batch, n_rows))
+            ]
+            cur.executemany(
+                f"INSERT INTO `{table}` (id, order_id, product_id, qty, unit_price, carrier_tracking) "
+                f"VALUES (%s, %s, %s, %s, %s, %s)",
+                values,
+            )
+    conn.commit()
+
+
+def buffered_fetch(query: str, limit: int = 500):
+    conn = db_utils.get_connection()
+    try:
+        with conn.cursor(DictCursor) as cur:
+            cur.execute(query)
+            return cur.fetchmany(size=limit)
+    finally:
+        conn.close()
+
+
+def walk_pages(query: str, max_pages: int) -> int:
+    offset = 0
+    for _ in range(max_pages):
+        rows, _, has_more = db_utils.run_sql_page(query, offset)
+        offset += len(rows)
+        if not has_more:
+            break
+    return offset
+
+
+def measure(label: str, fn):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    n = result if isinstance(result, int) else len(result[0] if isinstance(result, tuple) else result)
+    print(f"{label:10s} rows returned {n:9d}  peak heap {peak / 2**20:9.1f} MiB  {elapsed:7.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=3306)
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--database", default="bench")
+    parser.add_argument("--table", default="bench_order_detail")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--pages", type=int, default=20, help="pages to walk (0 = skip)")
+    args = parser.parse_args()
+
+    # Point db_utils (and its pool) at the local benchmark database.
+    db_utils.DB_HOST, db_utils.DB_PORT = args.host, args.port
+    db_utils.DB_USER, db_utils.DB_PASSWORD, db_utils.DB_NAME = args.user, args.password, args.database
+
+    conn = db_utils.get_connection()
+    try:
+        ensure_table(conn, args.table, args.rows)
+    finally:
+        conn.close()
+
+    query = f"SELECT * FROM `{args.table}` ORDER BY id"
+    measure("buffered", lambda: buffered_fetch(query))
+    measure("run_sql", lambda: db_utils.run_sql(query))
+    if args.pages:
+        measure("pages", lambda: walk_pages(query, args.pages))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Fetch + serialize cost of a query result: the previous path (DictCursor
+row dicts returned through the QueryResponse model) vs the columnar path
+(tuple cursor -> ColumnarResult -> columnar.query_payload), in both the
+"records" layout (same JSON as before) and the "columns" layout.
+
+Rows are synthetic SalesOrderHeader-like tuples (int, Decimal, datetime,
+varchar) unless --sql is given, in which case they are fetched from the
+configured database. Each path is timed end to end through a FastAPI app
+(TestClient), and its peak Python heap is measured with tracemalloc.
+
+Run from src/backend:
+    python -m benchmarks.result_serialization
+    python -m benchmarks.result_serialization --rows 500 5000 50000
+    python -m benchmarks.result_serialization --sql "SELECT * FROM SalesOrderHeader" --rows 5000
+"""
+import argparse
+import datetime
+import statistics
+import time
+import tracemalloc
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI
+from fastapi.responses import Response
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+from pymysql.constants import FIELD_TYPE
+
+from columnar import ColumnarResult, query_payload
+
+
+class QueryResponse(BaseModel):
+    # same as main.QueryResponse
+    sql: str
+    relevant_tables: List[str]
+    columns: List[str]
+    rows: List[Dict[str, Any]]
+    next_page_token: Optional[str] = None
+
+
+SYNTHETIC_DESCRIPTION = [
+    ("SalesOrderID", FIELD_TYPE.LONG),
+    ("OrderDate", FIELD_TYPE.TIMESTAMP),
+    ("Status", FIELD_TYPE.TINY),
+    ("SalesOrderNumber", FIELD_TYPE.VAR_STRING),
+    ("CustomerID", FIELD_TYPE.LONG),
+    ("SalesPersonID", FIELD_TYPE.LONG),
+    ("SubTotal", FIELD_TYPE.NEWDECIMAL),
+    ("TaxAmt", FIELD_TYPE.NEWDECIMAL),
+    ("TotalDue", FIELD_TYPE.NEWDECIMAL),
+    ("Comment", FIELD_TYPE.VAR_STRING),
+]
+
+
+def synthetic_rows(n: int) -> List[tuple]:
+    start = datetime.datetime(2011, 5, 31)
+    return [
+        (
+            43659 + i,
+            start + datetime.timedelta(hours=i),
+            5,
+            f"SO{43659 + i}",
+            11000 + i % 19000,
+            279 + i % 17 if i % 3 else None,
+            Decimal(f"{(i * 37) % 100000}.{i % 10000:04d}"),
+            Decimal(f"{(i * 3) % 8000}.{i % 10000:04d}"),
+            Decimal(f"{(i * 41) % 110000}.{i % 10000:04d}"),
+            None,
+        )
+        for i in range(n)
+    ]
+
+
+def fetch_live(sql: str, n: int):
+    from db_utils import pooled_connection
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"{sql.rstrip(';')} LIMIT {int(n)}")
+            description = cur.description
+            rows = [tuple(r.values()) for r in cur.fetchall()]
+    return description, rows
+
+
+def build_app(description, rows: List[tuple]) -> FastAPI:
+    columns = [d[0] for d in description]
+    app = FastAPI()
+
+    @app.get("/dict", response_model=QueryResponse)
+    def dict_path():
+        # DictCursor: one dict per row, then per-row model validation
+        records = [dict(zip(columns, r)) for r in rows]
+        return QueryResponse(sql="SELECT ...", relevant_tables=["SalesOrderHeader"], columns=columns, rows=records)
+
+    @app.get("/records", response_model=QueryResponse)
+    def records_path():
+        result = ColumnarResult.from_rows(description, rows)
+        return Response(
+            content=query_payload("SELECT ...", ["SalesOrderHeader"], result),
+            media_type="application/json",
+        )
+
+    @app.get("/columns")
+    def columns_path():
+        result = ColumnarResult.from_rows(description, rows)
+        return Response(
+            content=query_payload("SELECT ...", ["SalesOrderHeader"], result, layout="columns"),
+            media_type="application/json",
+        )
+
+    return app
+
+
+def measure(client: TestClient, path: str, repeat: int):
+    client.get(path)  # warm up
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        r = client.get(path)
+        times.append(time.perf_counter() - t0)
+        r.raise_for_status()
+
+    tracemalloc.start()
+    body = client.get(path).content
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(times), peak, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[500, 5000, 50000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--sql", help="fetch rows with this SELECT instead of generating them")
+    args = parser.parse_args()
+
+    print(f"{'rows':>7} {'path':>9} {'median ms':>10} {'peak MiB':>9} {'body KiB':>9}")
+    for n in args.rows:
+        if args.sql:
+            description, rows = fetch_live(args.sql, n)
+        else:
+            description = [(name, code, None, None, None, None, True) for name, code in SYNTHETIC_DESCRIPTION]
+            rows = synthetic_rows(n)
+
+        client = TestClient(build_app(description, rows))
+        results = {}
+        for path in ("dict", "records", "columns"):
+            median, peak, body = measure(client, f"/{path}", args.repeat)
+            results[path] = body
+            print(f"{len(rows):7d} {path:>9} {median * 1000:10.1f} {peak / 2**20:9.1f} {len(body) / 1024:9.1f}")
+        if results["dict"] != results["records"]:
+            print("  warning: response bodies differ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Prompt-size savings from per-query column pruning (schema_slicer).
+
+For each recorded question in results/eval_results_*.csv this compares the
+table text generate_sql_query would get today (full db_schema.json entries
+for the recorded relevant_tables plus bridge tables) against the sliced
+schema for the same tables and question.
+
+Run from src/backend:
+    python -m benchmarks.schema_token_savings
+    python -m benchmarks.schema_token_savings --verbose
+    python -m benchmarks.schema_token_savings --format verbose
+"""
+import argparse
+
+from benchmarks.table_retrieval_recall import load_reference_sets
+from config import SCHEMA_FORMAT, SCHEMA_FORMATS
+from db_utils import parse_table_descriptions, read_file
+from join_graph import JoinGraph
+from schema_slicer import render_sliced_schema
+from tokens import count_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--results", default="../../results/eval_results_*.csv")
+    parser.add_argument("--format", default=SCHEMA_FORMAT, choices=SCHEMA_FORMATS, help="format of the sliced text")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    items = load_reference_sets(args.results)
+    if not items:
+        raise SystemExit(f"No recorded relevant_tables found in {args.results}")
+
+    db_tables = read_file("db_schema.json")
+    schema = parse_table_descriptions(db_tables)
+    graph = JoinGraph(schema)
+
+    total_full = total_sliced = 0
+    print(f"{'full':>6} {'sliced':>6} {'saved':>6}  question")
+    for item in items:
+        tables = graph.connect(item["tables"])
+        full = "\n\n".join(db_tables[t] for t in tables if t in db_tables)
+        sliced = render_sliced_schema(schema, tables, item["user_query"], args.format)
+
+        full_tokens, sliced_tokens = count_tokens(full), count_tokens(sliced)
+        total_full += full_tokens
+        total_sliced += sliced_tokens
+        print(f"{full_tokens:6d} {sliced_tokens:6d} {1 - sliced_tokens / full_tokens:6.1%}  {item['user_query'][:70]}")
+        if args.verbose:
+            print(sliced, end="\n\n")
+
+    print(f"\nquestions: {len(items)}")
+    print(f"table tokens, full:   {total_full} (avg {total_full / len(items):.0f})")
+    print(f"table tokens, sliced: {total_sliced} (avg {total_sliced / len(items):.0f})")
+    print(f"saved: {total_full - total_sliced} tokens ({1 - total_sliced / total_full:.1%})")
+
+
+if __name__ == "__main__":
+    main()
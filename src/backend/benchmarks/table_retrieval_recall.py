@@ -0,0 +1,118 @@
+"""
+Offline recall@k of the local TableRetriever.
+
+Reference table sets are, by default, the tables the gold SQL reads
+(data/*.csv, parsed with sqlglot; CTE names excluded). With --reference llm
+they are the `relevant_tables` the LLM selected in recorded evaluation runs
+(results/eval_results_*.csv); rows where the API failed and recorded no
+tables are skipped.
+
+Run from src/backend:
+    python -m benchmarks.table_retrieval_recall
+    python -m benchmarks.table_retrieval_recall --reference llm --results "../../results/eval_results_*.csv" --k 1 3 5 8
+"""
+import argparse
+import csv
+import glob
+import json
+import time
+from typing import Dict, List
+
+from config import TABLE_RETRIEVER_EMBEDDING_MODEL, TABLE_RETRIEVER_MIN_CONFIDENCE
+from db_utils import read_file
+from table_retriever import TableRetriever, parse_table_catalog
+
+
+def gold_tables(sql: str) -> List[str]:
+    import sqlglot
+    from sqlglot import exp
+
+    tree = sqlglot.parse_one(sql, read="mysql")
+    ctes = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+    return sorted({t.name for t in tree.find_all(exp.Table) if t.name.lower() not in ctes})
+
+
+def load_gold_sets(pattern: str) -> List[Dict]:
+    items = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                items.append({"user_query": row["user_query"], "tables": gold_tables(row["sql_query"])})
+    return items
+
+
+def load_reference_sets(pattern: str) -> List[Dict]:
+    items = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                tables = json.loads(row.get("relevant_tables") or "[]")
+                if tables:
+                    items.append({"user_query": row["user_query"], "tables": tables})
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reference", choices=("gold", "llm"), default="gold", help="tables of the gold SQL, or the LLM's recorded selection")
+    parser.add_argument("--data", default="../../data/*.csv", help="gold SQL (--reference gold)")
+    parser.add_argument("--results", default="../../results/eval_results_*.csv", help="recorded runs (--reference llm)")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5, 8])
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if args.reference == "gold":
+        items = load_gold_sets(args.data)
+        if not items:
+            raise SystemExit(f"No gold SQL found in {args.data}")
+    else:
+        items = load_reference_sets(args.results)
+        if not items:
+            raise SystemExit(f"No recorded relevant_tables found in {args.results}")
+
+    t0 = time.perf_counter()
+    retriever = TableRetriever(
+        read_file("db_schema.json"),
+        parse_table_catalog(read_file("db_description.txt")),
+        embedding_model=TABLE_RETRIEVER_EMBEDDING_MODEL,
+    )
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    recall = {k: 0.0 for k in args.k}
+    confident = 0
+    confident_full_recall = 0
+    latencies = []
+
+    for item in items:
+        t0 = time.perf_counter()
+        ranked = [t for t, _ in retriever.rank(item["user_query"])]
+        selected, confidence = retriever.retrieve(item["user_query"])
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+        ref = set(item["tables"])
+        for k in args.k:
+            recall[k] += len(ref & set(ranked[:k])) / len(ref)
+
+        if confidence >= TABLE_RETRIEVER_MIN_CONFIDENCE:
+            confident += 1
+            confident_full_recall += int(ref <= set(selected))
+
+        if args.verbose:
+            print(f"- {item['user_query']}")
+            print(f"    reference: {sorted(ref)}")
+            print(f"    selected:  {selected} (confidence {confidence:.2f})")
+
+    n = len(items)
+    print(f"questions: {n}")
+    print(f"index build: {build_ms:.1f} ms")
+    print(f"retrieval latency: avg {sum(latencies) / n:.2f} ms, max {max(latencies):.2f} ms")
+    for k in args.k:
+        print(f"recall@{k}: {recall[k] / n:.3f}")
+    print(
+        f"confident (>= {TABLE_RETRIEVER_MIN_CONFIDENCE}): {confident}/{n} "
+        f"answered without the LLM, {confident_full_recall} of them with full recall"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+_MISSING = object()
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalize a natural-language question so trivially different spellings
+    share a cache entry: lower-case, punctuation at word boundaries removed
+    ("orders?" -> "orders"), whitespace collapsed. Punctuation inside a token
+    is kept so "1.5" or "e-mail" stay intact.
+    """
+    if text is None:
+        return ""
+    s = text.lower()
+    s = re.sub(r"(?<!\w)[^\w\s]+|[^\w\s]+(?!\w)", " ", s)
+    s = re.sub(r"\s+", " ", s)
+    return s.strip()
+
+
+def fingerprint(*parts: str) -> str:
+    """
+    Short stable hash over schema / prompt text. Used as a key prefix so a
+    change to db_schema.json or a prompt template invalidates old entries.
+    """
+    h = hashlib.sha256()
+    for p in parts:
+        h.update((p or "").encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()[:16]
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with per-entry time-to-live.
+
+    - get() moves a live entry to the MRU end; expired entries are dropped.
+    - set() evicts from the LRU end once max_size is reached.
+    - hits / misses / evictions / expirations are counted for stats().
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_s: Optional[float] = 3600.0, name: str = "cache"):
+        self.name = name
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+
+            value, expires_at = item
+            if expires_at is not None and expires_at <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        expires_at = None if not self.ttl_s else time.monotonic() + self.ttl_s
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+            self._data[key] = (value, expires_at)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl_s": self.ttl_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
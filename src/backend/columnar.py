@@ -0,0 +1,313 @@
+import json
+from array import array
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from pymysql.constants import FIELD_TYPE
+
+try:
+    # Rust serializer behind pydantic v2: same output as a response_model
+    # with Any values (Decimal -> "1.50", datetime -> ISO 8601), without
+    # building and validating a model per response.
+    from pydantic_core import to_json as _to_json
+except ImportError:  # pydantic v1
+    _to_json = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Arrow / Parquet responses unavailable; JSON still works
+    pa = pq = None
+
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+
+
+# pymysql type codes -> coarse column kinds, used to pick a column's storage
+# and by the serializers.
+_KINDS = {
+    FIELD_TYPE.TINY: "int",
+    FIELD_TYPE.SHORT: "int",
+    FIELD_TYPE.LONG: "int",
+    FIELD_TYPE.LONGLONG: "int",
+    FIELD_TYPE.INT24: "int",
+    FIELD_TYPE.YEAR: "int",
+    FIELD_TYPE.FLOAT: "float",
+    FIELD_TYPE.DOUBLE: "float",
+    FIELD_TYPE.DECIMAL: "decimal",
+    FIELD_TYPE.NEWDECIMAL: "decimal",
+    FIELD_TYPE.DATE: "date",
+    FIELD_TYPE.NEWDATE: "date",
+    FIELD_TYPE.DATETIME: "datetime",
+    FIELD_TYPE.TIMESTAMP: "datetime",
+    FIELD_TYPE.TIME: "time",
+    FIELD_TYPE.VARCHAR: "str",
+    FIELD_TYPE.VAR_STRING: "str",
+    FIELD_TYPE.STRING: "str",
+    FIELD_TYPE.ENUM: "str",
+    FIELD_TYPE.JSON: "str",
+    FIELD_TYPE.BLOB: "bytes",
+    FIELD_TYPE.TINY_BLOB: "bytes",
+    FIELD_TYPE.MEDIUM_BLOB: "bytes",
+    FIELD_TYPE.LONG_BLOB: "bytes",
+    FIELD_TYPE.BIT: "bytes",
+    FIELD_TYPE.GEOMETRY: "bytes",
+}
+
+# Non-NULL int / float columns are packed into typed arrays (8 bytes per
+# value instead of a pointer to a boxed object).
+_ARRAY_TYPECODES = {"int": "q", "float": "d"}
+
+
+class ColumnarResult:
+    """
+    Column-major query result: column names once, one sequence per column.
+
+    - columns: names in select order
+    - kinds:   coarse type per column ("int", "decimal", "datetime", ...)
+    - data:    per-column values; array("q") / array("d") for NULL-free
+               int / float columns, plain lists otherwise
+    - decimal_specs: (precision, scale) from the cursor description for
+               decimal columns, None elsewhere or when unknown
+    """
+
+    def __init__(
+        self,
+        columns: List[str],
+        kinds: List[str],
+        data: List[Sequence[Any]],
+        decimal_specs: Optional[List[Optional[Tuple[int, int]]]] = None,
+    ):
+        self.columns = columns
+        self.kinds = kinds
+        self.data = data
+        self.decimal_specs = decimal_specs or [None] * len(columns)
+
+    @classmethod
+    def from_rows(cls, description, rows: Sequence[tuple]) -> "ColumnarResult":
+        """
+        Build from cursor.description and tuple rows (pymysql Cursor /
+        SSCursor, not the dict cursors).
+        """
+        description = description or []
+        columns = [d[0] for d in description]
+        kinds = [_KINDS.get(d[1], "other") for d in description]
+        # pymysql reports the display length as precision (digits plus sign
+        # and point), an upper bound on the real one
+        decimal_specs = [
+            (d[4], d[5]) if kind == "decimal" and len(d) > 5 and d[4] is not None and d[5] is not None else None
+            for kind, d in zip(kinds, description)
+        ]
+
+        data: List[Sequence[Any]] = []
+        transposed = list(zip(*rows)) if rows else [() for _ in columns]
+        for kind, values in zip(kinds, transposed):
+            typecode = _ARRAY_TYPECODES.get(kind)
+            if typecode and None not in values:
+                try:
+                    data.append(array(typecode, values))
+                    continue
+                except (TypeError, OverflowError):
+                    pass  # e.g. unsigned BIGINT beyond int64
+            data.append(list(values))
+        return cls(columns, kinds, data, decimal_specs)
+
+    def __len__(self) -> int:
+        return len(self.data[0]) if self.data else 0
+
+    def column(self, name: str) -> Sequence[Any]:
+        return self.data[self.columns.index(name)]
+
+    def column_lists(self) -> List[List[Any]]:
+        # array.tolist() unboxes in C; zipping over arrays directly is slower
+        return [v.tolist() if isinstance(v, array) else v for v in self.data]
+
+    def rows(self) -> List[tuple]:
+        return list(zip(*self.column_lists())) if self.data else []
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """
+        Row dicts, as DictCursor would have returned them. Duplicate column
+        names keep the last value, also like DictCursor.
+        """
+        columns = self.columns
+        return [dict(zip(columns, values)) for values in zip(*self.column_lists())] if self.data else []
+
+
+def dumps_json(payload: Dict[str, Any]) -> bytes:
+    """
+    Serialize a response payload to JSON bytes without pydantic model
+    validation.
+    """
+    if _to_json is not None:
+        return _to_json(payload)
+    from fastapi.encoders import jsonable_encoder
+    return json.dumps(jsonable_encoder(payload)).encode("utf-8")
+
+
+def _rows_payload(result: Optional[ColumnarResult], layout: str) -> Dict[str, Any]:
+    # "records": rows as [{column: value}] (the QueryResponse shape)
+    # "columns": data as one list per column, aligned with "columns"; no
+    #            per-row objects are built on either side
+    if result is None:
+        return {"columns": [], "data": []} if layout == "columns" else {"columns": [], "rows": []}
+    if layout == "columns":
+        return {"columns": result.columns, "data": result.column_lists()}
+    return {"columns": result.columns, "rows": result.to_records()}
+
+
+def query_payload(
+    sql: str,
+    relevant_tables: List[str],
+    result: Optional[ColumnarResult],
+    next_page_token: Optional[str] = None,
+    layout: str = "records",
+) -> bytes:
+    """
+    JSON body of a /query response (same shape as main.QueryResponse for
+    the "records" layout).
+    """
+    return dumps_json(
+        {
+            "sql": sql,
+            "relevant_tables": relevant_tables,
+            **_rows_payload(result, layout),
+            "next_page_token": next_page_token,
+        }
+    )
+
+
+def append_fields(body: bytes, fields: Dict[str, Any]) -> bytes:
+    """
+    Add top-level fields to an already serialized JSON object (for values
+    only known after the body was built, like the request's timings).
+    """
+    extra = dumps_json(fields)
+    if len(extra) <= 2:
+        return body
+    return body[:-1] + (b"," if len(body) > 2 else b"") + extra[1:]
+
+
+def page_payload(result: ColumnarResult, next_page_token: Optional[str] = None, layout: str = "records") -> bytes:
+    """
+    JSON body of a /query/page response (same shape as main.PageResponse
+    for the "records" layout).
+    """
+    return dumps_json({**_rows_payload(result, layout), "next_page_token": next_page_token})
+
+
+def batch_payload(items: List[Dict[str, Any]], layout: str = "records") -> bytes:
+    """
+    JSON body of a /query/batch response: {"results": [...]} with one
+    /query-shaped object per question plus "error" and "duplicate_of".
+    """
+    results = []
+    for item in items:
+        results.append(
+            {
+                "sql": item["sql"],
+                "relevant_tables": item["relevant_tables"],
+                **_rows_payload(item["result"], layout),
+                "next_page_token": item["next_page_token"],
+                "error": item["error"],
+                "duplicate_of": item["duplicate_of"],
+            }
+        )
+    return dumps_json({"results": results})
+
+
+# ---------- Arrow / Parquet ----------
+
+def arrow_available() -> bool:
+    return pa is not None
+
+
+def _arrow_type(kind: str, decimal_spec: Optional[Tuple[int, int]]):
+    if kind == "decimal":
+        if decimal_spec is None:
+            return None  # inferred from the values (several times slower)
+        precision, scale = decimal_spec
+        precision = max(precision, scale, 1)
+        return pa.decimal128(precision, scale) if precision <= 38 else pa.decimal256(min(precision, 76), scale)
+    return {
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "datetime": pa.timestamp("us"),
+        "date": pa.date32(),
+        "time": pa.duration("us"),  # pymysql returns TIME as timedelta
+        "str": pa.string(),
+        "bytes": pa.binary(),
+    }.get(kind)
+
+
+def _arrow_column(kind: str, values: Sequence[Any], decimal_spec: Optional[Tuple[int, int]] = None):
+    if isinstance(values, array):
+        # typed arrays are already int64 / float64 buffers: wrap, don't copy
+        arrow_type = pa.int64() if values.typecode == "q" else pa.float64()
+        return pa.Array.from_buffers(arrow_type, len(values), [None, pa.py_buffer(values)])
+    arrow_type = _arrow_type(kind, decimal_spec)
+    for candidate in (arrow_type, None) if arrow_type is not None else (None,):
+        try:
+            return pa.array(values, type=candidate)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+            continue
+    # e.g. zero dates, which pymysql hands back as strings
+    return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+
+def to_arrow_table(result: Optional[ColumnarResult], metadata: Optional[Dict[str, str]] = None):
+    """
+    pyarrow Table with one Arrow array per column: DECIMAL stays decimal128,
+    DATETIME/TIMESTAMP become timestamp[us]. `metadata` is stored in the
+    schema (the Arrow body has no room for sql / next_page_token otherwise).
+    """
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed")
+    if result is None:
+        result = ColumnarResult([], [], [])
+    arrays = [
+        _arrow_column(kind, values, spec)
+        for kind, values, spec in zip(result.kinds, result.data, result.decimal_specs)
+    ]
+    table = pa.Table.from_arrays(arrays, names=list(result.columns))
+    if metadata:
+        table = table.replace_schema_metadata(metadata)
+    return table
+
+
+def arrow_ipc_payload(result: Optional[ColumnarResult], metadata: Optional[Dict[str, str]] = None) -> bytes:
+    """
+    Arrow IPC stream of the result; read with pyarrow.ipc.open_stream().
+    """
+    table = to_arrow_table(result, metadata)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def parquet_payload(result: Optional[ColumnarResult], metadata: Optional[Dict[str, str]] = None) -> bytes:
+    """
+    Parquet file of the result, for exports.
+    """
+    table = to_arrow_table(result, metadata)
+    sink = pa.BufferOutputStream()
+    pq.write_table(table, sink)
+    return sink.getvalue().to_pybytes()
+
+
+def result_metadata(
+    sql: Optional[str] = None,
+    relevant_tables: Optional[List[str]] = None,
+    next_page_token: Optional[str] = None,
+) -> Dict[str, str]:
+    """
+    The non-row parts of a /query response, as Arrow schema metadata.
+    """
+    meta = {"next_page_token": next_page_token or ""}
+    if sql is not None:
+        meta["sql"] = sql
+    if relevant_tables is not None:
+        meta["relevant_tables"] = json.dumps(relevant_tables)
+    return meta
+
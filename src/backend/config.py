@@ -9,9 +9,180 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 GEMINI_MODEL = "gemini-2.5-flash"
 
+# ---------- LLM RECORD / REPLAY ----------
+# "live":   call Gemini / OpenAI
+# "record": call live and append every answer to the cassette
+# "replay": answer from the cassette only (no network, no API key), e.g.
+#           for offline benchmarks and load tests
+LLM_MODES = ("live", "record", "replay")
+LLM_MODE = os.getenv("LLM_MODE", "live")
+LLM_CASSETTE_PATH = os.getenv("LLM_CASSETTE_PATH", "cassettes/llm.jsonl")
+# Simulated latency in replay mode: "none", "recorded", "fixed:0.8",
+# "uniform:0.3,1.5", "normal:0.8,0.2", "lognormal:0.8,0.5" (see llm_providers.LatencyModel)
+LLM_REPLAY_LATENCY = os.getenv("LLM_REPLAY_LATENCY", "none")
+LLM_REPLAY_SEED = 0
+
+# ---------- LLM RESILIENCE ----------
+# Live LLM calls go through llm_resilience.ResilientProvider: a deadline
+# per pipeline stage (covering retries, hedges and failover), jittered
+# retries on timeouts / 429 / 5xx / connection errors, optional hedging,
+# and a circuit breaker per provider that fails over to the other
+# configured provider (Gemini <-> OpenAI) while one is degraded
+LLM_RESILIENCE_ENABLED = True
+LLM_STAGE_DEADLINES_S = {
+    "rewrite": 20,
+    "select_tables": 20,
+    "rewrite_and_select": 25,
+    "generate_sql": 40,
+    "fused": 45,
+}
+LLM_DEFAULT_DEADLINE_S = 60  # stages not listed above (batch calls, direct calls)
+LLM_MAX_ATTEMPTS = 3
+LLM_RETRY_BACKOFF_S = (0.25, 4.0)  # base, cap; full jitter: uniform(0, min(cap, base * 2**retry))
+# Hedging: if an answer hasn't arrived after the provider's recent
+# LLM_HEDGE_QUANTILE latency for the stage, send the same prompt again and
+# take whichever answer comes first (costs tokens for the duplicate)
+LLM_HEDGE_ENABLED = False
+LLM_HEDGE_QUANTILE = 0.95
+LLM_HEDGE_MIN_SAMPLES = 20  # no hedging until this many latencies are known
+LLM_HEDGE_MIN_DELAY_S = 0.2
+LLM_FAILOVER_ENABLED = True  # use the second provider when both keys are set
+LLM_BREAKER_FAILURES = 3  # consecutive failures that open a provider's breaker
+LLM_BREAKER_COOLDOWN_S = 30  # then one probe call decides whether it closes
+
+# ---------- LLM ROUTING ----------
+# Candidate models per pipeline stage, as "provider:model" in order of
+# preference, e.g.
+#   {"rewrite": ["gemini:gemini-2.0-flash-lite", "openai:gpt-4o-mini"],
+#    "select_tables": ["gemini:gemini-2.0-flash-lite", "openai:gpt-4o-mini"],
+#    "generate_sql": ["gemini:gemini-2.5-flash", "openai:gpt-4o"]}
+# Stages not listed use every provider with a key, at its default model.
+# Routing plugs into ResilientProvider, so it needs LLM_RESILIENCE_ENABLED
+LLM_STAGE_ROUTES: dict = {}
+# "provider:model" for every stage (e.g. to evaluate one model)
+LLM_ROUTE_PIN = os.getenv("LLM_ROUTE_PIN")
+# "static":   always the first healthy candidate
+# "adaptive": the candidate with the lowest recent median latency among
+#             those with a low error rate and an eval accuracy at or above
+#             the floor
+LLM_ROUTING_MODES = ("static", "adaptive")
+LLM_ROUTING = os.getenv("LLM_ROUTING", "static")
+LLM_ROUTING_WINDOW_S = 300  # latency / error history kept per model and stage
+LLM_ROUTING_MIN_SAMPLES = 5  # calls before a model's numbers are trusted
+LLM_ROUTING_EXPLORE = 0.05  # share of calls sent to a random eligible model
+LLM_ROUTING_MAX_ERROR_RATE = 0.2
+LLM_ROUTING_ACCURACY_FLOOR = 0.0  # 0: no floor
+# Written by `python -m evaluation.run --accuracy-file` (repo results/ dir)
+LLM_ROUTING_ACCURACY_PATH = os.getenv("LLM_ROUTING_ACCURACY_PATH", "../../results/model_accuracy.json")
+
 # ---------- DB ----------
-DB_HOST = "relational.fel.cvut.cz"
-DB_PORT = 3306
-DB_NAME = "AdventureWorks2014"  # case-sensitive as on the site
-DB_USER = "guest"
-DB_PASSWORD = "ctu-relational"
\ No newline at end of file
+# Also used by the evaluation's execution scoring (src/evaluation/execution.py);
+# set the environment variables (or .env) to point both at a local copy
+DB_HOST = os.getenv("DB_HOST", "relational.fel.cvut.cz")
+DB_PORT = int(os.getenv("DB_PORT", "3306"))
+DB_NAME = os.getenv("DB_NAME", "AdventureWorks2014")  # case-sensitive as on the site
+DB_USER = os.getenv("DB_USER", "guest")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "ctu-relational")
+
+# ---------- CACHE ----------
+# Per-stage NL->SQL cache in SQLService (rewrite, table selection, SQL)
+CACHE_ENABLED = True
+CACHE_MAX_SIZE = 1024  # entries per stage
+CACHE_TTL_S = 6 * 60 * 60  # 6 hours
+
+# ---------- COALESCING ----------
+# Concurrent requests for the same normalized question (and mode) share one
+# in-flight LLM pipeline; identical SQL shares one DB execution
+COALESCING_ENABLED = True
+
+# ---------- SQL VALIDATION ----------
+# Generated SQL is parsed locally as MySQL (sqlglot) and checked against the
+# schema before it runs: one read-only SELECT, known tables and columns.
+# Failures go back to the model with the errors, at most
+# SQL_REPAIR_MAX_ATTEMPTS times; SQL that is still invalid is never run.
+SQL_VALIDATION_ENABLED = True
+SQL_REPAIR_MAX_ATTEMPTS = 2
+
+# ---------- DB POOL ----------
+DB_POOL_SIZE = 8  # max open connections
+DB_POOL_TIMEOUT_S = 30  # max wait for a free connection
+DB_POOL_MAX_IDLE_S = 300  # recycle connections idle longer than this
+DB_POOL_MAX_LIFETIME_S = 3600  # recycle connections older than this
+
+# ---------- STREAMING ----------
+STREAM_ROW_BATCH_SIZE = 100  # rows per "rows" event on /query/stream
+
+# ---------- RESULT PAGING ----------
+RESULT_PAGE_SIZE = 500  # rows per response page
+PAGE_TOKEN_TTL_S = 900  # how long a next_page_token stays valid
+PAGE_TOKEN_MAX = 1000  # max outstanding page tokens (LRU beyond that)
+# "records": rows as [{column: value}]; "columns": one list per column
+RESULT_LAYOUTS = ("records", "columns")
+
+# ---------- BATCH ----------
+# POST /query/batch: duplicate questions (after normalize_query) run once;
+# the rest run concurrently within these limits
+BATCH_MAX_QUESTIONS = 100  # per request
+BATCH_LLM_CONCURRENCY = 8  # LLM calls in flight per batch
+BATCH_DB_CONCURRENCY = 4  # SQL queries in flight per batch (also capped by DB_POOL_SIZE)
+BATCH_TABLE_SELECTION_SIZE = 20  # questions per batched table-selection call
+
+# ---------- TABLE RETRIEVER ----------
+# Local BM25 ranking used instead of the select_relevant_tables LLM call;
+# the LLM is only asked when retrieval confidence is below the threshold.
+# Off by default: against the gold SQL only 2 of the 5 confident answers
+# have every table (python -m benchmarks.table_retrieval_recall)
+TABLE_RETRIEVER_ENABLED = False
+TABLE_RETRIEVER_TOP_K = 5
+TABLE_RETRIEVER_MIN_RELATIVE_SCORE = 0.5  # keep tables scoring >= this x best
+TABLE_RETRIEVER_MIN_CONFIDENCE = 0.2
+TABLE_RETRIEVER_EMBEDDING_MODEL = None  # e.g. "all-MiniLM-L6-v2" (needs sentence-transformers)
+
+# ---------- JOIN GRAPH ----------
+# Add the bridge tables needed to join the selected tables (FK graph)
+JOIN_GRAPH_ENABLED = True
+
+# ---------- PIPELINE ----------
+# "sequential": rewrite -> select tables -> generate SQL (3 LLM calls)
+# "speculative": select tables on the raw question concurrently with the
+#               rewrite; keep them if they cover the rewritten question
+# "two_call":   rewrite + select fused, then generate SQL (2 LLM calls)
+# "fused":      one structured call returning rewrite, tables and SQL
+PIPELINE_MODES = ("sequential", "speculative", "two_call", "fused")
+PIPELINE_MODE = "sequential"  # default; can be overridden per request
+
+# ---------- SCHEMA SLICING ----------
+# Before SQL generation, cut each selected table down to the columns the
+# rewritten question can use (join keys and readable names always kept).
+# Off by default until its effect on eval accuracy is measured; turn it on
+# to cut prompt tokens (see benchmarks/schema_token_savings.py)
+COLUMN_PRUNING_ENABLED = False
+
+# ---------- SCHEMA FORMAT ----------
+# "verbose": db_schema.json / db_description.txt text as written
+# "compact": schema_compiler's one-line-per-table format and shortened
+#            catalog (about 70% / 50% fewer tokens; see schema_compiler.py).
+#            Opt-in until its effect on eval accuracy is measured
+SCHEMA_FORMATS = ("verbose", "compact")
+SCHEMA_FORMAT = "verbose"
+# "file": table structure parsed from db_schema.json
+# "live": introspect INFORMATION_SCHEMA at startup (falls back to the file)
+SCHEMA_SOURCE = "file"
+
+# ---------- TELEMETRY ----------
+# Spans around pipeline steps, LLM calls and DB access feed the Prometheus
+# histograms on GET /metrics; requests with include_timings=true also get
+# their own breakdown in the response
+TELEMETRY_ENABLED = True
+METRICS_BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40)
+
+# ---------- PROFILING ----------
+# Sample the Python stacks while a request runs and write them as folded
+# stacks (flamegraph.pl / speedscope input), one file per request.
+# PROFILING_ENABLED profiles every request to PROFILE_ROUTES; otherwise
+# only requests sending the PROFILING_HEADER (None: header ignored)
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILING_HEADER = "X-Profile"
+PROFILE_ROUTES = ("/query", "/query/page", "/query/batch")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_S = 0.005
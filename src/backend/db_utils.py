@@ -1,12 +1,25 @@
-from typing import Dict, List, Tuple
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
 
-import pymysql, os, json
-from pymysql.cursors import DictCursor
+import pymysql, os, re, json, threading, time
+from pymysql.cursors import DictCursor, SSCursor, SSDictCursor
 
-from config import DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD
+from columnar import ColumnarResult
+from telemetry import bind_context, span
+
+from config import (
+    DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD,
+    DB_POOL_SIZE, DB_POOL_TIMEOUT_S, DB_POOL_MAX_IDLE_S, DB_POOL_MAX_LIFETIME_S,
+    STREAM_ROW_BATCH_SIZE, RESULT_PAGE_SIZE,
+)
 
 
 def get_connection():
+    # autocommit so a pooled connection never keeps an old REPEATABLE READ
+    # snapshot open between queries
     return pymysql.connect(
         host=DB_HOST,
         port=DB_PORT,
@@ -14,9 +27,240 @@ def get_connection():
         password=DB_PASSWORD,
         database=DB_NAME,
         cursorclass=DictCursor,
+        autocommit=True,
     )
 
 
+class PoolTimeout(RuntimeError):
+    pass
+
+
+# pymysql raises OperationalError for many plain statement errors (1054
+# unknown column, 1052 ambiguous column, 1055 only_full_group_by, 1242
+# subquery returns more than one row), so the class alone can't tell a bad
+# query from a dead connection; the error number can. 2000-2999 are client
+# errors (2003 can't connect, 2006 gone away, 2013 lost connection, ...).
+_CONNECTION_LOST_ERRNOS = {1053, 1927}  # server shutting down, connection killed
+_SERVER_BUSY_ERRNOS = {1040, 1203, 1205, 1213, 1317, 3024}  # too many connections, lock wait, deadlock, interrupted, timeout
+
+
+def mysql_errno(e: BaseException) -> Optional[int]:
+    args = getattr(e, "args", ())
+    return args[0] if args and isinstance(args[0], int) else None
+
+
+def connection_broken(e: BaseException) -> bool:
+    """
+    True when a pymysql error leaves the connection unusable, so it must
+    not go back to the pool.
+    """
+    if isinstance(e, pymysql.err.InterfaceError):
+        return True
+    if not isinstance(e, pymysql.err.MySQLError):
+        return False
+    errno = mysql_errno(e)
+    return errno is None or 2000 <= errno < 3000 or errno in _CONNECTION_LOST_ERRNOS
+
+
+def statement_rejected(e: BaseException) -> bool:
+    """
+    True when MySQL refused the statement itself (syntax, unknown table or
+    column, GROUP BY rules, ...): the query is at fault, not the database.
+    """
+    return (
+        isinstance(e, pymysql.err.MySQLError)
+        and not connection_broken(e)
+        and mysql_errno(e) not in _SERVER_BUSY_ERRNOS
+    )
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of DB connections.
+
+    - At most max_size connections are open at once; acquire() blocks up to
+      timeout_s for one to be released, then raises PoolTimeout.
+    - Idle connections are health-checked (ping) on checkout.
+    - Connections idle longer than max_idle_s or older than max_lifetime_s
+      are closed and replaced instead of being handed out.
+    """
+
+    def __init__(
+        self,
+        connect=get_connection,
+        max_size: int = DB_POOL_SIZE,
+        timeout_s: float = DB_POOL_TIMEOUT_S,
+        max_idle_s: float = DB_POOL_MAX_IDLE_S,
+        max_lifetime_s: float = DB_POOL_MAX_LIFETIME_S,
+    ):
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout_s = timeout_s
+        self.max_idle_s = max_idle_s
+        self.max_lifetime_s = max_lifetime_s
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, last_used)
+        self._created_at: Dict[int, float] = {}
+        self._open = 0
+
+        self._metrics = {
+            "checkouts": 0,
+            "wait_total_s": 0.0,
+            "wait_max_s": 0.0,
+            "timeouts": 0,
+            "created": 0,
+            "recycled_idle": 0,
+            "recycled_lifetime": 0,
+            "health_check_failures": 0,
+            "discarded": 0,
+        }
+
+    def acquire(self):
+        start = time.monotonic()
+        deadline = start + self.timeout_s
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, last_used = self._idle.pop()  # LIFO keeps hot connections hot
+                    break
+                if self._open < self.max_size:
+                    self._open += 1
+                    conn, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._metrics["timeouts"] += 1
+                    raise PoolTimeout(
+                        f"No DB connection available within {self.timeout_s}s "
+                        f"(pool size {self.max_size})"
+                    )
+                self._cond.wait(remaining)
+
+            waited = time.monotonic() - start
+            self._metrics["checkouts"] += 1
+            self._metrics["wait_total_s"] += waited
+            self._metrics["wait_max_s"] = max(self._metrics["wait_max_s"], waited)
+
+        try:
+            if conn is not None and not self._is_usable(conn, last_used):
+                self._close(conn)
+                conn = None
+            if conn is None:
+                conn = self._connect()
+                self._created_at[id(conn)] = time.monotonic()
+                self._count("created")
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+        return conn
+
+    def release(self, conn, discard: bool = False) -> None:
+        if discard or not conn.open:
+            self._close(conn)
+            self._count("discarded")
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except pymysql.err.MySQLError as e:
+            # connection-level failure: don't hand this one out again
+            discard = connection_broken(e)
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def close_all(self) -> None:
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            m = dict(self._metrics)
+            m["size"] = self.max_size
+            m["open"] = self._open
+            m["idle"] = len(self._idle)
+            m["in_use"] = self._open - len(self._idle)
+        m["wait_avg_s"] = m["wait_total_s"] / m["checkouts"] if m["checkouts"] else 0.0
+        return m
+
+    def _is_usable(self, conn, last_used: float) -> bool:
+        now = time.monotonic()
+        if now - self._created_at.get(id(conn), now) > self.max_lifetime_s:
+            self._count("recycled_lifetime")
+            return False
+        if now - last_used > self.max_idle_s:
+            self._count("recycled_idle")
+            return False
+        try:
+            conn.ping(reconnect=False)
+        except Exception:
+            self._count("health_check_failures")
+            return False
+        return True
+
+    def _close(self, conn) -> None:
+        self._created_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _count(self, key: str) -> None:
+        with self._cond:
+            self._metrics[key] += 1
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Process-wide pool, created on first use.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def pooled_connection():
+    """
+    Borrow a connection from the shared pool:
+
+        with pooled_connection() as conn:
+            ...
+    """
+    return get_pool().connection()
+
+
+def pool_stats() -> Dict[str, Any]:
+    return get_pool().stats()
+
+
 def get_mysql_database_schema() -> Dict[str, Dict]:
     """
     Introspect MySQL INFORMATION_SCHEMA and build a schema dict:
@@ -40,8 +284,7 @@ def get_mysql_database_schema() -> Dict[str, Dict]:
     """
     schema: Dict[str, Dict] = {}
 
-    conn = get_connection()
-    try:
+    with pooled_connection() as conn:
         with conn.cursor() as cur:
             # All tables
             cur.execute(
@@ -80,46 +323,43 @@ def get_mysql_database_schema() -> Dict[str, Dict]:
             )
             fk_rows = cur.fetchall()
 
-        # Initialize tables
-        for t in tables:
-            schema[t] = {
-                "columns": [],
-                "primary_key": [],
-                "foreign_keys": [],
-            }
-
-        # Fill columns and PK
-        for row in col_rows:
-            tname = row["TABLE_NAME"]
-            if tname not in schema:
-                continue
-            schema[tname]["columns"].append(
-                {
-                    "name": row["COLUMN_NAME"],
-                    "type": row["DATA_TYPE"],
-                    "nullable": row["IS_NULLABLE"],
-                    "default": row["COLUMN_DEFAULT"],
-                }
-            )
-            if row["COLUMN_KEY"] == "PRI":
-                schema[tname]["primary_key"].append(row["COLUMN_NAME"])
+    # Initialize tables
+    for t in tables:
+        schema[t] = {
+            "columns": [],
+            "primary_key": [],
+            "foreign_keys": [],
+        }
 
-        # Foreign keys
-        for row in fk_rows:
-            tname = row["TABLE_NAME"]
-            if tname not in schema:
-                continue
-            schema[tname]["foreign_keys"].append(
-                {
-                    "column": row["COLUMN_NAME"],
-                    "references_table": row["REFERENCED_TABLE_NAME"],
-                    "references_column": row["REFERENCED_COLUMN_NAME"],
-                    "constraint_name": row["CONSTRAINT_NAME"],
-                }
-            )
+    # Fill columns and PK
+    for row in col_rows:
+        tname = row["TABLE_NAME"]
+        if tname not in schema:
+            continue
+        schema[tname]["columns"].append(
+            {
+                "name": row["COLUMN_NAME"],
+                "type": row["DATA_TYPE"],
+                "nullable": row["IS_NULLABLE"],
+                "default": row["COLUMN_DEFAULT"],
+            }
+        )
+        if row["COLUMN_KEY"] == "PRI":
+            schema[tname]["primary_key"].append(row["COLUMN_NAME"])
 
-    finally:
-        conn.close()
+    # Foreign keys
+    for row in fk_rows:
+        tname = row["TABLE_NAME"]
+        if tname not in schema:
+            continue
+        schema[tname]["foreign_keys"].append(
+            {
+                "column": row["COLUMN_NAME"],
+                "references_table": row["REFERENCED_TABLE_NAME"],
+                "references_column": row["REFERENCED_COLUMN_NAME"],
+                "constraint_name": row["CONSTRAINT_NAME"],
+            }
+        )
 
     return schema
 
@@ -152,6 +392,104 @@ def build_table_description(table_name: str, info: Dict) -> str:
     return "\n".join(lines)
 
 
+def parse_table_description(text: str) -> Tuple[str, Dict]:
+    """
+    Parse one db_schema.json entry ("Table: X\nColumns:\n- col type (flags)
+    ...\nForeign keys:\n- col → T.col (constraint)") back into the
+    (table_name, info) shape produced by get_mysql_database_schema, so code
+    that needs structure can work without a live DB connection.
+    """
+    table_name = ""
+    info: Dict[str, List] = {"columns": [], "primary_key": [], "foreign_keys": []}
+    section = None
+
+    for line in text.splitlines():
+        line = line.rstrip()
+        if line.startswith("Table:"):
+            table_name = line.split(":", 1)[1].strip()
+        elif line == "Columns:":
+            section = "columns"
+        elif line == "Foreign keys:":
+            section = "foreign_keys"
+        elif not line.startswith("- "):
+            section = None
+        elif section == "columns":
+            m = re.match(r"^- (.+?) (\w+)(?: \((.*)\))?$", line)
+            if not m:
+                continue
+            name, col_type, flags = m.group(1), m.group(2), m.group(3) or ""
+            default = None
+            dm = re.search(r"default (.*)$", flags)
+            if dm:
+                default = dm.group(1)
+            info["columns"].append(
+                {
+                    "name": name,
+                    "type": col_type,
+                    "nullable": "NO" if "NOT NULL" in flags else "YES",
+                    "default": default,
+                }
+            )
+            if re.match(r"^PK\b", flags):
+                info["primary_key"].append(name)
+        elif section == "foreign_keys":
+            m = re.match(r"^- (.+?) → (\w+)\.(.+?)(?: \((.*)\))?$", line)
+            if not m:
+                continue
+            info["foreign_keys"].append(
+                {
+                    "column": m.group(1),
+                    "references_table": m.group(2),
+                    "references_column": m.group(3),
+                    "constraint_name": m.group(4),
+                }
+            )
+
+    return table_name, info
+
+
+def parse_table_descriptions(db_tables: Dict[str, str]) -> Dict[str, Dict]:
+    """
+    Parse every db_schema.json entry. Returns the same shape as
+    get_mysql_database_schema: { table_name: info }.
+    """
+    schema: Dict[str, Dict] = {}
+    for key, text in db_tables.items():
+        name, info = parse_table_description(text)
+        schema[name or key] = info
+    return schema
+
+
+def render_table_description(table_name: str, info: Dict) -> str:
+    """
+    Inverse of parse_table_description: render a table in the
+    db_schema.json text format. FK constraint names are omitted when None.
+    """
+    pks = set(info.get("primary_key", []))
+    lines: List[str] = [f"Table: {table_name}", "Columns:"]
+    for col in info.get("columns", []):
+        flags = []
+        if col["name"] in pks:
+            flags.append("PK")
+        if col.get("nullable") == "NO":
+            flags.append("NOT NULL")
+        if col.get("default") is not None:
+            flags.append(f"default {col['default']}")
+        suffix = f" ({', '.join(flags)})" if flags else ""
+        lines.append(f"- {col['name']} {col['type']}{suffix}")
+
+    fks = info.get("foreign_keys", [])
+    if fks:
+        lines.append("Foreign keys:")
+        for fk in fks:
+            line = f"- {fk['column']} → {fk['references_table']}.{fk['references_column']}"
+            if fk.get("constraint_name"):
+                line += f" ({fk['constraint_name']})"
+            lines.append(line)
+
+    return "\n".join(lines)
+
+
 def build_all_table_descriptions(schema: Dict[str, Dict]) -> Dict[str, str]:
     """
     Returns dict: { table_name: description_text }
@@ -162,25 +500,211 @@ def build_all_table_descriptions(schema: Dict[str, Dict]) -> Dict[str, str]:
     }
 
 
+# Statement tails after which appending "LIMIT offset, n" is not safe (or
+# would change meaning); such queries are paged by skipping rows instead.
+_UNSAFE_TAIL = re.compile(
+    r"\bLIMIT\s+\d+\s*(?:(?:,|OFFSET)\s*\d+\s*)?$"
+    r"|\bFOR\s+(?:UPDATE|SHARE)(?:\s+(?:NOWAIT|SKIP\s+LOCKED))?\s*$|\bLOCK\s+IN\s+SHARE\s+MODE\s*$"
+    # SELECT ... INTO takes options and variable lists after INTO
+    r"|\bINTO\s+\S+\s*$|\bINTO\s+(?:OUTFILE|DUMPFILE)\b|\bINTO\s+@",
+    re.IGNORECASE,
+)
+
+
+def _close_after_error(cur) -> bool:
+    """
+    Close a cursor whose statement failed, reading off anything left of its
+    result; True when the connection is clean enough to go back to the pool.
+    """
+    if cur is None:
+        return True
+    try:
+        cur.close()
+    except Exception:
+        return False
+    return True
+
+
+def page_sql(query: str, offset: int, size: int):
+    """
+    `query` with "LIMIT offset, size" appended, or None when that can't be
+    done safely (the query has its own trailing LIMIT, comments, or more
+    than one statement).
+    """
+    stmt = query.strip().rstrip(";").strip()
+    if not stmt or ";" in stmt or "--" in stmt or "#" in stmt or "/*" in stmt:
+        return None
+    if _UNSAFE_TAIL.search(stmt):
+        return None
+    return f"{stmt} LIMIT {int(offset)}, {int(size)}"
+
+
+def fetch_sql_page(
+    query: str,
+    offset: int = 0,
+    page_size: int = RESULT_PAGE_SIZE,
+) -> Tuple[ColumnarResult, bool]:
+    """
+    Execute SQL and return one page as (ColumnarResult, has_more).
+
+    Uses an unbuffered server-side tuple cursor, so client memory is bounded
+    by the page size rather than the result size, and rows are never turned
+    into per-row dicts. When possible the page is cut on the server
+    ("LIMIT offset, page_size + 1"); otherwise the cursor skips `offset`
+    rows as they stream past and the connection is dropped instead of
+    draining whatever is left.
+    """
+    limited = page_sql(query, offset, page_size + 1)
+
+    pool = get_pool()
+    # connect: waiting for a pooled connection (or opening a new one)
+    with span("db.connect"):
+        conn = pool.acquire()
+    exhausted = False
+    cur = None
+    try:
+        cur = conn.cursor(SSCursor)
+        # execute: until the server starts sending rows
+        with span("db.execute", server_limit=limited is not None):
+            if limited is not None:
+                cur.execute(limited)
+            else:
+                cur.execute(query)
+                if offset:
+                    cur.scroll(offset, mode="relative")
+        description = cur.description
+
+        # fetch: reading the page off the wire into columns
+        with span("db.fetch") as attrs:
+            rows = cur.fetchmany(size=page_size + 1)
+            has_more = len(rows) > page_size
+            result = ColumnarResult.from_rows(description, rows[:page_size])
+            attrs["rows"] = len(result)
+
+        exhausted = limited is not None or not has_more
+        if exhausted:
+            cur.close()
+    except pymysql.err.MySQLError as e:
+        # statement rejected (syntax, unknown column, ...): the connection is
+        # fine once the cursor is closed; a broken one is dropped
+        exhausted = not connection_broken(e) and _close_after_error(cur)
+        raise
+    finally:
+        pool.release(conn, discard=not exhausted)
+
+    return result, has_more
+
+
+def run_sql_page(
+    query: str,
+    offset: int = 0,
+    page_size: int = RESULT_PAGE_SIZE,
+) -> Tuple[List[dict], List[str], bool]:
+    """
+    fetch_sql_page with row dicts: (rows, columns, has_more).
+    """
+    result, has_more = fetch_sql_page(query, offset, page_size)
+    return result.to_records(), result.columns, has_more
+
+
 def run_sql(query: str, limit: int = 500) -> Tuple[List[dict], List[str]]:
     """
     Execute SQL and return (rows, columns).
     Only fetch up to 'limit' rows to avoid huge responses.
     """
-    conn = get_connection()
-    rows: List[dict] = []
-    columns: List[str] = []
+    rows, columns, _ = run_sql_page(query, offset=0, page_size=limit)
+    return rows, columns
+
+
+# pymysql is blocking, so async callers run queries on a dedicated executor
+# sized to the pool: no more threads than there are connections to use.
+_db_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db")
+
+
+async def run_sql_async(query: str, limit: int = 500) -> Tuple[List[dict], List[str]]:
+    """
+    Async wrapper around run_sql that keeps the event loop free while the
+    query runs.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, bind_context(run_sql, query, limit))
+
+
+async def fetch_sql_page_async(
+    query: str,
+    offset: int = 0,
+    page_size: int = RESULT_PAGE_SIZE,
+) -> Tuple[ColumnarResult, bool]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, bind_context(fetch_sql_page, query, offset, page_size))
 
+
+def iter_sql_batches(
+    query: str,
+    batch_size: int = STREAM_ROW_BATCH_SIZE,
+    limit: int = 500,
+) -> Iterator[Tuple[List[str], List[dict]]]:
+    """
+    Execute SQL on an unbuffered cursor and yield (columns, rows) batches of
+    up to batch_size rows, at most `limit` rows in total. The first batch is
+    yielded as soon as the server sends it (columns come from the cursor
+    description, so an empty result still yields its columns once).
+
+    If iteration stops before the result is exhausted, the connection is
+    discarded instead of draining the rest of the result set. So is a
+    connection that failed (see connection_broken); one whose statement was
+    rejected goes back to the pool.
+    """
+    pool = get_pool()
+    with span("db.connect"):
+        conn = pool.acquire()
+    exhausted = False
+    cur = None
     try:
-        with conn.cursor() as cur:
+        cur = conn.cursor(SSDictCursor)
+        with span("db.execute"):
             cur.execute(query)
-            rows = cur.fetchmany(size=limit)  # only first N rows
-            if rows:
-                columns = list(rows[0].keys())
+        columns = [d[0] for d in cur.description or []]
+
+        sent = 0
+        while sent < limit:
+            size = min(batch_size, limit - sent)
+            rows = cur.fetchmany(size=size)
+            # a short batch means the server has no more rows
+            exhausted = len(rows) < size
+            if rows or sent == 0:
+                yield columns, rows
+            sent += len(rows)
+            if exhausted:
+                cur.close()
+                break
+    except pymysql.err.MySQLError as e:
+        exhausted = not connection_broken(e) and _close_after_error(cur)
+        raise
     finally:
-        conn.close()
+        pool.release(conn, discard=not exhausted)
+
+
+async def iter_sql_batches_async(
+    query: str,
+    batch_size: int = STREAM_ROW_BATCH_SIZE,
+    limit: int = 500,
+) -> AsyncIterator[Tuple[List[str], List[dict]]]:
+    """
+    Async variant of iter_sql_batches; each fetch runs on the DB executor.
+    """
+    loop = asyncio.get_running_loop()
+    batches = iter_sql_batches(query, batch_size, limit)
+    done = object()
+    try:
+        while True:
+            batch = await loop.run_in_executor(_db_executor, bind_context(next, batches, done))
+            if batch is done:
+                break
+            yield batch
+    finally:
+        await loop.run_in_executor(_db_executor, batches.close)
 
-    return rows, columns
 
 def read_file(path: str):
     """
@@ -0,0 +1,156 @@
+import heapq
+from typing import Dict, List, Optional, Tuple
+
+
+class JoinGraph:
+    """
+    Foreign-key join graph over the schema dict produced by
+    get_mysql_database_schema (or db_utils.parse_table_descriptions).
+
+    - Every FK is an undirected edge between the two tables.
+    - FK chains on the same column are collapsed into a direct edge too:
+      SalesOrderDetail.ProductID -> SpecialOfferProduct.ProductID ->
+      Product.ProductID means SalesOrderDetail joins Product directly.
+    - Shortest join paths between all pairs of tables are precomputed with
+      one Dijkstra run per table (the schema is small), so lookups are dict
+      reads. Passing *through* a table costs its degree, so paths avoid
+      generic hubs like BusinessEntity/Person (Customer -> Product goes via
+      SalesOrderHeader/SalesOrderDetail, not via the shared ID space of
+      BusinessEntity/ProductVendor).
+    """
+
+    def __init__(self, schema: Dict[str, Dict]):
+        self.tables: List[str] = sorted(schema.keys())
+
+        # table -> neighbour -> [(column, neighbour_column)]
+        self.edges: Dict[str, Dict[str, List[Tuple[str, str]]]] = {t: {} for t in self.tables}
+
+        fk_target: Dict[Tuple[str, str], Tuple[str, str]] = {}
+        for table, info in schema.items():
+            for fk in info.get("foreign_keys", []):
+                fk_target[(table, fk["column"])] = (fk["references_table"], fk["references_column"])
+
+        for (table, column), target in fk_target.items():
+            seen = set()
+            while target is not None and target not in seen and target[0] in self.edges:
+                seen.add(target)
+                self._add_edge(table, column, target[0], target[1])
+                target = fk_target.get(target)
+
+        self._parents: Dict[str, Dict[str, Optional[str]]] = {}
+        self._costs: Dict[str, Dict[str, int]] = {}
+        for t in self.tables:
+            self._parents[t], self._costs[t] = self._dijkstra(t)
+
+    def _add_edge(self, a: str, a_col: str, b: str, b_col: str) -> None:
+        if a == b:
+            return
+        pairs = self.edges[a].setdefault(b, [])
+        if (a_col, b_col) not in pairs:
+            pairs.append((a_col, b_col))
+        back = self.edges[b].setdefault(a, [])
+        if (b_col, a_col) not in back:
+            back.append((b_col, a_col))
+
+    def _dijkstra(self, source: str) -> Tuple[Dict[str, Optional[str]], Dict[str, int]]:
+        parents: Dict[str, Optional[str]] = {source: None}
+        costs: Dict[str, int] = {source: 0}
+        heap = [(0, source)]
+        done = set()
+        while heap:
+            cost, node = heapq.heappop(heap)
+            if node in done:
+                continue
+            done.add(node)
+            step = 1 + (len(self.edges[node]) if node != source else 0)
+            for nb in sorted(self.edges[node]):
+                new_cost = cost + step
+                if nb not in costs or new_cost < costs[nb]:
+                    costs[nb] = new_cost
+                    parents[nb] = node
+                    heapq.heappush(heap, (new_cost, nb))
+        return parents, costs
+
+    def shortest_path(self, a: str, b: str) -> Optional[List[str]]:
+        """
+        Tables on a shortest join path from a to b (inclusive), or None if
+        they are not connected.
+        """
+        parents = self._parents.get(a)
+        if parents is None or b not in parents:
+            return None
+        path = [b]
+        while path[-1] != a:
+            path.append(parents[path[-1]])
+        return list(reversed(path))
+
+    def path_cost(self, a: str, b: str) -> Optional[int]:
+        return self._costs.get(a, {}).get(b)
+
+    def connect(self, tables: List[str]) -> List[str]:
+        """
+        Smallest set of tables (approximately: greedy Steiner tree) that
+        contains all of `tables` and is join-connected.
+
+        Returns the input tables in their original order followed by any
+        bridge tables that had to be added. Unknown tables and tables that
+        cannot be reached are left as they are.
+        """
+        terminals = [t for t in dict.fromkeys(tables) if t in self._parents]
+        if len(terminals) < 2:
+            return list(tables)
+
+        # Prefer the tree that reaches the most terminals: one grown from an
+        # unreachable table is just that table, at cost 0.
+        best: Optional[Tuple[Tuple[int, int, int], List[str]]] = None
+        for start in terminals:
+            cost, tree = self._grow_tree(start, terminals)
+            reached = sum(1 for t in terminals if t in tree)
+            key = (-reached, cost, len(tree))
+            if best is None or key < best[0]:
+                best = (key, tree)
+        best_tree = best[1]
+
+        bridges = [t for t in best_tree if t not in tables]
+        return list(tables) + bridges
+
+    def _grow_tree(self, start: str, terminals: List[str]) -> Tuple[int, List[str]]:
+        # Takahashi-Matsuyama: repeatedly attach the terminal closest to the
+        # current tree via its cheapest path.
+        tree = [start]
+        in_tree = {start}
+        remaining = [t for t in terminals if t != start]
+        total = 0
+
+        while remaining:
+            choice = None
+            for term in remaining:
+                for node in tree:
+                    cost = self.path_cost(node, term)
+                    if cost is not None and (choice is None or cost < choice[0]):
+                        choice = (cost, term, node)
+            if choice is None:
+                break  # the rest is unreachable from this tree
+
+            cost, term, node = choice
+            total += cost
+            for t in self.shortest_path(node, term):
+                if t not in in_tree:
+                    in_tree.add(t)
+                    tree.append(t)
+            remaining.remove(term)
+
+        return total, tree
+
+    def join_conditions(self, tables: List[str]) -> List[str]:
+        """
+        "A.col = B.col" for every FK edge among the given tables.
+        """
+        conds = []
+        members = set(tables)
+        for a in tables:
+            for b, pairs in sorted(self.edges.get(a, {}).items()):
+                if b in members and a < b:
+                    for a_col, b_col in pairs:
+                        conds.append(f"{a}.{a_col} = {b}.{b_col}")
+        return conds
@@ -0,0 +1,346 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+
+# A provider turns a prompt into {"text", "prompt_tokens", "completion_tokens"}.
+# stream_async() yields {"text": chunk} dicts; the chunk carrying the
+# provider's usage report also has "prompt_tokens" / "completion_tokens".
+# `stage` names the pipeline step asking (rewrite, generate_sql, ...); the
+# live SDK providers ignore it, llm_resilience uses it for deadlines.
+
+
+class LLMProvider:
+    """
+    Interface for llm_utils: live SDK clients, and the record / replay
+    wrappers used for offline benchmarks.
+    """
+
+    name = "base"
+    model: Optional[str] = None
+
+    def generate(self, prompt: str, stage: Optional[str] = None) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def generate_async(self, prompt: str, stage: Optional[str] = None) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def stream_async(self, prompt: str, stage: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        # default: one chunk with the whole answer
+        yield await self.generate_async(prompt, stage=stage)
+
+
+def _result(text: Optional[str], prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> Dict[str, Any]:
+    return {
+        "text": (text or "").strip(),
+        "prompt_tokens": prompt_tokens or 0,
+        "completion_tokens": completion_tokens or 0,
+    }
+
+
+# ---------- Live providers ----------
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    def __init__(self, api_key: str, model: str, timeout_s: Optional[float] = None):
+        from google import genai
+        from google.genai import types
+
+        self.model = model
+        http_options = types.HttpOptions(timeout=int(timeout_s * 1000)) if timeout_s else None
+        self.client = genai.Client(api_key=api_key, http_options=http_options)
+        self.config = types.GenerateContentConfig(temperature=0.0)
+
+    @staticmethod
+    def _usage(response) -> Tuple[int, int]:
+        meta = getattr(response, "usage_metadata", None)
+        if meta is None:
+            return 0, 0
+        return meta.prompt_token_count or 0, meta.candidates_token_count or 0
+
+    def generate(self, prompt: str, stage: Optional[str] = None) -> Dict[str, Any]:
+        response = self.client.models.generate_content(model=self.model, contents=[prompt], config=self.config)
+        return _result(response.text, *self._usage(response))
+
+    async def generate_async(self, prompt: str, stage: Optional[str] = None) -> Dict[str, Any]:
+        response = await self.client.aio.models.generate_content(model=self.model, contents=[prompt], config=self.config)
+        return _result(response.text, *self._usage(response))
+
+    async def stream_async(self, prompt: str, stage: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        stream = await self.client.aio.models.generate_content_stream(
+            model=self.model, contents=[prompt], config=self.config
+        )
+        async for chunk in stream:
+            out = {"text": chunk.text or ""}
+            if getattr(chunk, "usage_metadata", None) is not None:
+                out["prompt_tokens"], out["completion_tokens"] = self._usage(chunk)
+            yield out
+
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+
+    def __init__(self, api_key: str, model: str, timeout_s: Optional[float] = None, max_retries: int = 2):
+        from openai import AsyncOpenAI, OpenAI
+
+        self.model = model
+        options = {"max_retries": max_retries}
+        if timeout_s:
+            options["timeout"] = timeout_s
+        self.client = OpenAI(api_key=api_key, **options)
+        self.async_client = AsyncOpenAI(api_key=api_key, **options)
+
+    @staticmethod
+    def _usage(response) -> Tuple[int, int]:
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return 0, 0
+        return usage.prompt_tokens or 0, usage.completion_tokens or 0
+
+    def _request(self, prompt: str) -> Dict[str, Any]:
+        return {"model": self.model, "messages": [{"role": "user", "content": prompt}], "temperature": 0.0}
+
+    def generate(self, prompt: str, stage: Optional[str] = None) -> Dict[str, Any]:
+        response = self.client.chat.completions.create(**self._request(prompt))
+        return _result(response.choices[0].message.content, *self._usage(response))
+
+    async def generate_async(self, prompt: str, stage: Optional[str] = None) -> Dict[str, Any]:
+        response = await self.async_client.chat.completions.create(**self._request(prompt))
+        return _result(response.choices[0].message.content, *self._usage(response))
+
+    async def stream_async(self, prompt: str, stage: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        stream = await self.async_client.chat.completions.create(
+            **self._request(prompt), stream=True, stream_options={"include_usage": True}
+        )
+        async for chunk in stream:
+            out = {"text": (chunk.choices[0].delta.content or "") if chunk.choices else ""}
+            if getattr(chunk, "usage", None) is not None:
+                out["prompt_tokens"], out["completion_tokens"] = self._usage(chunk)
+            yield out
+
+
+# ---------- Cassettes (record / replay) ----------
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    Recorded LLM answers, one JSON line per prompt:
+    {"prompt_hash", "text", "prompt_tokens", "completion_tokens",
+     "latency_s", "provider", "model", "prompt_preview"}.
+    Append-only; a prompt recorded twice keeps the last answer. Prompts
+    include the schema text, so one cassette matches one schema format and
+    prompt version (and should hold one model's answers).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        entry = json.loads(line)
+                        self.entries[entry["prompt_hash"]] = entry
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, prompt: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(prompt_hash(prompt))
+
+    def put(self, prompt: str, result: Dict[str, Any], latency_s: float, provider: str, model: Optional[str]) -> None:
+        entry = {
+            "prompt_hash": prompt_hash(prompt),
+            "text": result["text"],
+            "prompt_tokens": result["prompt_tokens"],
+            "completion_tokens": result["completion_tokens"],
+            "latency_s": round(latency_s, 4),
+            "provider": provider,
+            "model": model,
+            "prompt_preview": prompt[:200],
+        }
+        with self._lock:
+            self.entries[entry["prompt_hash"]] = entry
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class RecordingProvider(LLMProvider):
+    """
+    Pass-through to a live provider that writes every answer (and how long
+    it took) to the cassette.
+    """
+
+    name = "record"
+
+    def __init__(self, inner: LLMProvider, cassette: Cassette):
+        self.inner = inner
+        self.cassette = cassette
+        self.model = inner.model
+
+    def generate(self, prompt: str, stage: Optional[str] = None) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        result = self.inner.generate(prompt, stage=stage)
+        self.cassette.put(prompt, result, time.perf_counter() - t0, self.inner.name, self.model)
+        return result
+
+    async def generate_async(self, prompt: str, stage: Optional[str] = None) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        result = await self.inner.generate_async(prompt, stage=stage)
+        self.cassette.put(prompt, result, time.perf_counter() - t0, self.inner.name, self.model)
+        return result
+
+    async def stream_async(self, prompt: str, stage: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        t0 = time.perf_counter()
+        parts, usage = [], {}
+        async for chunk in self.inner.stream_async(prompt, stage=stage):
+            parts.append(chunk["text"])
+            usage.update({k: v for k, v in chunk.items() if k != "text"})
+            yield chunk
+        result = _result("".join(parts), usage.get("prompt_tokens"), usage.get("completion_tokens"))
+        self.cassette.put(prompt, result, time.perf_counter() - t0, self.inner.name, self.model)
+
+
+class LatencyModel:
+    """
+    Simulated call latency for replay, from a spec string:
+
+    - "none"                 answer immediately
+    - "recorded"             the latency measured when recording
+    - "fixed:S"              S seconds
+    - "uniform:LO,HI"        uniform between LO and HI seconds
+    - "normal:MEAN,SD"       normal, clipped at 0
+    - "lognormal:MEDIAN,SIGMA"  lognormal with that median (long tail,
+                             closest to real API latency)
+
+    "xK" after any spec (e.g. "recorded x0.5") scales it. Draws come from
+    one seeded generator, so a single-threaded run is reproducible.
+    """
+
+    _SPEC = re.compile(r"^\s*(\w+)(?::([\d.,\s]+))?\s*(?:x\s*([\d.]+))?\s*$")
+
+    def __init__(self, spec: str = "none", seed: Optional[int] = 0):
+        m = self._SPEC.match(spec or "none")
+        if not m:
+            raise ValueError(f"Invalid latency spec: {spec!r}")
+        self.spec = spec
+        self.kind = m.group(1)
+        self.params = [float(p) for p in (m.group(2) or "").split(",") if p.strip()]
+        self.scale = float(m.group(3)) if m.group(3) else 1.0
+        expected = {"none": 0, "recorded": 0, "fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if self.kind not in expected or len(self.params) != expected[self.kind]:
+            raise ValueError(f"Invalid latency spec: {spec!r}")
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self, recorded_s: Optional[float] = None) -> float:
+        p = self.params
+        with self._lock:
+            if self.kind == "none":
+                s = 0.0
+            elif self.kind == "recorded":
+                s = recorded_s or 0.0
+            elif self.kind == "fixed":
+                s = p[0]
+            elif self.kind == "uniform":
+                s = self._rng.uniform(p[0], p[1])
+            elif self.kind == "normal":
+                s = max(0.0, self._rng.gauss(p[0], p[1]))
+            else:
+                s = self._rng.lognormvariate(math.log(p[0]), p[1])
+        return s * self.scale
+
+
+class ReplayProvider(LLMProvider):
+    """
+    Answers from a cassette, with no network and no API key. A prompt that
+    was never recorded raises (the pipeline treats it like a failed call).
+    Latency is simulated with time.sleep / asyncio.sleep, so concurrency
+    behaves like a real provider: sync calls hold their thread, async calls
+    free the event loop.
+    """
+
+    name = "replay"
+
+    def __init__(self, cassette: Cassette, latency: Optional[LatencyModel] = None, stream_chunk_chars: int = 16):
+        self.cassette = cassette
+        self.latency = latency or LatencyModel("none")
+        self.stream_chunk_chars = stream_chunk_chars
+        models = {e.get("model") for e in cassette.entries.values()}
+        self.model = models.pop() if len(models) == 1 else None
+        self.counts = {"hits": 0, "misses": 0}
+        self._counts_lock = threading.Lock()
+
+    def _lookup(self, prompt: str) -> Tuple[Dict[str, Any], float]:
+        entry = self.cassette.get(prompt)
+        with self._counts_lock:
+            self.counts["hits" if entry is not None else "misses"] += 1
+        if entry is None:
+            raise RuntimeError(
+                f"No recorded LLM answer for prompt {prompt_hash(prompt)[:12]} in {self.cassette.path} "
+                "(record it with LLM_MODE=record)"
+            )
+        return _result(entry["text"], entry["prompt_tokens"], entry["completion_tokens"]), self.latency.sample(
+            entry.get("latency_s")
+        )
+
+    def generate(self, prompt: str, stage: Optional[str] = None) -> Dict[str, Any]:
+        result, delay = self._lookup(prompt)
+        if delay:
+            time.sleep(delay)
+        return result
+
+    async def generate_async(self, prompt: str, stage: Optional[str] = None) -> Dict[str, Any]:
+        result, delay = self._lookup(prompt)
+        if delay:
+            await asyncio.sleep(delay)
+        return result
+
+    async def stream_async(self, prompt: str, stage: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        # the delay is spread over the chunks, like tokens arriving
+        result, delay = self._lookup(prompt)
+        text, n = result["text"], self.stream_chunk_chars
+        chunks = [text[i : i + n] for i in range(0, len(text), n)] or [""]
+        for i, chunk in enumerate(chunks):
+            if delay:
+                await asyncio.sleep(delay / len(chunks))
+            out = {"text": chunk}
+            if i == len(chunks) - 1:
+                out["prompt_tokens"], out["completion_tokens"] = result["prompt_tokens"], result["completion_tokens"]
+            yield out
+
+
+def live_providers(
+    gemini_api_key: Optional[str],
+    openai_api_key: Optional[str],
+    gemini_model: str,
+    openai_model: str,
+    timeout_s: Optional[float] = None,
+    sdk_retries: bool = True,
+) -> List[LLMProvider]:
+    """
+    Every provider with a key, Gemini first. timeout_s caps each HTTP
+    request; sdk_retries=False turns off the OpenAI SDK's own retries (for
+    when llm_resilience retries instead).
+    """
+    providers: List[LLMProvider] = []
+    if gemini_api_key:
+        providers.append(GeminiProvider(gemini_api_key, gemini_model, timeout_s))
+    if openai_api_key:
+        providers.append(OpenAIProvider(openai_api_key, openai_model, timeout_s, max_retries=2 if sdk_retries else 0))
+    return providers
+
@@ -0,0 +1,496 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Sequence, Set, Tuple
+
+from config import (
+    LLM_BREAKER_COOLDOWN_S,
+    LLM_BREAKER_FAILURES,
+    LLM_DEFAULT_DEADLINE_S,
+    LLM_HEDGE_ENABLED,
+    LLM_HEDGE_MIN_DELAY_S,
+    LLM_HEDGE_MIN_SAMPLES,
+    LLM_HEDGE_QUANTILE,
+    LLM_MAX_ATTEMPTS,
+    LLM_RETRY_BACKOFF_S,
+    LLM_STAGE_DEADLINES_S,
+)
+from llm_providers import LLMProvider
+from llm_router import ModelRouter
+from telemetry import LLM_EVENTS
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """
+    The stage's deadline ran out before any provider answered.
+    """
+
+
+class LLMUnavailable(RuntimeError):
+    """
+    Every provider's circuit breaker is open.
+    """
+
+
+_RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# SDK / httpx exception classes (matched by name anywhere in the MRO, so
+# neither SDK has to be importable here)
+_RETRYABLE_TYPES = {"APIConnectionError", "APITimeoutError", "TransportError", "TimeoutException", "ServerError"}
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    Timeouts, dropped connections, rate limits and 5xx; not bad requests,
+    auth errors or unparseable answers.
+    """
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    status = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    if isinstance(status, int) and status in _RETRYABLE_STATUS:
+        return True
+    return any(cls.__name__ in _RETRYABLE_TYPES for cls in type(exc).__mro__)
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures; open
+    rejects calls for `cooldown_s`, then lets one probe through
+    (half-open): success closes it, failure opens it again.
+
+    allow() hands out a ticket ("call" or "probe") that goes back with the
+    outcome. While not closed, only the probe's outcome counts; calls that
+    started before the breaker opened and finish later are ignored, so one
+    straggler can't reopen or close it.
+    """
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES, cooldown_s: float = LLM_BREAKER_COOLDOWN_S):
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.state = "closed"
+        self.failures = 0
+        self.opens = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> Optional[str]:
+        """
+        "call" or "probe" when a call may go ahead, None when rejected.
+        """
+        with self._lock:
+            if self.state == "closed":
+                return "call"
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown_s:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return "probe"
+            return None
+
+    def _counts(self, ticket: str) -> bool:
+        return self.state == "closed" or (ticket == "probe" and self.state == "half_open")
+
+    def record_success(self, ticket: str) -> None:
+        with self._lock:
+            if self._counts(ticket):
+                self.state = "closed"
+                self.failures = 0
+                self._probing = False
+
+    def record_failure(self, ticket: str) -> bool:
+        """
+        Count a failure; True when it opened the breaker.
+        """
+        with self._lock:
+            if not self._counts(ticket):
+                return False
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._probing = False
+                self.opens += 1
+                return True
+            return False
+
+    def release(self, ticket: str) -> None:
+        """
+        The call was abandoned (cancelled) without an outcome; a probe slot
+        is handed to the next call.
+        """
+        with self._lock:
+            if ticket == "probe" and self.state == "half_open":
+                self._probing = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures, "opens": self.opens}
+
+
+class LatencyTracker:
+    """
+    Recent successful call latencies per (provider, stage), for the hedge
+    delay.
+    """
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[Tuple[int, str], Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: Tuple[int, str], seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def quantile(self, key: Tuple[int, str], q: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < max(1, min_samples):
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class ResilientProvider(LLMProvider):
+    """
+    Wraps one or more providers (in order of preference) with:
+
+    - a deadline per stage (LLM_STAGE_DEADLINES_S) for the whole call,
+      retries and hedges included
+    - up to `max_attempts` attempts on retryable errors, with full-jitter
+      backoff; a retry goes to a provider that hasn't failed this call if
+      there is one (immediate failover)
+    - hedging: once a provider has `hedge_min_samples` latencies for the
+      stage, an attempt still unanswered after their `hedge_quantile` gets a
+      second identical request, and the first answer wins
+    - a circuit breaker per provider, so a degraded provider is skipped
+      (traffic fails over) until a probe call succeeds again
+    - with a `router` (llm_router.ModelRouter), the providers to try and
+      their order come from it per stage instead of `providers` order
+
+    A timed-out sync call can't be interrupted; its thread finishes in the
+    background (bounded by the SDK's own request timeout). Async losers
+    are cancelled. Streams are retried / failed over only until their
+    first chunk arrives, and are never hedged.
+    """
+
+    def __init__(
+        self,
+        providers: Sequence[LLMProvider],
+        stage_deadlines_s: Optional[Dict[str, float]] = None,
+        default_deadline_s: float = LLM_DEFAULT_DEADLINE_S,
+        max_attempts: int = LLM_MAX_ATTEMPTS,
+        backoff_s: Tuple[float, float] = LLM_RETRY_BACKOFF_S,
+        hedge: bool = LLM_HEDGE_ENABLED,
+        hedge_quantile: float = LLM_HEDGE_QUANTILE,
+        hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+        hedge_min_delay_s: float = LLM_HEDGE_MIN_DELAY_S,
+        breaker_failures: int = LLM_BREAKER_FAILURES,
+        breaker_cooldown_s: float = LLM_BREAKER_COOLDOWN_S,
+        router: Optional[ModelRouter] = None,
+        seed: Optional[int] = None,
+    ):
+        if not providers:
+            raise ValueError("ResilientProvider needs at least one provider")
+        self.providers: List[LLMProvider] = list(providers)
+        self.inner = self.providers[0]
+        self.name = self.inner.name
+        self.model = self.inner.model
+        self.stage_deadlines_s = dict(LLM_STAGE_DEADLINES_S if stage_deadlines_s is None else stage_deadlines_s)
+        self.default_deadline_s = default_deadline_s
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_s = backoff_s
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay_s = hedge_min_delay_s
+        self.breakers = [CircuitBreaker(breaker_failures, breaker_cooldown_s) for _ in self.providers]
+        self.router = router
+        self.latencies = LatencyTracker()
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-call")
+        self.counts = {
+            "calls": 0,
+            "attempts": 0,
+            "retries": 0,
+            "timeouts": 0,
+            "errors": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "failovers": 0,
+            "breaker_opens": 0,
+            "rejected": 0,
+        }
+        self._counts_lock = threading.Lock()
+
+    # ---------- Policy ----------
+
+    def deadline_for(self, stage: Optional[str]) -> float:
+        return self.stage_deadlines_s.get(stage or "", self.default_deadline_s)
+
+    def _count(self, event: str, i: Optional[int] = None) -> None:
+        with self._counts_lock:
+            self.counts[event] += 1
+        if event not in ("calls", "attempts"):
+            LLM_EVENTS.inc(event=event, provider=self.providers[i].name if i is not None else "")
+
+    def _pick(self, failed: Set[int], stage: Optional[str]) -> Tuple[Optional[int], Optional[str]]:
+        order = self.router.order(stage) if self.router is not None else list(range(len(self.providers)))
+        # providers that haven't failed this call first, in preference order
+        for i in sorted(order, key=lambda i: i in failed):
+            ticket = self.breakers[i].allow()
+            if ticket is not None:
+                if i != order[0]:
+                    self._count("failovers", i)
+                return i, ticket
+        return None, None
+
+    def _backoff(self, retry: int) -> float:
+        base, cap = self.backoff_s
+        with self._rng_lock:
+            return self._rng.uniform(0, min(cap, base * 2 ** retry))
+
+    def hedge_delay(self, i: int, stage: Optional[str]) -> Optional[float]:
+        if not self.hedge:
+            return None
+        q = self.latencies.quantile((i, stage or ""), self.hedge_quantile, self.hedge_min_samples)
+        return None if q is None else max(q, self.hedge_min_delay_s)
+
+    def _succeeded(self, i: int, ticket: str, stage: Optional[str], seconds: float) -> None:
+        self.breakers[i].record_success(ticket)
+        self.latencies.record((i, stage or ""), seconds)
+        if self.router is not None:
+            self.router.record(i, stage, seconds)
+
+    def _failed(self, i: int, ticket: str, stage: Optional[str], exc: BaseException) -> None:
+        self._count("timeouts" if isinstance(exc, TimeoutError) else "errors", i)
+        if not is_retryable(exc):
+            # the provider answered (it rejected the prompt), so it's healthy
+            self.breakers[i].record_success(ticket)
+            return
+        if self.router is not None:
+            self.router.record(i, stage, None)
+        if self.breakers[i].record_failure(ticket):
+            self._count("breaker_opens", i)
+            print(f"LLM circuit breaker opened for {self.providers[i].name}: {exc!r}")
+
+    def _deadline_error(self, stage: Optional[str], last_error: Optional[BaseException]) -> BaseException:
+        """
+        The deadline ran out (in an attempt or while backing off); the last
+        attempt's error is kept as the cause.
+        """
+        error = LLMDeadlineExceeded(
+            f"LLM call for stage {stage or 'direct'!r} exceeded its {self.deadline_for(stage)}s deadline"
+            + (f" (last error: {last_error!r})" if last_error is not None else "")
+        )
+        error.__cause__ = last_error
+        return error
+
+    def _exhausted(self, stage: Optional[str], deadline: float, last_error: BaseException) -> BaseException:
+        # every attempt failed; a timed-out last attempt used up the deadline
+        if time.monotonic() >= deadline:
+            return self._deadline_error(stage, last_error)
+        return last_error
+
+    def _unavailable(self, last_error: Optional[BaseException]) -> BaseException:
+        self._count("rejected")
+        if last_error is not None:
+            return last_error
+        names = ", ".join(p.name for p in self.providers)
+        return LLMUnavailable(f"All LLM providers are unavailable (circuit open): {names}")
+
+    # ---------- Sync ----------
+
+    def _attempt(self, i: int, prompt: str, stage: Optional[str], timeout_s: float) -> Dict[str, Any]:
+        provider = self.providers[i]
+        end = time.monotonic() + timeout_s
+        futures = [self._executor.submit(provider.generate, prompt, stage)]
+        delay = self.hedge_delay(i, stage)
+        if delay is not None and delay < timeout_s:
+            done, _ = wait(futures, timeout=delay)
+            if not done:
+                self._count("hedges", i)
+                futures.append(self._executor.submit(provider.generate, prompt, stage))
+
+        pending, error = set(futures), None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, end - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f"{provider.name} did not answer within {timeout_s:.1f}s")
+            for future in done:
+                if future.exception() is None:
+                    if future is not futures[0]:
+                        self._count("hedge_wins", i)
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    def generate(self, prompt: str, stage: Optional[str] = None) -> Dict[str, Any]:
+        self._count("calls")
+        deadline = time.monotonic() + self.deadline_for(stage)
+        failed: Set[int] = set()
+        last_error: Optional[BaseException] = None
+        for attempt in range(self.max_attempts):
+            if attempt:
+                self._count("retries")
+                time.sleep(min(self._backoff(attempt - 1), max(0.0, deadline - time.monotonic())))
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise self._deadline_error(stage, last_error)
+            i, ticket = self._pick(failed, stage)
+            if i is None:
+                raise self._unavailable(last_error)
+            self._count("attempts")
+            t0 = time.perf_counter()
+            try:
+                result = self._attempt(i, prompt, stage, remaining)
+            except Exception as e:
+                self._failed(i, ticket, stage, e)
+                if not is_retryable(e):
+                    raise
+                failed.add(i)
+                last_error = e
+                continue
+            except BaseException:
+                self.breakers[i].release(ticket)
+                raise
+            self._succeeded(i, ticket, stage, time.perf_counter() - t0)
+            return result
+        raise self._exhausted(stage, deadline, last_error)
+
+    # ---------- Async ----------
+
+    async def _attempt_async(self, i: int, prompt: str, stage: Optional[str], timeout_s: float) -> Dict[str, Any]:
+        provider = self.providers[i]
+        end = time.monotonic() + timeout_s
+        tasks = [asyncio.ensure_future(provider.generate_async(prompt, stage=stage))]
+        try:
+            delay = self.hedge_delay(i, stage)
+            if delay is not None and delay < timeout_s:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    self._count("hedges", i)
+                    tasks.append(asyncio.ensure_future(provider.generate_async(prompt, stage=stage)))
+
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, end - time.monotonic()), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise TimeoutError(f"{provider.name} did not answer within {timeout_s:.1f}s")
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self._count("hedge_wins", i)
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def generate_async(self, prompt: str, stage: Optional[str] = None) -> Dict[str, Any]:
+        self._count("calls")
+        deadline = time.monotonic() + self.deadline_for(stage)
+        failed: Set[int] = set()
+        last_error: Optional[BaseException] = None
+        for attempt in range(self.max_attempts):
+            if attempt:
+                self._count("retries")
+                await asyncio.sleep(min(self._backoff(attempt - 1), max(0.0, deadline - time.monotonic())))
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise self._deadline_error(stage, last_error)
+            i, ticket = self._pick(failed, stage)
+            if i is None:
+                raise self._unavailable(last_error)
+            self._count("attempts")
+            t0 = time.perf_counter()
+            try:
+                result = await self._attempt_async(i, prompt, stage, remaining)
+            except Exception as e:
+                self._failed(i, ticket, stage, e)
+                if not is_retryable(e):
+                    raise
+                failed.add(i)
+                last_error = e
+                continue
+            except BaseException:
+                self.breakers[i].release(ticket)
+                raise
+            self._succeeded(i, ticket, stage, time.perf_counter() - t0)
+            return result
+        raise self._exhausted(stage, deadline, last_error)
+
+    async def stream_async(self, prompt: str, stage: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        self._count("calls")
+        deadline = time.monotonic() + self.deadline_for(stage)
+        failed: Set[int] = set()
+        last_error: Optional[BaseException] = None
+        for attempt in range(self.max_attempts):
+            if attempt:
+                self._count("retries")
+                await asyncio.sleep(min(self._backoff(attempt - 1), max(0.0, deadline - time.monotonic())))
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise self._deadline_error(stage, last_error)
+            i, ticket = self._pick(failed, stage)
+            if i is None:
+                raise self._unavailable(last_error)
+            self._count("attempts")
+            t0 = time.perf_counter()
+            stream = self.providers[i].stream_async(prompt, stage=stage)
+            try:
+                # the deadline covers the time to the first chunk
+                first = await asyncio.wait_for(stream.__anext__(), remaining)
+            except StopAsyncIteration:
+                self._succeeded(i, ticket, stage, time.perf_counter() - t0)
+                return
+            except Exception as e:
+                await stream.aclose()
+                if isinstance(e, asyncio.TimeoutError):
+                    e = TimeoutError(f"{self.providers[i].name} sent nothing within {remaining:.1f}s")
+                self._failed(i, ticket, stage, e)
+                if not is_retryable(e):
+                    raise e
+                failed.add(i)
+                last_error = e
+                continue
+            except BaseException:
+                self.breakers[i].release(ticket)
+                raise
+
+            try:
+                yield first
+                async for chunk in stream:
+                    yield chunk
+            except Exception as e:
+                self._failed(i, ticket, stage, e)
+                raise
+            except BaseException:
+                # consumer stopped reading; the provider was streaming fine
+                self._succeeded(i, ticket, stage, time.perf_counter() - t0)
+                raise
+            self._succeeded(i, ticket, stage, time.perf_counter() - t0)
+            return
+        raise self._exhausted(stage, deadline, last_error)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._counts_lock:
+            counts = dict(self.counts)
+        return {
+            **counts,
+            "providers": [
+                {"provider": p.name, "model": p.model, **breaker.snapshot()}
+                for p, breaker in zip(self.providers, self.breakers)
+            ],
+            "routing": self.router.stats() if self.router is not None else None,
+        }
@@ -0,0 +1,292 @@
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+from config import (
+    LLM_ROUTING,
+    LLM_ROUTING_ACCURACY_FLOOR,
+    LLM_ROUTING_ACCURACY_PATH,
+    LLM_ROUTING_EXPLORE,
+    LLM_ROUTING_MAX_ERROR_RATE,
+    LLM_ROUTING_MIN_SAMPLES,
+    LLM_ROUTING_MODES,
+    LLM_ROUTING_WINDOW_S,
+)
+from llm_providers import GeminiProvider, LLMProvider, OpenAIProvider
+
+# how often the accuracy file's mtime is checked for a newer eval result
+_ACCURACY_RELOAD_S = 30
+
+
+def target_name(provider: LLMProvider) -> str:
+    return f"{provider.name}:{provider.model}"
+
+
+def parse_target(spec: str) -> Tuple[str, str]:
+    provider, sep, model = spec.partition(":")
+    if not sep or provider not in ("gemini", "openai") or not model:
+        raise ValueError(f"Invalid LLM route {spec!r}; expected 'gemini:<model>' or 'openai:<model>'")
+    return provider, model
+
+
+def load_accuracy(path: str) -> Dict[str, float]:
+    """
+    {"provider:model": accuracy} from the file evaluation.run writes
+    ({"provider:model": {"accuracy", "metric", "n", ...}}).
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {k: v["accuracy"] for k, v in data.items() if isinstance(v, dict) and v.get("accuracy") is not None}
+
+
+class ModelRouter:
+    """
+    Chooses the order in which a stage's candidate models are tried (for
+    ResilientProvider, which still skips open breakers and fails over
+    down the list).
+
+    Per (model, stage) it keeps the outcomes of recent calls (latency, or
+    a failure) for `window_s`. "adaptive" puts first the candidate with
+    the lowest median latency among those that are healthy (error rate at
+    most max_error_rate) and meet the eval accuracy floor; a model with
+    fewer than min_samples recent calls is tried first so it gets
+    measured, and `explore` of the calls go to a random eligible model so
+    numbers stay current. Old history expires, so a model that was
+    dropped for errors is retried once its window has passed.
+    """
+
+    def __init__(
+        self,
+        targets: Sequence[str],
+        routes: Dict[str, List[int]],
+        default_route: List[int],
+        mode: str = LLM_ROUTING,
+        window_s: float = LLM_ROUTING_WINDOW_S,
+        min_samples: int = LLM_ROUTING_MIN_SAMPLES,
+        explore: float = LLM_ROUTING_EXPLORE,
+        max_error_rate: float = LLM_ROUTING_MAX_ERROR_RATE,
+        accuracy_floor: float = LLM_ROUTING_ACCURACY_FLOOR,
+        accuracy_path: Optional[str] = LLM_ROUTING_ACCURACY_PATH,
+        seed: Optional[int] = None,
+    ):
+        if mode not in LLM_ROUTING_MODES:
+            raise ValueError(f"Unknown LLM routing {mode!r}; expected one of {LLM_ROUTING_MODES}")
+        self.targets = list(targets)
+        self.routes = routes
+        self.default_route = default_route
+        self.mode = mode
+        self.window_s = window_s
+        self.min_samples = min_samples
+        self.explore = explore
+        self.max_error_rate = max_error_rate
+        self.accuracy_floor = accuracy_floor
+        self.accuracy_path = accuracy_path
+        self._accuracy: Dict[str, float] = {}
+        self._accuracy_mtime: Optional[float] = None
+        self._accuracy_checked = 0.0
+        # (target index, stage) -> deque of (timestamp, latency_s or None for a failure)
+        self._history: Dict[Tuple[int, str], Deque[Tuple[float, Optional[float]]]] = {}
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._warned_floor = set()
+
+    def candidates(self, stage: Optional[str]) -> List[int]:
+        return self.routes.get(stage or "", self.default_route)
+
+    # ---------- Measurements ----------
+
+    def record(self, i: int, stage: Optional[str], latency_s: Optional[float]) -> None:
+        """
+        A finished call: its latency, or None when it failed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            history = self._history.setdefault((i, stage or ""), deque())
+            history.append((now, latency_s))
+            self._expire(history, now)
+
+    def _expire(self, history: Deque, now: float) -> None:
+        while history and now - history[0][0] > self.window_s:
+            history.popleft()
+
+    def _window(self, i: int, stage: Optional[str]) -> List[Optional[float]]:
+        now = time.monotonic()
+        with self._lock:
+            history = self._history.get((i, stage or ""))
+            if not history:
+                return []
+            self._expire(history, now)
+            return [latency for _, latency in history]
+
+    @staticmethod
+    def _summary(window: List[Optional[float]]) -> Dict[str, Any]:
+        latencies = sorted(x for x in window if x is not None)
+        return {
+            "calls": len(window),
+            "error_rate": round(1 - len(latencies) / len(window), 3) if window else None,
+            "p50_s": round(latencies[len(latencies) // 2], 3) if latencies else None,
+        }
+
+    def accuracy(self, target: str) -> Optional[float]:
+        now = time.monotonic()
+        with self._lock:
+            # one caller per reload interval checks the file
+            reload = bool(self.accuracy_path) and now - self._accuracy_checked >= _ACCURACY_RELOAD_S
+            if reload:
+                self._accuracy_checked = now
+        if reload:
+            try:
+                mtime = os.path.getmtime(self.accuracy_path)
+            except OSError:
+                mtime = None
+            if mtime != self._accuracy_mtime:
+                try:
+                    accuracy = load_accuracy(self.accuracy_path)
+                except Exception as e:
+                    accuracy = None
+                    print(f"Could not read {self.accuracy_path}: {e}")
+                with self._lock:
+                    self._accuracy_mtime = mtime
+                    if accuracy is not None:
+                        self._accuracy = accuracy
+        with self._lock:
+            return self._accuracy.get(target)
+
+    def _meets_floor(self, i: int) -> bool:
+        if self.accuracy_floor <= 0:
+            return True
+        accuracy = self.accuracy(self.targets[i])
+        return accuracy is not None and accuracy >= self.accuracy_floor
+
+    # ---------- Routing ----------
+
+    def order(self, stage: Optional[str], explore: bool = True) -> List[int]:
+        """
+        Candidate indexes for a stage, preferred first.
+        """
+        candidates = self.candidates(stage)
+        if self.mode == "static" or len(candidates) < 2:
+            return candidates
+
+        eligible, unmeasured, latency = [], [], {}
+        for i in candidates:
+            if not self._meets_floor(i):
+                continue
+            summary = self._summary(self._window(i, stage))
+            if summary["calls"] < self.min_samples:
+                unmeasured.append(i)
+            elif summary["error_rate"] <= self.max_error_rate and summary["p50_s"] is not None:
+                latency[i] = summary["p50_s"]
+            else:
+                continue
+            eligible.append(i)
+
+        if not eligible:
+            with self._lock:
+                warn = stage not in self._warned_floor
+                self._warned_floor.add(stage)
+            if warn:
+                print(f"No model for stage {stage!r} is healthy and meets the accuracy floor; using the configured order")
+            return candidates
+
+        roll, pick = 1.0, None
+        if explore:
+            with self._lock:
+                roll = self._rng.random()
+                pick = self._rng.choice(eligible)
+        if unmeasured:
+            best = unmeasured[0]
+        elif explore and roll < self.explore:
+            best = pick
+        else:
+            best = min(eligible, key=lambda i: latency[i])
+        return [best] + [i for i in candidates if i != best]
+
+    def current(self) -> Dict[str, str]:
+        """
+        The model each routed stage would use next (first choice, ignoring
+        exploration).
+        """
+        stages = sorted(self.routes) + ["default"]
+        return {stage: self.targets[self.order(stage if stage != "default" else None, explore=False)[0]] for stage in stages}
+
+    def stats(self) -> Dict[str, Any]:
+        models: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            keys = list(self._history)
+        for i, stage in sorted(keys):
+            summary = self._summary(self._window(i, stage))
+            if summary["calls"]:
+                models.setdefault(self.targets[i], {})[stage or "default"] = summary
+        return {
+            "mode": self.mode,
+            "routes": {stage: [self.targets[i] for i in route] for stage, route in self.routes.items()},
+            "default_route": [self.targets[i] for i in self.default_route],
+            "accuracy_floor": self.accuracy_floor,
+            "accuracy": {t: self.accuracy(t) for t in self.targets},
+            "models": models,
+        }
+
+
+def routed_providers(
+    stage_routes: Dict[str, List[str]],
+    pin: Optional[str],
+    api_keys: Dict[str, Optional[str]],
+    default_models: Dict[str, str],
+    timeout_s: Optional[float] = None,
+    sdk_retries: bool = True,
+    mode: str = LLM_ROUTING,
+) -> Tuple[List[LLMProvider], Optional[ModelRouter]]:
+    """
+    One provider per distinct "provider:model" in the routes (plus the
+    defaults), and the router over them. Targets whose provider has no API
+    key are left out. ([], None) when nothing is routable.
+    """
+    def build(provider: str, model: str) -> Optional[LLMProvider]:
+        key = api_keys.get(provider)
+        if not key:
+            return None
+        if provider == "gemini":
+            return GeminiProvider(key, model, timeout_s)
+        return OpenAIProvider(key, model, timeout_s, max_retries=2 if sdk_retries else 0)
+
+    providers: List[LLMProvider] = []
+    index: Dict[str, int] = {}
+
+    def resolve(specs: List[str]) -> List[int]:
+        route = []
+        for spec in specs:
+            provider, model = parse_target(spec)
+            name = f"{provider}:{model}"
+            if name not in index:
+                built = build(provider, model)
+                if built is None:
+                    print(f"LLM route {name} skipped: no API key for {provider}")
+                    continue
+                index[name] = len(providers)
+                providers.append(built)
+            if index[name] not in route:
+                route.append(index[name])
+        return route
+
+    if pin:
+        pinned = resolve([pin])
+        if not pinned:
+            return [], None
+        return providers, ModelRouter([target_name(p) for p in providers], {}, pinned, mode="static")
+
+    default_route = resolve([f"{p}:{m}" for p, m in default_models.items() if api_keys.get(p)])
+    routes = {}
+    for stage, specs in stage_routes.items():
+        route = resolve(specs)
+        if route:
+            routes[stage] = route
+    if not providers:
+        return [], None
+    return providers, ModelRouter([target_name(p) for p in providers], routes, default_route or [0], mode=mode)
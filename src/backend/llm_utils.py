@@ -1,65 +1,228 @@
 import json
 import os
-from typing import List
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
 
 from dotenv import load_dotenv
 load_dotenv()
 
 from prompt_templates import (
     RELEVANT_TABLES_PROMPT_TEMPLATE,
+    RELEVANT_TABLES_BATCH_PROMPT_TEMPLATE,
     SQL_QUERY_PROMPT_TEMPLATE,
-    QUERY_REWRITE_PROMPT_TEMPLATE
+    SQL_REPAIR_PROMPT_TEMPLATE,
+    QUERY_REWRITE_PROMPT_TEMPLATE,
+    REWRITE_AND_SELECT_PROMPT_TEMPLATE,
+    FUSED_PIPELINE_PROMPT_TEMPLATE,
 )
 
+from config import (
+    LLM_CASSETTE_PATH,
+    LLM_DEFAULT_DEADLINE_S,
+    LLM_FAILOVER_ENABLED,
+    LLM_MODE,
+    LLM_MODES,
+    LLM_REPLAY_LATENCY,
+    LLM_REPLAY_SEED,
+    LLM_RESILIENCE_ENABLED,
+    LLM_ROUTE_PIN,
+    LLM_STAGE_DEADLINES_S,
+    LLM_STAGE_ROUTES,
+)
+from llm_providers import Cassette, LatencyModel, LLMProvider, RecordingProvider, ReplayProvider, live_providers
+from llm_resilience import ResilientProvider
+from llm_router import routed_providers
+from telemetry import LLM_SECONDS, LLM_TOKENS, current_span, record_span, span
+
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 
-LLM_PROVIDER = None
-client = None
 
-if GEMINI_API_KEY:
-    from google import genai
-    from google.genai import types
+def create_provider(
+    mode: str = LLM_MODE,
+    cassette_path: str = LLM_CASSETTE_PATH,
+    latency: str = LLM_REPLAY_LATENCY,
+    resilient: bool = LLM_RESILIENCE_ENABLED,
+) -> Optional[LLMProvider]:
+    """
+    Provider for a mode in LLM_MODES. None in live / record mode when
+    neither GEMINI_API_KEY nor OPENAI_API_KEY is set. Live calls go through
+    a ResilientProvider unless resilient=False (replay never does); with
+    LLM_STAGE_ROUTES or LLM_ROUTE_PIN set, it picks the model per stage.
+    """
+    if mode not in LLM_MODES:
+        raise ValueError(f"Unknown LLM mode {mode!r}; expected one of {LLM_MODES}")
+    if mode == "replay":
+        return ReplayProvider(Cassette(cassette_path), LatencyModel(latency, seed=LLM_REPLAY_SEED))
+
+    # each HTTP request is capped at the longest stage deadline, so an
+    # abandoned sync call can't hold its thread forever
+    timeout_s = max([LLM_DEFAULT_DEADLINE_S, *LLM_STAGE_DEADLINES_S.values()]) if resilient else None
+    routed = bool(LLM_STAGE_ROUTES or LLM_ROUTE_PIN)
+    if routed and not resilient:
+        print("LLM_STAGE_ROUTES / LLM_ROUTE_PIN need LLM_RESILIENCE_ENABLED; ignoring the routes")
+    if routed and resilient:
+        providers, router = routed_providers(
+            LLM_STAGE_ROUTES,
+            LLM_ROUTE_PIN,
+            api_keys={"gemini": GEMINI_API_KEY, "openai": OPENAI_API_KEY},
+            default_models={"gemini": GEMINI_MODEL, "openai": OPENAI_MODEL},
+            timeout_s=timeout_s,
+            sdk_retries=False,
+        )
+        if not providers:
+            return None
+        provider: LLMProvider = ResilientProvider(providers, router=router)
+    else:
+        providers = live_providers(
+            GEMINI_API_KEY, OPENAI_API_KEY, GEMINI_MODEL, OPENAI_MODEL, timeout_s=timeout_s, sdk_retries=not resilient
+        )
+        if not providers:
+            return None
+        if resilient:
+            provider = ResilientProvider(providers if LLM_FAILOVER_ENABLED else providers[:1])
+        else:
+            provider = providers[0]
+    if mode == "record":
+        provider = RecordingProvider(provider, Cassette(cassette_path))
+    return provider
+
+
+# Missing keys only fail the first LLM call, so the app (and anything
+# importing it) still starts; replay mode needs no key at all.
+_provider: Optional[LLMProvider] = create_provider()
+
+
+def get_provider() -> LLMProvider:
+    if _provider is None:
+        raise RuntimeError("No LLM provider found in .env. Provide either GEMINI_API_KEY or OPENAI_API_KEY.")
+    return _provider
+
+
+def set_provider(provider: Optional[LLMProvider]) -> None:
+    """
+    Swap the provider at runtime (benchmarks, load tests).
+    """
+    global _provider
+    _provider = provider
+
+
+# Token usage as reported by the provider, summed over all calls
+_usage_lock = threading.Lock()
+_usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+
+def _record_usage(prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+    with _usage_lock:
+        _usage["calls"] += 1
+        _usage["prompt_tokens"] += prompt_tokens
+        _usage["completion_tokens"] += completion_tokens
+
+
+def _observe_call(stage: str, duration: float, prompt_tokens: int, completion_tokens: int) -> None:
+    # per-stage LLM latency and tokens for /metrics
+    LLM_SECONDS.observe(duration, stage=stage)
+    LLM_TOKENS.inc(prompt_tokens, stage=stage, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, stage=stage, kind="completion")
+
 
-    client = genai.Client(api_key=GEMINI_API_KEY)
-    generation_config = types.GenerateContentConfig(temperature=0.0)
-    LLM_PROVIDER = "gemini"
+def _resilient() -> Optional[ResilientProvider]:
+    provider = _provider
+    if isinstance(provider, RecordingProvider):
+        provider = provider.inner
+    return provider if isinstance(provider, ResilientProvider) else None
 
-elif OPENAI_API_KEY:
-    from openai import OpenAI
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    LLM_PROVIDER = "openai"
 
-if not LLM_PROVIDER:
-    raise RuntimeError("No LLM provider found in .env. Provide either GEMINI_API_KEY or OPENAI_API_KEY.")
+def llm_info() -> Dict[str, Any]:
+    """
+    Active provider, model and mode (reported by /stats, so eval caches can
+    key on the model). With per-stage routing, also the routing mode and
+    the model each stage would use next.
+    """
+    provider = _provider
+    if provider is None:
+        return {"provider": None, "model": None, "mode": LLM_MODE}
+    mode = provider.name if provider.name in ("record", "replay") else "live"
+    info: Dict[str, Any] = {"provider": getattr(provider, "inner", provider).name, "model": provider.model, "mode": mode}
+    resilient = _resilient()
+    if resilient is not None and resilient.router is not None:
+        info["routing"] = resilient.router.mode
+        info["routes"] = resilient.router.current()
+    return info
+
+
+def resilience_stats() -> Optional[Dict[str, Any]]:
+    """
+    Retry / hedge / failover counters and breaker states (for /stats), or
+    None when calls don't go through a ResilientProvider.
+    """
+    resilient = _resilient()
+    return resilient.stats() if resilient is not None else None
+
+
+def get_llm_usage() -> Dict[str, int]:
+    with _usage_lock:
+        return dict(_usage)
+
+
+def reset_llm_usage() -> None:
+    with _usage_lock:
+        for k in _usage:
+            _usage[k] = 0
 
 
 def llm_generate(prompt: str) -> str:
     """
-    Return raw text output from whichever LLM provider is active.
-    - Gemini
-    - OpenAI
+    Return raw text output from the active provider (Gemini, OpenAI, or a
+    record / replay cassette).
     """
-    if LLM_PROVIDER == "gemini":
-        response = client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=[prompt],
-            config=generation_config,
-        )
-        return response.text.strip()
+    stage = current_span() or "direct"
+    with span("llm", stage=stage) as attrs:
+        t0 = time.perf_counter()
+        result = get_provider().generate(prompt, stage=stage)
+        _observe_call(stage, time.perf_counter() - t0, result["prompt_tokens"], result["completion_tokens"])
+        attrs.update(prompt_tokens=result["prompt_tokens"], completion_tokens=result["completion_tokens"])
+    _record_usage(result["prompt_tokens"], result["completion_tokens"])
+    return result["text"]
 
-    elif LLM_PROVIDER == "openai":
-        response = client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.0,
-        )
-        return response.choices[0].message.content.strip()
 
-    else:
-        raise RuntimeError("Invalid LLM provider configured.")
+async def llm_generate_async(prompt: str) -> str:
+    """
+    Async variant of llm_generate using the provider's async client, so the
+    event loop is free while the request is in flight.
+    """
+    stage = current_span() or "direct"
+    with span("llm", stage=stage) as attrs:
+        t0 = time.perf_counter()
+        result = await get_provider().generate_async(prompt, stage=stage)
+        _observe_call(stage, time.perf_counter() - t0, result["prompt_tokens"], result["completion_tokens"])
+        attrs.update(prompt_tokens=result["prompt_tokens"], completion_tokens=result["completion_tokens"])
+    _record_usage(result["prompt_tokens"], result["completion_tokens"])
+    return result["text"]
+
+async def llm_stream_async(prompt: str) -> AsyncIterator[str]:
+    """
+    Stream the model's output as text chunks as they arrive. Usage is
+    recorded once the stream ends (the providers report it on the last
+    chunk).
+    """
+    stage = current_span() or "stream"
+    prompt_tokens = completion_tokens = 0
+    t0 = time.perf_counter()
+    async for chunk in get_provider().stream_async(prompt, stage=stage):
+        if "prompt_tokens" in chunk:
+            prompt_tokens, completion_tokens = chunk["prompt_tokens"], chunk["completion_tokens"]
+        if chunk["text"]:
+            yield chunk["text"]
+
+    duration = time.perf_counter() - t0
+    _observe_call(stage, duration, prompt_tokens, completion_tokens)
+    record_span("llm", t0, duration, stage=stage, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    _record_usage(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
 
 def _strip_code_fences(text: str) -> str:
     text = text.strip()
@@ -72,13 +235,15 @@ def _strip_code_fences(text: str) -> str:
         text = "\n".join(lines).strip()
     return text
 
-def select_relevant_tables(user_query: str, table_descriptions: str) -> List[str]:
-    prompt = RELEVANT_TABLES_PROMPT_TEMPLATE.format(
+# ---------- Prompt building / response parsing (shared by sync + async) ----------
+
+def _relevant_tables_prompt(user_query: str, table_descriptions: str) -> str:
+    return RELEVANT_TABLES_PROMPT_TEMPLATE.format(
         user_query=user_query,
         table_descriptions=table_descriptions,
     )
 
-    raw = llm_generate(prompt)
+def _parse_relevant_tables(raw: str) -> List[str]:
     raw = _strip_code_fences(raw)
 
     try:
@@ -89,13 +254,38 @@ def select_relevant_tables(user_query: str, table_descriptions: str) -> List[str
     except Exception as e:
         raise RuntimeError(f"Failed to parse relevant tables JSON: {e}\nRaw: {raw}") from e
 
-def generate_sql_query(user_query: str, tables_text: str) -> str:
+def _relevant_tables_batch_prompt(user_queries: List[str], table_descriptions: str) -> str:
+    numbered = "\n".join(f"{i}. {q}" for i, q in enumerate(user_queries, 1))
+    return RELEVANT_TABLES_BATCH_PROMPT_TEMPLATE.format(
+        user_queries=numbered,
+        table_descriptions=table_descriptions,
+    )
+
+def _parse_relevant_tables_batch(raw: str, n: int) -> List[Optional[List[str]]]:
+    # One entry per query; None where the answer is missing or malformed,
+    # so the caller can ask for just those again.
+    obj = _parse_json_object(raw, "batched relevant tables")
+    out: List[Optional[List[str]]] = []
+    for i in range(1, n + 1):
+        tables = obj.get(str(i))
+        out.append([str(t).strip() for t in tables] if isinstance(tables, list) else None)
+    return out
+
+def _sql_query_prompt(
+    user_query: str, tables_text: str, previous_sql: Optional[str] = None, errors: Optional[List[str]] = None
+) -> str:
     prompt = SQL_QUERY_PROMPT_TEMPLATE.format(
         user_query=user_query,
         tables=tables_text,
     )
+    if previous_sql is not None:
+        prompt += SQL_REPAIR_PROMPT_TEMPLATE.format(
+            sql=previous_sql,
+            errors="\n".join(f"- {e}" for e in errors or []),
+        )
+    return prompt
 
-    text = llm_generate(prompt)
+def _parse_sql_query(text: str) -> str:
     text = _strip_code_fences(text)
 
     # special case handling
@@ -104,15 +294,13 @@ def generate_sql_query(user_query: str, tables_text: str) -> str:
 
     return text.strip()
 
-def rewrite_user_query(user_query: str, table_descriptions: str) -> str:
-    prompt = QUERY_REWRITE_PROMPT_TEMPLATE.format(
+def _rewrite_prompt(user_query: str, table_descriptions: str) -> str:
+    return QUERY_REWRITE_PROMPT_TEMPLATE.format(
         user_query=user_query,
         table_descriptions=table_descriptions,
     )
 
-    # Call your LLM
-    rewritten = llm_generate(prompt)
-
+def _parse_rewrite(rewritten: str) -> str:
     # Remove code fences if model returns ```text```
     rewritten = _strip_code_fences(rewritten)
 
@@ -120,4 +308,130 @@ def rewrite_user_query(user_query: str, table_descriptions: str) -> str:
     if rewritten.strip().upper().startswith("NOT POSSIBLE WITH GIVEN TABLES"):
         return "NOT POSSIBLE WITH GIVEN TABLES"
 
-    return rewritten.strip()
\ No newline at end of file
+    return rewritten.strip()
+
+def _parse_json_object(raw: str, what: str) -> Dict[str, Any]:
+    raw = _strip_code_fences(raw)
+    m = re.search(r"\{.*\}", raw, flags=re.DOTALL)
+    try:
+        obj = json.loads(m.group(0) if m else raw)
+        if not isinstance(obj, dict):
+            raise ValueError("Expected a JSON object")
+        return obj
+    except Exception as e:
+        raise RuntimeError(f"Failed to parse {what} JSON: {e}\nRaw: {raw}") from e
+
+def _rewrite_and_select_prompt(user_query: str, table_descriptions: str) -> str:
+    return REWRITE_AND_SELECT_PROMPT_TEMPLATE.format(
+        user_query=user_query,
+        table_descriptions=table_descriptions,
+    )
+
+def _parse_rewrite_and_select(raw: str) -> Dict[str, Any]:
+    obj = _parse_json_object(raw, "rewrite+select")
+    tables = obj.get("relevant_tables") or []
+    if not isinstance(tables, list):
+        raise RuntimeError(f"Expected relevant_tables to be a JSON list\nRaw: {raw}")
+    return {
+        "rewritten_query": _parse_rewrite(str(obj.get("rewritten_query") or "")),
+        "relevant_tables": [str(t).strip() for t in tables],
+    }
+
+def _fused_prompt(user_query: str, tables_text: str) -> str:
+    return FUSED_PIPELINE_PROMPT_TEMPLATE.format(
+        user_query=user_query,
+        tables=tables_text,
+    )
+
+def _parse_fused(raw: str) -> Dict[str, Any]:
+    obj = _parse_rewrite_and_select(raw)
+    sql = _parse_json_object(raw, "fused pipeline").get("sql") or ""
+    obj["sql"] = _parse_sql_query(str(sql)) if sql else "NOT POSSIBLE WITH GIVEN TABLES"
+    return obj
+
+# ---------- Pipeline stages ----------
+
+def select_relevant_tables(user_query: str, table_descriptions: str) -> List[str]:
+    raw = llm_generate(_relevant_tables_prompt(user_query, table_descriptions))
+    return _parse_relevant_tables(raw)
+
+def generate_sql_query(
+    user_query: str, tables_text: str, previous_sql: Optional[str] = None, errors: Optional[List[str]] = None
+) -> str:
+    """
+    SQL for the question over the given tables. With previous_sql and
+    errors, asks the model to repair that rejected query instead.
+    """
+    text = llm_generate(_sql_query_prompt(user_query, tables_text, previous_sql, errors))
+    return _parse_sql_query(text)
+
+def rewrite_user_query(user_query: str, table_descriptions: str) -> str:
+    rewritten = llm_generate(_rewrite_prompt(user_query, table_descriptions))
+    return _parse_rewrite(rewritten)
+
+async def select_relevant_tables_async(user_query: str, table_descriptions: str) -> List[str]:
+    raw = await llm_generate_async(_relevant_tables_prompt(user_query, table_descriptions))
+    return _parse_relevant_tables(raw)
+
+async def generate_sql_query_async(
+    user_query: str, tables_text: str, previous_sql: Optional[str] = None, errors: Optional[List[str]] = None
+) -> str:
+    text = await llm_generate_async(_sql_query_prompt(user_query, tables_text, previous_sql, errors))
+    return _parse_sql_query(text)
+
+async def rewrite_user_query_async(user_query: str, table_descriptions: str) -> str:
+    rewritten = await llm_generate_async(_rewrite_prompt(user_query, table_descriptions))
+    return _parse_rewrite(rewritten)
+
+async def generate_sql_query_stream_async(user_query: str, tables_text: str) -> AsyncIterator[str]:
+    """
+    Raw SQL-generation output chunk by chunk; join the chunks and pass the
+    result through parse_sql_query for the final SQL.
+    """
+    async for chunk in llm_stream_async(_sql_query_prompt(user_query, tables_text)):
+        yield chunk
+
+def parse_sql_query(text: str) -> str:
+    return _parse_sql_query(text)
+
+# ---------- Batched stages (several questions, one call) ----------
+
+def select_relevant_tables_batch(user_queries: List[str], table_descriptions: str) -> List[Optional[List[str]]]:
+    """
+    Table selection for several questions over the same catalog in one
+    call, so the catalog is sent once instead of once per question.
+    Returns one table list per question, None where the model's answer
+    was unusable.
+    """
+    raw = llm_generate(_relevant_tables_batch_prompt(user_queries, table_descriptions))
+    return _parse_relevant_tables_batch(raw, len(user_queries))
+
+async def select_relevant_tables_batch_async(user_queries: List[str], table_descriptions: str) -> List[Optional[List[str]]]:
+    raw = await llm_generate_async(_relevant_tables_batch_prompt(user_queries, table_descriptions))
+    return _parse_relevant_tables_batch(raw, len(user_queries))
+
+# ---------- Fused stages (fewer round trips) ----------
+
+def rewrite_and_select_tables(user_query: str, table_descriptions: str) -> Dict[str, Any]:
+    """
+    One call for rewrite + table selection.
+    Returns {"rewritten_query": str, "relevant_tables": [str]}.
+    """
+    raw = llm_generate(_rewrite_and_select_prompt(user_query, table_descriptions))
+    return _parse_rewrite_and_select(raw)
+
+def generate_fused(user_query: str, tables_text: str) -> Dict[str, Any]:
+    """
+    One call for the whole pipeline.
+    Returns {"rewritten_query": str, "relevant_tables": [str], "sql": str}.
+    """
+    raw = llm_generate(_fused_prompt(user_query, tables_text))
+    return _parse_fused(raw)
+
+async def rewrite_and_select_tables_async(user_query: str, table_descriptions: str) -> Dict[str, Any]:
+    raw = await llm_generate_async(_rewrite_and_select_prompt(user_query, table_descriptions))
+    return _parse_rewrite_and_select(raw)
+
+async def generate_fused_async(user_query: str, tables_text: str) -> Dict[str, Any]:
+    raw = await llm_generate_async(_fused_prompt(user_query, tables_text))
+    return _parse_fused(raw)
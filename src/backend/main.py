@@ -1,8 +1,42 @@
-from fastapi import FastAPI, HTTPException
+import json
+import secrets
+import time
+
+import pymysql
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import Any, AsyncIterator, Dict, List, Optional
 
+from columnar import (
+    ARROW_STREAM_MEDIA_TYPE,
+    PARQUET_MEDIA_TYPE,
+    append_fields,
+    arrow_available,
+    arrow_ipc_payload,
+    batch_payload,
+    dumps_json,
+    page_payload,
+    parquet_payload,
+    query_payload,
+    result_metadata,
+)
+from config import (
+    BATCH_MAX_QUESTIONS,
+    PIPELINE_MODES,
+    PROFILE_DIR,
+    PROFILE_ROUTES,
+    PROFILING_ENABLED,
+    PROFILING_HEADER,
+    RESULT_LAYOUTS,
+)
+from db_utils import PoolTimeout, pool_stats, statement_rejected
+from llm_resilience import LLMDeadlineExceeded, LLMUnavailable
+from llm_utils import get_llm_usage, llm_info, resilience_stats
+from profiling import SamplingProfiler
 from sql_service import SQLService
+from sql_validator import SQLValidationError
+from telemetry import HTTP_REQUESTS, HTTP_SECONDS, collect_trace, render_metrics, span
 
 app = FastAPI(
     title="LLM-powered SQL Assistant",
@@ -15,6 +49,13 @@ service = SQLService()
 
 class QueryRequest(BaseModel):
     user_query: str
+    # one of config.PIPELINE_MODES; None -> config.PIPELINE_MODE
+    pipeline_mode: Optional[str] = None
+    # one of config.RESULT_LAYOUTS; "columns" returns "data" (one list per
+    # column) instead of "rows"
+    result_layout: str = "records"
+    # add a per-stage "timings" breakdown to the response
+    include_timings: bool = False
 
 
 class QueryResponse(BaseModel):
@@ -22,20 +63,315 @@ class QueryResponse(BaseModel):
     relevant_tables: List[str]
     columns: List[str]
     rows: List[Dict[str, Any]]
+    # pass to GET /query/page for the next RESULT_PAGE_SIZE rows
+    next_page_token: Optional[str] = None
+    # only with include_timings: {"total_ms", "stages", "spans"}
+    timings: Optional[Dict[str, Any]] = None
+
 
+class BatchRequest(BaseModel):
+    user_queries: List[str]
+    pipeline_mode: Optional[str] = None
+    result_layout: str = "records"
+
+
+class BatchItem(BaseModel):
+    # sql is None when the question failed; error says why
+    sql: Optional[str] = None
+    relevant_tables: List[str]
+    columns: List[str]
+    rows: List[Dict[str, Any]]
+    next_page_token: Optional[str] = None
+    error: Optional[str] = None
+    # index of the earlier identical question whose answer this reuses
+    duplicate_of: Optional[int] = None
+
+
+class BatchResponse(BaseModel):
+    results: List[BatchItem]
+
+
+class PageResponse(BaseModel):
+    columns: List[str]
+    rows: List[Dict[str, Any]]
+    next_page_token: Optional[str] = None
+    timings: Optional[Dict[str, Any]] = None
 
-@app.post("/query", response_model=QueryResponse)
-def query_db(payload: QueryRequest):
-    # try:
-        sql_text, relevant_tables, rows, columns = service.handle_user_query(
-            payload.user_query
+
+@app.middleware("http")
+async def record_http_metrics(request: Request, call_next):
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # the route template, not the raw path, so labels stay bounded
+        route = request.scope.get("route")
+        path = getattr(route, "path", None) or "unmatched"
+        HTTP_REQUESTS.inc(method=request.method, route=path, status=str(status))
+        HTTP_SECONDS.observe(time.perf_counter() - t0, method=request.method, route=path)
+
+
+def _profile_requested(request: Request) -> bool:
+    if request.url.path not in PROFILE_ROUTES:
+        return False
+    if PROFILING_ENABLED:
+        return True
+    return PROFILING_HEADER is not None and request.headers.get(PROFILING_HEADER, "").lower() in ("1", "true", "yes")
+
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """
+    Sample the request while it runs and write its folded stacks to
+    PROFILE_DIR; the file path comes back in X-Profile-Output. A header
+    check only when not profiling.
+    """
+    if not _profile_requested(request):
+        return await call_next(request)
+
+    profiler = SamplingProfiler().start()
+    try:
+        response = await call_next(request)
+    finally:
+        profiler.stop()
+    name = time.strftime("%Y%m%d-%H%M%S") + "-" + request.url.path.strip("/").replace("/", "_") + "-" + secrets.token_hex(3)
+    path = profiler.write(PROFILE_DIR, name)
+    print(f"Profile: {path} ({profiler.samples} samples, {profiler.duration_s * 1000:.0f} ms)")
+    response.headers["X-Profile-Output"] = path
+    return response
+
+
+def _http_error(e: Exception) -> HTTPException:
+    """
+    Status for a pipeline failure, so clients can tell bad SQL (422) from
+    an overloaded or unreachable dependency (503 / 504).
+    """
+    if isinstance(e, SQLValidationError):
+        return HTTPException(status_code=422, detail={"message": str(e), "sql": e.sql, "errors": e.errors})
+    # by error number: pymysql raises OperationalError for 1054 unknown
+    # column etc. as well as for a lost connection
+    if statement_rejected(e):
+        return HTTPException(status_code=422, detail=f"MySQL rejected the generated SQL: {e}")
+    if isinstance(e, LLMDeadlineExceeded):
+        return HTTPException(status_code=504, detail=str(e))
+    if isinstance(e, (LLMUnavailable, PoolTimeout, pymysql.err.MySQLError)):
+        return HTTPException(status_code=503, detail=str(e))
+    return HTTPException(status_code=500, detail=str(e) or type(e).__name__)
+
+
+def _check_pipeline_mode(payload) -> None:
+    if payload.pipeline_mode and payload.pipeline_mode not in PIPELINE_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"pipeline_mode must be one of: {', '.join(PIPELINE_MODES)}",
         )
-    # except Exception as e:
-    #     raise HTTPException(status_code=500, detail=str(e))
-
-        return QueryResponse(
-            sql=sql_text,
-            relevant_tables=relevant_tables,
-            columns=columns,
-            rows=rows,
+
+
+def _check_result_layout(layout: str) -> None:
+    if layout not in RESULT_LAYOUTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"result_layout must be one of: {', '.join(RESULT_LAYOUTS)}",
         )
+
+
+# Accept media types -> response format. "application/x-parquet" is the
+# older, still common spelling.
+_RESULT_FORMATS = {
+    "application/json": "json",
+    "*/*": "json",
+    "application/*": "json",
+    ARROW_STREAM_MEDIA_TYPE: "arrow",
+    PARQUET_MEDIA_TYPE: "parquet",
+    "application/x-parquet": "parquet",
+}
+
+
+def _negotiate_format(request: Request) -> str:
+    """
+    Pick "json", "arrow" or "parquet" from the Accept header, highest q
+    first. No Accept header, or nothing recognised, means JSON; asking only
+    for Arrow / Parquet without pyarrow installed is a 406.
+    """
+    accept = request.headers.get("accept")
+    if not accept:
+        return "json"
+
+    ranked = []
+    for i, part in enumerate(accept.split(",")):
+        media, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if q > 0 and media.lower() in _RESULT_FORMATS:
+            ranked.append((-q, i, _RESULT_FORMATS[media.lower()]))
+
+    unavailable = False
+    for _, _, fmt in sorted(ranked):
+        if fmt != "json" and not arrow_available():
+            unavailable = True
+            continue
+        return fmt
+    if unavailable:
+        raise HTTPException(status_code=406, detail="Arrow / Parquet responses need pyarrow on the server")
+    return "json"
+
+
+def _json_response(body: bytes, trace) -> Response:
+    if trace is not None:
+        body = append_fields(body, {"timings": trace.breakdown()})
+    return Response(content=body, media_type="application/json")
+
+
+def _binary_response(fmt: str, result, metadata: Dict[str, str], filename: str, trace=None) -> Response:
+    # sql / relevant_tables / next_page_token travel in the schema metadata
+    # (and the token also as a header, for clients that only look at those)
+    headers = {"X-Next-Page-Token": metadata["next_page_token"]} if metadata["next_page_token"] else {}
+    if trace is not None:
+        # timings travel in the metadata too; serialization happens after,
+        # so it is not part of them
+        metadata = {**metadata, "timings": json.dumps(trace.breakdown())}
+    if fmt == "parquet":
+        headers["Content-Disposition"] = f'attachment; filename="{filename}.parquet"'
+        return Response(parquet_payload(result, metadata), media_type=PARQUET_MEDIA_TYPE, headers=headers)
+    return Response(arrow_ipc_payload(result, metadata), media_type=ARROW_STREAM_MEDIA_TYPE, headers=headers)
+
+
+@app.post(
+    "/query",
+    response_model=QueryResponse,
+    responses={200: {"content": {ARROW_STREAM_MEDIA_TYPE: {}, PARQUET_MEDIA_TYPE: {}}}},
+)
+async def query_db(payload: QueryRequest, request: Request):
+    """
+    JSON by default; send `Accept: application/vnd.apache.arrow.stream` for
+    an Arrow IPC stream or `Accept: application/vnd.apache.parquet` for a
+    Parquet download of the same rows (DECIMAL and DATETIME keep their
+    types in both). With include_timings the response also has "timings"
+    (a "timings" metadata key for Arrow / Parquet).
+    """
+    _check_pipeline_mode(payload)
+    _check_result_layout(payload.result_layout)
+    fmt = _negotiate_format(request)
+
+    with collect_trace() as trace:
+        try:
+            sql_text, relevant_tables, result, next_page_token = await service.handle_user_query_page_async(
+                payload.user_query,
+                mode=payload.pipeline_mode,
+            )
+        except Exception as e:
+            raise _http_error(e) from e
+        trace = trace if payload.include_timings else None
+
+        if fmt != "json":
+            metadata = result_metadata(sql_text, relevant_tables, next_page_token)
+            return _binary_response(fmt, result, metadata, "query_results", trace)
+
+        # Serialized directly from the columnar result: QueryResponse documents
+        # the shape, but rows are not validated one by one through pydantic.
+        with span("serialize"):
+            body = query_payload(sql_text, relevant_tables, result, next_page_token, payload.result_layout)
+        return _json_response(body, trace)
+
+
+@app.get(
+    "/query/page",
+    response_model=PageResponse,
+    responses={200: {"content": {ARROW_STREAM_MEDIA_TYPE: {}, PARQUET_MEDIA_TYPE: {}}}},
+)
+async def query_page(request: Request, page_token: str, result_layout: str = "records", include_timings: bool = False):
+    """
+    Next page of a /query or /query/stream result. Re-runs the stored SQL
+    only; the LLM pipeline is not involved. Negotiates Arrow / Parquet like
+    /query.
+    """
+    _check_result_layout(result_layout)
+    fmt = _negotiate_format(request)
+    with collect_trace() as trace:
+        try:
+            result, next_page_token = await service.fetch_page_async(page_token)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Unknown or expired page token")
+        except Exception as e:
+            raise _http_error(e) from e
+        trace = trace if include_timings else None
+
+        if fmt != "json":
+            metadata = result_metadata(next_page_token=next_page_token)
+            return _binary_response(fmt, result, metadata, "query_page", trace)
+        with span("serialize"):
+            body = page_payload(result, next_page_token, result_layout)
+        return _json_response(body, trace)
+
+
+@app.post("/query/batch", response_model=BatchResponse)
+async def query_batch(payload: BatchRequest):
+    """
+    Several questions in one request. Duplicates (after normalization) run
+    once, the rest concurrently within BATCH_LLM_CONCURRENCY /
+    BATCH_DB_CONCURRENCY. Results come back in input order; a failed
+    question gets "error" instead of failing the batch.
+    """
+    _check_pipeline_mode(payload)
+    _check_result_layout(payload.result_layout)
+    if not payload.user_queries:
+        raise HTTPException(status_code=400, detail="user_queries must not be empty")
+    if len(payload.user_queries) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+
+    items = await service.handle_batch_async(payload.user_queries, mode=payload.pipeline_mode)
+    return Response(content=batch_payload(items, payload.result_layout), media_type="application/json")
+
+
+@app.post("/query/stream")
+async def query_db_stream(payload: QueryRequest):
+    """
+    Same pipeline as /query, streamed as NDJSON: one {"event", "data"}
+    object per line (see SQLService.stream_user_query). Failures after the
+    stream has started arrive as an "error" event.
+    """
+    _check_pipeline_mode(payload)
+    events = service.stream_user_query(payload.user_query, mode=payload.pipeline_mode)
+    return StreamingResponse(_ndjson(events), media_type="application/x-ndjson")
+
+
+async def _ndjson(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    # same encoder as the /query body, so DECIMAL stays an exact string
+    # and datetimes ISO 8601 on both
+    try:
+        async for event in events:
+            yield dumps_json(event) + b"\n"
+    except Exception as e:
+        yield dumps_json({"event": "error", "data": str(e)}) + b"\n"
+
+
+@app.get("/metrics")
+def metrics():
+    """
+    Prometheus exposition: per-stage span and LLM latency histograms, LLM
+    tokens, HTTP request counts and durations.
+    """
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/stats")
+def stats():
+    return {
+        "cache": service.cache_stats(),
+        "page_tokens": service.page_tokens.stats(),
+        "table_retriever": service.retriever_stats(),
+        "speculation": service.speculation_stats(),
+        "batch": service.batch_stats(),
+        "coalescing": service.coalescing_stats(),
+        "validation": service.validation_stats(),
+        "llm": {**llm_info(), **get_llm_usage(), "resilience": resilience_stats()},
+        "db_pool": pool_stats(),
+    }
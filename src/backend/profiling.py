@@ -0,0 +1,111 @@
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Set
+
+from config import PROFILE_DIR, PROFILE_INTERVAL_S
+
+# Leaf frames of a thread that is parked rather than working: waiting on a
+# lock / condition / queue, an idle pool worker, or the event loop polling
+# for I/O. Blocking socket reads (MySQL, LLM HTTP calls) are not in here,
+# so they show up as the wall time they cost.
+_IDLE_FILES = ("threading.py", "selectors.py", "queue.py")
+_IDLE_FUNCS = {("thread.py", "_worker")}
+
+
+def _is_idle(frame) -> bool:
+    filename = os.path.basename(frame.f_code.co_filename)
+    return filename in _IDLE_FILES or (filename, frame.f_code.co_name) in _IDLE_FUNCS
+
+
+def _label(frame) -> str:
+    code = frame.f_code
+    # ";" separates frames in the folded format
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler: a background thread snapshots every other
+    thread's Python stack each `interval_s` and counts identical stacks.
+    Nothing is hooked into the profiled code, so cost is per sample, not
+    per call, and zero when no profiler is running.
+
+    Samples cover the whole process, so requests running at the same time
+    as the profiled one appear in its profile too.
+    """
+
+    def __init__(self, interval_s: float = PROFILE_INTERVAL_S):
+        self.interval_s = interval_s
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.duration_s = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._t0 = 0.0
+
+    def start(self) -> "SamplingProfiler":
+        self._t0 = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration_s = time.perf_counter() - self._t0
+        return self
+
+    def __enter__(self) -> "SamplingProfiler":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval_s):
+            self.sample(skip={own}, names=names)
+
+    def sample(self, skip: Set[int] = frozenset(), names: Optional[Dict[int, str]] = None) -> None:
+        """
+        Record one snapshot of all threads except `skip`.
+        """
+        if names is None:
+            names = {}
+        self.samples += 1
+        for ident, frame in sys._current_frames().items():
+            if ident in skip or _is_idle(frame):
+                continue
+            if ident not in names:
+                thread = next((t for t in threading.enumerate() if t.ident == ident), None)
+                names[ident] = re.sub(r"[_-](\d+|[0-9a-f]{8,})$", "", thread.name) if thread else "thread"
+            labels = []
+            while frame is not None:
+                labels.append(_label(frame))
+                frame = frame.f_back
+            labels.append(names[ident].replace(";", ","))
+            self.stacks[";".join(reversed(labels))] += 1
+
+    def folded(self) -> str:
+        """
+        Collapsed stacks ("thread;outer;...;leaf count" per line), the input
+        format of flamegraph.pl, speedscope and inferno.
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+    def write(self, directory: str = PROFILE_DIR, name: Optional[str] = None) -> str:
+        """
+        Write the folded stacks to `directory` and return the file path.
+        """
+        os.makedirs(directory, exist_ok=True)
+        name = name or time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(directory, f"{name}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.folded())
+        return path
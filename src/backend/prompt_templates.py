@@ -198,3 +198,126 @@ If impossible, return exactly:
 NOT POSSIBLE WITH GIVEN TABLES
 """
 
+
+REWRITE_AND_SELECT_PROMPT_TEMPLATE = """You are a query rewriter and SQL database assistant.
+
+Step 1 - Rewrite the user's question into a clear, explicit, SQL-friendly version:
+- Make the question unambiguous.
+- Use only tables or concepts that appear in the database description.
+- Expand vague terms (e.g., “last month”, “top products”, “recent orders”) into logical descriptions, but do NOT insert exact dates.
+- Make implied filters, joins, metrics, and groupings explicit in natural language.
+- Remove pronouns and unclear references.
+- If the user asks for entities such as customers, products, stores, vendors, or people,
+  state that the output should include human-readable identifiers (e.g., name, title, or email) if available.
+- If the question implies purchases, orders, or spending, state that relevant aggregate
+  metrics should be returned (e.g., number of distinct products, total spend) if derivable from the schema.
+- End with a sentence starting with "Return ..." that clearly lists the expected output fields.
+- DO NOT write SQL.
+
+Step 2 - Select the smallest set of tables that fully answer the REWRITTEN question:
+- Use only the tables described below.
+- Prefer highly relevant tables over loosely related ones.
+- DO NOT invent tables that are not provided.
+
+====================
+USER QUESTION:
+{user_query}
+====================
+
+====================
+TABLE DESCRIPTIONS:
+{table_descriptions}
+====================
+
+Output format:
+Return ONLY a JSON object, no explanation, no commentary:
+{{"rewritten_query": "...", "relevant_tables": ["Customer", "SalesOrderHeader"]}}
+"""
+
+FUSED_PIPELINE_PROMPT_TEMPLATE = """You are an SQL assistant with ZERO tolerance for hallucination.
+In ONE answer you will rewrite the user's question, pick the tables it needs, and write the SQL.
+
+Database:
+- This is a MySQL relational database.
+- Use MySQL syntax only.
+- For time differences, you may use TIMESTAMPDIFF or comparisons with INTERVAL (e.g., WHERE t2.datetime <= t1.datetime + INTERVAL 1 DAY).
+
+Step 1 - rewritten_query: rewrite the question into a clear, explicit, SQL-friendly version.
+- Make implied filters, joins, metrics, and groupings explicit; expand vague terms but do NOT insert exact dates.
+- End with a sentence starting with "Return ..." that lists the expected output fields.
+
+Step 2 - relevant_tables: the smallest set of tables from TABLE DEFINITIONS that answers the rewritten query.
+
+Step 3 - sql: a correct and PERFORMANCE-CONSCIOUS query for the rewritten query.
+1. Use ONLY tables and columns explicitly listed in TABLE DEFINITIONS; never invent tables, columns or relationships.
+2. Join only on foreign keys or relationships explicitly implied by TABLE DEFINITIONS.
+3. ALWAYS qualify columns using table aliases.
+4. For customers, products, stores, vendors, or people, include human-readable columns (name, title, email) when available; returning only IDs is NOT allowed when readable identifiers exist.
+5. If the question implies purchases, orders, or spending, include relevant aggregates (COUNT(DISTINCT ...), SUM(...)) that can be computed from available columns.
+6. Select only necessary columns, prefer SARGABLE predicates, avoid unnecessary DISTINCT / ORDER BY / GROUP BY, use LIMIT only when explicitly requested.
+7. If the question cannot be answered with the given tables, set "sql" to exactly: NOT POSSIBLE WITH GIVEN TABLES
+
+====================
+USER QUESTION:
+{user_query}
+====================
+
+====================
+TABLE DEFINITIONS:
+{tables}
+====================
+
+Output format:
+Return ONLY a JSON object, no explanation, no commentary, no code fences:
+{{"rewritten_query": "...", "relevant_tables": ["..."], "sql": "SELECT ..."}}
+"""
+
+RELEVANT_TABLES_BATCH_PROMPT_TEMPLATE = """You are an expert SQL database assistant.
+
+Your task:
+Given several numbered REWRITTEN USER QUERIES and one set of TABLE DESCRIPTIONS, identify
+for EACH query which tables are relevant for answering it. Treat every query on its own.
+
+Instructions:
+- Use only the tables described below.
+- Select the smallest set of tables that fully answer each query.
+- Prefer highly relevant tables over loosely related ones.
+- DO NOT invent tables that are not provided.
+
+====================
+REWRITTEN USER QUERIES:
+{user_queries}
+====================
+
+====================
+TABLE DESCRIPTIONS:
+{table_descriptions}
+====================
+
+Output format:
+Return ONLY a JSON object mapping every query number to its JSON array of table names,
+no explanation, no commentary:
+{{"1": ["Customer", "SalesOrderHeader"], "2": ["Product"]}}
+"""
+
+# Appended to SQL_QUERY_PROMPT_TEMPLATE when a generated query failed local
+# validation (sql_validator), so the model fixes that query instead of
+# starting over.
+SQL_REPAIR_PROMPT_TEMPLATE = """
+====================
+PREVIOUS ATTEMPT (REJECTED):
+{sql}
+====================
+
+====================
+VALIDATION ERRORS:
+{errors}
+====================
+
+The previous attempt was rejected before running. Fix every error listed above:
+- Use ONLY table and column names exactly as written in TABLE DEFINITIONS.
+- Return a single read-only SELECT query in MySQL syntax.
+Return ONLY the corrected SQL query in a code block.
+If impossible, return exactly:
+NOT POSSIBLE WITH GIVEN TABLES
+"""
@@ -0,0 +1,220 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+
+# Short spellings for the MySQL types AdventureWorks uses. The legend is
+# emitted once in the preamble so the model can read them back.
+TYPE_ABBREVIATIONS = {
+    "varchar": "str",
+    "nvarchar": "str",
+    "char": "str",
+    "longtext": "text",
+    "timestamp": "ts",
+    "datetime": "dt",
+    "decimal": "dec",
+    "tinyint": "tiny",
+    "smallint": "small",
+    "longblob": "blob",
+    "varbinary": "blob",
+    "geometry": "geo",
+}
+
+# A column counts as shared when at least this share of tables has it
+# with the same type (AdventureWorks: ModifiedDate in 69 of 71 tables).
+COMMON_COLUMN_MIN_SHARE = 0.5
+
+
+def abbreviate_type(col_type: str) -> str:
+    return TYPE_ABBREVIATIONS.get(col_type, col_type)
+
+
+def quote_name(name: str) -> str:
+    # AWBuildVersion has a `Database Version` column; spell it as in SQL.
+    return name if re.fullmatch(r"\w+", name) else f"`{name}`"
+
+
+def common_columns(schema: Dict[str, Dict], min_share: float = COMMON_COLUMN_MIN_SHARE) -> List[Tuple[str, str]]:
+    """
+    (name, type) pairs present in at least min_share of the tables and never
+    part of a primary or foreign key, most widespread first.
+    """
+    if not schema:
+        return []
+    counts: Dict[Tuple[str, str], int] = {}
+    keys = set()
+    for info in schema.values():
+        keys |= set(info.get("primary_key", []))
+        keys |= {fk["column"] for fk in info.get("foreign_keys", [])}
+        for col in info.get("columns", []):
+            pair = (col["name"], col["type"])
+            counts[pair] = counts.get(pair, 0) + 1
+
+    threshold = min_share * len(schema)
+    shared = [p for p, n in counts.items() if n >= threshold and p[0] not in keys]
+    return sorted(shared, key=lambda p: (-counts[p], p[0]))
+
+
+def compile_table(table_name: str, info: Dict, common: List[Tuple[str, str]] = ()) -> str:
+    """
+    One-line DDL-like rendering of a table:
+
+        SalesOrderHeader(SalesOrderID int PK, OrderDate ts, CustomerID int >Customer, ...)
+
+    Shared columns listed in `common` are left out (the preamble declares
+    them once); a table lacking one says so with "-Name". FK targets are
+    inline: ">Table" when the referenced column has the same name,
+    ">Table.Column" otherwise. Nullability and defaults are dropped; names
+    that aren't plain identifiers are backquoted.
+    """
+    pks = set(info.get("primary_key", []))
+    refs: Dict[str, List[str]] = {}
+    for fk in info.get("foreign_keys", []):
+        target = fk["references_table"]
+        if fk["references_column"] != fk["column"]:
+            target += f".{quote_name(fk['references_column'])}"
+        refs.setdefault(fk["column"], [])
+        if target not in refs[fk["column"]]:
+            refs[fk["column"]].append(target)
+
+    shared = set(common)
+    present = set()
+    parts: List[str] = []
+    for col in info.get("columns", []):
+        pair = (col["name"], col["type"])
+        if pair in shared:
+            present.add(pair)
+            continue
+        part = f"{quote_name(col['name'])} {abbreviate_type(col['type'])}"
+        if col["name"] in pks:
+            part += " PK"
+        for target in refs.get(col["name"], []):
+            part += f" >{target}"
+        parts.append(part)
+
+    parts.extend(f"-{quote_name(name)}" for name, col_type in common if (name, col_type) not in present)
+    return f"{table_name}({', '.join(parts)})"
+
+
+def compile_preamble(common: List[Tuple[str, str]]) -> str:
+    """
+    Legend for the compact format, included once per prompt.
+    """
+    legend = ", ".join(
+        f"{short}={full}"
+        for full, short in TYPE_ABBREVIATIONS.items()
+        if full in ("varchar", "timestamp", "datetime", "decimal", "tinyint", "smallint")
+    )
+    lines = [f"Format: Table(column type [PK] [>ReferencedTable[.Column]]). Types: {legend}."]
+    if common:
+        cols = ", ".join(f"{quote_name(name)} {abbreviate_type(t)}" for name, t in common)
+        lines.append(f"Every table also has {cols} unless listed as -Column.")
+    return "\n".join(lines)
+
+
+def _short_description(text: str, max_words: int) -> str:
+    # First sentence, minus the "The `X` table" opener every entry repeats.
+    sentence = re.split(r"(?<=[.!?])\s", text.strip(), maxsplit=1)[0]
+    sentence = re.sub(r"^The\s+`?\w+`?\s+table\s+", "", sentence, flags=re.IGNORECASE)
+    words = sentence.rstrip(".").split()
+    if len(words) > max_words:
+        words = words[:max_words] + ["..."]
+    return " ".join(words)
+
+
+def compile_catalog(
+    schema: Dict[str, Dict],
+    descriptions: Optional[Dict[str, str]] = None,
+    max_words: int = 16,
+) -> str:
+    """
+    Global table catalog for table selection, one line per table:
+
+        - SalesOrderHeader >Address,Customer,...: stores sales order headers ...
+
+    The FK targets come from the schema; the text after the colon is the
+    first sentence of the db_description.txt entry, cut to max_words, when
+    descriptions are given.
+    """
+    descriptions = descriptions or {}
+    lines = ["Available tables (>X = has a foreign key to X):"]
+    for table in sorted(schema, key=str.lower):
+        refs = sorted({fk["references_table"] for fk in schema[table].get("foreign_keys", [])} - {table})
+        line = f"- {table}"
+        if refs:
+            line += f" >{','.join(refs)}"
+        desc = descriptions.get(table)
+        if desc:
+            line += f": {_short_description(desc, max_words)}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def compile_schema(
+    schema: Dict[str, Dict],
+    descriptions: Optional[Dict[str, str]] = None,
+    min_share: float = COMMON_COLUMN_MIN_SHARE,
+) -> Dict:
+    """
+    Compile a schema dict (get_mysql_database_schema or
+    db_utils.parse_table_descriptions) into the compact prompt format:
+
+    {
+        "preamble": legend + shared columns, prepended once per prompt,
+        "tables":   { table_name: one-line definition },
+        "catalog":  global table catalog for table selection,
+        "common":   [(name, type), ...] shared columns left out of "tables",
+    }
+    """
+    common = common_columns(schema, min_share)
+    return {
+        "preamble": compile_preamble(common),
+        "tables": {t: compile_table(t, info, common) for t, info in schema.items()},
+        "catalog": compile_catalog(schema, descriptions),
+        "common": common,
+    }
+
+
+def render_compact(compiled: Dict, tables: List[str]) -> str:
+    """
+    Preamble plus the compiled definitions of `tables` ("" if none are known).
+    """
+    lines = [compiled["tables"][t] for t in tables if t in compiled["tables"]]
+    if not lines:
+        return ""
+    return compiled["preamble"] + "\n\n" + "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # Token report for each schema format. Run from src/backend:
+    #   python schema_compiler.py          (compile db_schema.json)
+    #   python schema_compiler.py --live   (compile from INFORMATION_SCHEMA)
+    import sys
+
+    from db_utils import (
+        build_all_table_descriptions,
+        get_mysql_database_schema,
+        parse_table_descriptions,
+        read_file,
+    )
+    from table_retriever import parse_table_catalog
+    from tokens import count_tokens
+
+    db_tables = read_file("db_schema.json")
+    db_description = read_file("db_description.txt")
+    schema = get_mysql_database_schema() if "--live" in sys.argv else parse_table_descriptions(db_tables)
+    compiled = compile_schema(schema, parse_table_catalog(db_description))
+    compact_tables = render_compact(compiled, list(schema))
+
+    report = [
+        ("per-table map: db_schema.json", count_tokens("\n\n".join(db_tables.values()))),
+        ("per-table map: build_table_description", count_tokens("\n\n".join(build_all_table_descriptions(schema).values()))),
+        ("per-table map: compact", count_tokens(compact_tables)),
+        ("catalog: db_description.txt", count_tokens(db_description)),
+        ("catalog: compact", count_tokens(compiled["catalog"])),
+    ]
+    print(f"{len(schema)} tables, shared columns: {compiled['common']}")
+    for label, n in report:
+        print(f"{label:42s} {n:7d} tokens")
+    print("\n" + compiled["preamble"])
+    for t in list(compiled["tables"])[:3]:
+        print(compiled["tables"][t])
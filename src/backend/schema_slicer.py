@@ -0,0 +1,152 @@
+from typing import Dict, List, Set
+
+from db_utils import render_table_description
+from schema_compiler import compile_preamble, compile_table
+from table_retriever import tokenize
+
+
+# Dropped unless the question names them: bookkeeping columns present in most
+# tables, and bulky types the SQL generator never needs to see.
+BOILERPLATE_COLUMNS = {"rowguid", "ModifiedDate", "SpatialLocation"}
+BULKY_TYPES = {"geometry", "longblob", "blob", "varbinary", "longtext"}
+
+# Kept whenever their table is selected: the prompt asks for human-readable
+# output, so the generator has to see these.
+READABLE_COLUMNS = {
+    "Name", "FirstName", "MiddleName", "LastName", "Title", "EmailAddress",
+    "AccountNumber", "ProductNumber", "JobTitle", "CompanyName",
+}
+
+# Question words that make columns of a type family relevant even when the
+# column name isn't mentioned ("when", "in 2011" -> OrderDate).
+TYPE_HINTS = {
+    "date": (
+        {"date", "datetime", "timestamp", "time"},
+        {"date", "day", "daily", "month", "monthly", "year", "yearly", "annual", "time",
+         "when", "recent", "latest", "earliest", "last", "first", "since", "before",
+         "after", "period", "quarter", "week", "hour", "older", "newest", "oldest"},
+    ),
+    "amount": (
+        {"decimal", "float", "double", "numeric"},
+        {"amount", "price", "cost", "revenue", "sale", "total", "sum", "average", "avg",
+         "value", "spend", "spent", "profit", "margin", "tax", "freight", "due", "rate",
+         "expensive", "cheap", "cheapest", "pay", "salary", "weight", "size"},
+    ),
+    "quantity": (
+        {"int", "smallint", "tinyint"},
+        {"quantity", "qty", "count", "stock", "inventory"},
+    ),
+}
+
+# A few synonyms between question words and AdventureWorks column tokens.
+SYNONYMS = {
+    "quantity": {"qty"},
+    "revenue": {"due", "subtotal", "line"},
+    "sale": {"subtotal", "due"},
+    "email": {"email", "address"},
+    "phone": {"phone", "number"},
+    "country": {"region"},
+}
+
+
+def _question_terms(question: str) -> Set[str]:
+    terms = set(tokenize(question))
+    for t in list(terms):
+        terms |= SYNONYMS.get(t, set())
+    return terms
+
+
+def _join_columns(table: str, info: Dict, schema: Dict[str, Dict], tables: List[str]) -> Set[str]:
+    """
+    PK columns of `table`, its FK columns that point at another selected
+    table, and columns other selected tables point at.
+    """
+    selected = set(tables)
+    keep = set(info.get("primary_key", []))
+    keep |= {fk["column"] for fk in info.get("foreign_keys", []) if fk["references_table"] in selected}
+    for other in tables:
+        for fk in schema.get(other, {}).get("foreign_keys", []):
+            if fk["references_table"] == table:
+                keep.add(fk["references_column"])
+    return keep
+
+
+def slice_table(table: str, info: Dict, schema: Dict[str, Dict], tables: List[str], question: str) -> Dict:
+    """
+    Copy of `info` keeping only the columns relevant to `question`.
+
+    Kept: join columns (PK, FKs between selected tables, referenced columns),
+    readable identifiers, columns whose name shares a term with the question
+    (ignoring terms that only repeat the table name), and non-key columns of
+    a type family the question hints at. Dropped: everything else, including
+    boilerplate unless the question spells out its full name. FK lines are
+    kept for the remaining FK columns, without constraint names.
+    """
+    terms = _question_terms(question)
+    table_terms = set(tokenize(table))
+    hinted_types: Set[str] = set()
+    for types, words in TYPE_HINTS.values():
+        if terms & words:
+            hinted_types |= types
+
+    join_cols = _join_columns(table, info, schema, tables)
+
+    columns = []
+    for col in info.get("columns", []):
+        name = col["name"]
+        name_terms = set(tokenize(name))
+        named = bool((name_terms & terms) - table_terms)
+
+        if name in BOILERPLATE_COLUMNS or col["type"] in BULKY_TYPES:
+            keep = bool(name_terms) and name_terms <= terms
+        else:
+            keep = (
+                name in join_cols
+                or name in READABLE_COLUMNS
+                or named
+                or (col["type"] in hinted_types and not name.endswith("ID"))
+            )
+        if keep:
+            columns.append(col)
+
+    kept = {c["name"] for c in columns}
+    return {
+        "columns": columns,
+        "primary_key": list(info.get("primary_key", [])),
+        "foreign_keys": [
+            dict(fk, constraint_name=None)
+            for fk in info.get("foreign_keys", [])
+            if fk["column"] in kept
+        ],
+    }
+
+
+def slice_schema(schema: Dict[str, Dict], tables: List[str], question: str) -> Dict[str, Dict]:
+    """
+    { table: sliced info } for the selected tables that exist in `schema`.
+    """
+    return {
+        t: slice_table(t, schema[t], schema, tables, question)
+        for t in tables
+        if t in schema
+    }
+
+
+def render_sliced_schema(
+    schema: Dict[str, Dict],
+    tables: List[str],
+    question: str,
+    schema_format: str = "verbose",
+) -> str:
+    """
+    Compact per-query schema text for generate_sql_query, either in the
+    db_schema.json format ("verbose") or schema_compiler's one-line format
+    ("compact").
+    """
+    sliced = slice_schema(schema, tables, question)
+    if not sliced:
+        return ""
+    if schema_format == "compact":
+        lines = [compile_table(t, info) for t, info in sliced.items()]
+        return compile_preamble([]) + "\n\n" + "\n".join(lines)
+    return "\n\n".join(render_table_description(t, info) for t, info in sliced.items())
@@ -0,0 +1,114 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from telemetry import annotate, capture_spans, replay_spans
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key: the first caller runs the
+    function, callers arriving while it is still in flight wait for it and
+    share its result (or exception). Nothing is kept once the call is done;
+    remembering results is TTLCache's job.
+
+    - do():       for threads (sync endpoints, ThreadPoolExecutor workers)
+    - do_async(): for coroutines on one event loop
+    The two don't coalesce with each other. With enabled=False every call
+    just runs (and is counted).
+
+    Coalesced callers didn't run anything themselves, so their request
+    traces get the leader's spans instead, marked coalesced=True, and the
+    span they waited in is marked coalesced=True too. Timings are shared
+    only on success.
+    """
+
+    def __init__(self, name: str = "singleflight", enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self._tasks: Dict[Hashable, asyncio.Future] = {}
+
+        self.calls = 0
+        self.executions = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            self.calls += 1
+            future = self._calls.get(key) if self.enabled else None
+            leader = future is None
+            if leader:
+                self.executions += 1
+                if self.enabled:
+                    future = self._calls[key] = Future()
+
+        if not leader:
+            annotate(coalesced=True)
+            result, spans = future.result()
+            replay_spans(spans, coalesced=True)
+            return result
+        if future is None:
+            return fn()
+
+        try:
+            with capture_spans() as spans:
+                result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result((result, spans))
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        with self._lock:
+            self.calls += 1
+            task = self._tasks.get(key) if self.enabled else None
+            leader = task is None
+            if leader:
+                self.executions += 1
+                if not self.enabled:
+                    task = asyncio.ensure_future(fn())
+                else:
+                    task = asyncio.ensure_future(self._run_captured(fn))
+                    self._tasks[key] = task
+                    task.add_done_callback(lambda t: self._finish(key, t))
+
+        # shield: one caller going away (client disconnect) must not cancel
+        # the computation the others are waiting on
+        if not self.enabled:
+            return await asyncio.shield(task)
+        if not leader:
+            annotate(coalesced=True)
+        result, spans = await asyncio.shield(task)
+        if not leader:
+            replay_spans(spans, coalesced=True)
+        return result
+
+    @staticmethod
+    async def _run_captured(fn: Callable[[], Awaitable[Any]]) -> Any:
+        with capture_spans() as spans:
+            result = await fn()
+        return result, spans
+
+    def _finish(self, key: Hashable, task: asyncio.Future) -> None:
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+        if not task.cancelled():
+            task.exception()  # retrieved, even if every waiter was cancelled
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "calls": self.calls,
+                "executions": self.executions,
+                "coalesced": self.calls - self.executions,
+                "in_flight": len(self._calls) + len(self._tasks),
+            }
@@ -1,7 +1,68 @@
-from typing import Dict, List, Tuple, Any
+import asyncio
+import json
+import re
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Any
 
-from db_utils import get_mysql_database_schema, build_all_table_descriptions, run_sql, read_file
-from llm_utils import select_relevant_tables, generate_sql_query, rewrite_user_query
+from cache import TTLCache, fingerprint, normalize_query
+from columnar import ColumnarResult
+from config import (
+    CACHE_ENABLED, CACHE_MAX_SIZE, CACHE_TTL_S,
+    TABLE_RETRIEVER_ENABLED, TABLE_RETRIEVER_TOP_K, TABLE_RETRIEVER_MIN_RELATIVE_SCORE,
+    TABLE_RETRIEVER_MIN_CONFIDENCE, TABLE_RETRIEVER_EMBEDDING_MODEL,
+    JOIN_GRAPH_ENABLED,
+    PIPELINE_MODE, PIPELINE_MODES,
+    COLUMN_PRUNING_ENABLED,
+    SCHEMA_FORMAT, SCHEMA_SOURCE,
+    RESULT_PAGE_SIZE, PAGE_TOKEN_TTL_S, PAGE_TOKEN_MAX,
+    BATCH_LLM_CONCURRENCY, BATCH_DB_CONCURRENCY, BATCH_TABLE_SELECTION_SIZE,
+    COALESCING_ENABLED,
+    SQL_VALIDATION_ENABLED, SQL_REPAIR_MAX_ATTEMPTS,
+)
+from db_utils import (
+    get_mysql_database_schema,
+    build_all_table_descriptions,
+    parse_table_descriptions,
+    render_table_description,
+    run_sql,
+    run_sql_async,
+    fetch_sql_page,
+    fetch_sql_page_async,
+    iter_sql_batches_async,
+    read_file,
+)
+from join_graph import JoinGraph
+from llm_utils import (
+    select_relevant_tables,
+    generate_sql_query,
+    rewrite_user_query,
+    select_relevant_tables_async,
+    generate_sql_query_async,
+    rewrite_user_query_async,
+    rewrite_and_select_tables,
+    rewrite_and_select_tables_async,
+    generate_fused,
+    generate_fused_async,
+    generate_sql_query_stream_async,
+    parse_sql_query,
+    select_relevant_tables_batch_async,
+)
+from prompt_templates import (
+    RELEVANT_TABLES_PROMPT_TEMPLATE,
+    RELEVANT_TABLES_BATCH_PROMPT_TEMPLATE,
+    SQL_QUERY_PROMPT_TEMPLATE,
+    SQL_REPAIR_PROMPT_TEMPLATE,
+    QUERY_REWRITE_PROMPT_TEMPLATE,
+    REWRITE_AND_SELECT_PROMPT_TEMPLATE,
+    FUSED_PIPELINE_PROMPT_TEMPLATE,
+)
+from schema_compiler import compile_schema, render_compact
+from schema_slicer import render_sliced_schema
+from singleflight import SingleFlight
+from sql_validator import SQLValidationError, SQLValidator, validator_available
+from table_retriever import TableRetriever, parse_table_catalog, split_identifier
+from telemetry import annotate, bind_context, span
 
 
 class SQLService:
@@ -12,50 +73,968 @@ class SQLService:
         # For relevant-table selection, we can pass the concatenated descriptions
         self.all_tables_text: str = read_file("db_description.txt")
 
-    def handle_user_query(self, user_query: str) -> Tuple[str, List[str], List[dict], List[str]]:
+        # Structured view of the schema (columns / PK / FKs per table)
+        self.schema_info: Dict[str, Dict] = self._load_schema_info()
+
+        # Prompt text for the schema: the files as written, or the compact
+        # compiled format (see schema_compiler.py)
+        self.schema_format = SCHEMA_FORMAT
+        self.compiled_schema = compile_schema(self.schema_info, parse_table_catalog(self.all_tables_text))
+        self.catalog_text: str = (
+            self.compiled_schema["catalog"] if self.schema_format == "compact" else self.all_tables_text
+        )
+
+        # Per-stage caches. Every key starts with a fingerprint of the schema
+        # and prompt templates so editing either invalidates old entries.
+        self.cache_enabled = CACHE_ENABLED
+        self.cache_fingerprint = fingerprint(
+            json.dumps(self.db_tables, sort_keys=True),
+            self.all_tables_text,
+            self.schema_format,
+            QUERY_REWRITE_PROMPT_TEMPLATE,
+            RELEVANT_TABLES_PROMPT_TEMPLATE,
+            RELEVANT_TABLES_BATCH_PROMPT_TEMPLATE,
+            SQL_QUERY_PROMPT_TEMPLATE,
+            SQL_REPAIR_PROMPT_TEMPLATE,
+            REWRITE_AND_SELECT_PROMPT_TEMPLATE,
+            FUSED_PIPELINE_PROMPT_TEMPLATE,
+        )
+        self.rewrite_cache = TTLCache(CACHE_MAX_SIZE, CACHE_TTL_S, name="rewrite")
+        self.tables_cache = TTLCache(CACHE_MAX_SIZE, CACHE_TTL_S, name="tables")
+        self.sql_cache = TTLCache(CACHE_MAX_SIZE, CACHE_TTL_S, name="sql")
+
+        # Concurrent identical requests share one in-flight computation: the
+        # LLM pipeline per (mode, normalized question), execution per SQL text.
+        self.inflight_pipelines = SingleFlight("pipeline", enabled=COALESCING_ENABLED)
+        self.inflight_sql = SingleFlight("sql", enabled=COALESCING_ENABLED)
+
+        # Opaque next_page_token -> {"sql", "offset"}; kept server-side so
+        # clients page through results without ever sending SQL back.
+        self.page_tokens = TTLCache(PAGE_TOKEN_MAX, PAGE_TOKEN_TTL_S, name="page_tokens")
+
+        # Local table ranking; the LLM selects tables only when it is unsure.
+        self.table_retriever = None
+        if TABLE_RETRIEVER_ENABLED:
+            self.table_retriever = TableRetriever(
+                self.db_tables,
+                parse_table_catalog(self.all_tables_text),
+                embedding_model=TABLE_RETRIEVER_EMBEDDING_MODEL,
+            )
+        self.retrieval_counts = {"local": 0, "llm_fallback": 0}
+
+        # Speculative mode: table selection on the raw question runs next to
+        # the rewrite (sync path uses this executor, async uses the loop).
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="speculative")
+        self.speculation_counts = {"kept": 0, "discarded": 0}
+        # "SalesOrderHeader" or "sales order header" (optionally plural) in
+        # a rewritten question counts as naming that table.
+        self._table_by_mention = {}
+        for t in self.db_tables:
+            self._table_by_mention[t.lower()] = t
+            self._table_by_mention[" ".join(split_identifier(t)).lower()] = t
+        self._table_mention = re.compile(
+            r"\b(" + "|".join(map(re.escape, sorted(self._table_by_mention, key=len, reverse=True))) + r")(?:e?s)?\b",
+            re.IGNORECASE,
+        )
+
+        # FK join graph, so selected tables that can't be joined directly get
+        # the bridge tables they need before SQL generation.
+        self.join_graph = None
+        if JOIN_GRAPH_ENABLED:
+            self.join_graph = JoinGraph(self.schema_info)
+
+        # Generated SQL is checked against the schema before it runs, and
+        # sent back to the model with the errors when it fails
+        self.validation_enabled = SQL_VALIDATION_ENABLED
+        self.repair_max_attempts = SQL_REPAIR_MAX_ATTEMPTS
+        self.sql_validator = SQLValidator(self.schema_info)
+        if self.validation_enabled and not validator_available():
+            print("sqlglot is not installed; SQL validation only checks for a single SELECT")
+        self.validation_counts = {"checked": 0, "valid": 0, "repaired": 0, "rejected": 0, "repair_calls": 0}
+
+        # /query/batch: how much work deduplication and batched table
+        # selection saved
+        self.batch_counts = {"batches": 0, "questions": 0, "unique_questions": 0, "batched_selection_calls": 0}
+
+    def _load_schema_info(self) -> Dict[str, Dict]:
         """
-        Returns:
-          sql_text, relevant_tables, rows, columns
+        Table structure from INFORMATION_SCHEMA when SCHEMA_SOURCE is "live"
+        (db_tables is then regenerated from it), else parsed from
+        db_schema.json.
         """
-        modified_query = rewrite_user_query(
-            user_query=user_query,
-            table_descriptions=self.all_tables_text,
-        )
-        print(f"Rewritten query: {modified_query}")
-        # 1) Pick relevant tables
-        relevant_tables = select_relevant_tables(
-            user_query=modified_query,
-            table_descriptions=self.all_tables_text,
+        if SCHEMA_SOURCE == "live":
+            try:
+                schema = get_mysql_database_schema()
+                self.db_tables = {t: render_table_description(t, info) for t, info in schema.items()}
+                return schema
+            except Exception as e:
+                print(f"Schema introspection failed, using db_schema.json: {e}")
+        return parse_table_descriptions(self.db_tables)
+
+    def _cached(self, cache: TTLCache, key: Tuple, compute):
+        """
+        Return cache[key], computing and storing it on a miss.
+        """
+        if not self.cache_enabled:
+            return compute()
+
+        key = (self.cache_fingerprint,) + key
+        value = cache.get(key)
+        annotate(cache="miss" if value is None else "hit")
+        if value is None:
+            value = compute()
+            cache.set(key, value)
+        return value
+
+    async def _cached_async(self, cache: TTLCache, key: Tuple, compute):
+        """
+        Async variant of _cached; compute() returns an awaitable.
+        """
+        if not self.cache_enabled:
+            return await compute()
+
+        key = (self.cache_fingerprint,) + key
+        value = cache.get(key)
+        annotate(cache="miss" if value is None else "hit")
+        if value is None:
+            value = await compute()
+            cache.set(key, value)
+        return value
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.cache_enabled,
+            "fingerprint": self.cache_fingerprint,
+            "stages": {
+                c.name: c.stats()
+                for c in (self.rewrite_cache, self.tables_cache, self.sql_cache)
+            },
+        }
+
+    def retriever_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.table_retriever is not None,
+            "min_confidence": TABLE_RETRIEVER_MIN_CONFIDENCE,
+            **self.retrieval_counts,
+        }
+
+    def _retrieve_tables(self, query: str):
+        """
+        Tables from the local retriever, or None when it is not confident
+        enough and the LLM should select instead.
+        """
+        if self.table_retriever is None:
+            return None
+
+        tables, confidence = self.table_retriever.retrieve(
+            query,
+            top_k=TABLE_RETRIEVER_TOP_K,
+            min_relative_score=TABLE_RETRIEVER_MIN_RELATIVE_SCORE,
         )
+        if tables and confidence >= TABLE_RETRIEVER_MIN_CONFIDENCE:
+            self.retrieval_counts["local"] += 1
+            print(f"Retrieved tables locally (confidence {confidence:.2f})")
+            return tables
+
+        self.retrieval_counts["llm_fallback"] += 1
+        return None
+
+    def _speculation_holds(self, modified_query: str, speculative_tables: List[str]) -> bool:
+        """
+        Cheap check that tables picked from the raw question also serve the
+        rewritten one: every table the rewrite names must be covered (after
+        bridge tables), and so must the local retriever's confident top hit.
+        """
+        covered = set(speculative_tables)
+        if self.join_graph is not None:
+            covered = set(self.join_graph.connect(list(speculative_tables)))
+        mentioned = {
+            self._table_by_mention[m.group(1).lower()]
+            for m in self._table_mention.finditer(modified_query)
+        }
+        holds = bool(covered) and mentioned <= covered
+
+        if holds and self.table_retriever is not None:
+            tables, confidence = self.table_retriever.retrieve(
+                modified_query,
+                top_k=TABLE_RETRIEVER_TOP_K,
+                min_relative_score=TABLE_RETRIEVER_MIN_RELATIVE_SCORE,
+            )
+            if tables and confidence >= TABLE_RETRIEVER_MIN_CONFIDENCE:
+                holds = tables[0] in covered
+
+        self.speculation_counts["kept" if holds else "discarded"] += 1
+        print(f"Speculative tables {'kept' if holds else 'discarded'}: {speculative_tables}")
+        return holds
+
+    def speculation_stats(self) -> Dict[str, Any]:
+        total = self.speculation_counts["kept"] + self.speculation_counts["discarded"]
+        return {
+            **self.speculation_counts,
+            "keep_rate": self.speculation_counts["kept"] / total if total else 0.0,
+        }
+
+    def coalescing_stats(self) -> Dict[str, Any]:
+        return {f.name: f.stats() for f in (self.inflight_pipelines, self.inflight_sql)}
+
+    def validation_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.validation_enabled,
+            "parser": "sqlglot" if validator_available() else "keyword",
+            **self.validation_counts,
+        }
 
-        print(f"Relevant tables: {relevant_tables}")
+    def batch_stats(self) -> Dict[str, Any]:
+        return dict(self.batch_counts)
+
+    def _add_bridge_tables(self, relevant_tables: List[str]) -> List[str]:
+        if self.join_graph is None:
+            return relevant_tables
+
+        connected = self.join_graph.connect(relevant_tables)
+        if len(connected) > len(relevant_tables):
+            print(f"Added bridge tables: {connected[len(relevant_tables):]}")
+        return connected
+
+    def clear_cache(self) -> None:
+        for c in (self.rewrite_cache, self.tables_cache, self.sql_cache):
+            c.clear()
+
+    def _tables_text(self, relevant_tables: List[str], question: Optional[str] = None) -> str:
+        """
+        Build text only for the selected tables ("" if none are known).
+        With column pruning on and a question given, each table is cut down
+        to the columns that question can use.
+        """
+        if COLUMN_PRUNING_ENABLED and question:
+            return render_sliced_schema(self.schema_info, relevant_tables, question, self.schema_format)
+        if self.schema_format == "compact":
+            return render_compact(self.compiled_schema, relevant_tables)
 
-        # 2) Build text only for these tables
         relevant_tables_text_parts = []
         for t in relevant_tables:
             desc = self.db_tables.get(t)
             if desc:
                 relevant_tables_text_parts.append(desc)
 
-        if not relevant_tables_text_parts:
-            # No usable tables -> can't answer
-            return "NOT POSSIBLE WITH GIVEN TABLES", [], [], []
+        return "\n\n".join(relevant_tables_text_parts)
+
+    # ---------- SQL validation ----------
+
+    def _check_sql(self, sql_text: str) -> List[str]:
+        if sql_text.strip().upper().startswith("NOT POSSIBLE WITH GIVEN TABLES"):
+            return []
+        with span("validate_sql") as attrs:
+            errors = self.sql_validator.validate(sql_text)
+            attrs["valid"] = not errors
+        return errors
 
-        relevant_tables_text = "\n\n".join(relevant_tables_text_parts)
+    def _validation_outcome(self, sql_text: str, errors: List[str], attempts: int) -> str:
+        self.validation_counts["checked"] += 1
+        self.validation_counts["repair_calls"] += attempts
+        if errors:
+            self.validation_counts["rejected"] += 1
+            print(f"SQL rejected after {attempts} repair attempt(s): {'; '.join(errors)}")
+            raise SQLValidationError(sql_text, errors)
+        self.validation_counts["repaired" if attempts else "valid"] += 1
+        return sql_text
+
+    def _validated_sql(self, question: str, tables_text: str, sql_text: str) -> str:
+        """
+        sql_text if it passes SQLValidator, else the model's repair of it,
+        asked for at most repair_max_attempts times with the errors found.
+        Raises SQLValidationError when no attempt passes, so invalid SQL
+        never reaches MySQL.
+        """
+        if not self.validation_enabled:
+            return sql_text
+        errors = self._check_sql(sql_text)
+        attempts = 0
+        while errors and attempts < self.repair_max_attempts:
+            attempts += 1
+            print(f"SQL failed validation ({'; '.join(errors)}); repair attempt {attempts}")
+            # the repair is a generate_sql call as far as the LLM layer goes:
+            # same deadline, routes and accuracy floor
+            with span("repair_sql", attempt=attempts), span("generate_sql", repair=True):
+                sql_text = generate_sql_query(question, tables_text, previous_sql=sql_text, errors=errors)
+            errors = self._check_sql(sql_text)
+        return self._validation_outcome(sql_text, errors, attempts)
+
+    async def _validated_sql_async(self, question: str, tables_text: str, sql_text: str) -> str:
+        if not self.validation_enabled:
+            return sql_text
+        errors = self._check_sql(sql_text)
+        attempts = 0
+        while errors and attempts < self.repair_max_attempts:
+            attempts += 1
+            print(f"SQL failed validation ({'; '.join(errors)}); repair attempt {attempts}")
+            with span("repair_sql", attempt=attempts), span("generate_sql", repair=True):
+                sql_text = await generate_sql_query_async(question, tables_text, previous_sql=sql_text, errors=errors)
+            errors = self._check_sql(sql_text)
+        return self._validation_outcome(sql_text, errors, attempts)
+
+    def _validated_fused(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        # repairs see only the tables the fused call picked
+        tables_text = self._tables_text(list(result["relevant_tables"]), result["rewritten_query"])
+        return {**result, "sql": self._validated_sql(result["rewritten_query"], tables_text, result["sql"])}
+
+    async def _validated_fused_async(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        tables_text = self._tables_text(list(result["relevant_tables"]), result["rewritten_query"])
+        return {**result, "sql": await self._validated_sql_async(result["rewritten_query"], tables_text, result["sql"])}
+
+    def _resolve_mode(self, mode: Optional[str]) -> str:
+        mode = mode or PIPELINE_MODE
+        if mode not in PIPELINE_MODES:
+            raise ValueError(f"Unknown pipeline mode '{mode}'. Use one of: {', '.join(PIPELINE_MODES)}")
+        return mode
+
+    def _all_definitions_text(self) -> str:
+        if self.schema_format == "compact":
+            return render_compact(self.compiled_schema, list(self.compiled_schema["tables"]))
+        return "\n\n".join(self.db_tables.values())
+
+    def generate_sql(self, user_query: str, mode: Optional[str] = None) -> Tuple[str, List[str]]:
+        """
+        Run the LLM part of the pipeline.
+        mode (defaults to config.PIPELINE_MODE):
+          - "sequential": rewrite -> tables -> SQL, one LLM call each
+          - "speculative": tables selected on the raw question in parallel
+            with the rewrite, kept if they cover the rewritten question
+          - "two_call":   rewrite + tables in one call, then SQL
+          - "fused":      everything in one structured call
+        Concurrent calls for the same question and mode share one run.
+        Returns:
+          sql_text, relevant_tables
+        """
+        mode = self._resolve_mode(mode)
+        with span("pipeline", mode=mode):
+            return self.inflight_pipelines.do(
+                (mode, normalize_query(user_query)),
+                lambda: self._generate_sql(user_query, mode),
+            )
+
+    def _generate_sql(self, user_query: str, mode: str) -> Tuple[str, List[str]]:
+        if mode == "fused":
+            return self._generate_fused(user_query)
+
+        if mode == "two_call":
+            modified_query, relevant_tables = self._rewrite_and_select(user_query)
+        elif mode == "speculative":
+            modified_query, relevant_tables = self._speculative_rewrite_and_select(user_query)
+        else:
+            modified_query, relevant_tables = self._rewrite_then_select(user_query)
+
+        return self._generate_from_tables(modified_query, relevant_tables)
+
+    def _rewrite_then_select(self, user_query: str) -> Tuple[str, List[str]]:
+        modified_query = self._rewrite(user_query)
+        print(f"Rewritten query: {modified_query}")
+        # 1) Pick relevant tables
+        return modified_query, self._select_tables(modified_query)
+
+    def _rewrite(self, user_query: str) -> str:
+        with span("rewrite"):
+            return self._cached(
+                self.rewrite_cache,
+                (normalize_query(user_query),),
+                lambda: rewrite_user_query(
+                    user_query=user_query,
+                    table_descriptions=self.catalog_text,
+                ),
+            )
+
+    def _select_tables(self, query: str) -> List[str]:
+        """
+        Local retrieval, LLM as fallback.
+        """
+        with span("select_tables", source="local") as attrs:
+            relevant_tables = self._retrieve_tables(query)
+            if relevant_tables is None:
+                attrs["source"] = "llm"
+                relevant_tables = list(self._cached(
+                    self.tables_cache,
+                    (normalize_query(query),),
+                    lambda: select_relevant_tables(
+                        user_query=query,
+                        table_descriptions=self.catalog_text,
+                    ),
+                ))
+            return relevant_tables
+
+    def _speculative_rewrite_and_select(self, user_query: str) -> Tuple[str, List[str]]:
+        # Table selection on the raw question runs while the rewrite is in
+        # flight; both results are needed for the check, so the critical path
+        # is max(rewrite, select) instead of rewrite + select.
+        speculative = self._executor.submit(bind_context(self._select_tables, user_query))
+        modified_query = self._rewrite(user_query)
+        print(f"Rewritten query: {modified_query}")
+        speculative_tables = speculative.result()
+
+        if self._speculation_holds(modified_query, speculative_tables):
+            return modified_query, speculative_tables
+        return modified_query, self._select_tables(modified_query)
+
+    def _rewrite_and_select(self, user_query: str) -> Tuple[str, List[str]]:
+        with span("rewrite_and_select"):
+            result = self._cached(
+                self.rewrite_cache,
+                ("two_call", normalize_query(user_query)),
+                lambda: rewrite_and_select_tables(
+                    user_query=user_query,
+                    table_descriptions=self.catalog_text,
+                ),
+            )
+        print(f"Rewritten query: {result['rewritten_query']}")
+        return result["rewritten_query"], list(result["relevant_tables"])
+
+    def _prepare_tables(self, modified_query: str, relevant_tables: List[str]) -> Tuple[List[str], str]:
+        """
+        Add bridge tables and build the table text for SQL generation.
+        """
+        with span("prepare_tables"):
+            relevant_tables = self._add_bridge_tables(relevant_tables)
+
+            print(f"Relevant tables: {relevant_tables}")
+
+            # 2) Build text only for these tables
+            return relevant_tables, self._tables_text(relevant_tables, modified_query)
+
+    def _generate_from_tables(self, modified_query: str, relevant_tables: List[str]) -> Tuple[str, List[str]]:
+        relevant_tables, relevant_tables_text = self._prepare_tables(modified_query, relevant_tables)
+
+        if not relevant_tables_text:
+            # No usable tables -> can't answer
+            return "NOT POSSIBLE WITH GIVEN TABLES", []
 
         # 3) Generate SQL
-        sql_text = generate_sql_query(
+        with span("generate_sql"):
+            sql_text = self._cached(
+                self.sql_cache,
+                (normalize_query(modified_query), tuple(relevant_tables)),
+                lambda: self._validated_sql(
+                    modified_query,
+                    relevant_tables_text,
+                    generate_sql_query(
+                        user_query=modified_query,
+                        tables_text=relevant_tables_text,
+                    ),
+                ),
+            )
+
+        print(f"Generated SQL: {sql_text}")
+
+        return sql_text, relevant_tables
+
+    def _generate_fused(self, user_query: str) -> Tuple[str, List[str]]:
+        with span("fused"):
+            result = self._cached(
+                self.sql_cache,
+                ("fused", normalize_query(user_query)),
+                lambda: self._validated_fused(
+                    generate_fused(
+                        user_query=user_query,
+                        tables_text=self._all_definitions_text(),
+                    )
+                ),
+            )
+        print(f"Rewritten query: {result['rewritten_query']}")
+        print(f"Relevant tables: {result['relevant_tables']}")
+        print(f"Generated SQL: {result['sql']}")
+        return result["sql"], list(result["relevant_tables"])
+
+    async def generate_sql_async(self, user_query: str, mode: Optional[str] = None) -> Tuple[str, List[str]]:
+        """
+        Async variant of generate_sql; shares the same caches.
+        """
+        mode = self._resolve_mode(mode)
+        with span("pipeline", mode=mode):
+            return await self.inflight_pipelines.do_async(
+                (mode, normalize_query(user_query)),
+                lambda: self._generate_sql_async(user_query, mode),
+            )
+
+    async def _generate_sql_async(self, user_query: str, mode: str) -> Tuple[str, List[str]]:
+        if mode == "fused":
+            return await self._generate_fused_async(user_query)
+
+        if mode == "two_call":
+            modified_query, relevant_tables = await self._rewrite_and_select_async(user_query)
+        elif mode == "speculative":
+            modified_query, relevant_tables = await self._speculative_rewrite_and_select_async(user_query)
+        else:
+            modified_query, relevant_tables = await self._rewrite_then_select_async(user_query)
+
+        return await self._generate_from_tables_async(modified_query, relevant_tables)
+
+    async def _rewrite_then_select_async(self, user_query: str) -> Tuple[str, List[str]]:
+        modified_query = await self._rewrite_async(user_query)
+        print(f"Rewritten query: {modified_query}")
+
+        return modified_query, await self._select_tables_async(modified_query)
+
+    async def _rewrite_async(self, user_query: str) -> str:
+        with span("rewrite"):
+            return await self._cached_async(
+                self.rewrite_cache,
+                (normalize_query(user_query),),
+                lambda: rewrite_user_query_async(
+                    user_query=user_query,
+                    table_descriptions=self.catalog_text,
+                ),
+            )
+
+    async def _select_tables_async(self, query: str) -> List[str]:
+        with span("select_tables", source="local") as attrs:
+            relevant_tables = self._retrieve_tables(query)
+            if relevant_tables is None:
+                attrs["source"] = "llm"
+                relevant_tables = list(await self._cached_async(
+                    self.tables_cache,
+                    (normalize_query(query),),
+                    lambda: select_relevant_tables_async(
+                        user_query=query,
+                        table_descriptions=self.catalog_text,
+                    ),
+                ))
+            return relevant_tables
+
+    async def _speculative_rewrite_and_select_async(self, user_query: str) -> Tuple[str, List[str]]:
+        modified_query, speculative_tables = await asyncio.gather(
+            self._rewrite_async(user_query),
+            self._select_tables_async(user_query),
+        )
+        print(f"Rewritten query: {modified_query}")
+
+        if self._speculation_holds(modified_query, speculative_tables):
+            return modified_query, speculative_tables
+        return modified_query, await self._select_tables_async(modified_query)
+
+    async def _rewrite_and_select_async(self, user_query: str) -> Tuple[str, List[str]]:
+        with span("rewrite_and_select"):
+            result = await self._cached_async(
+                self.rewrite_cache,
+                ("two_call", normalize_query(user_query)),
+                lambda: rewrite_and_select_tables_async(
+                    user_query=user_query,
+                    table_descriptions=self.catalog_text,
+                ),
+            )
+        print(f"Rewritten query: {result['rewritten_query']}")
+        return result["rewritten_query"], list(result["relevant_tables"])
+
+    async def _generate_from_tables_async(self, modified_query: str, relevant_tables: List[str]) -> Tuple[str, List[str]]:
+        relevant_tables, relevant_tables_text = self._prepare_tables(modified_query, relevant_tables)
+
+        if not relevant_tables_text:
+            return "NOT POSSIBLE WITH GIVEN TABLES", []
+
+        with span("generate_sql"):
+            sql_text = await self._cached_async(
+                self.sql_cache,
+                (normalize_query(modified_query), tuple(relevant_tables)),
+                lambda: self._generate_validated_async(modified_query, relevant_tables_text),
+            )
+
+        print(f"Generated SQL: {sql_text}")
+
+        return sql_text, relevant_tables
+
+    async def _generate_validated_async(self, modified_query: str, relevant_tables_text: str) -> str:
+        sql_text = await generate_sql_query_async(
             user_query=modified_query,
             tables_text=relevant_tables_text,
         )
+        return await self._validated_sql_async(modified_query, relevant_tables_text, sql_text)
 
-        print(f"Generated SQL: {sql_text}")
+    async def _generate_fused_validated_async(self, user_query: str) -> Dict[str, Any]:
+        result = await generate_fused_async(
+            user_query=user_query,
+            tables_text=self._all_definitions_text(),
+        )
+        return await self._validated_fused_async(result)
+
+    async def _generate_fused_async(self, user_query: str) -> Tuple[str, List[str]]:
+        with span("fused"):
+            result = await self._cached_async(
+                self.sql_cache,
+                ("fused", normalize_query(user_query)),
+                lambda: self._generate_fused_validated_async(user_query),
+            )
+        print(f"Rewritten query: {result['rewritten_query']}")
+        print(f"Relevant tables: {result['relevant_tables']}")
+        print(f"Generated SQL: {result['sql']}")
+        return result["sql"], list(result["relevant_tables"])
+
+    def handle_user_query(self, user_query: str, mode: Optional[str] = None) -> Tuple[str, List[str], List[dict], List[str]]:
+        """
+        Returns:
+          sql_text, relevant_tables, rows, columns
+        """
+        sql_text, relevant_tables = self.generate_sql(user_query, mode=mode)
 
         if sql_text.strip().upper().startswith("NOT POSSIBLE WITH GIVEN TABLES"):
             # Don't run anything
             return "NOT POSSIBLE WITH GIVEN TABLES", relevant_tables, [], []
 
         # 4) Run SQL
-        rows, columns = run_sql(sql_text)
+        with span("execute") as attrs:
+            rows, columns = self.inflight_sql.do(("run_sql", sql_text), lambda: run_sql(sql_text))
+            attrs["rows"] = len(rows)
 
         return sql_text, relevant_tables, rows, columns
+
+    async def handle_user_query_async(self, user_query: str, mode: Optional[str] = None) -> Tuple[str, List[str], List[dict], List[str]]:
+        """
+        Async variant of handle_user_query for the FastAPI endpoint.
+        Returns:
+          sql_text, relevant_tables, rows, columns
+        """
+        sql_text, relevant_tables = await self.generate_sql_async(user_query, mode=mode)
+
+        if sql_text.strip().upper().startswith("NOT POSSIBLE WITH GIVEN TABLES"):
+            return "NOT POSSIBLE WITH GIVEN TABLES", relevant_tables, [], []
+
+        with span("execute") as attrs:
+            rows, columns = await self.inflight_sql.do_async(("run_sql", sql_text), lambda: run_sql_async(sql_text))
+            attrs["rows"] = len(rows)
+
+        return sql_text, relevant_tables, rows, columns
+
+    def _next_page_token(self, sql_text: str, offset: int, has_more: bool) -> Optional[str]:
+        if not has_more:
+            return None
+        token = secrets.token_urlsafe(16)
+        self.page_tokens.set(token, {"sql": sql_text, "offset": offset})
+        return token
+
+    def _page_for_token(self, page_token: str) -> Dict[str, Any]:
+        page = self.page_tokens.get(page_token)
+        if page is None:
+            raise KeyError(f"Unknown or expired page token: {page_token}")
+        return page
+
+    def _fetch_page(self, sql_text: str, offset: int) -> Tuple[ColumnarResult, bool]:
+        """
+        fetch_sql_page, shared by concurrent callers asking for the same
+        page of the same SQL.
+        """
+        with span("execute", offset=offset):
+            return self.inflight_sql.do(
+                ("page", sql_text, offset, RESULT_PAGE_SIZE),
+                lambda: fetch_sql_page(sql_text, offset, RESULT_PAGE_SIZE),
+            )
+
+    async def _fetch_page_async(self, sql_text: str, offset: int, limit: Optional[asyncio.Semaphore] = None) -> Tuple[ColumnarResult, bool]:
+        async def fetch():
+            if limit is None:
+                return await fetch_sql_page_async(sql_text, offset, RESULT_PAGE_SIZE)
+            async with limit:
+                return await fetch_sql_page_async(sql_text, offset, RESULT_PAGE_SIZE)
+
+        with span("execute", offset=offset):
+            return await self.inflight_sql.do_async(("page", sql_text, offset, RESULT_PAGE_SIZE), fetch)
+
+    def handle_user_query_page(
+        self, user_query: str, mode: Optional[str] = None
+    ) -> Tuple[str, List[str], Optional[ColumnarResult], Optional[str]]:
+        """
+        handle_user_query returning the first page of rows as a
+        ColumnarResult plus a next_page_token (None when there are no more
+        rows). The result is None when no SQL was run.
+        Returns:
+          sql_text, relevant_tables, result, next_page_token
+        """
+        sql_text, relevant_tables = self.generate_sql(user_query, mode=mode)
+
+        if sql_text.strip().upper().startswith("NOT POSSIBLE WITH GIVEN TABLES"):
+            return "NOT POSSIBLE WITH GIVEN TABLES", relevant_tables, None, None
+
+        result, has_more = self._fetch_page(sql_text, 0)
+        return sql_text, relevant_tables, result, self._next_page_token(sql_text, len(result), has_more)
+
+    async def handle_user_query_page_async(
+        self, user_query: str, mode: Optional[str] = None
+    ) -> Tuple[str, List[str], Optional[ColumnarResult], Optional[str]]:
+        sql_text, relevant_tables = await self.generate_sql_async(user_query, mode=mode)
+
+        if sql_text.strip().upper().startswith("NOT POSSIBLE WITH GIVEN TABLES"):
+            return "NOT POSSIBLE WITH GIVEN TABLES", relevant_tables, None, None
+
+        result, has_more = await self._fetch_page_async(sql_text, 0)
+        return sql_text, relevant_tables, result, self._next_page_token(sql_text, len(result), has_more)
+
+    def fetch_page(self, page_token: str) -> Tuple[ColumnarResult, Optional[str]]:
+        """
+        Next page of an earlier result; the SQL is re-run, the LLM is not.
+        Raises KeyError for unknown or expired tokens.
+        Returns:
+          result, next_page_token
+        """
+        page = self._page_for_token(page_token)
+        result, has_more = self._fetch_page(page["sql"], page["offset"])
+        return result, self._next_page_token(page["sql"], page["offset"] + len(result), has_more)
+
+    async def fetch_page_async(self, page_token: str) -> Tuple[ColumnarResult, Optional[str]]:
+        page = self._page_for_token(page_token)
+        result, has_more = await self._fetch_page_async(page["sql"], page["offset"])
+        return result, self._next_page_token(page["sql"], page["offset"] + len(result), has_more)
+
+    async def stream_user_query(self, user_query: str, mode: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of handle_user_query_async: yields events as each
+        stage finishes, so clients can show progress long before the rows
+        are in.
+
+          {"event": "rewritten_query", "data": str}
+          {"event": "relevant_tables", "data": [str]}
+          {"event": "sql_delta", "data": str}    raw LLM chunks (sequential-style modes, cache miss)
+          {"event": "sql", "data": str}          final, parsed and validated SQL
+          {"event": "columns", "data": [str]}
+          {"event": "rows", "data": [dict]}      batches of STREAM_ROW_BATCH_SIZE rows
+          {"event": "done", "data": {"row_count": int, "next_page_token": str | None}}
+        """
+        mode = self._resolve_mode(mode)
+
+        if mode == "fused":
+            result = await self._cached_async(
+                self.sql_cache,
+                ("fused", normalize_query(user_query)),
+                lambda: self._generate_fused_validated_async(user_query),
+            )
+            yield {"event": "rewritten_query", "data": result["rewritten_query"]}
+            yield {"event": "relevant_tables", "data": list(result["relevant_tables"])}
+            sql_text, relevant_tables = result["sql"], list(result["relevant_tables"])
+        else:
+            if mode == "two_call":
+                modified_query, relevant_tables = await self._rewrite_and_select_async(user_query)
+                yield {"event": "rewritten_query", "data": modified_query}
+            elif mode == "speculative":
+                modified_query, relevant_tables = await self._speculative_rewrite_and_select_async(user_query)
+                yield {"event": "rewritten_query", "data": modified_query}
+            else:
+                modified_query = await self._rewrite_async(user_query)
+                print(f"Rewritten query: {modified_query}")
+                yield {"event": "rewritten_query", "data": modified_query}
+                relevant_tables = await self._select_tables_async(modified_query)
+
+            relevant_tables, relevant_tables_text = self._prepare_tables(modified_query, relevant_tables)
+            yield {"event": "relevant_tables", "data": relevant_tables}
+
+            if not relevant_tables_text:
+                sql_text, relevant_tables = "NOT POSSIBLE WITH GIVEN TABLES", []
+            else:
+                key = (self.cache_fingerprint, normalize_query(modified_query), tuple(relevant_tables))
+                sql_text = self.sql_cache.get(key) if self.cache_enabled else None
+                if sql_text is None:
+                    chunks = []
+                    async for chunk in generate_sql_query_stream_async(modified_query, relevant_tables_text):
+                        chunks.append(chunk)
+                        yield {"event": "sql_delta", "data": chunk}
+                    sql_text = parse_sql_query("".join(chunks))
+                    # a repaired query arrives whole, after the rejected deltas
+                    sql_text = await self._validated_sql_async(modified_query, relevant_tables_text, sql_text)
+                    if self.cache_enabled:
+                        self.sql_cache.set(key, sql_text)
+                print(f"Generated SQL: {sql_text}")
+
+        yield {"event": "sql", "data": sql_text}
+
+        if sql_text.strip().upper().startswith("NOT POSSIBLE WITH GIVEN TABLES"):
+            yield {"event": "done", "data": {"row_count": 0, "next_page_token": None}}
+            return
+
+        # One row past the page tells whether a next page exists.
+        row_count = 0
+        has_more = False
+        columns_sent = False
+        async for columns, rows in iter_sql_batches_async(sql_text, limit=RESULT_PAGE_SIZE + 1):
+            if not columns_sent:
+                yield {"event": "columns", "data": columns}
+                columns_sent = True
+            if row_count + len(rows) > RESULT_PAGE_SIZE:
+                has_more = True
+                rows = rows[: RESULT_PAGE_SIZE - row_count]
+            if rows:
+                row_count += len(rows)
+                yield {"event": "rows", "data": rows}
+        yield {
+            "event": "done",
+            "data": {
+                "row_count": row_count,
+                "next_page_token": self._next_page_token(sql_text, row_count, has_more),
+            },
+        }
+
+    async def handle_batch_async(
+        self,
+        user_queries: List[str],
+        mode: Optional[str] = None,
+        llm_concurrency: int = BATCH_LLM_CONCURRENCY,
+        db_concurrency: int = BATCH_DB_CONCURRENCY,
+    ) -> List[Dict[str, Any]]:
+        """
+        Run the pipeline for several questions at once. Questions equal
+        after normalize_query run once, and distinct questions that end up
+        with the same SQL share one execution (inflight_sql, so also with
+        concurrent /query requests). Everything else runs
+        concurrently with at most llm_concurrency LLM calls and
+        db_concurrency SQL queries in flight. In sequential mode, table
+        selection for the questions the local retriever can't place is
+        batched into shared LLM calls over the catalog.
+
+        A failing question does not fail the batch. Returns one dict per
+        question, in input order:
+          {"sql", "relevant_tables", "result", "next_page_token", "error", "duplicate_of"}
+        "error" is None on success, else the message (the other fields are
+        then empty); "duplicate_of" is the index of the earlier identical
+        question whose answer was reused, or None.
+        """
+        mode = self._resolve_mode(mode)
+
+        questions: List[str] = []  # distinct questions
+        first_input: List[int] = []  # per distinct question: its first index in user_queries
+        slot_by_key: Dict[str, int] = {}
+        slots: List[int] = []  # per input: index into questions
+        for i, q in enumerate(user_queries):
+            key = normalize_query(q)
+            if key not in slot_by_key:
+                slot_by_key[key] = len(questions)
+                questions.append(q)
+                first_input.append(i)
+            slots.append(slot_by_key[key])
+
+        llm_limit = asyncio.Semaphore(llm_concurrency)
+        db_limit = asyncio.Semaphore(db_concurrency)
+
+        if mode == "sequential":
+            generated = await self._generate_batch_sequential_async(questions, llm_limit)
+        else:
+            async def generate(q: str):
+                # two_call and fused make one LLM call at a time per question,
+                # so a slot per question is exact (speculative may use two)
+                async with llm_limit:
+                    return await self.generate_sql_async(q, mode=mode)
+
+            generated = await asyncio.gather(*(generate(q) for q in questions), return_exceptions=True)
+
+        executed = set()
+
+        async def run(gen) -> Dict[str, Any]:
+            if isinstance(gen, BaseException):
+                raise gen
+            sql_text, relevant_tables = gen
+            if sql_text.strip().upper().startswith("NOT POSSIBLE WITH GIVEN TABLES"):
+                return {"sql": "NOT POSSIBLE WITH GIVEN TABLES", "relevant_tables": relevant_tables, "result": None, "next_page_token": None}
+
+            executed.add(sql_text)
+            result, has_more = await self._fetch_page_async(sql_text, 0, db_limit)
+            return {
+                "sql": sql_text,
+                "relevant_tables": relevant_tables,
+                "result": result,
+                "next_page_token": self._next_page_token(sql_text, len(result), has_more),
+            }
+
+        outcomes = await asyncio.gather(*(run(g) for g in generated), return_exceptions=True)
+
+        items = []
+        for i, slot in enumerate(slots):
+            outcome = outcomes[slot]
+            if isinstance(outcome, BaseException):
+                if not isinstance(outcome, Exception):
+                    raise outcome  # cancellation etc.
+                item = {"sql": None, "relevant_tables": [], "result": None, "next_page_token": None, "error": str(outcome) or type(outcome).__name__}
+            else:
+                item = {**outcome, "error": None}
+            item["duplicate_of"] = first_input[slot] if first_input[slot] != i else None
+            items.append(item)
+
+        self.batch_counts["batches"] += 1
+        self.batch_counts["questions"] += len(user_queries)
+        self.batch_counts["unique_questions"] += len(questions)
+        print(f"Batch: {len(user_queries)} questions, {len(questions)} unique, {len(executed)} distinct SQL queries")
+        return items
+
+    async def _generate_batch_sequential_async(self, questions: List[str], llm_limit: asyncio.Semaphore) -> List[Any]:
+        """
+        Sequential mode stage by stage across a batch: all rewrites
+        concurrently, then batched table selection, then SQL generation
+        concurrently. Returns per question a (sql_text, relevant_tables)
+        tuple, or the exception that stopped it.
+        """
+        async def limited(fn, *args):
+            async with llm_limit:
+                return await fn(*args)
+
+        rewrites = await asyncio.gather(*(limited(self._rewrite_async, q) for q in questions), return_exceptions=True)
+        ok = [i for i, r in enumerate(rewrites) if not isinstance(r, BaseException)]
+        for i in ok:
+            print(f"Rewritten query: {rewrites[i]}")
+
+        selected = await self._select_tables_batch_async([rewrites[i] for i in ok], llm_limit)
+        tables_by_index = dict(zip(ok, selected))
+
+        async def generate(i: int):
+            if isinstance(rewrites[i], BaseException):
+                raise rewrites[i]
+            tables = tables_by_index[i]
+            if isinstance(tables, BaseException):
+                raise tables
+            return await limited(self._generate_from_tables_async, rewrites[i], tables)
+
+        return await asyncio.gather(*(generate(i) for i in range(len(questions))), return_exceptions=True)
+
+    async def _select_tables_batch_async(self, queries: List[str], llm_limit: asyncio.Semaphore) -> List[Any]:
+        """
+        _select_tables_async for many questions: local retrieval and the
+        tables cache first, then the remaining distinct questions in
+        batched LLM calls of BATCH_TABLE_SELECTION_SIZE. Questions a
+        batched reply leaves out (or a failed batched call) are asked one
+        by one. Returns per question a table list or an exception.
+        """
+        selected: List[Any] = [None] * len(queries)
+        pending: Dict[str, List[int]] = {}  # normalized question -> positions
+        for i, q in enumerate(queries):
+            tables = self._retrieve_tables(q)
+            if tables is None and self.cache_enabled:
+                tables = self.tables_cache.get((self.cache_fingerprint, normalize_query(q)))
+            if tables is not None:
+                selected[i] = list(tables)
+            else:
+                pending.setdefault(normalize_query(q), []).append(i)
+
+        async def resolve(key: str, tables: Optional[List[str]]) -> None:
+            try:
+                if tables is None:
+                    async with llm_limit:
+                        tables = await select_relevant_tables_async(
+                            user_query=queries[pending[key][0]],
+                            table_descriptions=self.catalog_text,
+                        )
+                if self.cache_enabled:
+                    self.tables_cache.set((self.cache_fingerprint, key), tables)
+                for i in pending[key]:
+                    selected[i] = list(tables)
+            except Exception as e:
+                for i in pending[key]:
+                    selected[i] = e
+
+        async def select_chunk(keys: List[str]) -> None:
+            answers: List[Optional[List[str]]] = [None] * len(keys)
+            if len(keys) > 1:
+                try:
+                    async with llm_limit:
+                        answers = await select_relevant_tables_batch_async(
+                            user_queries=[queries[pending[k][0]] for k in keys],
+                            table_descriptions=self.catalog_text,
+                        )
+                    self.batch_counts["batched_selection_calls"] += 1
+                except Exception as e:
+                    print(f"Batched table selection failed, selecting one by one: {e}")
+            await asyncio.gather(*(resolve(k, tables) for k, tables in zip(keys, answers)))
+
+        keys = list(pending)
+        size = BATCH_TABLE_SELECTION_SIZE
+        await asyncio.gather(*(select_chunk(keys[i:i + size]) for i in range(0, len(keys), size)))
+        return selected
+
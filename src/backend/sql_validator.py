@@ -0,0 +1,237 @@
+import difflib
+import re
+from typing import Dict, List, Optional
+
+try:
+    import sqlglot
+    from sqlglot import exp
+    from sqlglot.errors import ParseError
+    from sqlglot.optimizer.scope import Scope, traverse_scope
+except ImportError:  # only the SELECT-only check runs without sqlglot
+    sqlglot = None
+
+# Statements anywhere in the tree that would change data or schema
+_FORBIDDEN = (
+    ("Insert", "INSERT"),
+    ("Update", "UPDATE"),
+    ("Delete", "DELETE"),
+    ("Merge", "MERGE"),
+    ("Drop", "DROP"),
+    ("Create", "CREATE"),
+    ("Alter", "ALTER"),
+    ("TruncateTable", "TRUNCATE"),
+    ("Command", "non-query statement"),
+    ("Into", "SELECT ... INTO"),
+    ("Lock", "locking clause (FOR UPDATE / FOR SHARE)"),
+)
+
+_LEADING_COMMENTS = re.compile(r"^\s*(?:(?:--|#)[^\n]*\n|/\*.*?\*/\s*)*", re.DOTALL)
+
+
+class SQLValidationError(ValueError):
+    """
+    Generated SQL that failed validation (after any repair attempts).
+    """
+
+    def __init__(self, sql: str, errors: List[str]):
+        super().__init__("Invalid SQL: " + "; ".join(errors))
+        self.sql = sql
+        self.errors = errors
+
+
+def validator_available() -> bool:
+    return sqlglot is not None
+
+
+class SQLValidator:
+    """
+    Checks generated SQL locally before it reaches MySQL:
+
+    - it parses as MySQL (sqlglot), and is a single SELECT / UNION query
+      with no data- or schema-changing statement anywhere in it
+    - every table exists in the schema
+    - every column exists in the table (or derived table / CTE) it refers
+      to; unqualified columns must exist in exactly one table in scope
+
+    Errors are short, precise sentences ("Unknown column p.Bogus in
+    Person; did you mean ...") meant to be fed back to the model. Names are
+    matched case-insensitively, as MySQL does for columns.
+
+    Without sqlglot only the SELECT-only check runs (on the leading
+    keyword), so the service still starts.
+    """
+
+    def __init__(self, schema: Dict[str, Dict]):
+        # lower-case name -> name, for tables and (per table) columns
+        self.tables: Dict[str, str] = {t.lower(): t for t in schema}
+        self.columns: Dict[str, Dict[str, str]] = {
+            t.lower(): {c["name"].lower(): c["name"] for c in info.get("columns", [])} for t, info in schema.items()
+        }
+
+    def validate(self, sql: str) -> List[str]:
+        """
+        Problems found in `sql`; empty when it is fine to run.
+        """
+        if sqlglot is None:
+            return self._validate_keyword(sql)
+        try:
+            statements = [s for s in sqlglot.parse(sql, read="mysql") if s is not None]
+        except ParseError as e:
+            return [self._parse_error(e)]
+        except Exception as e:  # tokenizer errors etc.
+            return [f"MySQL syntax error: {e}"]
+        if len(statements) != 1:
+            return [f"Expected exactly one SQL statement, found {len(statements)}"]
+
+        tree = statements[0]
+        errors = self._statement_errors(tree)
+        if errors:
+            return errors
+        try:
+            scopes = traverse_scope(tree)
+        except Exception as e:
+            return [f"Could not resolve the query's tables and columns: {e}"]
+        # traverse_scope yields inner scopes first, and an outer scope's
+        # columns include the unresolved ones of its subqueries; each column
+        # is checked once, in the innermost scope that contains it
+        checked = set()
+        for scope in scopes:
+            errors.extend(self._scope_errors(scope, checked))
+        # the same problem can show up in several scopes
+        return list(dict.fromkeys(errors))
+
+    # ---------- Statement ----------
+
+    @staticmethod
+    def _validate_keyword(sql: str) -> List[str]:
+        body = _LEADING_COMMENTS.sub("", sql).strip().rstrip(";").strip()
+        keyword = body.split(None, 1)[0].upper() if body else ""
+        if keyword not in ("SELECT", "WITH", "("):
+            return [f"Only SELECT queries are allowed, got {keyword or 'an empty statement'}"]
+        if ";" in body:
+            return ["Expected exactly one SQL statement"]
+        return []
+
+    @staticmethod
+    def _parse_error(e: "ParseError") -> str:
+        if not e.errors:
+            return f"MySQL syntax error: {e}"
+        err = e.errors[0]
+        near = (err.get("highlight") or "").strip()
+        return (
+            f"MySQL syntax error at line {err.get('line')}, column {err.get('col')}"
+            + (f" near {near!r}" if near else "")
+            + f": {err.get('description')}"
+        )
+
+    @staticmethod
+    def _statement_errors(tree: "exp.Expression") -> List[str]:
+        if not isinstance(tree, exp.Query):
+            return [f"Only SELECT queries are allowed, got {tree.key.upper()}"]
+        found = []
+        for class_name, label in _FORBIDDEN:
+            cls = getattr(exp, class_name, None)
+            if cls is not None and tree.find(cls) is not None:
+                found.append(f"{label} is not allowed; only read-only SELECT queries can run")
+        return found
+
+    # ---------- Tables and columns ----------
+
+    def _scope_errors(self, scope: "Scope", checked: set) -> List[str]:
+        errors = []
+        for name, source in scope.sources.items():
+            if not isinstance(source, exp.Table):
+                continue
+            known = self.tables.get(source.name.lower())
+            if known is None:
+                errors.append(f"Unknown table {source.name}" + self._suggest(source.name, self.tables.values()))
+            elif known != source.name:
+                # table names are case-sensitive on Linux MySQL servers
+                errors.append(f"Table {source.name} must be written {known}")
+
+        # HAVING / ORDER BY can name a select alias instead of a column
+        # JOIN ... USING (col) merges col, so it isn't ambiguous
+        aliases, merged = set(), set()
+        if isinstance(scope.expression, exp.Select):
+            aliases = {s.alias.lower() for s in scope.expression.selects if isinstance(s, exp.Alias)}
+            for join in scope.expression.args.get("joins") or []:
+                merged.update(c.name.lower() for c in join.args.get("using") or [])
+        for column in scope.columns:
+            if id(column) in checked:
+                continue
+            checked.add(id(column))
+            if isinstance(column.this, exp.Star):
+                continue
+            if column.table:
+                errors.extend(self._qualified_errors(scope, column))
+            elif column.name.lower() not in aliases | merged:
+                errors.extend(self._unqualified_errors(scope, column))
+        return errors
+
+    def _source(self, scope: "Scope", name: str):
+        # correlated subqueries can refer to an outer query's tables
+        while scope is not None:
+            if name in scope.sources:
+                return scope.sources[name]
+            scope = scope.parent
+        return None
+
+    def _source_columns(self, source) -> Optional[Dict[str, str]]:
+        """
+        {lower-case column: column} a source provides, None when unknown
+        (unknown table, SELECT * derived table, ...).
+        """
+        if isinstance(source, exp.Table):
+            return self.columns.get(source.name.lower())
+        if isinstance(source, Scope) and isinstance(source.expression, exp.Query):
+            selects = source.expression.selects
+            if any(isinstance(s, exp.Star) or (isinstance(s, exp.Column) and isinstance(s.this, exp.Star)) for s in selects):
+                return None
+            return {s.alias_or_name.lower(): s.alias_or_name for s in selects}
+        return None
+
+    def _qualified_errors(self, scope: "Scope", column: "exp.Column") -> List[str]:
+        source = self._source(scope, column.table)
+        if source is None:
+            known = ", ".join(sorted(scope.sources)) or "none"
+            return [f"Unknown table or alias {column.table} in {column.sql(dialect='mysql')} (in scope: {known})"]
+        columns = self._source_columns(source)
+        if columns is None or column.name.lower() in columns:
+            return []
+        owner = source.name if isinstance(source, exp.Table) else f"derived table {column.table}"
+        return [
+            f"Unknown column {column.table}.{column.name} in {owner}" + self._suggest(column.name, columns.values())
+        ]
+
+    def _unqualified_errors(self, scope: "Scope", column: "exp.Column") -> List[str]:
+        name = column.name.lower()
+        owners, unknown = [], False
+        for alias, source in scope.sources.items():
+            columns = self._source_columns(source)
+            if columns is None:
+                unknown = True
+            elif name in columns:
+                owners.append(alias)
+        if len(owners) > 1:
+            return [f"Column {column.name} is ambiguous; it exists in {', '.join(owners)}. Qualify it with a table alias"]
+        if owners or unknown or not scope.sources:
+            return []
+        if scope.parent is not None and self._source_columns_contain(scope.parent, name):
+            return []  # correlated reference to the outer query
+        candidates = [c for source in scope.sources.values() for c in (self._source_columns(source) or {}).values()]
+        return [f"Unknown column {column.name}" + self._suggest(column.name, candidates)]
+
+    def _source_columns_contain(self, scope: "Scope", name: str) -> bool:
+        while scope is not None:
+            for source in scope.sources.values():
+                columns = self._source_columns(source)
+                if columns is None or name in columns:
+                    return True
+            scope = scope.parent
+        return False
+
+    @staticmethod
+    def _suggest(name: str, candidates) -> str:
+        by_lower = {c.lower(): c for c in candidates}
+        close = difflib.get_close_matches(name.lower(), by_lower, n=3, cutoff=0.6)
+        return f"; did you mean {', '.join(by_lower[c] for c in close)}?" if close else ""
@@ -0,0 +1,231 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from db_utils import parse_table_description
+
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "each", "for", "from", "get",
+    "has", "have", "in", "is", "it", "its", "list", "me", "of", "on", "or", "per",
+    "return", "show", "that", "the", "their", "them", "these", "this", "to", "was",
+    "were", "what", "which", "who", "with", "all", "any", "find", "retrieve", "give",
+    "table", "tables", "column", "columns", "id", "int",
+    "varchar", "not", "null", "pk", "default", "should", "include", "if", "available",
+    "output", "such", "e", "g",
+}
+
+# Columns present in (almost) every AdventureWorks table; they say nothing
+# about what a table is for.
+_BOILERPLATE_COLUMNS = {"rowguid", "ModifiedDate"}
+
+
+def split_identifier(word: str) -> List[str]:
+    # SalesOrderHeader -> Sales Order Header, CustomerID -> Customer ID
+    return re.findall(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+", word)
+
+
+def _stem(token: str) -> str:
+    # Deliberately tiny: just enough to make "orders"/"order" and
+    # "categories"/"category" meet.
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith(("sses", "shes", "ches", "xes")):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    if len(token) > 5 and token.endswith("ed"):
+        token = token[:-2]
+        # shipped -> ship
+        if len(token) > 2 and token[-1] == token[-2]:
+            token = token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower-cased, camel-case-split, lightly stemmed tokens without stopwords.
+    """
+    tokens: List[str] = []
+    for word in re.findall(r"[A-Za-z0-9]+", text or ""):
+        for part in split_identifier(word):
+            t = part.lower()
+            if t in _STOPWORDS or len(t) < 2:
+                continue
+            tokens.append(_stem(t))
+    return tokens
+
+
+def parse_table_catalog(catalog_text: str) -> Dict[str, str]:
+    """
+    Parse db_description.txt ("- Name: description" lines) into
+    { table_name: description }.
+    """
+    out: Dict[str, str] = {}
+    for line in catalog_text.splitlines():
+        m = re.match(r"^- ([A-Za-z0-9_]+): (.*)$", line.strip())
+        if m:
+            out[m.group(1)] = m.group(2)
+    return out
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a small, fixed set of documents.
+    """
+
+    def __init__(self, docs: Dict[str, List[str]], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_tf: Dict[str, Counter] = {d: Counter(toks) for d, toks in docs.items()}
+        self.doc_len: Dict[str, int] = {d: len(toks) for d, toks in docs.items()}
+        self.avg_len = (sum(self.doc_len.values()) / len(docs)) if docs else 0.0
+
+        df: Counter = Counter()
+        for tf in self.doc_tf.values():
+            df.update(tf.keys())
+        n = len(docs)
+        self.idf: Dict[str, float] = {
+            t: math.log(1 + (n - f + 0.5) / (f + 0.5)) for t, f in df.items()
+        }
+
+    def scores(self, query_tokens: List[str]) -> Dict[str, float]:
+        q = Counter(query_tokens)
+        out: Dict[str, float] = {}
+        for doc, tf in self.doc_tf.items():
+            norm = self.k1 * (1 - self.b + self.b * self.doc_len[doc] / (self.avg_len or 1.0))
+            s = 0.0
+            for term in q:
+                f = tf.get(term)
+                if f:
+                    s += self.idf[term] * f * (self.k1 + 1) / (f + norm)
+            out[doc] = s
+        return out
+
+
+class TableRetriever:
+    """
+    In-process table ranker used in place of the select_relevant_tables LLM
+    call when it is confident.
+
+    Each table becomes one document built from its name (weighted), its
+    column names and its prose description. Ranking is BM25, optionally
+    blended with cosine similarity from a local sentence-transformers model.
+    """
+
+    NAME_WEIGHT = 2
+    # Added to the BM25 score (relative to the best match) in proportion to
+    # how much of a table's name the query spells out, so "products
+    # supplied by vendors" prefers ProductVendor over ProductProductPhoto.
+    NAME_COVERAGE_BONUS = 0.5
+
+    def __init__(
+        self,
+        db_tables: Dict[str, str],
+        table_catalog: Optional[Dict[str, str]] = None,
+        embedding_model: Optional[str] = None,
+    ):
+        table_catalog = table_catalog or {}
+        self.tables: List[str] = list(db_tables.keys())
+
+        # Descriptions name neighbouring tables ("referenced by
+        # SalesOrderHeader ..."); those mentions would make every neighbour
+        # match, so they are removed before indexing.
+        other_tables = re.compile(
+            r"`?\b(" + "|".join(sorted(map(re.escape, self.tables), key=len, reverse=True)) + r")\b`?"
+        ) if self.tables else None
+
+        docs: Dict[str, List[str]] = {}
+        self._name_tokens: Dict[str, set] = {}
+        self._doc_text: Dict[str, str] = {}
+        for table, definition in db_tables.items():
+            name_tokens = list(dict.fromkeys(tokenize(table)))
+            column_tokens = tokenize(" ".join(_column_names(definition)))
+            desc = table_catalog.get(table, "")
+            desc_tokens = tokenize(other_tables.sub(" ", desc) if other_tables else desc)
+            docs[table] = name_tokens * self.NAME_WEIGHT + column_tokens + desc_tokens
+            self._name_tokens[table] = set(name_tokens)
+            self._doc_text[table] = f"{table}. {desc} Columns: {', '.join(_column_names(definition))}"
+
+        self.bm25 = BM25Index(docs)
+
+        self.embedder = None
+        self._doc_vectors = None
+        if embedding_model:
+            self._load_embeddings(embedding_model)
+
+    def _load_embeddings(self, model_name: str) -> None:
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            print("sentence-transformers not installed; table retriever uses BM25 only")
+            return
+
+        self.embedder = SentenceTransformer(model_name)
+        self._doc_vectors = self.embedder.encode(
+            [self._doc_text[t] for t in self.tables],
+            normalize_embeddings=True,
+        )
+
+    def rank(self, query: str) -> List[Tuple[str, float]]:
+        """
+        All tables ordered by relevance, with scores scaled to [0, 1]
+        (1.0 = best match for this query).
+        """
+        query_tokens = tokenize(query)
+        raw = self.bm25.scores(query_tokens)
+        top = max(raw.values()) if raw else 0.0
+        if top <= 0:
+            return sorted(((t, 0.0) for t in self.tables), key=lambda kv: kv[0])
+
+        query_set = set(query_tokens)
+        scores = {}
+        for t, s in raw.items():
+            name = self._name_tokens[t]
+            coverage = len(name & query_set) / len(name) if name else 0.0
+            scores[t] = s / top + self.NAME_COVERAGE_BONUS * coverage
+        best = max(scores.values())
+        scores = {t: s / best for t, s in scores.items()}
+
+        if self.embedder is not None:
+            qv = self.embedder.encode([query], normalize_embeddings=True)[0]
+            for t, dv in zip(self.tables, self._doc_vectors):
+                cos = float(sum(a * b for a, b in zip(qv, dv)))
+                scores[t] = 0.5 * scores[t] + 0.5 * max(cos, 0.0)
+
+        return sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))
+
+    def retrieve(
+        self,
+        query: str,
+        top_k: int = 5,
+        min_relative_score: float = 0.5,
+    ) -> Tuple[List[str], float]:
+        """
+        Pick tables for the query.
+
+        Returns (tables, confidence): the top_k tables scoring at least
+        min_relative_score of the best one, and how clearly those tables
+        stand out from the rest (0 = no signal, 1 = clean separation).
+        """
+        ranked = self.rank(query)
+        if not ranked or ranked[0][1] <= 0:
+            return [], 0.0
+
+        selected = [t for t, s in ranked[:top_k] if s >= min_relative_score]
+
+        # Confidence: gap between the weakest selected table and the best
+        # table left out. A long flat tail means the query matched weakly
+        # and evenly, which is when the LLM should decide instead.
+        weakest = ranked[len(selected) - 1][1]
+        runner_up = ranked[len(selected)][1] if len(ranked) > len(selected) else 0.0
+        confidence = weakest - runner_up
+
+        return selected, confidence
+
+
+
+def _column_names(definition: str) -> List[str]:
+    _, info = parse_table_description(definition)
+    return [c["name"] for c in info["columns"] if c["name"] not in _BOILERPLATE_COLUMNS]
@@ -0,0 +1,304 @@
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from config import TELEMETRY_ENABLED, METRICS_BUCKETS_S
+
+
+# ---------- Metrics (Prometheus text format) ----------
+
+def _label_text(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+class Counter:
+    """
+    Monotonic counter per label combination.
+    """
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels.get(k, "")) for k in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram per label combination, in seconds.
+    """
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = METRICS_BUCKETS_S):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(k, "")) for k in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else _number(bound)
+                    labels = _label_text(self.labelnames, key, 'le="' + le + '"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {_number(total)}")
+                lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+REGISTRY: List[Any] = []
+
+SPAN_SECONDS = Histogram(
+    "nl2sql_span_duration_seconds", "Duration of pipeline steps (rewrite, llm, db.execute, ...)", ["span"]
+)
+SPAN_ERRORS = Counter("nl2sql_span_errors_total", "Pipeline steps that raised", ["span"])
+LLM_SECONDS = Histogram("nl2sql_llm_call_duration_seconds", "LLM call duration by pipeline stage", ["stage"])
+LLM_TOKENS = Counter("nl2sql_llm_tokens_total", "Provider-reported LLM tokens by pipeline stage", ["stage", "kind"])
+LLM_EVENTS = Counter(
+    "nl2sql_llm_resilience_events_total", "LLM retries, timeouts, hedges, failovers and breaker trips", ["event", "provider"]
+)
+HTTP_REQUESTS = Counter("nl2sql_http_requests_total", "HTTP requests", ["method", "route", "status"])
+HTTP_SECONDS = Histogram("nl2sql_http_request_duration_seconds", "HTTP request duration", ["method", "route"])
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---------- Tracing ----------
+
+# The request's trace (None outside collect_trace) and the innermost open
+# span (name, attributes). Both follow asyncio tasks automatically; for thread pools use
+# bind_context().
+_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("trace", default=None)
+_current: contextvars.ContextVar[Optional[Tuple[str, Dict[str, Any]]]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Trace:
+    """
+    Spans finished during one request, for the optional timing breakdown.
+    """
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        # unrounded start times, parallel to spans: nested spans often open
+        # within the 0.01 ms that start_ms keeps
+        self._starts: List[float] = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, parent: Optional[str], start: float, duration: float, attributes: Dict[str, Any], error: bool) -> None:
+        record = {
+            "name": name,
+            "parent": parent,
+            "start_ms": round((start - self.t0) * 1000, 2),
+            "duration_ms": round(duration * 1000, 2),
+        }
+        if error:
+            record["error"] = True
+        record.update(attributes)
+        with self._lock:
+            self.spans.append(record)
+            self._starts.append(start)
+
+    def breakdown(self) -> Dict[str, Any]:
+        """
+        {"total_ms", "stages": {span name: summed ms}, "spans": [...]}
+        with spans in start order. Stages nest (llm time is also counted in
+        the rewrite / generate_sql span around it).
+        """
+        with self._lock:
+            order = sorted(range(len(self.spans)), key=self._starts.__getitem__)
+            spans = [self.spans[i] for i in order]
+        stages: Dict[str, float] = {}
+        for s in spans:
+            stages[s["name"]] = round(stages.get(s["name"], 0.0) + s["duration_ms"], 2)
+        return {
+            "total_ms": round((time.perf_counter() - self.t0) * 1000, 2),
+            "stages": stages,
+            "spans": spans,
+        }
+
+
+@contextmanager
+def collect_trace() -> Iterator[Trace]:
+    """
+    Record the spans of everything run inside the block (including tasks
+    and bound thread-pool calls it starts).
+    """
+    trace = Trace()
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+def current_span() -> Optional[str]:
+    current = _current.get()
+    return current[0] if current else None
+
+
+def annotate(**attributes: Any) -> None:
+    """
+    Add attributes to the innermost open span (e.g. cache="hit").
+    """
+    current = _current.get()
+    if current is not None:
+        current[1].update(attributes)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Time a step: observed in nl2sql_span_duration_seconds{span=name} and,
+    inside collect_trace, added to the request's trace. Yields the
+    attribute dict so the step can add to it (token counts, row counts).
+    """
+    if not TELEMETRY_ENABLED:
+        yield attributes
+        return
+
+    parent = current_span()
+    token = _current.set((name, attributes))
+    start = time.perf_counter()
+    error = False
+    try:
+        yield attributes
+    except BaseException:
+        error = True
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        _current.reset(token)
+        SPAN_SECONDS.observe(duration, span=name)
+        if error:
+            SPAN_ERRORS.inc(span=name)
+        trace = _trace.get()
+        if trace is not None:
+            trace.add(name, parent, start, duration, attributes, error)
+
+
+def record_span(name: str, start: float, duration: float, **attributes: Any) -> None:
+    """
+    Record an already-timed step as a child of the current span, without
+    opening one; for async generators, which can't keep a span's context
+    open across yields.
+    """
+    if not TELEMETRY_ENABLED:
+        return
+    SPAN_SECONDS.observe(duration, span=name)
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(name, current_span(), start, duration, attributes, False)
+
+
+class _SpanCapture:
+    """
+    Stands in for the request's trace inside capture_spans(): keeps the raw
+    spans and passes them on to the trace it replaced (if any).
+    """
+
+    def __init__(self, parent: Optional[Trace]):
+        self.parent = parent
+        self.spans: List[Tuple[str, Optional[str], float, float, Dict[str, Any], bool]] = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, parent: Optional[str], start: float, duration: float, attributes: Dict[str, Any], error: bool) -> None:
+        with self._lock:
+            self.spans.append((name, parent, start, duration, dict(attributes), error))
+        if self.parent is not None:
+            self.parent.add(name, parent, start, duration, attributes, error)
+
+
+@contextmanager
+def capture_spans() -> Iterator[List[Tuple]]:
+    """
+    Collect the spans recorded inside the block (they still reach the
+    request's trace), so they can be replayed into other requests' traces
+    with replay_spans(); used by SingleFlight for coalesced callers.
+    """
+    if not TELEMETRY_ENABLED:
+        yield []
+        return
+    capture = _SpanCapture(_trace.get())
+    token = _trace.set(capture)
+    try:
+        yield capture.spans
+    finally:
+        _trace.reset(token)
+
+
+def replay_spans(spans: Sequence[Tuple], **attributes: Any) -> None:
+    """
+    Add spans from capture_spans() to the current request's trace, with
+    extra attributes (e.g. coalesced=True). Not observed in the metrics
+    again: the work ran once.
+    """
+    trace = _trace.get()
+    if trace is None:
+        return
+    for name, parent, start, duration, attrs, error in spans:
+        trace.add(name, parent, start, duration, {**attrs, **attributes}, error)
+
+
+def bind_context(fn: Callable, *args: Any) -> Callable[[], Any]:
+    """
+    fn(*args) bound to a copy of the caller's context, for
+    executor.submit / loop.run_in_executor (which don't carry contextvars
+    over to the worker thread, so spans there would miss the trace).
+    """
+    return functools.partial(contextvars.copy_context().run, fn, *args)
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# The backend is a flat set of modules run from src/backend (relative
+# db_schema.json / db_description.txt paths), so tests run from there too.
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_ROOT = os.path.dirname(os.path.dirname(BACKEND_DIR))
+
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
@@ -0,0 +1,62 @@
+import time
+
+from cache import TTLCache, normalize_query
+
+
+def test_get_set_and_counters():
+    cache = TTLCache(max_size=4, ttl_s=None)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    assert cache.get("b", "default") == "default"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 2, 1 / 3)
+
+
+def test_evicts_least_recently_used():
+    cache = TTLCache(max_size=2, ttl_s=None)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")  # b is now least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_overwrite_does_not_evict():
+    cache = TTLCache(max_size=2, ttl_s=None)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("a", 10)
+    assert len(cache) == 2
+    assert cache.get("a") == 10 and cache.get("b") == 2
+
+
+def test_entries_expire():
+    cache = TTLCache(max_size=2, ttl_s=0.05)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    assert cache.stats()["expirations"] == 1
+
+
+def test_falsy_values_are_cached():
+    cache = TTLCache()
+    cache.set("empty", [])
+    assert cache.get("empty", "missing") == []
+
+
+def test_clear():
+    cache = TTLCache()
+    cache.set("a", 1)
+    cache.clear()
+    assert cache.get("a") is None
+
+
+def test_normalize_query():
+    assert normalize_query("  List ALL orders?  ") == normalize_query("list all orders")
+    assert normalize_query("Price above 1.5, e-mail") == "price above 1.5 e-mail"
+    assert normalize_query(None) == ""
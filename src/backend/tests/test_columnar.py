@@ -0,0 +1,226 @@
+import datetime
+import json
+from array import array
+from decimal import Decimal
+
+import pytest
+from pymysql.constants import FIELD_TYPE
+
+from columnar import (
+    ColumnarResult,
+    append_fields,
+    arrow_available,
+    arrow_ipc_payload,
+    batch_payload,
+    page_payload,
+    parquet_payload,
+    query_payload,
+    result_metadata,
+    to_arrow_table,
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# (name, type_code, display_size, internal_size, precision, scale, null_ok),
+# as pymysql's cursor.description has them
+DESCRIPTION = (
+    ("ProductID", FIELD_TYPE.LONG, None, 11, 11, 0, False),
+    ("Name", FIELD_TYPE.VAR_STRING, None, 200, 200, 0, False),
+    ("ListPrice", FIELD_TYPE.NEWDECIMAL, None, 21, 21, 4, False),
+    ("Weight", FIELD_TYPE.DOUBLE, None, 22, 22, 31, True),
+    ("SellStartDate", FIELD_TYPE.DATETIME, None, 19, 19, 0, False),
+)
+ROWS = [
+    (680, "HL Road Frame - Black, 58", Decimal("1431.5000"), 1016.04, datetime.datetime(2008, 4, 30)),
+    (706, "HL Road Frame - Red, 58", Decimal("1431.5000"), None, datetime.datetime(2008, 4, 30, 12, 5, 1)),
+    (707, "Sport-100 Helmet, Red", Decimal("34.9900"), None, datetime.datetime(2011, 5, 31)),
+]
+
+
+@pytest.fixture
+def result():
+    return ColumnarResult.from_rows(DESCRIPTION, ROWS)
+
+
+# ---------- ColumnarResult ----------
+
+
+def test_from_rows_is_column_major(result):
+    assert result.columns == ["ProductID", "Name", "ListPrice", "Weight", "SellStartDate"]
+    assert result.kinds == ["int", "str", "decimal", "float", "datetime"]
+    assert len(result) == 3
+    assert result.column("Name") == [r[1] for r in ROWS]
+    assert result.rows() == ROWS
+
+
+def test_null_free_numbers_are_typed_arrays(result):
+    assert result.data[0] == array("q", [680, 706, 707])
+    assert isinstance(result.column("Weight"), list)  # has NULLs
+    only_floats = ColumnarResult.from_rows((("Weight", FIELD_TYPE.DOUBLE),), [(1.5,), (2.0,)])
+    assert only_floats.data[0] == array("d", [1.5, 2.0])
+
+
+def test_unsigned_bigint_beyond_int64_stays_a_list():
+    big = ColumnarResult.from_rows((("n", FIELD_TYPE.LONGLONG),), [(2**64 - 1,), (1,)])
+    assert big.data[0] == [2**64 - 1, 1]
+
+
+def test_decimal_specs_come_from_the_description(result):
+    assert result.decimal_specs == [None, None, (21, 4), None, None]
+    short = ColumnarResult.from_rows((("ListPrice", FIELD_TYPE.NEWDECIMAL),), [(Decimal("1.50"),)])
+    assert short.decimal_specs == [None]
+
+
+def test_unknown_type_codes_are_other():
+    assert ColumnarResult.from_rows((("x", 9999),), [("?",)]).kinds == ["other"]
+
+
+def test_empty_result_keeps_its_columns():
+    empty = ColumnarResult.from_rows(DESCRIPTION, [])
+    assert empty.columns[0] == "ProductID" and len(empty) == 0
+    assert empty.to_records() == [] and empty.rows() == []
+    assert ColumnarResult.from_rows(None, []).columns == []
+
+
+def test_records_match_dict_cursor_rows(result):
+    records = result.to_records()
+    assert records[1] == dict(zip(result.columns, ROWS[1]))
+    # duplicate names: the last value wins, like DictCursor
+    dup = ColumnarResult.from_rows((("Name", FIELD_TYPE.VAR_STRING), ("Name", FIELD_TYPE.VAR_STRING)), [("a", "b")])
+    assert dup.to_records() == [{"Name": "b"}]
+
+
+# ---------- JSON payloads ----------
+
+
+def test_records_layout(result):
+    body = json.loads(query_payload("SELECT 1", ["Product"], result, "tok"))
+    assert body["sql"] == "SELECT 1"
+    assert body["relevant_tables"] == ["Product"]
+    assert body["next_page_token"] == "tok"
+    assert body["columns"] == result.columns
+    assert body["rows"][0] == {
+        "ProductID": 680,
+        "Name": "HL Road Frame - Black, 58",
+        "ListPrice": "1431.5000",
+        "Weight": 1016.04,
+        "SellStartDate": "2008-04-30T00:00:00",
+    }
+    assert "data" not in body
+
+
+def test_columns_layout_matches_records(result):
+    records = json.loads(query_payload("SELECT 1", [], result))["rows"]
+    body = json.loads(query_payload("SELECT 1", [], result, layout="columns"))
+    assert "rows" not in body
+    assert [dict(zip(body["columns"], values)) for values in zip(*body["data"])] == records
+    assert body["data"][3] == [1016.04, None, None]
+
+
+@pytest.mark.parametrize("layout, rows_key", [("records", "rows"), ("columns", "data")])
+def test_no_result(layout, rows_key):
+    body = json.loads(query_payload("SELECT 1", [], None, layout=layout))
+    assert body["columns"] == [] and body[rows_key] == []
+
+
+def test_page_and_batch_payloads(result):
+    page = json.loads(page_payload(result, "tok", "columns"))
+    assert set(page) == {"columns", "data", "next_page_token"}
+    assert page["data"] == json.loads(query_payload("", [], result, layout="columns"))["data"]
+
+    items = [
+        {"sql": "SELECT 1", "relevant_tables": ["Product"], "result": result, "next_page_token": None, "error": None, "duplicate_of": None},
+        {"sql": None, "relevant_tables": [], "result": None, "next_page_token": None, "error": "boom", "duplicate_of": 0},
+    ]
+    results = json.loads(batch_payload(items))["results"]
+    assert results[0]["rows"] == json.loads(query_payload("SELECT 1", [], result))["rows"]
+    assert results[1] == {
+        "sql": None, "relevant_tables": [], "columns": [], "rows": [], "next_page_token": None, "error": "boom", "duplicate_of": 0,
+    }
+
+
+def test_append_fields():
+    assert json.loads(append_fields(b'{"a":1}', {"timings": {"total_ms": 2}})) == {"a": 1, "timings": {"total_ms": 2}}
+    assert append_fields(b"{}", {"b": 2}) == b'{"b":2}'
+    assert append_fields(b'{"a":1}', {}) == b'{"a":1}'
+
+
+# ---------- Arrow / Parquet ----------
+
+needs_arrow = pytest.mark.skipif(not arrow_available(), reason="pyarrow not installed")
+
+
+def read_stream(payload):
+    return pa.ipc.open_stream(payload).read_all()
+
+
+@needs_arrow
+def test_arrow_keeps_decimal_and_datetime_types(result):
+    table = to_arrow_table(result)
+    assert table.schema.field("ProductID").type == pa.int64()
+    assert table.schema.field("ListPrice").type == pa.decimal128(21, 4)
+    assert table.schema.field("SellStartDate").type == pa.timestamp("us")
+    assert table.schema.field("Weight").type == pa.float64()
+    assert table.column("ListPrice").to_pylist() == [r[2] for r in ROWS]
+    assert table.column("SellStartDate").to_pylist() == [r[4] for r in ROWS]
+    assert table.column("Weight").to_pylist() == [1016.04, None, None]
+
+
+@needs_arrow
+def test_wide_decimal_uses_decimal256():
+    wide = ColumnarResult.from_rows((("Total", FIELD_TYPE.NEWDECIMAL, None, 67, 67, 4),), [(Decimal("1" * 60 + ".5"),)])
+    column = to_arrow_table(wide).column("Total")
+    assert column.type == pa.decimal256(67, 4)
+    assert column.to_pylist() == [Decimal("1" * 60 + ".5000")]
+
+
+@needs_arrow
+def test_decimal_without_spec_is_inferred():
+    table = to_arrow_table(ColumnarResult(["p"], ["decimal"], [[Decimal("1.50"), None]]))
+    assert pa.types.is_decimal(table.schema.field("p").type)
+    assert table.column("p").to_pylist() == [Decimal("1.50"), None]
+
+
+@needs_arrow
+def test_values_arrow_rejects_fall_back_to_strings():
+    # zero dates come back from pymysql as strings
+    dates = ColumnarResult(["d"], ["datetime"], [[datetime.datetime(2011, 5, 31), "0000-00-00 00:00:00"]])
+    assert to_arrow_table(dates).column("d").to_pylist() == ["2011-05-31 00:00:00", "0000-00-00 00:00:00"]
+
+
+@needs_arrow
+def test_time_and_bytes_columns():
+    table = to_arrow_table(ColumnarResult(["t", "b"], ["time", "bytes"], [[datetime.timedelta(hours=1)], [b"\x01"]]))
+    assert table.schema.field("t").type == pa.duration("us")
+    assert table.column("t").to_pylist() == [datetime.timedelta(hours=1)]
+    assert table.column("b").to_pylist() == [b"\x01"]
+
+
+@needs_arrow
+def test_ipc_stream_round_trips_rows_and_metadata(result):
+    metadata = result_metadata("SELECT 1", ["Product"], "tok")
+    table = read_stream(arrow_ipc_payload(result, metadata))
+    assert table.to_pylist() == result.to_records()
+    meta = {k.decode(): v.decode() for k, v in table.schema.metadata.items()}
+    assert meta == {"sql": "SELECT 1", "relevant_tables": '["Product"]', "next_page_token": "tok"}
+
+
+@needs_arrow
+def test_parquet_round_trips_rows_and_types(result):
+    table = pq.read_table(pa.BufferReader(parquet_payload(result, result_metadata(next_page_token=None))))
+    assert table.schema.field("ListPrice").type == pa.decimal128(21, 4)
+    assert table.column("SellStartDate").to_pylist() == [r[4] for r in ROWS]
+    assert table.to_pylist() == result.to_records()
+    assert table.schema.metadata[b"next_page_token"] == b""
+
+
+@needs_arrow
+def test_empty_and_missing_results():
+    assert read_stream(arrow_ipc_payload(None)).num_rows == 0
+    empty = read_stream(arrow_ipc_payload(ColumnarResult.from_rows(DESCRIPTION, [])))
+    assert empty.column_names == [d[0] for d in DESCRIPTION]
+    assert empty.schema.field("ListPrice").type == pa.decimal128(21, 4)
@@ -0,0 +1,307 @@
+import threading
+import time
+
+import pymysql
+import pytest
+from pymysql.constants import FIELD_TYPE
+
+import db_utils
+from db_utils import ConnectionPool, PoolTimeout, page_sql
+
+ROWS = [(i, f"name {i}") for i in range(10)]
+DESCRIPTION = (("id", FIELD_TYPE.LONG), ("name", FIELD_TYPE.VAR_STRING))
+
+
+def server_error(errno: int, message: str = "error") -> pymysql.err.MySQLError:
+    """
+    The exception pymysql raises for a server error packet with this errno
+    (e.g. 1054 unknown column comes back as OperationalError).
+    """
+    packet = b"\xff" + errno.to_bytes(2, "little") + b"#42000" + message.encode()
+    try:
+        pymysql.err.raise_mysql_exception(packet)
+    except pymysql.err.MySQLError as e:
+        return e
+
+
+class FakeCursor:
+    def __init__(self, conn, dict_rows: bool):
+        self.conn = conn
+        self.dict_rows = dict_rows
+        self.rows = []
+        self.description = None
+        self.closed = False
+
+    def execute(self, query):
+        self.conn.queries.append(query)
+        if self.conn.error is not None:
+            raise self.conn.error
+        self.rows = list(ROWS)
+        self.description = DESCRIPTION
+
+    def scroll(self, value, mode="relative"):
+        self.rows = self.rows[value:]
+
+    def fetchmany(self, size):
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        if self.dict_rows:
+            return [dict(zip(("id", "name"), row)) for row in batch]
+        return batch
+
+    def close(self):
+        self.closed = True
+        self.rows = []
+
+
+class FakeConnection:
+    def __init__(self, error=None):
+        self.open = True
+        self.error = error
+        self.pings = 0
+        self.ping_error = None
+        self.queries = []
+        self.cursors = []
+
+    def ping(self, reconnect=False):
+        self.pings += 1
+        if self.ping_error is not None:
+            raise self.ping_error
+
+    def cursor(self, cursorclass=None):
+        cur = FakeCursor(self, dict_rows=cursorclass is db_utils.SSDictCursor)
+        self.cursors.append(cur)
+        return cur
+
+    def close(self):
+        self.open = False
+
+
+class Connector:
+    def __init__(self, error=None):
+        self.error = error
+        self.made = []
+
+    def __call__(self):
+        conn = FakeConnection(self.error)
+        self.made.append(conn)
+        return conn
+
+
+@pytest.fixture
+def connector(monkeypatch):
+    connect = Connector()
+    pool = ConnectionPool(connect=connect, max_size=2, timeout_s=0.1)
+    monkeypatch.setattr(db_utils, "get_pool", lambda: pool)
+    connect.pool = pool
+    return connect
+
+
+# ---------- ConnectionPool ----------
+
+
+def test_pool_reuses_released_connections():
+    connect = Connector()
+    pool = ConnectionPool(connect=connect, max_size=2)
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    assert len(connect.made) == 1
+    assert conn.pings == 1  # health-checked on checkout
+
+
+def test_pool_is_bounded_and_times_out():
+    pool = ConnectionPool(connect=Connector(), max_size=2, timeout_s=0.05)
+    a, b = pool.acquire(), pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert pool.stats()["timeouts"] == 1
+
+    # a release wakes a waiting caller
+    threading.Timer(0.02, pool.release, [a]).start()
+    pool.timeout_s = 1
+    assert pool.acquire() is a
+    pool.release(b)
+
+
+def test_pool_context_manager_discards_only_broken_connections():
+    pool = ConnectionPool(connect=Connector(), max_size=1)
+    with pytest.raises(pymysql.err.ProgrammingError):
+        with pool.connection() as conn:
+            raise pymysql.err.ProgrammingError(1064, "syntax error")
+    assert pool.stats()["idle"] == 1 and conn.open
+
+    with pytest.raises(pymysql.err.OperationalError):
+        with pool.connection() as same:
+            raise server_error(1054, "Unknown column 'Bogus'")
+    assert same is conn and conn.open
+
+    with pytest.raises(pymysql.err.OperationalError):
+        with pool.connection() as same:
+            raise pymysql.err.OperationalError(2013, "lost connection")
+    assert same is conn and not conn.open
+    assert pool.stats()["discarded"] == 1
+    assert pool.stats()["open"] == 0
+
+
+def test_pool_recycles_idle_old_and_dead_connections():
+    connect = Connector()
+    pool = ConnectionPool(connect=connect, max_size=1, max_idle_s=0.05, max_lifetime_s=10)
+    conn = pool.acquire()
+    pool.release(conn)
+    time.sleep(0.06)
+    fresh = pool.acquire()
+    assert fresh is not conn and not conn.open
+    assert pool.stats()["recycled_idle"] == 1
+
+    fresh.ping_error = pymysql.err.OperationalError(2006, "gone away")
+    pool.release(fresh)
+    assert pool.acquire() is not fresh
+    assert pool.stats()["health_check_failures"] == 1
+
+    pool.max_lifetime_s = 0
+    conn = connect.made[-1]
+    pool.release(conn)
+    assert pool.acquire() is not conn
+    assert pool.stats()["recycled_lifetime"] == 1
+    assert pool.stats()["open"] == 1
+
+
+def test_pool_failed_connect_frees_the_slot():
+    pool = ConnectionPool(connect=Connector(), max_size=1)
+
+    def fail():
+        raise pymysql.err.OperationalError(2003, "can't connect")
+
+    pool._connect = fail
+    with pytest.raises(pymysql.err.OperationalError):
+        pool.acquire()
+    assert pool.stats()["open"] == 0
+
+
+def test_pool_close_all_closes_idle_connections():
+    pool = ConnectionPool(connect=Connector(), max_size=2)
+    a, b = pool.acquire(), pool.acquire()
+    pool.release(a)
+    pool.close_all()
+    assert not a.open and b.open
+    assert pool.stats()["open"] == 1
+
+
+# ---------- page_sql ----------
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("SELECT * FROM Product", "SELECT * FROM Product LIMIT 20, 10"),
+        ("  SELECT * FROM Product ;  ", "SELECT * FROM Product LIMIT 20, 10"),
+        ("SELECT * FROM (SELECT * FROM Product LIMIT 5) p WHERE ListPrice > 0", "SELECT * FROM (SELECT * FROM Product LIMIT 5) p WHERE ListPrice > 0 LIMIT 20, 10"),
+    ],
+)
+def test_page_sql_appends_limit(query, expected):
+    assert page_sql(query, 20, 10) == expected
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "",
+        ";",
+        "SELECT * FROM Product LIMIT 5",
+        "SELECT * FROM Product limit 5, 10",
+        "SELECT * FROM Product LIMIT 10 OFFSET 5",
+        "SELECT * FROM Product FOR UPDATE",
+        "SELECT * FROM Product FOR SHARE",
+        "SELECT * FROM Product FOR UPDATE SKIP LOCKED",
+        "SELECT * FROM Product LOCK IN SHARE MODE",
+        "SELECT COUNT(*) FROM Product INTO @n",
+        "SELECT ProductID, Name FROM Product INTO @id, @name",
+        "SELECT * FROM Product INTO OUTFILE '/tmp/x'",
+        "SELECT * FROM Product INTO OUTFILE '/tmp/x' FIELDS TERMINATED BY ','",
+        "SELECT * FROM Product; DROP TABLE Product",
+        "SELECT * FROM Product -- LIMIT 5",
+        "SELECT * FROM Product # note",
+        "SELECT /* hint */ * FROM Product",
+    ],
+)
+def test_page_sql_refuses_unsafe_queries(query):
+    assert page_sql(query, 0, 10) is None
+
+
+# ---------- fetch_sql_page / iter_sql_batches ----------
+
+
+def test_fetch_page_uses_server_limit_and_keeps_connection(connector):
+    result, has_more = db_utils.fetch_sql_page("SELECT id, name FROM Product", offset=2, page_size=3)
+    conn = connector.made[0]
+    assert conn.queries == ["SELECT id, name FROM Product LIMIT 2, 4"]
+    assert has_more and len(result) == 3
+    assert connector.pool.stats()["idle"] == 1
+
+
+def test_fetch_page_without_server_limit_discards_unread_result(connector):
+    _, has_more = db_utils.fetch_sql_page("SELECT id, name FROM Product LIMIT 8", page_size=3)
+    assert has_more
+    assert connector.pool.stats()["discarded"] == 1
+
+
+@pytest.mark.parametrize("errno", [1064, 1146, 1054, 1052, 1055, 1242])
+def test_statement_errors_are_rejections(errno):
+    error = server_error(errno)
+    assert db_utils.statement_rejected(error)
+    assert not db_utils.connection_broken(error)
+
+
+@pytest.mark.parametrize("errno", [2003, 2006, 2013, 1927])
+def test_client_errors_mean_a_broken_connection(errno):
+    error = pymysql.err.OperationalError(errno, "lost")
+    assert db_utils.connection_broken(error)
+    assert not db_utils.statement_rejected(error)
+
+
+def test_busy_server_is_not_a_rejection():
+    error = server_error(1205, "Lock wait timeout exceeded")
+    assert not db_utils.statement_rejected(error)
+    assert not db_utils.connection_broken(error)
+
+
+@pytest.mark.parametrize("fetch", ["page", "batches"])
+@pytest.mark.parametrize("errno", [1064, 1054, 1052, 1055, 1242])
+def test_rejected_statement_returns_connection_to_pool(connector, fetch, errno):
+    connector.error = server_error(errno)
+    with pytest.raises(type(connector.error)):
+        if fetch == "page":
+            db_utils.fetch_sql_page("SELECT Bogus FROM Product")
+        else:
+            list(db_utils.iter_sql_batches("SELECT Bogus FROM Product"))
+    conn = connector.made[0]
+    assert conn.open and conn.cursors[0].closed
+    stats = connector.pool.stats()
+    assert stats["discarded"] == 0 and stats["idle"] == 1
+
+
+@pytest.mark.parametrize("fetch", ["page", "batches"])
+@pytest.mark.parametrize("error", [pymysql.err.OperationalError(2013, "lost"), pymysql.err.InterfaceError(0, "closed")])
+def test_broken_connection_is_discarded(connector, fetch, error):
+    connector.error = error
+    with pytest.raises(type(error)):
+        if fetch == "page":
+            db_utils.fetch_sql_page("SELECT id FROM Product")
+        else:
+            list(db_utils.iter_sql_batches("SELECT id FROM Product"))
+    assert not connector.made[0].open
+    assert connector.pool.stats()["discarded"] == 1
+
+
+def test_iter_batches_reads_everything_and_keeps_connection(connector):
+    batches = list(db_utils.iter_sql_batches("SELECT id, name FROM Product", batch_size=4))
+    assert [len(rows) for _, rows in batches] == [4, 4, 2]
+    assert batches[0][0] == ["id", "name"]
+    assert connector.pool.stats()["idle"] == 1
+
+
+def test_iter_batches_stopped_early_discards_connection(connector):
+    batches = db_utils.iter_sql_batches("SELECT id, name FROM Product", batch_size=4)
+    next(batches)
+    batches.close()
+    assert connector.pool.stats()["discarded"] == 1
@@ -0,0 +1,119 @@
+import pytest
+
+from join_graph import JoinGraph
+
+
+def fk(column, table, references_column=None):
+    return {"column": column, "references_table": table, "references_column": references_column or column}
+
+
+# A slice of AdventureWorks: Customer reaches Product either through the
+# order tables or through the BusinessEntity hub; AWBuildVersion is an island.
+SCHEMA = {
+    "Customer": {"foreign_keys": [fk("BusinessEntityID", "BusinessEntity")]},
+    "SalesOrderHeader": {"foreign_keys": [fk("CustomerID", "Customer")]},
+    "SalesOrderDetail": {
+        "foreign_keys": [fk("SalesOrderID", "SalesOrderHeader"), fk("ProductID", "SpecialOfferProduct")],
+    },
+    "SpecialOfferProduct": {"foreign_keys": [fk("ProductID", "Product"), fk("SpecialOfferID", "SpecialOffer")]},
+    "SpecialOffer": {},
+    "Product": {},
+    "ProductVendor": {"foreign_keys": [fk("BusinessEntityID", "BusinessEntity"), fk("ProductID", "Product")]},
+    "BusinessEntity": {},
+    "Person": {"foreign_keys": [fk("BusinessEntityID", "BusinessEntity")]},
+    "Vendor": {"foreign_keys": [fk("BusinessEntityID", "BusinessEntity")]},
+    "Store": {"foreign_keys": [fk("BusinessEntityID", "BusinessEntity")]},
+    "Employee": {"foreign_keys": [fk("ManagerID", "Employee", "BusinessEntityID")]},
+    "AWBuildVersion": {},
+}
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return JoinGraph(SCHEMA)
+
+
+def is_connected(graph, tables):
+    seen, todo = {tables[0]}, [tables[0]]
+    while todo:
+        for nb in graph.edges[todo.pop()]:
+            if nb in tables and nb not in seen:
+                seen.add(nb)
+                todo.append(nb)
+    return seen == set(tables)
+
+
+# ---------- Edges ----------
+
+
+def test_fk_chain_is_collapsed_into_a_direct_edge(graph):
+    assert graph.edges["SalesOrderDetail"]["Product"] == [("ProductID", "ProductID")]
+    assert graph.join_conditions(["SalesOrderDetail", "Product"]) == ["Product.ProductID = SalesOrderDetail.ProductID"]
+
+
+def test_self_reference_adds_no_edge(graph):
+    assert graph.edges["Employee"] == {}
+
+
+# ---------- Shortest paths ----------
+
+
+def test_path_avoids_hub_tables(graph):
+    # both routes are three joins; the one through BusinessEntity costs more
+    assert graph.shortest_path("Customer", "Product") == ["Customer", "SalesOrderHeader", "SalesOrderDetail", "Product"]
+    assert graph.path_cost("Customer", "Product") == 8
+    assert graph.shortest_path("Product", "Customer") == ["Product", "SalesOrderDetail", "SalesOrderHeader", "Customer"]
+
+
+def test_neighbours_are_one_step_apart(graph):
+    assert graph.shortest_path("Person", "BusinessEntity") == ["Person", "BusinessEntity"]
+    assert graph.path_cost("Person", "BusinessEntity") == 1
+    assert graph.path_cost("Person", "Person") == 0
+
+
+def test_unreachable_and_unknown_tables_have_no_path(graph):
+    assert graph.shortest_path("Customer", "AWBuildVersion") is None
+    assert graph.path_cost("Customer", "AWBuildVersion") is None
+    assert graph.shortest_path("Nope", "Customer") is None
+    assert graph.path_cost("Customer", "Nope") is None
+
+
+# ---------- connect ----------
+
+
+def test_connect_adds_bridge_tables_after_the_input(graph):
+    assert graph.connect(["Customer", "Product"]) == ["Customer", "Product", "SalesOrderHeader", "SalesOrderDetail"]
+
+
+def test_connect_shares_bridges_between_terminals(graph):
+    tables = graph.connect(["Customer", "Product", "SpecialOffer"])
+    assert tables[:3] == ["Customer", "Product", "SpecialOffer"]
+    assert set(tables[3:]) == {"SalesOrderHeader", "SalesOrderDetail", "SpecialOfferProduct"}
+    assert is_connected(graph, tables)
+
+
+def test_connected_tables_need_no_bridge(graph):
+    assert graph.connect(["SalesOrderDetail", "Customer", "SalesOrderHeader"]) == [
+        "SalesOrderDetail",
+        "Customer",
+        "SalesOrderHeader",
+    ]
+
+
+def test_connect_leaves_unreachable_and_unknown_tables_alone(graph):
+    tables = graph.connect(["Customer", "AWBuildVersion", "Nope", "Product"])
+    assert tables == ["Customer", "AWBuildVersion", "Nope", "Product", "SalesOrderHeader", "SalesOrderDetail"]
+
+
+@pytest.mark.parametrize("tables", [[], ["Product"], ["Product", "Product"], ["Product", "Nope"]])
+def test_connect_single_table_is_unchanged(graph, tables):
+    assert graph.connect(tables) == tables
+
+
+def test_join_conditions_cover_every_edge_among_the_tables(graph):
+    tables = graph.connect(["Customer", "Product"])
+    assert sorted(graph.join_conditions(tables)) == [
+        "Customer.CustomerID = SalesOrderHeader.CustomerID",
+        "Product.ProductID = SalesOrderDetail.ProductID",
+        "SalesOrderDetail.SalesOrderID = SalesOrderHeader.SalesOrderID",
+    ]
@@ -0,0 +1,238 @@
+import asyncio
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+from llm_providers import LLMProvider
+from llm_resilience import CircuitBreaker, LLMDeadlineExceeded, LLMUnavailable, ResilientProvider
+
+STAGE = "generate_sql"
+OK = {"text": "SELECT 1", "prompt_tokens": 1, "completion_tokens": 1}
+
+
+class FakeAPIError(Exception):
+    # looks like an SDK status error to llm_resilience.is_retryable
+    def __init__(self, status_code: int):
+        super().__init__(f"fake provider returned {status_code}")
+        self.status_code = status_code
+
+
+class FakeProvider(LLMProvider):
+    """
+    Plays back a script of (delay_s, exception or None) outcomes, one per
+    call; the last one repeats once the script runs out.
+    """
+
+    def __init__(self, name: str, script: List[tuple]):
+        self.name = name
+        self.model = f"{name}-fake"
+        self.script = list(script)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _next(self) -> tuple:
+        with self._lock:
+            self.calls += 1
+            return self.script.pop(0) if len(self.script) > 1 else self.script[0]
+
+    def generate(self, prompt: str, stage: Optional[str] = None) -> Dict[str, Any]:
+        delay, error = self._next()
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return dict(OK, text=f"{self.name} answer")
+
+    async def generate_async(self, prompt: str, stage: Optional[str] = None) -> Dict[str, Any]:
+        delay, error = self._next()
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return dict(OK, text=f"{self.name} answer")
+
+
+def resilient(providers: List[LLMProvider], **kwargs) -> ResilientProvider:
+    options = dict(
+        stage_deadlines_s={STAGE: 2.0},
+        max_attempts=3,
+        backoff_s=(0.0, 0.0),
+        hedge=False,
+        breaker_failures=3,
+        breaker_cooldown_s=0.2,
+        seed=0,
+    )
+    options.update(kwargs)
+    return ResilientProvider(providers, **options)
+
+
+# ---------- Retries ----------
+
+
+@pytest.mark.parametrize(
+    "error", [TimeoutError("read timed out"), ConnectionError("reset"), FakeAPIError(429), FakeAPIError(500), FakeAPIError(503)]
+)
+def test_retries_retryable_errors(error):
+    provider = FakeProvider("primary", [(0, error), (0, None)])
+    llm = resilient([provider])
+    assert llm.generate("q", stage=STAGE)["text"] == "primary answer"
+    assert provider.calls == 2
+    assert llm.stats()["retries"] == 1
+
+
+@pytest.mark.parametrize("status", [400, 401, 403, 404, 422])
+def test_does_not_retry_other_4xx(status):
+    provider = FakeProvider("primary", [(0, FakeAPIError(status)), (0, None)])
+    llm = resilient([provider])
+    with pytest.raises(FakeAPIError):
+        llm.generate("q", stage=STAGE)
+    assert provider.calls == 1
+    assert llm.stats()["retries"] == 0
+    # the provider answered, so its breaker stays closed
+    assert llm.breakers[0].state == "closed"
+
+
+def test_async_retries_then_succeeds():
+    provider = FakeProvider("primary", [(0, FakeAPIError(503)), (0, None)])
+    llm = resilient([provider])
+    assert asyncio.run(llm.generate_async("q", stage=STAGE))["text"] == "primary answer"
+    assert provider.calls == 2
+
+
+# ---------- Deadlines ----------
+
+
+def test_stalled_call_hits_stage_deadline():
+    provider = FakeProvider("primary", [(1.0, None)])
+    llm = resilient([provider], stage_deadlines_s={STAGE: 0.2})
+    t0 = time.monotonic()
+    with pytest.raises(LLMDeadlineExceeded):
+        llm.generate("q", stage=STAGE)
+    assert time.monotonic() - t0 < 0.8
+
+
+def test_stalled_async_call_hits_stage_deadline():
+    provider = FakeProvider("primary", [(1.0, None)])
+    llm = resilient([provider], stage_deadlines_s={STAGE: 0.2})
+    t0 = time.monotonic()
+    with pytest.raises(LLMDeadlineExceeded):
+        asyncio.run(llm.generate_async("q", stage=STAGE))
+    assert time.monotonic() - t0 < 0.8
+
+
+def test_deadline_runs_out_during_backoff():
+    provider = FakeProvider("primary", [(0, FakeAPIError(503)), (0, None)])
+    llm = resilient([provider], stage_deadlines_s={STAGE: 0.2}, backoff_s=(10.0, 10.0))
+    t0 = time.monotonic()
+    with pytest.raises(LLMDeadlineExceeded) as info:
+        llm.generate("q", stage=STAGE)
+    assert time.monotonic() - t0 < 0.8
+    assert provider.calls == 1
+    assert isinstance(info.value.__cause__, FakeAPIError)
+
+
+# ---------- Hedging ----------
+
+
+def test_hedged_request_wins():
+    # fast answers to learn the latency, then a stall that the hedge beats
+    provider = FakeProvider("primary", [(0.01, None)] * 3 + [(1.5, None), (0.01, None)])
+    llm = resilient([provider], hedge=True, hedge_min_samples=3, hedge_min_delay_s=0.05)
+    for _ in range(3):
+        llm.generate("q", stage=STAGE)
+    t0 = time.monotonic()
+    assert llm.generate("q", stage=STAGE)["text"] == "primary answer"
+    assert time.monotonic() - t0 < 0.5
+    stats = llm.stats()
+    assert stats["hedges"] == 1
+    assert stats["hedge_wins"] == 1
+
+
+def test_async_hedged_request_wins():
+    provider = FakeProvider("primary", [(0.01, None)] * 3 + [(1.5, None), (0.01, None)])
+    llm = resilient([provider], hedge=True, hedge_min_samples=3, hedge_min_delay_s=0.05)
+
+    async def run() -> float:
+        for _ in range(3):
+            await llm.generate_async("q", stage=STAGE)
+        t0 = time.monotonic()
+        await llm.generate_async("q", stage=STAGE)
+        return time.monotonic() - t0
+
+    assert asyncio.run(run()) < 0.5
+    assert llm.stats()["hedge_wins"] == 1
+
+
+# ---------- Circuit breaker and failover ----------
+
+
+def test_breaker_opens_then_fails_over():
+    primary = FakeProvider("primary", [(0, FakeAPIError(503))])
+    backup = FakeProvider("backup", [(0, None)])
+    llm = resilient([primary, backup])
+
+    # each call: primary fails, the retry fails over to the backup
+    for _ in range(3):
+        assert llm.generate("q", stage=STAGE)["text"] == "backup answer"
+    assert primary.calls == 3
+    assert llm.breakers[0].state == "open"
+    assert llm.stats()["breaker_opens"] == 1
+
+    # open: the primary is skipped entirely
+    assert llm.generate("q", stage=STAGE)["text"] == "backup answer"
+    assert primary.calls == 3
+    assert llm.stats()["failovers"] >= 4
+
+
+def test_half_open_probe_success_closes_breaker():
+    primary = FakeProvider("primary", [(0, FakeAPIError(503))] * 3 + [(0, None)])
+    backup = FakeProvider("backup", [(0, None)])
+    llm = resilient([primary, backup])
+    for _ in range(3):
+        llm.generate("q", stage=STAGE)
+    assert llm.breakers[0].state == "open"
+
+    time.sleep(0.25)  # cooldown
+    assert llm.generate("q", stage=STAGE)["text"] == "primary answer"
+    assert llm.breakers[0].state == "closed"
+
+
+def test_half_open_probe_failure_reopens_breaker():
+    primary = FakeProvider("primary", [(0, FakeAPIError(503))])
+    backup = FakeProvider("backup", [(0, None)])
+    llm = resilient([primary, backup])
+    for _ in range(3):
+        llm.generate("q", stage=STAGE)
+
+    time.sleep(0.25)
+    assert llm.generate("q", stage=STAGE)["text"] == "backup answer"
+    assert primary.calls == 4  # the probe
+    assert llm.breakers[0].state == "open"
+    assert llm.stats()["breaker_opens"] == 2
+
+
+def test_single_provider_with_open_breaker_fails_fast():
+    provider = FakeProvider("primary", [(0, FakeAPIError(503))])
+    llm = resilient([provider], max_attempts=1)
+    for _ in range(3):
+        with pytest.raises(FakeAPIError):
+            llm.generate("q", stage=STAGE)
+    with pytest.raises(LLMUnavailable):
+        llm.generate("q", stage=STAGE)
+    assert provider.calls == 3
+
+
+def test_breaker_ignores_stale_outcomes():
+    breaker = CircuitBreaker(failure_threshold=1, cooldown_s=0.05)
+    stale = breaker.allow()
+    assert breaker.record_failure(breaker.allow())
+    # a call started before the breaker opened can't close it
+    breaker.record_success(stale)
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    probe = breaker.allow()
+    assert probe == "probe"
+    assert breaker.allow() is None  # one probe at a time
+    breaker.release(probe)  # abandoned probe: the next call gets the slot
+    assert breaker.allow() == "probe"
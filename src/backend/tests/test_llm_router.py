@@ -0,0 +1,81 @@
+import threading
+
+from llm_router import ModelRouter
+
+
+def make_router(**kwargs) -> ModelRouter:
+    options = dict(mode="adaptive", min_samples=5, explore=0.0, accuracy_path=None, seed=0)
+    options.update(kwargs)
+    return ModelRouter(["a:slow", "b:fast"], {"rewrite": [0, 1]}, [0], **options)
+
+
+def test_static_keeps_configured_order():
+    router = make_router(mode="static")
+    for _ in range(10):
+        router.record(1, "rewrite", 0.01)
+        router.record(0, "rewrite", 1.0)
+    assert router.order("rewrite") == [0, 1]
+
+
+def test_adaptive_prefers_lowest_p50():
+    router = make_router()
+    for _ in range(10):
+        router.record(0, "rewrite", 1.0)
+        router.record(1, "rewrite", 0.1)
+    assert router.order("rewrite") == [1, 0]
+    assert router.current()["rewrite"] == "b:fast"
+
+
+def test_unmeasured_model_goes_first():
+    router = make_router()
+    for _ in range(10):
+        router.record(0, "rewrite", 0.1)
+    router.record(1, "rewrite", 0.5)
+    assert router.order("rewrite") == [1, 0]
+
+
+def test_all_failures_is_excluded_not_unmeasured():
+    router = make_router()
+    for _ in range(10):
+        router.record(0, "rewrite", None)
+        router.record(1, "rewrite", 0.5)
+    assert router.order("rewrite") == [1, 0]
+
+
+def test_high_error_rate_is_excluded():
+    router = make_router(max_error_rate=0.2)
+    for i in range(10):
+        router.record(0, "rewrite", 0.05 if i % 2 else None)
+        router.record(1, "rewrite", 0.5)
+    assert router.order("rewrite") == [1, 0]
+
+
+def test_accuracy_floor(tmp_path):
+    path = tmp_path / "model_accuracy.json"
+    path.write_text('{"a:slow": {"accuracy": 0.9}, "b:fast": {"accuracy": 0.4}}')
+    router = make_router(accuracy_floor=0.5, accuracy_path=str(path))
+    for _ in range(10):
+        router.record(0, "rewrite", 1.0)
+        router.record(1, "rewrite", 0.1)
+    assert router.order("rewrite") == [0, 1]
+
+
+def test_floor_warning_prints_once_across_threads(tmp_path, capsys):
+    path = tmp_path / "model_accuracy.json"
+    path.write_text('{"a:slow": {"accuracy": 0.1}, "b:fast": {"accuracy": 0.2}}')
+    router = make_router(accuracy_floor=0.5, accuracy_path=str(path))
+    start = threading.Barrier(8)
+    orders = []
+
+    def route():
+        start.wait()
+        for _ in range(50):
+            orders.append(router.order("rewrite"))
+
+    threads = [threading.Thread(target=route) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert all(order == [0, 1] for order in orders)
+    assert capsys.readouterr().out.count("meets the accuracy floor") == 1
@@ -0,0 +1,244 @@
+import asyncio
+import datetime
+import json
+from decimal import Decimal
+
+import pymysql
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from pymysql.constants import FIELD_TYPE
+from starlette.requests import Request
+
+import main
+from columnar import ARROW_STREAM_MEDIA_TYPE, PARQUET_MEDIA_TYPE, ColumnarResult, arrow_available, query_payload
+from telemetry import span
+from db_utils import PoolTimeout
+from llm_resilience import LLMDeadlineExceeded, LLMUnavailable
+from sql_validator import SQLValidationError
+from test_db_utils import server_error
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+needs_arrow = pytest.mark.skipif(not arrow_available(), reason="pyarrow not installed")
+
+DESCRIPTION = (
+    ("Name", FIELD_TYPE.VAR_STRING, None, 200, 200, 0, False),
+    ("ListPrice", FIELD_TYPE.NEWDECIMAL, None, 21, 21, 4, False),
+    ("SellStartDate", FIELD_TYPE.DATETIME, None, 19, 19, 0, False),
+)
+ROWS = [("Sport-100 Helmet, Red", Decimal("34.9900"), datetime.datetime(2011, 5, 31))]
+
+
+class FakeService:
+    """
+    Stands in for SQLService behind the /query and /query/page routes.
+    """
+
+    async def handle_user_query_page_async(self, user_query, mode=None):
+        with span("generate_sql"):
+            pass
+        return "SELECT Name FROM Product", ["Product"], ColumnarResult.from_rows(DESCRIPTION, ROWS), "next-token"
+
+    async def fetch_page_async(self, page_token):
+        if page_token != "next-token":
+            raise KeyError(page_token)
+        return ColumnarResult.from_rows(DESCRIPTION, ROWS), None
+
+    async def handle_batch_async(self, user_queries, mode=None):
+        return [
+            {"sql": f"SELECT '{q}'", "relevant_tables": [], "result": None, "next_page_token": None, "error": None, "duplicate_of": None}
+            for q in user_queries
+        ]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, "service", FakeService())
+    return TestClient(main.app)
+
+
+def accept(header):
+    return Request({"type": "http", "headers": [(b"accept", header.encode())] if header is not None else []})
+
+
+def metadata(table):
+    return {k.decode(): v.decode() for k, v in table.schema.metadata.items()}
+
+
+# ---------- Error statuses ----------
+
+
+@pytest.mark.parametrize("errno", [1054, 1052, 1055, 1242, 1064, 1146])
+def test_bad_sql_is_422(errno):
+    assert main._http_error(server_error(errno)).status_code == 422
+
+
+def test_validation_error_is_422():
+    error = main._http_error(SQLValidationError("SELECT Bogus FROM Product", ["Unknown column Bogus"]))
+    assert error.status_code == 422
+    assert error.detail["errors"] == ["Unknown column Bogus"]
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        pymysql.err.OperationalError(2003, "can't connect"),
+        pymysql.err.OperationalError(2006, "gone away"),
+        pymysql.err.OperationalError(2013, "lost connection"),
+        pymysql.err.InterfaceError(0, ""),
+        server_error(1205, "Lock wait timeout exceeded"),
+        PoolTimeout("no connection"),
+        LLMUnavailable("all breakers open"),
+    ],
+)
+def test_unavailable_dependency_is_503(error):
+    assert main._http_error(error).status_code == 503
+
+
+def test_llm_deadline_is_504():
+    assert main._http_error(LLMDeadlineExceeded("too slow")).status_code == 504
+
+
+def test_anything_else_is_500():
+    assert main._http_error(KeyError("x")).status_code == 500
+
+
+# ---------- /query/stream encoding ----------
+
+
+def test_stream_events_encode_like_the_query_body():
+    row = {"ListPrice": Decimal("3578.2700"), "SellStartDate": datetime.datetime(2011, 5, 31)}
+
+    async def events():
+        yield {"event": "rows", "data": [row]}
+        raise RuntimeError("connection lost")
+
+    async def collect():
+        return [line async for line in main._ndjson(events())]
+
+    rows_line, error_line = asyncio.run(collect())
+    description = (("ListPrice", FIELD_TYPE.NEWDECIMAL), ("SellStartDate", FIELD_TYPE.DATETIME))
+    result = ColumnarResult.from_rows(description, [tuple(row.values())])
+    assert json.loads(rows_line)["data"] == json.loads(query_payload("SELECT 1", [], result))["rows"]
+    assert json.loads(rows_line)["data"][0]["ListPrice"] == "3578.2700"
+    assert json.loads(error_line) == {"event": "error", "data": "connection lost"}
+
+
+# ---------- Content negotiation ----------
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        (None, "json"),
+        ("", "json"),
+        ("*/*", "json"),
+        ("text/html", "json"),
+        ("application/json", "json"),
+        (ARROW_STREAM_MEDIA_TYPE, "arrow"),
+        (PARQUET_MEDIA_TYPE, "parquet"),
+        ("application/x-parquet", "parquet"),
+        (f"application/json;q=0.5, {ARROW_STREAM_MEDIA_TYPE}", "arrow"),
+        (f"{ARROW_STREAM_MEDIA_TYPE};q=0.2, application/json;q=0.9", "json"),
+        (f"{PARQUET_MEDIA_TYPE}, {ARROW_STREAM_MEDIA_TYPE}", "parquet"),
+        (f"{PARQUET_MEDIA_TYPE};q=0, application/json", "json"),
+        (f"{PARQUET_MEDIA_TYPE};q=bogus, */*;q=0.1", "json"),
+        (f"{ARROW_STREAM_MEDIA_TYPE.upper()} ; q=0.8", "arrow"),
+    ],
+)
+@needs_arrow
+def test_negotiate_format(header, expected):
+    assert main._negotiate_format(accept(header)) == expected
+
+
+def test_binary_only_accept_without_pyarrow_is_406(monkeypatch):
+    monkeypatch.setattr(main, "arrow_available", lambda: False)
+    with pytest.raises(HTTPException) as e:
+        main._negotiate_format(accept(ARROW_STREAM_MEDIA_TYPE))
+    assert e.value.status_code == 406
+    assert main._negotiate_format(accept(f"{PARQUET_MEDIA_TYPE}, application/json;q=0.1")) == "json"
+
+
+# ---------- /query and /query/page formats ----------
+
+
+def test_query_json_with_timings(client):
+    response = client.post("/query", json={"user_query": "helmets", "include_timings": True})
+    assert response.headers["content-type"] == "application/json"
+    body = response.json()
+    assert body["rows"] == [{"Name": "Sport-100 Helmet, Red", "ListPrice": "34.9900", "SellStartDate": "2011-05-31T00:00:00"}]
+    assert body["next_page_token"] == "next-token"
+    assert {"generate_sql", "serialize"} <= set(body["timings"]["stages"])
+    assert "timings" not in client.post("/query", json={"user_query": "helmets"}).json()
+
+
+@needs_arrow
+def test_query_arrow_carries_metadata_and_types(client):
+    response = client.post(
+        "/query", json={"user_query": "helmets", "include_timings": True}, headers={"Accept": ARROW_STREAM_MEDIA_TYPE}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == ARROW_STREAM_MEDIA_TYPE
+    assert response.headers["x-next-page-token"] == "next-token"
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.schema.field("ListPrice").type == pa.decimal128(21, 4)
+    assert table.schema.field("SellStartDate").type == pa.timestamp("us")
+    assert table.to_pylist() == [dict(zip([d[0] for d in DESCRIPTION], ROWS[0]))]
+    meta = metadata(table)
+    assert meta["sql"] == "SELECT Name FROM Product"
+    assert json.loads(meta["relevant_tables"]) == ["Product"]
+    assert meta["next_page_token"] == "next-token"
+    assert "generate_sql" in json.loads(meta["timings"])["stages"]
+
+
+@needs_arrow
+def test_query_page_parquet_download(client):
+    response = client.get("/query/page", params={"page_token": "next-token"}, headers={"Accept": PARQUET_MEDIA_TYPE})
+    assert response.headers["content-type"] == PARQUET_MEDIA_TYPE
+    assert response.headers["content-disposition"] == 'attachment; filename="query_page.parquet"'
+    assert "x-next-page-token" not in response.headers
+    table = pq.read_table(pa.BufferReader(response.content))
+    assert table.column("ListPrice").to_pylist() == [Decimal("34.9900")]
+    meta = metadata(table)
+    assert meta["next_page_token"] == "" and "sql" not in meta and "timings" not in meta
+
+
+def test_query_page_unknown_token_is_404(client):
+    assert client.get("/query/page", params={"page_token": "nope"}).status_code == 404
+
+
+# ---------- /query/batch limits ----------
+
+
+def test_batch_accepts_up_to_the_limit(client, monkeypatch):
+    monkeypatch.setattr(main, "BATCH_MAX_QUESTIONS", 3)
+    response = client.post("/query/batch", json={"user_queries": ["a", "b", "c"], "result_layout": "columns"})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["sql"] for r in results] == ["SELECT 'a'", "SELECT 'b'", "SELECT 'c'"]
+    assert results[0]["data"] == []
+
+
+@pytest.mark.parametrize("questions", [[], ["a", "b", "c", "d"]])
+def test_batch_outside_the_limits_is_400(client, monkeypatch, questions):
+    monkeypatch.setattr(main, "BATCH_MAX_QUESTIONS", 3)
+    response = client.post("/query/batch", json={"user_queries": questions})
+    assert response.status_code == 400
+
+
+# ---------- /metrics ----------
+
+
+def test_metrics_endpoint_labels_requests_by_route_template(client):
+    client.get("/query/page", params={"page_token": "nope"})
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert 'nl2sql_http_requests_total{method="GET",route="/query/page",status="404"}' in text
+    assert 'nl2sql_http_request_duration_seconds_bucket{method="GET",route="/query/page",le="+Inf"}' in text
+    assert "page_token=nope" not in text
@@ -0,0 +1,133 @@
+import os
+import re
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+import main
+from profiling import SamplingProfiler
+
+
+def busy_wait(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def request(path, headers=()):
+    return Request({"type": "http", "path": path, "headers": [(k.lower().encode(), v.encode()) for k, v in headers]})
+
+
+# ---------- Folded stacks ----------
+
+
+def test_samples_fold_into_thread_rooted_stacks():
+    # a plain flag: Event.is_set() runs in threading.py, which counts as idle
+    running = [True]
+
+    def spin():
+        while running[0]:
+            busy_wait(0.001)
+
+    worker = threading.Thread(target=spin, name="worker-12")
+    worker.start()
+    try:
+        profiler = SamplingProfiler()
+        for _ in range(5):
+            profiler.sample(skip={threading.get_ident()})
+    finally:
+        running[0] = False
+        worker.join()
+
+    assert profiler.samples == 5
+    worker_stacks = [s for s in profiler.stacks if s.startswith("worker;")]
+    assert worker_stacks, list(profiler.stacks)
+    # root (thread name, numeric suffix dropped) first, the sampled leaf last
+    frames = worker_stacks[0].split(";")
+    assert frames[0] == "worker"
+    assert any(f.startswith("spin (test_profiling.py:") for f in frames)
+    assert frames[-1].startswith(("spin ", "busy_wait "))
+    assert sum(profiler.stacks[s] for s in worker_stacks) == 5
+
+
+def test_parked_threads_are_not_sampled():
+    ready = threading.Event()
+    release = threading.Event()
+
+    def park():
+        ready.set()
+        release.wait()
+
+    parked = threading.Thread(target=park, name="parked")
+    parked.start()
+    ready.wait()
+    try:
+        profiler = SamplingProfiler()
+        profiler.sample(skip={threading.get_ident()})
+    finally:
+        release.set()
+        parked.join()
+    assert not any(s.startswith("parked;") for s in profiler.stacks)
+
+
+def test_folded_format_and_write(tmp_path):
+    profiler = SamplingProfiler()
+    profiler.stacks.update({"MainThread;main (app.py:1);query (app.py:9)": 3, "MainThread;main (app.py:1)": 1})
+    assert profiler.folded() == "MainThread;main (app.py:1) 1\nMainThread;main (app.py:1);query (app.py:9) 3\n"
+    path = profiler.write(str(tmp_path / "profiles"), "run")
+    assert path == str(tmp_path / "profiles" / "run.folded")
+    with open(path) as f:
+        assert f.read() == profiler.folded()
+
+
+def test_background_sampling_sees_the_profiled_code():
+    with SamplingProfiler(interval_s=0.001) as profiler:
+        busy_wait(0.1)
+    assert profiler.samples > 10
+    assert profiler.duration_s >= 0.1
+    assert any("busy_wait (test_profiling.py:" in s for s in profiler.stacks)
+    assert not any(s.startswith("sampling-profiler;") for s in profiler.stacks)
+    for line in profiler.folded().splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0 and stack
+
+
+# ---------- Request gating ----------
+
+
+@pytest.mark.parametrize(
+    "enabled, header, path, headers, expected",
+    [
+        (False, "X-Profile", "/query", [], False),
+        (False, "X-Profile", "/query", [("X-Profile", "1")], True),
+        (False, "X-Profile", "/query/batch", [("X-Profile", "TRUE")], True),
+        (False, "X-Profile", "/query", [("X-Profile", "0")], False),
+        (False, "X-Profile", "/metrics", [("X-Profile", "1")], False),
+        (False, None, "/query", [("X-Profile", "1")], False),
+        (True, None, "/query/page", [], True),
+        (True, "X-Profile", "/health", [], False),
+    ],
+)
+def test_profile_gating(monkeypatch, enabled, header, path, headers, expected):
+    monkeypatch.setattr(main, "PROFILING_ENABLED", enabled)
+    monkeypatch.setattr(main, "PROFILING_HEADER", header)
+    assert main._profile_requested(request(path, headers)) is expected
+
+
+def test_profiled_request_writes_its_folded_stacks(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "PROFILE_DIR", str(tmp_path))
+    client = TestClient(main.app)
+
+    plain = client.get("/query/page", params={"page_token": "nope"})
+    assert "x-profile-output" not in plain.headers
+    assert os.listdir(tmp_path) == []
+
+    profiled = client.get("/query/page", params={"page_token": "nope"}, headers={"X-Profile": "1"})
+    assert profiled.status_code == 404
+    path = profiled.headers["x-profile-output"]
+    assert os.path.dirname(path) == str(tmp_path)
+    assert re.fullmatch(r"\d{8}-\d{6}-query_page-[0-9a-f]{6}\.folded", os.path.basename(path))
+    assert os.path.exists(path)
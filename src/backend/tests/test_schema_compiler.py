@@ -0,0 +1,159 @@
+import json
+import re
+
+import pytest
+
+from db_utils import parse_table_descriptions
+from schema_compiler import (
+    abbreviate_type,
+    common_columns,
+    compile_catalog,
+    compile_preamble,
+    compile_schema,
+    compile_table,
+    render_compact,
+)
+
+SALES_ORDER_HEADER = {
+    "columns": [
+        {"name": "SalesOrderID", "type": "int"},
+        {"name": "OrderDate", "type": "timestamp"},
+        {"name": "CustomerID", "type": "int"},
+        {"name": "BillToAddressID", "type": "int"},
+        {"name": "TotalDue", "type": "decimal"},
+        {"name": "ModifiedDate", "type": "timestamp"},
+    ],
+    "primary_key": ["SalesOrderID"],
+    "foreign_keys": [
+        {"column": "CustomerID", "references_table": "Customer", "references_column": "CustomerID"},
+        {"column": "BillToAddressID", "references_table": "Address", "references_column": "AddressID"},
+    ],
+}
+
+
+@pytest.fixture(scope="module")
+def schema():
+    with open("db_schema.json") as f:
+        return parse_table_descriptions(json.load(f))
+
+
+def parse_compact(line, common):
+    """
+    Read a compile_table line back into (table, {column: type}, primary
+    key, {column: [fk targets]}), restoring shared columns it leaves out.
+    """
+    abbreviations = {}
+    for full in ("varchar", "timestamp", "datetime", "decimal", "tinyint", "smallint", "longtext", "geometry", "longblob"):
+        abbreviations.setdefault(abbreviate_type(full), full)
+
+    m = re.fullmatch(r"(\w+)\((.*)\)", line)
+    table, body = m.group(1), m.group(2)
+    columns, pks, refs = {}, [], {}
+    missing = set()
+    for part in re.findall(r"(?:`[^`]*`|[^,])+", body):
+        part = part.strip()
+        if part.startswith("-"):
+            missing.add(part[1:].strip("`"))
+            continue
+        name, rest = re.fullmatch(r"(`[^`]*`|\S+) (.*)", part).groups()
+        name = name.strip("`")
+        col_type, *flags = rest.split(" ")
+        columns[name] = col_type
+        for flag in flags:
+            if flag == "PK":
+                pks.append(name)
+            else:
+                refs.setdefault(name, []).append(flag[1:])
+    for name, col_type in common:
+        if name not in missing:
+            columns[name] = abbreviate_type(col_type)
+    return table, columns, pks, refs
+
+
+# ---------- compile_table ----------
+
+
+def test_compile_table_format():
+    line = compile_table("SalesOrderHeader", SALES_ORDER_HEADER)
+    assert line == (
+        "SalesOrderHeader(SalesOrderID int PK, OrderDate ts, CustomerID int >Customer, "
+        "BillToAddressID int >Address.AddressID, TotalDue dec, ModifiedDate ts)"
+    )
+
+
+def test_non_identifier_names_are_backquoted():
+    info = {"columns": [{"name": "Database Version", "type": "varchar"}, {"name": "VersionDate", "type": "datetime"}]}
+    assert compile_table("AWBuildVersion", info) == "AWBuildVersion(`Database Version` str, VersionDate dt)"
+
+
+def test_shared_columns_are_left_out_or_marked_missing():
+    common = [("ModifiedDate", "timestamp"), ("rowguid", "varchar")]
+    line = compile_table("SalesOrderHeader", SALES_ORDER_HEADER, common)
+    assert "ModifiedDate" not in line
+    assert line.endswith(", -rowguid)")
+
+
+def test_common_columns_skip_keys_and_rare_columns():
+    schema = {
+        "A": {"columns": [{"name": "ID", "type": "int"}, {"name": "ModifiedDate", "type": "timestamp"}], "primary_key": ["ID"]},
+        "B": {"columns": [{"name": "ID", "type": "int"}, {"name": "ModifiedDate", "type": "timestamp"}], "primary_key": ["ID"]},
+        "C": {"columns": [{"name": "Note", "type": "varchar"}, {"name": "ModifiedDate", "type": "datetime"}]},
+    }
+    assert common_columns(schema) == [("ModifiedDate", "timestamp")]
+    assert common_columns({}) == []
+
+
+def test_preamble_declares_shared_columns():
+    assert "Every table also has" not in compile_preamble([])
+    assert "ModifiedDate ts unless listed as -Column" in compile_preamble([("ModifiedDate", "timestamp")])
+
+
+# ---------- Round trip over db_schema.json ----------
+
+
+def test_compact_output_round_trips_every_table_and_column(schema):
+    compiled = compile_schema(schema)
+    assert compiled["common"]  # ModifiedDate, rowguid
+    assert set(compiled["tables"]) == set(schema)
+    for table, info in schema.items():
+        name, columns, pks, refs = parse_compact(compiled["tables"][table], compiled["common"])
+        assert name == table
+        assert columns == {c["name"]: abbreviate_type(c["type"]) for c in info["columns"]}
+        assert pks == [c["name"] for c in info["columns"] if c["name"] in info["primary_key"]]
+        expected_refs = {}
+        for fk in info["foreign_keys"]:
+            target = fk["references_table"]
+            if fk["references_column"] != fk["column"]:
+                target += "." + fk["references_column"]
+            if target not in expected_refs.get(fk["column"], []):
+                expected_refs.setdefault(fk["column"], []).append(target)
+        assert refs == expected_refs
+
+
+def test_compact_is_smaller_than_db_schema_json(schema):
+    with open("db_schema.json") as f:
+        verbose = "\n\n".join(json.load(f).values())
+    compiled = compile_schema(schema)
+    assert len(render_compact(compiled, list(schema))) < len(verbose) / 2
+
+
+def test_render_compact_skips_unknown_tables(schema):
+    compiled = compile_schema(schema)
+    text = render_compact(compiled, ["Product", "Nope"])
+    assert text == compiled["preamble"] + "\n\n" + compiled["tables"]["Product"]
+    assert render_compact(compiled, ["Nope"]) == ""
+
+
+# ---------- Catalog ----------
+
+
+def test_catalog_lists_every_table_with_its_fk_targets(schema):
+    catalog = compile_catalog(schema, {"Product": "The `Product` table stores products sold or used. More text."})
+    lines = catalog.splitlines()[1:]
+    assert len(lines) == len(schema)
+    assert "- Product >ProductModel,ProductSubcategory,UnitMeasure: stores products sold or used" in lines
+
+
+def test_catalog_descriptions_are_cut_to_max_words():
+    catalog = compile_catalog({"Product": {}}, {"Product": "The Product table " + "word " * 30 + "."}, max_words=4)
+    assert catalog.splitlines()[1] == "- Product: word word word word ..."
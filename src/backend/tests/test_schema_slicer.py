@@ -0,0 +1,114 @@
+import json
+
+import pytest
+
+from db_utils import parse_table_description, parse_table_descriptions
+from schema_slicer import READABLE_COLUMNS, render_sliced_schema, slice_schema, slice_table
+
+
+@pytest.fixture(scope="module")
+def schema():
+    with open("db_schema.json") as f:
+        return parse_table_descriptions(json.load(f))
+
+
+def kept(schema, tables, question):
+    return {t: [c["name"] for c in info["columns"]] for t, info in slice_schema(schema, tables, question).items()}
+
+
+# ---------- Columns kept ----------
+
+
+@pytest.mark.parametrize(
+    "tables, question",
+    [
+        (["Customer", "SalesOrderHeader"], "how many orders did each customer place"),
+        (["Product", "SalesOrderDetail", "SalesOrderHeader"], "best selling products in 2013"),
+        (["Employee", "EmployeeDepartmentHistory", "Department"], "employees per department"),
+        (["Person", "EmailAddress"], ""),
+    ],
+)
+def test_join_keys_are_always_kept(schema, tables, question):
+    columns = kept(schema, tables, question)
+    selected = set(tables)
+    for t in tables:
+        info = schema[t]
+        assert set(info["primary_key"]) <= set(columns[t])
+        for fk in info["foreign_keys"]:
+            if fk["references_table"] in selected:
+                assert fk["column"] in columns[t]
+                assert fk["references_column"] in columns[fk["references_table"]]
+
+
+def test_readable_names_are_always_kept(schema):
+    tables = ["Person", "Product", "Vendor", "Employee", "Department", "Store"]
+    columns = kept(schema, tables, "count rows")
+    for t in tables:
+        readable = [c["name"] for c in schema[t]["columns"] if c["name"] in READABLE_COLUMNS]
+        assert readable and set(readable) <= set(columns[t])
+
+
+def test_unrelated_columns_are_dropped(schema):
+    columns = kept(schema, ["Product"], "product names")
+    assert columns["Product"] == ["ProductID", "Name", "ProductNumber"]
+
+
+def test_named_and_hinted_columns_are_kept(schema):
+    columns = kept(schema, ["Product"], "list price and color of each product")
+    assert {"ListPrice", "Color"} <= set(columns["Product"])
+    # "price" hints at every money column, but not at foreign keys
+    assert "StandardCost" in columns["Product"]
+    assert "ProductModelID" not in columns["Product"]
+
+    dates = kept(schema, ["SalesOrderHeader"], "orders placed since 2013")["SalesOrderHeader"]
+    assert {"OrderDate", "DueDate", "ShipDate"} <= set(dates)
+
+
+def test_table_name_terms_do_not_pull_in_columns(schema):
+    # "product" is in the table name; it shouldn't select ProductLine etc.
+    assert "ProductLine" not in kept(schema, ["Product"], "products")["Product"]
+
+
+def test_boilerplate_needs_its_full_name(schema):
+    assert "ModifiedDate" not in kept(schema, ["Product"], "recently modified products")["Product"]
+    assert "ModifiedDate" in kept(schema, ["Product"], "products by modified date")["Product"]
+    assert "rowguid" not in kept(schema, ["Product"], "every column of product")["Product"]
+
+
+def test_bulky_columns_are_dropped(schema):
+    assert "SpatialLocation" not in kept(schema, ["Address"], "addresses in Seattle")["Address"]
+
+
+# ---------- Keys and FK lines ----------
+
+
+def test_fk_lines_follow_kept_columns_without_constraint_names(schema):
+    sliced = slice_table("SalesOrderHeader", schema["SalesOrderHeader"], schema, ["SalesOrderHeader", "Customer"], "")
+    assert [fk["column"] for fk in sliced["foreign_keys"]] == ["CustomerID"]
+    assert sliced["foreign_keys"][0]["constraint_name"] is None
+    assert sliced["primary_key"] == schema["SalesOrderHeader"]["primary_key"]
+
+
+def test_unknown_tables_are_skipped(schema):
+    assert list(slice_schema(schema, ["Product", "Nope"], "")) == ["Product"]
+    assert render_sliced_schema(schema, ["Nope"], "") == ""
+
+
+# ---------- Rendering ----------
+
+
+def test_verbose_output_parses_back_to_the_slice(schema):
+    tables = ["Customer", "SalesOrderHeader"]
+    sliced = slice_schema(schema, tables, "total due per customer")
+    blocks = render_sliced_schema(schema, tables, "total due per customer").split("\n\n")
+    assert len(blocks) == 2
+    for block, table in zip(blocks, tables):
+        name, info = parse_table_description(block)
+        assert name == table
+        assert info == sliced[table]
+
+
+def test_compact_output_lists_the_kept_columns(schema):
+    text = render_sliced_schema(schema, ["Product"], "product names", schema_format="compact")
+    assert text.startswith("Format: ")
+    assert text.endswith("\n\nProduct(ProductID int PK, Name str, ProductNumber str)")
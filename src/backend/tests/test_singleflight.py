@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from singleflight import SingleFlight
+from telemetry import collect_trace, span
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    runs = []
+    release = threading.Event()
+
+    def work():
+        runs.append(1)
+        release.wait(2)
+        return "answer"
+
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(flight.do, "key", work) for _ in range(4)]
+        time.sleep(0.1)
+        release.set()
+        assert [f.result() for f in futures] == ["answer"] * 4
+    assert len(runs) == 1
+    assert flight.stats() == {"enabled": True, "calls": 4, "executions": 1, "coalesced": 3, "in_flight": 0}
+
+
+def test_nothing_is_kept_after_the_call():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.do("key", lambda: 2) == 2
+    assert flight.stats()["executions"] == 2
+
+
+def test_error_reaches_every_caller():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def work():
+        release.wait(2)
+        raise ValueError("boom")
+
+    with ThreadPoolExecutor(3) as pool:
+        futures = [pool.submit(flight.do, "key", work) for _ in range(3)]
+        time.sleep(0.1)
+        release.set()
+        for f in futures:
+            with pytest.raises(ValueError):
+                f.result()
+    assert flight.stats()["executions"] == 1
+
+
+def test_disabled_runs_every_call():
+    flight = SingleFlight(enabled=False)
+    assert [flight.do("key", lambda: 1) for _ in range(3)] == [1, 1, 1]
+    assert flight.stats()["executions"] == 3
+
+
+def _traced_call(flight: SingleFlight, work):
+    with collect_trace() as trace:
+        with span("pipeline"):
+            flight.do("key", work)
+    return trace.breakdown()
+
+
+def test_followers_get_the_leaders_timings_marked_coalesced():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def work():
+        with span("generate_sql"):
+            release.wait(2)
+        return "answer"
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(_traced_call, flight, work)
+        time.sleep(0.05)
+        follower = pool.submit(_traced_call, flight, work)
+        time.sleep(0.05)
+        release.set()
+        leader, follower = leader.result(), follower.result()
+
+    assert [s["name"] for s in leader["spans"]] == ["pipeline", "generate_sql"]
+    assert not any(s.get("coalesced") for s in leader["spans"])
+
+    spans = {s["name"]: s for s in follower["spans"]}
+    assert spans["pipeline"]["coalesced"] is True
+    assert spans["generate_sql"]["coalesced"] is True
+    assert spans["generate_sql"]["parent"] == "pipeline"
+    assert follower["stages"]["generate_sql"] == leader["stages"]["generate_sql"]
+
+
+def test_async_followers_get_the_leaders_timings_marked_coalesced():
+    flight = SingleFlight()
+
+    async def work():
+        with span("generate_sql"):
+            await asyncio.sleep(0.05)
+        return "answer"
+
+    async def traced_call():
+        with collect_trace() as trace:
+            with span("pipeline"):
+                assert await flight.do_async("key", work) == "answer"
+        return trace.breakdown()
+
+    async def main():
+        return await asyncio.gather(traced_call(), traced_call())
+
+    leader, follower = asyncio.run(main())
+    assert flight.stats()["executions"] == 1
+    assert not any(s.get("coalesced") for s in leader["spans"])
+    assert {s["name"]: s.get("coalesced") for s in follower["spans"]} == {"pipeline": True, "generate_sql": True}
@@ -0,0 +1,257 @@
+import asyncio
+import threading
+from typing import Any, Dict, List, Optional
+
+import pytest
+from pymysql.constants import FIELD_TYPE
+
+import llm_utils
+import sql_service
+from columnar import ColumnarResult
+from llm_providers import LLMProvider
+from sql_service import SQLService
+from sql_validator import validator_available
+
+
+class StageRecorder(LLMProvider):
+    """
+    Answers every prompt with `answer` and records the stage of each call.
+    """
+
+    name = "fake"
+    model = "fake-model"
+
+    def __init__(self, answer: str):
+        self.answer = answer
+        self.stages: List[Optional[str]] = []
+        self._lock = threading.Lock()
+
+    def generate(self, prompt: str, stage: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            self.stages.append(stage)
+        return {"text": self.answer, "prompt_tokens": 1, "completion_tokens": 1}
+
+    async def generate_async(self, prompt: str, stage: Optional[str] = None) -> Dict[str, Any]:
+        return self.generate(prompt, stage)
+
+
+@pytest.fixture(scope="module")
+def service():
+    return SQLService()
+
+
+@pytest.fixture
+def provider():
+    previous = llm_utils._provider
+    recorder = StageRecorder("SELECT Name FROM Product")
+    llm_utils.set_provider(recorder)
+    yield recorder
+    llm_utils.set_provider(previous)
+
+
+# ---------- SQL repair ----------
+
+
+@pytest.mark.skipif(not validator_available(), reason="sqlglot not installed")
+def test_repair_call_uses_the_generate_sql_stage(service, provider):
+    sql = service._validated_sql("product names", "Product(Name)", "SELECT Bogus FROM Product")
+    assert sql == "SELECT Name FROM Product"
+    # same deadline / routes / accuracy floor as SQL generation
+    assert provider.stages == ["generate_sql"]
+
+
+@pytest.mark.skipif(not validator_available(), reason="sqlglot not installed")
+def test_async_repair_call_uses_the_generate_sql_stage(service, provider):
+    sql = asyncio.run(service._validated_sql_async("product names", "Product(Name)", "SELECT Bogus FROM Product"))
+    assert sql == "SELECT Name FROM Product"
+    assert provider.stages == ["generate_sql"]
+
+
+# ---------- Batches ----------
+
+
+class FakeDB:
+    """
+    fetch_sql_page_async stand-in: one row per query, recording the SQL run
+    and the most queries it saw in flight at once.
+    """
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.queries: List[str] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, sql_text, offset, page_size):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        self.queries.append(sql_text)
+        if sql_text in self.fail:
+            raise RuntimeError(f"cannot run {sql_text}")
+        return ColumnarResult.from_rows((("sql", FIELD_TYPE.VAR_STRING),), [(sql_text,)]), False
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeDB()
+    monkeypatch.setattr(sql_service, "fetch_sql_page_async", fake)
+    return fake
+
+
+@pytest.fixture
+def generated(service, monkeypatch):
+    """
+    generate_sql_async stand-in for the non-sequential modes: "SQL <q>"
+    over ["Product"], "fail" raises, "impossible" gives up.
+    """
+    calls: List[str] = []
+
+    async def generate_sql_async(q, mode=None):
+        calls.append(q)
+        if "fail" in q:
+            raise ValueError(f"no SQL for {q}")
+        if "impossible" in q:
+            return "NOT POSSIBLE WITH GIVEN TABLES", []
+        # "how many" and "count of" land on the same query
+        return "SQL " + q.replace("count of", "how many"), ["Product"]
+
+    monkeypatch.setattr(service, "generate_sql_async", generate_sql_async)
+    return calls
+
+
+def batch(service, questions, **kwargs):
+    return asyncio.run(service.handle_batch_async(questions, mode="two_call", **kwargs))
+
+
+def test_batch_runs_duplicates_once_and_points_at_the_first(service, generated, db):
+    items = batch(service, ["Product names", "product  names?", "vendors", "PRODUCT NAMES"])
+    assert generated == ["Product names", "vendors"]
+    assert [item["duplicate_of"] for item in items] == [None, 0, None, 0]
+    assert items[1]["sql"] == items[0]["sql"] == "SQL Product names"
+    assert items[1]["result"] is items[0]["result"]
+    assert sorted(db.queries) == ["SQL Product names", "SQL vendors"]
+
+
+def test_batch_shares_execution_of_equal_sql(service, generated, db):
+    items = batch(service, ["how many products", "count of products"])
+    assert generated == ["how many products", "count of products"]
+    assert items[1]["duplicate_of"] is None
+    assert items[1]["sql"] == items[0]["sql"]
+    assert db.queries == ["SQL how many products"]
+
+
+def test_failures_are_reported_per_question(service, generated, db):
+    db.fail.add("SQL vendors")
+    items = batch(service, ["please fail", "vendors", "impossible question", "products", "please fail"])
+    assert items[0] == {
+        "sql": None, "relevant_tables": [], "result": None, "next_page_token": None,
+        "error": "no SQL for please fail", "duplicate_of": None,
+    }
+    assert items[1]["error"] == "cannot run SQL vendors" and items[1]["sql"] is None
+    assert items[2]["sql"] == "NOT POSSIBLE WITH GIVEN TABLES" and items[2]["error"] is None and items[2]["result"] is None
+    assert items[3]["error"] is None and items[3]["result"].column("sql") == ["SQL products"]
+    assert items[4]["error"] == items[0]["error"] and items[4]["duplicate_of"] == 0
+    assert "SQL impossible question" not in db.queries
+
+
+def test_batch_keeps_db_concurrency_bounded(service, generated, db):
+    items = batch(service, [f"question {i}" for i in range(10)], db_concurrency=3)
+    assert [item["sql"] for item in items] == [f"SQL question {i}" for i in range(10)]
+    assert db.max_in_flight == 3
+
+
+def test_batch_counts(service, generated, db):
+    before = dict(service.batch_counts)
+    batch(service, ["a question", "A question", "another"])
+    assert service.batch_counts["batches"] == before["batches"] + 1
+    assert service.batch_counts["questions"] == before["questions"] + 3
+    assert service.batch_counts["unique_questions"] == before["unique_questions"] + 2
+
+
+# ---------- Batched table selection ----------
+
+
+@pytest.fixture
+def selection(service, monkeypatch):
+    """
+    Fake table-selection LLM calls. The batched call answers "T<n>" for a
+    question "q<n>" except those listed in `skip`; every call is recorded.
+    """
+    state = {"batched": [], "single": [], "skip": set(), "batch_fails": False}
+
+    async def batched(user_queries, table_descriptions):
+        state["batched"].append(list(user_queries))
+        if state["batch_fails"]:
+            raise RuntimeError("bad batch reply")
+        return [None if q in state["skip"] else ["T" + q[1:]] for q in user_queries]
+
+    async def single(user_query, table_descriptions):
+        state["single"].append(user_query)
+        if user_query == "q-broken":
+            raise RuntimeError("selection failed")
+        return ["T" + user_query[1:]]
+
+    monkeypatch.setattr(sql_service, "select_relevant_tables_batch_async", batched)
+    monkeypatch.setattr(sql_service, "select_relevant_tables_async", single)
+    monkeypatch.setattr(sql_service, "BATCH_TABLE_SELECTION_SIZE", 3)
+    monkeypatch.setattr(service, "cache_enabled", False)
+    monkeypatch.setattr(service, "table_retriever", None)
+    return state
+
+
+def select(service, queries):
+    return asyncio.run(service._select_tables_batch_async(queries, asyncio.Semaphore(8)))
+
+
+def test_selection_is_chunked(service, selection):
+    queries = [f"q{i}" for i in range(7)]
+    assert select(service, queries) == [[f"T{i}"] for i in range(7)]
+    assert sorted(map(len, selection["batched"])) == [3, 3]
+    # a chunk of one is asked on its own
+    assert selection["single"] == ["q6"]
+
+
+def test_duplicate_questions_are_selected_once(service, selection):
+    tables = select(service, ["q1", "Q1", "q2", "q1?"])
+    assert tables == [["T1"], ["T1"], ["T2"], ["T1"]]
+    assert selection["batched"] == [["q1", "q2"]]
+    assert tables[0] is not tables[1]  # callers may mutate their copy
+
+
+def test_questions_left_out_of_a_batched_reply_are_asked_alone(service, selection):
+    selection["skip"] = {"q2"}
+    assert select(service, ["q1", "q2", "q3"]) == [["T1"], ["T2"], ["T3"]]
+    assert selection["single"] == ["q2"]
+
+
+def test_failed_batched_call_falls_back_to_one_by_one(service, selection):
+    selection["batch_fails"] = True
+    assert select(service, ["q1", "q2", "q-broken"])[:2] == [["T1"], ["T2"]]
+    assert sorted(selection["single"]) == ["q-broken", "q1", "q2"]
+
+
+def test_selection_error_is_returned_for_its_question(service, selection):
+    selection["skip"] = {"q-broken"}
+    tables = select(service, ["q1", "q-broken"])
+    assert tables[0] == ["T1"]
+    assert isinstance(tables[1], RuntimeError)
+
+
+def test_sequential_batch_uses_batched_selection(service, selection, db, monkeypatch):
+    async def rewrite(q):
+        if q == "q-unclear":
+            raise ValueError("cannot rewrite")
+        return q
+
+    async def generate(q, tables):
+        return f"SELECT * FROM {tables[0]}", tables
+
+    monkeypatch.setattr(service, "_rewrite_async", rewrite)
+    monkeypatch.setattr(service, "_generate_from_tables_async", generate)
+    items = asyncio.run(service.handle_batch_async(["q1", "q2", "q-unclear", "q3", "q2"], mode="sequential"))
+    assert [item["sql"] for item in items] == ["SELECT * FROM T1", "SELECT * FROM T2", None, "SELECT * FROM T3", "SELECT * FROM T2"]
+    assert items[2]["error"] == "cannot rewrite"
+    assert items[4]["duplicate_of"] == 1
+    assert selection["batched"] == [["q1", "q2", "q3"]]
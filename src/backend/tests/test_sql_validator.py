@@ -0,0 +1,75 @@
+import glob
+import os
+
+import pandas as pd
+import pytest
+
+from conftest import REPO_ROOT
+from db_utils import parse_table_descriptions, read_file
+from sql_validator import SQLValidator
+
+pytest.importorskip("sqlglot")
+
+
+@pytest.fixture(scope="module")
+def validator() -> SQLValidator:
+    return SQLValidator(parse_table_descriptions(read_file("db_schema.json")))
+
+
+def test_gold_sql_validates(validator):
+    df = pd.concat(pd.read_csv(f) for f in glob.glob(os.path.join(REPO_ROOT, "data", "*.csv")))
+    assert len(df) > 0
+    for sql in df["sql_query"]:
+        assert validator.validate(sql) == [], sql
+
+
+def test_recorded_predictions_validate(validator):
+    # a correlated MAX(StartDate) subquery under a JOIN, inside a UNION
+    path = os.path.join(REPO_ROOT, "results", "eval_results_20251221_213255.csv")
+    if not os.path.exists(path):
+        pytest.skip("no recorded eval results")
+    for sql in pd.read_csv(path)["pred_sql"].dropna():
+        if not sql.strip().upper().startswith("NOT POSSIBLE"):
+            assert validator.validate(sql) == [], sql
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "SELECT p.Name FROM Product p WHERE p.ProductID IN (SELECT ProductID FROM SalesOrderDetail WHERE OrderQty > 10)",
+        "SELECT c.CustomerID FROM Customer c WHERE EXISTS "
+        "(SELECT 1 FROM SalesOrderHeader WHERE CustomerID = c.CustomerID AND TotalDue > 1000)",
+        "SELECT p.Name, plph.ListPrice FROM Product p "
+        "JOIN ProductListPriceHistory plph ON plph.ProductID = p.ProductID "
+        "WHERE plph.ListPrice > (SELECT AVG(ListPrice) FROM ProductListPriceHistory WHERE ProductID = p.ProductID)",
+        # unqualified name only the outer query has: a correlated reference
+        "SELECT p.Name FROM Product p WHERE EXISTS (SELECT 1 FROM SalesOrderDetail d WHERE d.ProductID = ProductNumber)",
+        "WITH t AS (SELECT c.CustomerID AS cid FROM Customer c) SELECT t.cid, cid FROM t",
+        "SELECT FirstName, COUNT(*) c FROM Person GROUP BY FirstName HAVING c > 1 ORDER BY c",
+        "SELECT BusinessEntityID FROM Person JOIN Employee USING (BusinessEntityID)",
+    ],
+)
+def test_subqueries_and_aliases_validate(validator, sql):
+    assert validator.validate(sql) == []
+
+
+@pytest.mark.parametrize(
+    "sql, error",
+    [
+        ("SELECT p.Bogus FROM Product p", "Unknown column p.Bogus in Product"),
+        ("SELECT p.Name FROM Product p WHERE p.ProductID IN (SELECT ProductID FROM SalesOrderDetail WHERE Nope > 1)",
+         "Unknown column Nope"),
+        ("SELECT BusinessEntityID FROM Person p JOIN Employee e ON e.BusinessEntityID = p.BusinessEntityID",
+         "Column BusinessEntityID is ambiguous"),
+        ("SELECT Name FROM Prodct", "Unknown table Prodct"),
+        ("SELECT name FROM product", "Table product must be written Product"),
+        ("SELECT x.Name FROM Product p", "Unknown table or alias x"),
+        ("DELETE FROM Product", "Only SELECT queries are allowed"),
+        ("SELECT 1; DROP TABLE Product", "Expected exactly one SQL statement"),
+        ("SELECT * FROM Product FOR UPDATE", "locking clause"),
+        ("SELEC 1", "MySQL syntax error"),
+    ],
+)
+def test_invalid_sql_is_reported(validator, sql, error):
+    errors = validator.validate(sql)
+    assert errors and error in errors[0], errors
@@ -0,0 +1,162 @@
+import json
+
+import pytest
+
+from table_retriever import BM25Index, TableRetriever, parse_table_catalog, split_identifier, tokenize
+
+
+def table(name, *columns):
+    return f"Table: {name}\nColumns:\n" + "\n".join(f"- {c} varchar" for c in columns)
+
+
+@pytest.fixture(scope="module")
+def adventure_works():
+    with open("db_schema.json") as f:
+        db_tables = json.load(f)
+    with open("db_description.txt") as f:
+        catalog = parse_table_catalog(f.read())
+    return TableRetriever(db_tables, catalog)
+
+
+def ranked_by(retriever, ranking):
+    retriever.rank = lambda query: ranking
+    return retriever
+
+
+# ---------- Tokens ----------
+
+
+@pytest.mark.parametrize(
+    "word, parts",
+    [
+        ("SalesOrderHeader", ["Sales", "Order", "Header"]),
+        ("CustomerID", ["Customer", "ID"]),
+        ("AWBuildVersion", ["AW", "Build", "Version"]),
+        ("AddressLine1", ["Address", "Line", "1"]),
+    ],
+)
+def test_split_identifier(word, parts):
+    assert split_identifier(word) == parts
+
+
+def test_tokenize_stems_and_drops_stopwords():
+    assert tokenize("List the categories of shipped orders") == ["category", "ship", "order"]
+    assert tokenize("ProductCategoryID") == ["product", "category"]
+    assert tokenize(None) == []
+
+
+def test_parse_table_catalog():
+    text = "Available tables:\n- Product: Things we sell.\n  - not a table\n- Vendor: Suppliers.\n"
+    assert parse_table_catalog(text) == {"Product": "Things we sell.", "Vendor": "Suppliers."}
+
+
+# ---------- BM25 ----------
+
+
+def test_bm25_rare_terms_weigh_more():
+    index = BM25Index({"a": ["order", "ship"], "b": ["order", "vendor"], "c": ["order"]})
+    scores = index.scores(["order", "ship"])
+    assert scores["a"] > scores["c"] > 0
+    assert index.idf["ship"] > index.idf["order"]
+
+
+def test_bm25_term_frequency_saturates():
+    index = BM25Index({"once": ["order", "x"], "twice": ["order", "order"], "none": ["x", "y"]})
+    scores = index.scores(["order"])
+    assert scores["twice"] > scores["once"]
+    assert scores["twice"] < 2 * scores["once"]
+    assert scores["none"] == 0
+
+
+def test_bm25_prefers_shorter_documents():
+    index = BM25Index({"short": ["order"], "long": ["order", "a", "b", "c", "d", "e"]})
+    scores = index.scores(["order"])
+    assert scores["short"] > scores["long"]
+
+
+def test_empty_index():
+    assert BM25Index({}).scores(["order"]) == {}
+    assert TableRetriever({}).retrieve("orders") == ([], 0.0)
+
+
+# ---------- Ranking ----------
+
+
+def test_rank_scales_scores_to_the_best_match():
+    retriever = TableRetriever(
+        {
+            "Product": table("Product", "ProductID", "Name", "ListPrice"),
+            "Vendor": table("Vendor", "VendorID", "Name", "CreditRating"),
+            "ProductVendor": table("ProductVendor", "ProductID", "VendorID", "StandardPrice"),
+        }
+    )
+    ranking = retriever.rank("vendor credit rating")
+    assert ranking[0] == ("Vendor", 1.0)
+    assert all(0 <= score <= 1 for _, score in ranking)
+    assert [t for t, _ in ranking] == ["Vendor", "ProductVendor", "Product"]
+
+
+def test_unmatched_query_ranks_nothing(adventure_works):
+    ranking = adventure_works.rank("")
+    assert {score for _, score in ranking} == {0.0}
+    assert [t for t, _ in ranking] == sorted(adventure_works.tables)
+    assert adventure_works.retrieve("") == ([], 0.0)
+
+
+def test_boilerplate_columns_are_not_indexed():
+    retriever = TableRetriever(
+        {
+            "Product": table("Product", "ProductID", "rowguid", "ModifiedDate"),
+            "Vendor": table("Vendor", "VendorID", "rowguid", "ModifiedDate"),
+        }
+    )
+    assert retriever.retrieve("modified date rowguid") == ([], 0.0)
+
+
+def test_name_coverage_breaks_ties_between_neighbours(adventure_works):
+    ranking = adventure_works.rank("products supplied by vendors")
+    assert ranking[0][0] == "ProductVendor"
+    assert {t for t, _ in ranking[:3]} == {"ProductVendor", "Product", "Vendor"}
+
+
+def test_descriptions_mentioning_other_tables_do_not_match_them(adventure_works):
+    # Address's description says it is referenced by SalesOrderHeader
+    tables, _ = adventure_works.retrieve("sales order header totals")
+    assert tables[0] == "SalesOrderHeader"
+    assert "Address" not in tables
+
+
+# ---------- Cutoffs and confidence ----------
+
+
+def test_retrieve_keeps_tables_above_the_relative_score():
+    retriever = ranked_by(TableRetriever({}), [("A", 1.0), ("B", 0.8), ("C", 0.45), ("D", 0.1)])
+    tables, confidence = retriever.retrieve("q", top_k=5, min_relative_score=0.5)
+    assert tables == ["A", "B"]
+    # weakest selected (B) minus the best left out (C)
+    assert confidence == pytest.approx(0.35)
+
+
+def test_retrieve_stops_at_top_k():
+    retriever = ranked_by(TableRetriever({}), [("A", 1.0), ("B", 0.9), ("C", 0.85), ("D", 0.2)])
+    tables, confidence = retriever.retrieve("q", top_k=2, min_relative_score=0.5)
+    assert tables == ["A", "B"]
+    assert confidence == pytest.approx(0.05)
+
+
+def test_flat_tail_means_low_confidence():
+    flat = [("A", 1.0)] + [(t, 0.95) for t in "BCDEFG"]
+    tables, confidence = ranked_by(TableRetriever({}), flat).retrieve("q", top_k=3)
+    assert tables == ["A", "B", "C"]
+    assert confidence == pytest.approx(0.0)
+
+
+def test_everything_selected_compares_against_zero():
+    retriever = ranked_by(TableRetriever({}), [("A", 1.0), ("B", 0.7)])
+    assert retriever.retrieve("q") == (["A", "B"], pytest.approx(0.7))
+
+
+def test_clear_query_clears_the_default_confidence(adventure_works):
+    tables, confidence = adventure_works.retrieve("credit card numbers of customers")
+    assert tables[0] == "CreditCard"
+    assert confidence >= 0.2  # TABLE_RETRIEVER_MIN_CONFIDENCE
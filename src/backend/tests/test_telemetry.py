@@ -0,0 +1,237 @@
+import asyncio
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import telemetry
+from telemetry import (
+    REGISTRY,
+    SPAN_ERRORS,
+    Counter,
+    Histogram,
+    annotate,
+    bind_context,
+    capture_spans,
+    collect_trace,
+    current_span,
+    record_span,
+    render_metrics,
+    replay_spans,
+    span,
+)
+
+# One sample line: name{label="value",...} value
+SAMPLE_LINE = re.compile(r'^[a-zA-Z_:][\w:]*(\{(\w+="([^"\\]|\\.)*",?)*\})? (-?[0-9.]+(e[+-]?\d+)?|[+-]Inf|NaN)$')
+
+
+@pytest.fixture
+def metrics():
+    """
+    Counter / Histogram factories whose metrics leave the registry again.
+    """
+    made = []
+
+    def make(cls, *args, **kwargs):
+        made.append(cls(*args, **kwargs))
+        return made[-1]
+
+    yield make
+    for metric in made:
+        REGISTRY.remove(metric)
+
+
+def names(trace):
+    return [(s["name"], s["parent"]) for s in trace.breakdown()["spans"]]
+
+
+# ---------- Metrics ----------
+
+
+def test_counter_text_format(metrics):
+    requests = metrics(Counter, "test_requests_total", "Requests", ["route", "status"])
+    requests.inc(route="/query", status="200")
+    requests.inc(2, route="/query", status="200")
+    requests.inc(0.5, route='/a"b\\c\nd', status="500")
+    assert requests.render() == [
+        "# HELP test_requests_total Requests",
+        "# TYPE test_requests_total counter",
+        'test_requests_total{route="/a\\"b\\\\c\\nd",status="500"} 0.5',
+        'test_requests_total{route="/query",status="200"} 3',
+    ]
+
+
+def test_unlabelled_counter(metrics):
+    total = metrics(Counter, "test_total", "Total")
+    total.inc()
+    assert total.render()[-1] == "test_total 1"
+
+
+def test_histogram_buckets_are_cumulative(metrics):
+    seconds = metrics(Histogram, "test_seconds", "Durations", ["stage"], buckets=(1, 0.1))
+    for value in (0.05, 0.1, 0.5, 3):
+        seconds.observe(value, stage="llm")
+    assert seconds.render() == [
+        "# HELP test_seconds Durations",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{stage="llm",le="0.1"} 2',
+        'test_seconds_bucket{stage="llm",le="1"} 3',
+        'test_seconds_bucket{stage="llm",le="+Inf"} 4',
+        'test_seconds_sum{stage="llm"} 3.65',
+        'test_seconds_count{stage="llm"} 4',
+    ]
+
+
+def test_metrics_page_is_valid_text_format(metrics):
+    metrics(Counter, "test_page_total", "Page").inc()
+    with span("test.render"):
+        pass
+    text = render_metrics()
+    assert text.endswith("\n")
+    declared = set()
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            name, kind = line.split()[2:]
+            assert kind in ("counter", "histogram") and name not in declared
+            declared.add(name)
+        elif not line.startswith("# HELP "):
+            assert SAMPLE_LINE.match(line), line
+            assert re.match(r"[^{ ]+", line).group(0).removesuffix("_bucket").removesuffix("_sum").removesuffix("_count") in declared
+    assert 'nl2sql_span_duration_seconds_count{span="test.render"}' in text
+    assert "test_page_total 1" in text
+
+
+# ---------- Spans ----------
+
+
+def test_spans_nest():
+    with collect_trace() as trace:
+        with span("pipeline"):
+            assert current_span() == "pipeline"
+            with span("rewrite"):
+                with span("llm"):
+                    assert current_span() == "llm"
+            with span("generate_sql"):
+                pass
+        assert current_span() is None
+    assert names(trace) == [("pipeline", None), ("rewrite", "pipeline"), ("llm", "rewrite"), ("generate_sql", "pipeline")]
+
+
+def test_spans_follow_asyncio_tasks():
+    async def step(name, delay):
+        with span(name):
+            await asyncio.sleep(delay)
+            assert current_span() == name
+
+    async def main():
+        with span("batch"):
+            await asyncio.gather(step("a", 0.02), step("b", 0.01))
+            assert current_span() == "batch"
+
+    with collect_trace() as trace:
+        asyncio.run(main())
+    assert sorted(names(trace)) == [("a", "batch"), ("b", "batch"), ("batch", None)]
+
+
+def test_bound_thread_pool_calls_join_the_trace():
+    def work(name):
+        with span(name):
+            return current_span()
+
+    with collect_trace() as trace, ThreadPoolExecutor(2) as pool:
+        with span("execute"):
+            assert pool.submit(bind_context(work, "db.fetch")).result() == "db.fetch"
+            pool.submit(work, "unbound").result()
+    assert names(trace) == [("execute", None), ("db.fetch", "execute")]
+
+
+def test_concurrent_requests_keep_separate_traces():
+    traces = {}
+    start = threading.Barrier(4)
+
+    def request(i):
+        with collect_trace() as trace:
+            start.wait()
+            for _ in range(20):
+                with span(f"request{i}"):
+                    pass
+        traces[i] = trace
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for i, trace in traces.items():
+        assert trace.breakdown()["stages"].keys() == {f"request{i}"}
+        assert len(trace.spans) == 20
+
+
+def test_failed_span_is_flagged_and_counted():
+    before = SPAN_ERRORS._values.get(("test.fail",), 0)
+    with collect_trace() as trace:
+        with pytest.raises(ValueError):
+            with span("test.fail", attempt=1):
+                annotate(cache="miss")
+                raise ValueError("boom")
+    (record,) = trace.spans
+    assert record["error"] is True and record["attempt"] == 1 and record["cache"] == "miss"
+    assert SPAN_ERRORS._values[("test.fail",)] == before + 1
+
+
+def test_record_span_is_a_child_of_the_current_span():
+    with collect_trace() as trace:
+        with span("stream"):
+            record_span("db.fetch", time.perf_counter(), 0.002, rows=100)
+    fetch = next(s for s in trace.spans if s["name"] == "db.fetch")
+    assert fetch["parent"] == "stream" and fetch["rows"] == 100 and fetch["duration_ms"] == 2.0
+
+
+def test_spans_outside_a_trace_only_feed_metrics():
+    with span("test.untraced"):
+        annotate(ignored=True)
+    assert 'span="test.untraced"' in render_metrics()
+
+
+def test_disabled_telemetry_records_nothing(monkeypatch):
+    monkeypatch.setattr(telemetry, "TELEMETRY_ENABLED", False)
+    with collect_trace() as trace:
+        with span("test.disabled", a=1) as attributes:
+            assert attributes == {"a": 1}
+            assert current_span() is None
+    assert trace.spans == []
+    assert 'span="test.disabled"' not in render_metrics()
+
+
+# ---------- Timing breakdown ----------
+
+
+def test_breakdown_sums_stages_in_start_order():
+    with collect_trace() as trace:
+        for _ in range(2):
+            with span("llm"):
+                time.sleep(0.01)
+        with span("execute"):
+            pass
+    breakdown = trace.breakdown()
+    assert [s["name"] for s in breakdown["spans"]] == ["llm", "llm", "execute"]
+    assert breakdown["stages"]["llm"] == pytest.approx(sum(s["duration_ms"] for s in breakdown["spans"][:2]), abs=0.02)
+    assert breakdown["stages"]["llm"] >= 20
+    assert breakdown["total_ms"] >= breakdown["stages"]["llm"]
+    starts = [s["start_ms"] for s in breakdown["spans"]]
+    assert starts == sorted(starts)
+
+
+def test_captured_spans_replay_into_other_traces():
+    with collect_trace() as leader:
+        with capture_spans() as captured:
+            with span("llm", tokens=5):
+                pass
+    with collect_trace() as follower:
+        replay_spans(captured, coalesced=True)
+    assert leader.spans[0]["tokens"] == 5 and "coalesced" not in leader.spans[0]
+    assert follower.spans[0]["name"] == "llm"
+    assert follower.spans[0]["tokens"] == 5 and follower.spans[0]["coalesced"] is True
+    replay_spans(captured)  # no trace: nothing to do
@@ -0,0 +1,22 @@
+import math
+
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # not installed, or no cached encoding offline
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Prompt-size estimate for reports and benchmarks.
+
+    Uses tiktoken's cl100k_base when available; otherwise ~4 characters per
+    token, which is close enough for comparing prompt formats.
+    """
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return math.ceil(len(text) / 4)
@@ -0,0 +1,292 @@
+import datetime
+import hashlib
+import re
+import threading
+from decimal import Decimal, InvalidOperation, localcontext
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+import pymysql
+from pymysql.cursors import SSCursor
+
+# The backend's database settings (DB_* environment variables or .env
+# override them); point them, or --db-host etc., at a local copy to keep
+# evaluation load off the shared server.
+from backend.config import DB_HOST, DB_NAME, DB_PASSWORD, DB_PORT, DB_USER
+from evaluation.store import DiskCache, content_hash
+
+EXEC_TIMEOUT_S = 60
+FETCH_BATCH_SIZE = 1000
+
+# Numbers are compared after rounding to this many decimal places, so
+# 1.5 (DOUBLE), 1.5000 (DECIMAL) and 1.50000001 hash alike.
+NUMERIC_PLACES = 6
+
+# Bump when normalization changes, so cached fingerprints are recomputed.
+FINGERPRINT_VERSION = 1
+
+_NULL = "\x00"
+_SEP = "\x1f"
+_MOD = 1 << 128
+
+
+def connection_broken(e: BaseException) -> bool:
+    """
+    True when a failed query left the connection unusable. pymysql raises
+    OperationalError for plain statement errors too (1054 unknown column,
+    1055 only_full_group_by, 1242 ...), so this goes by error number:
+    client errors 2000-2999 (2006 gone away, 2013 lost connection, ...),
+    server shutdown / killed connection, or InterfaceError.
+    """
+    if isinstance(e, pymysql.err.InterfaceError):
+        return True
+    if not isinstance(e, pymysql.err.MySQLError):
+        return True  # e.g. interrupted mid-result: rows may be left unread
+    errno = e.args[0] if e.args and isinstance(e.args[0], int) else None
+    return errno is None or 2000 <= errno < 3000 or errno in (1053, 1927)
+
+
+def _number(value: Any) -> str:
+    try:
+        d = value if isinstance(value, Decimal) else Decimal(repr(value))
+    except InvalidOperation:
+        return str(value)
+    if not d.is_finite():
+        return str(d)
+    # enough precision for every integer digit (SUM / DOUBLE results can
+    # exceed the default 28), or round() raises InvalidOperation
+    with localcontext() as ctx:
+        ctx.prec = max(ctx.prec, d.adjusted() + NUMERIC_PLACES + 2)
+        d = round(d, NUMERIC_PLACES)
+        if d == d.to_integral_value():
+            return str(int(d))
+        return format(d.normalize(), "f")
+
+
+def normalize_value(value: Any) -> str:
+    """
+    Canonical text for one cell: numbers rounded and without trailing
+    zeros, temporal values in ISO form, NULL distinct from every string.
+    """
+    if value is None:
+        return _NULL
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, (float, Decimal)):
+        return _number(value)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return _number(Decimal(str(value.total_seconds())))
+    if isinstance(value, (bytes, bytearray)):
+        return "0x" + bytes(value).hex()
+    return str(value)
+
+
+def row_digest(row: Sequence[Any], ignore_column_order: bool = False) -> bytes:
+    cells = [normalize_value(v) for v in row]
+    if ignore_column_order:
+        cells.sort()
+    return hashlib.blake2b(_SEP.join(cells).encode("utf-8"), digest_size=16).digest()
+
+
+class ResultFingerprint:
+    """
+    Streaming hash of a result set; rows are added one at a time and never
+    kept.
+
+    - unordered: multiset hash, the sum of the row digests mod 2**128, so
+      row order doesn't matter but duplicate rows do
+    - ordered:   a running hash over the row digests in sequence
+    """
+
+    def __init__(self, ordered: bool = False, ignore_column_order: bool = False):
+        self.ordered = ordered
+        self.ignore_column_order = ignore_column_order
+        self.rows = 0
+        self._sum = 0
+        self._chain = hashlib.blake2b(digest_size=16)
+
+    def add(self, row: Sequence[Any]) -> None:
+        digest = row_digest(row, self.ignore_column_order)
+        self.rows += 1
+        if self.ordered:
+            self._chain.update(digest)
+        else:
+            self._sum = (self._sum + int.from_bytes(digest, "big")) % _MOD
+
+    def update(self, rows: Iterable[Sequence[Any]]) -> None:
+        for row in rows:
+            self.add(row)
+
+    def hexdigest(self) -> str:
+        if self.ordered:
+            return self._chain.hexdigest()
+        return f"{self._sum:032x}"
+
+
+def _strip_literals_and_comments(sql: str) -> str:
+    sql = re.sub(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"", "''", sql)
+    sql = re.sub(r"/\*.*?\*/", " ", sql, flags=re.DOTALL)
+    return re.sub(r"(--|#)[^\n]*", " ", sql)
+
+
+def has_top_level_order_by(sql: str) -> bool:
+    """
+    True when the statement itself is ordered; ORDER BY inside subqueries
+    or window functions (OVER (ORDER BY ...)) doesn't count.
+    """
+    s = _strip_literals_and_comments(sql or "")
+    while True:
+        stripped = re.sub(r"\([^()]*\)", " ", s)
+        if stripped == s:
+            break
+        s = stripped
+    return re.search(r"\border\s+by\b", s, flags=re.IGNORECASE) is not None
+
+
+def is_read_only(sql: str) -> bool:
+    """
+    A single SELECT (or WITH ... SELECT) statement; anything else is not
+    executed during evaluation.
+    """
+    s = _strip_literals_and_comments(sql or "").strip().rstrip(";").strip()
+    if not s or ";" in s:
+        return False
+    return re.match(r"^\(*\s*(select|with)\b", s, flags=re.IGNORECASE) is not None
+
+
+class ExecutionScorer:
+    """
+    Execution accuracy: run gold and predicted SQL and compare result-set
+    fingerprints. Rows are streamed from an unbuffered cursor and hashed
+    as they arrive, so result size doesn't matter. Fingerprints are cached
+    (DiskCache namespace "result") per SQL text and database, which keeps
+    gold queries from being re-run on every evaluation.
+    """
+
+    def __init__(
+        self,
+        host: str = DB_HOST,
+        port: int = DB_PORT,
+        user: str = DB_USER,
+        password: str = DB_PASSWORD,
+        database: str = DB_NAME,
+        cache: Optional[DiskCache] = None,
+        timeout_s: int = EXEC_TIMEOUT_S,
+        ignore_column_order: bool = False,
+    ):
+        self.connect_args = {"host": host, "port": port, "user": user, "password": password, "database": database}
+        self.cache = cache
+        self.timeout_s = timeout_s
+        self.ignore_column_order = ignore_column_order
+        self.db_key = [host, port, database]
+        self._local = threading.local()
+        self.counts = {"executions": 0, "cached": 0}
+        self._counts_lock = threading.Lock()
+
+    def _count(self, name: str) -> None:
+        with self._counts_lock:
+            self.counts[name] += 1
+
+    def _connection(self):
+        # one connection per worker thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = pymysql.connect(
+                **self.connect_args,
+                cursorclass=SSCursor,
+                autocommit=True,
+                read_timeout=self.timeout_s,
+            )
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(f"SET SESSION MAX_EXECUTION_TIME = {int(self.timeout_s * 1000)}")
+            except pymysql.MySQLError:
+                pass  # MariaDB / old MySQL: read_timeout still applies
+            self._local.conn = conn
+        return conn
+
+    def _drop_connection(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _execute(self, sql: str, ordered: bool) -> Dict[str, Any]:
+        fp = ResultFingerprint(ordered=ordered, ignore_column_order=self.ignore_column_order)
+        conn = self._connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+                columns = len(cur.description or [])
+                while True:
+                    rows = cur.fetchmany(FETCH_BATCH_SIZE)
+                    if not rows:
+                        break
+                    fp.update(rows)
+        except Exception as e:
+            # bad SQL leaves the connection fine (the cursor is closed);
+            # a broken one, or unread rows, means starting fresh next time
+            if connection_broken(e):
+                self._drop_connection()
+            raise
+        return {"columns": columns, "rows": fp.rows, "digest": fp.hexdigest(), "ordered": ordered}
+
+    def fingerprint(self, sql: str, ordered: bool) -> Dict[str, Any]:
+        """
+        {"columns", "rows", "digest", "ordered"} for a query's result.
+        Raises for SQL that fails or is not a single SELECT.
+        """
+        sql = (sql or "").strip().rstrip(";")
+        if not is_read_only(sql):
+            raise ValueError("not a single SELECT statement")
+
+        key = content_hash(sql, ordered, self.ignore_column_order, FINGERPRINT_VERSION, *self.db_key)
+        if self.cache is not None:
+            cached = self.cache.get("result", key)
+            if cached is not None:
+                self._count("cached")
+                return cached
+
+        self._count("executions")
+        result = self._execute(sql, ordered)
+        if self.cache is not None:
+            self.cache.set("result", key, result)
+        return result
+
+    def score(self, gold_sql: str, pred_sql: str) -> Dict[str, Any]:
+        """
+        Execution match of a prediction, as report columns:
+          exec_match   True / False, None when the gold query itself fails
+          exec_error   why the gold or predicted query couldn't be run
+          exec_ordered whether row order was compared (gold has ORDER BY)
+          gold_rows, pred_rows
+        """
+        ordered = has_top_level_order_by(gold_sql)
+        out = {"exec_match": None, "exec_error": None, "exec_ordered": ordered, "gold_rows": None, "pred_rows": None}
+        try:
+            gold = self.fingerprint(gold_sql, ordered)
+        except Exception as e:
+            out["exec_error"] = f"gold: {e}"
+            return out
+        out["gold_rows"] = gold["rows"]
+
+        try:
+            pred = self.fingerprint(pred_sql, ordered)
+        except Exception as e:
+            out["exec_match"] = False
+            out["exec_error"] = f"pred: {e}"
+            return out
+        out["pred_rows"] = pred["rows"]
+        out["exec_match"] = (pred["columns"], pred["rows"], pred["digest"]) == (gold["columns"], gold["rows"], gold["digest"])
+        return out
+
+    def close(self) -> None:
+        self._drop_connection()
@@ -0,0 +1,197 @@
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+JUDGE_MODEL = "gpt-4o-mini"
+
+JUDGE_PROMPT = """You are a strict SQL evaluator.
+
+Task:
+Given (1) a natural-language question, (2) a GOLD SQL, and (3) a PREDICTED SQL,
+judge whether GOLD and PREDICTED are semantically equivalent for the same schema/data.
+
+Return JSON ONLY with keys:
+- "equivalent": true/false
+- "score": integer from 0 to 5  (5 = fully equivalent, 0 = totally wrong)
+- "reason": short explanation (<= 2 sentences)
+
+Be careful:
+- Different formatting is fine.
+- Different table aliases are fine.
+- If selected columns, filters, joins, grouping, or ordering change the meaning, it's NOT equivalent.
+
+NL_QUESTION:
+{question}
+
+GOLD_SQL:
+{gold}
+
+PREDICTED_SQL:
+{pred}
+"""
+
+JUDGE_BATCH_PROMPT = """You are a strict SQL evaluator.
+
+Task:
+For each numbered item below you get (1) a natural-language question, (2) a GOLD SQL,
+and (3) a PREDICTED SQL. Judge each item on its own: are GOLD and PREDICTED
+semantically equivalent for the same schema/data?
+
+Return JSON ONLY, one verdict per item:
+{{"verdicts": [{{"id": <item id>, "equivalent": true/false, "score": <0-5>, "reason": "<= 2 sentences"}}, ...]}}
+- "score": integer from 0 to 5  (5 = fully equivalent, 0 = totally wrong)
+
+Be careful:
+- Different formatting is fine.
+- Different table aliases are fine.
+- If selected columns, filters, joins, grouping, or ordering change the meaning, it's NOT equivalent.
+
+{items}
+"""
+
+JUDGE_BATCH_ITEM = """### ITEM {id}
+NL_QUESTION:
+{question}
+
+GOLD_SQL:
+{gold}
+
+PREDICTED_SQL:
+{pred}
+"""
+
+# Structured output for batch calls: the model can't drop or rename keys.
+_VERDICTS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "verdicts": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "integer"},
+                    "equivalent": {"type": "boolean"},
+                    "score": {"type": "integer"},
+                    "reason": {"type": "string"},
+                },
+                "required": ["id", "equivalent", "score", "reason"],
+                "additionalProperties": False,
+            },
+        }
+    },
+    "required": ["verdicts"],
+    "additionalProperties": False,
+}
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _get_client(timeout_s: Optional[float] = None):
+    # created on first use so importing this module needs no API key
+    global _client
+    with _client_lock:
+        if _client is None:
+            from openai import OpenAI
+            _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=timeout_s)
+        return _client
+
+
+def parse_judge_output(text: str) -> Dict[str, Any]:
+    """
+    {"equivalent", "score", "reason"} from the judge's reply; equivalent and
+    score are None when the reply can't be parsed.
+    """
+    text = (text or "").strip()
+
+    # Extract JSON object robustly
+    m = re.search(r"\{.*\}", text, flags=re.DOTALL)
+    if not m:
+        return {"equivalent": None, "score": None, "reason": f"Could not parse JSON. Raw: {text[:200]}"}
+
+    try:
+        obj = json.loads(m.group(0))
+        if "equivalent" not in obj or "score" not in obj or "reason" not in obj:
+            return {"equivalent": None, "score": None, "reason": f"Invalid judge JSON: {obj}"}
+        return obj
+    except Exception as e:
+        return {"equivalent": None, "score": None, "reason": f"JSON parse error: {e}. Raw: {text[:200]}"}
+
+
+def call_openai_judge(
+    question: str,
+    gold_sql: str,
+    pred_sql: str,
+    model: str = JUDGE_MODEL,
+    timeout_s: Optional[float] = 60,
+) -> Dict[str, Any]:
+    prompt = JUDGE_PROMPT.format(question=question, gold=gold_sql, pred=pred_sql)
+
+    # Ask the model to return only JSON; we still parse defensively.
+    resp = _get_client(timeout_s).responses.create(
+        model=model,
+        input=prompt,
+    )
+    return parse_judge_output(resp.output_text)
+
+
+def parse_judge_batch_output(text: str, n_items: int) -> List[Optional[Dict[str, Any]]]:
+    """
+    Verdicts from a batch reply, in item order; None for items the reply
+    has no valid verdict for (those are judged again on their own). An id
+    answered twice counts as unanswered: the reply is misnumbered there,
+    so neither verdict can be trusted to be that item's.
+    """
+    out: List[Optional[Dict[str, Any]]] = [None] * n_items
+    m = re.search(r"\{.*\}", (text or "").strip(), flags=re.DOTALL)
+    if not m:
+        return out
+    try:
+        verdicts = json.loads(m.group(0)).get("verdicts")
+    except Exception:
+        return out
+    seen = set()
+    repeated = set()
+    for v in verdicts if isinstance(verdicts, list) else []:
+        if not isinstance(v, dict) or not {"id", "equivalent", "score", "reason"} <= v.keys():
+            continue
+        i = v["id"]
+        # bool is an int subclass; true is not item 1
+        if not isinstance(i, int) or isinstance(i, bool) or not 0 <= i < n_items:
+            continue
+        if i in seen:
+            repeated.add(i)
+            continue
+        seen.add(i)
+        out[i] = {"equivalent": v["equivalent"], "score": v["score"], "reason": v["reason"]}
+    for i in repeated:
+        out[i] = None
+    return out
+
+
+def call_openai_judge_batch(
+    items: Sequence[Tuple[str, str, str]],
+    model: str = JUDGE_MODEL,
+    timeout_s: Optional[float] = 60,
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    Judge several (question, gold_sql, pred_sql) triples in one call.
+    Returns one verdict per item (None where the reply had none).
+    """
+    prompt = JUDGE_BATCH_PROMPT.format(
+        items="\n".join(
+            JUDGE_BATCH_ITEM.format(id=i, question=q, gold=g, pred=p) for i, (q, g, p) in enumerate(items)
+        )
+    )
+    resp = _get_client(timeout_s).responses.create(
+        model=model,
+        input=prompt,
+        text={"format": {"type": "json_schema", "name": "verdicts", "schema": _VERDICTS_SCHEMA, "strict": True}},
+    )
+    return parse_judge_batch_output(resp.output_text, len(items))
@@ -0,0 +1,233 @@
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    # C implementation of the same Levenshtein distance, plus a pairwise
+    # multi-threaded batch version
+    from rapidfuzz.distance import Levenshtein as _rf_levenshtein
+    from rapidfuzz.process import cpdist as _rf_cpdist
+except ImportError:  # pure-Python DP below
+    _rf_levenshtein = _rf_cpdist = None
+
+
+SQL_KEYWORDS = {
+    "select","from","where","join","inner","left","right","full","cross","on",
+    "group","by","having","order","limit","offset","distinct","union","all",
+    "insert","into","values","update","set","delete","case","when","then","else","end",
+    "as","and","or","not","in","exists","between","like","is","null"
+}
+
+def normalize_sql(sql: str) -> str:
+    """Normalization that preserves structure while removing formatting noise."""
+    if sql is None:
+        return ""
+    s = sql.strip()
+    s = s.rstrip(";")
+    s = re.sub(r"\s+", " ", s)          # collapse whitespace
+    s = s.replace("`", "")              # remove backticks (optional)
+    return s.lower().strip()
+
+_TOKEN_RE = re.compile(r"[a-z_]+|\d+|<=|>=|!=|=|<|>|\*|\(|\)|,|\.")
+
+def _normalized_tokens(s: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(s) if t.strip()]
+
+def sql_tokens(sql: str) -> List[str]:
+    """Simple SQL tokenization (no external deps)."""
+    return _normalized_tokens(normalize_sql(sql))
+
+def token_f1(pred: str, gold: str) -> Tuple[float, float, float]:
+    p = sql_tokens(pred)
+    g = sql_tokens(gold)
+    if not p and not g:
+        return (1.0, 1.0, 1.0)
+    if not p or not g:
+        return (0.0, 0.0, 0.0)
+
+    pc = Counter(p)
+    gc = Counter(g)
+
+    common = 0
+    for k in pc.keys():
+        common += min(pc[k], gc.get(k, 0))
+
+    precision = common / max(1, sum(pc.values()))
+    recall = common / max(1, sum(gc.values()))
+    f1 = 0.0 if (precision + recall) == 0 else 2 * precision * recall / (precision + recall)
+    return (precision, recall, f1)
+
+def keyword_f1(pred: str, gold: str) -> Tuple[float, float, float]:
+    pset = {t for t in sql_tokens(pred) if t in SQL_KEYWORDS}
+    gset = {t for t in sql_tokens(gold) if t in SQL_KEYWORDS}
+    if not pset and not gset:
+        return (1.0, 1.0, 1.0)
+    if not pset or not gset:
+        return (0.0, 0.0, 0.0)
+
+    common = len(pset & gset)
+    precision = common / len(pset)
+    recall = common / len(gset)
+    f1 = 0.0 if (precision + recall) == 0 else 2 * precision * recall / (precision + recall)
+    return (precision, recall, f1)
+
+def levenshtein(a: str, b: str) -> int:
+    """Classic DP Levenshtein distance."""
+    a = a or ""
+    b = b or ""
+    if a == b:
+        return 0
+    if _rf_levenshtein is not None:
+        return _rf_levenshtein.distance(a, b)
+    if len(a) == 0:
+        return len(b)
+    if len(b) == 0:
+        return len(a)
+
+    if len(a) > len(b):
+        a, b = b, a
+
+    prev = list(range(len(a) + 1))
+    for i, cb in enumerate(b, start=1):
+        cur = [i]
+        for j, ca in enumerate(a, start=1):
+            ins = cur[j-1] + 1
+            dele = prev[j] + 1
+            sub = prev[j-1] + (0 if ca == cb else 1)
+            cur.append(min(ins, dele, sub))
+        prev = cur
+    return prev[-1]
+
+def edit_similarity(pred: str, gold: str) -> float:
+    p = normalize_sql(pred)
+    g = normalize_sql(gold)
+    if not p and not g:
+        return 1.0
+    dist = levenshtein(p, g)
+    denom = max(1, max(len(p), len(g)))
+    return 1.0 - (dist / denom)
+
+def _as_sql(value) -> str:
+    # NaN / None cells (e.g. failed predictions read back from CSV) score as ""
+    return value if isinstance(value, str) else ""
+
+def sql_metrics(pred: str, gold: str) -> dict:
+    """
+    All string-level metrics for one prediction, keyed by report column.
+    """
+    pred, gold = _as_sql(pred), _as_sql(gold)
+    p_tok, r_tok, f1_tok = token_f1(pred, gold)
+    p_kw, r_kw, f1_kw = keyword_f1(pred, gold)
+    return {
+        "exact_match": pred == gold,
+        "normalized_exact_match": normalize_sql(pred) == normalize_sql(gold),
+        "token_precision": p_tok,
+        "token_recall": r_tok,
+        "token_f1": f1_tok,
+        "keyword_precision": p_kw,
+        "keyword_recall": r_kw,
+        "keyword_f1": f1_kw,
+        "edit_similarity": edit_similarity(pred, gold),
+    }
+
+
+# ---------- Batch metrics over pandas columns ----------
+
+METRIC_COLUMNS = [
+    "exact_match",
+    "normalized_exact_match",
+    "token_precision",
+    "token_recall",
+    "token_f1",
+    "keyword_precision",
+    "keyword_recall",
+    "keyword_f1",
+    "edit_similarity",
+]
+
+
+@lru_cache(maxsize=65536)
+def _prepared(sql: str) -> Tuple[str, Counter, int, frozenset]:
+    # normalized text, token counts, token total, keyword set; gold SQL
+    # repeats across variants and runs, so each string is tokenized once
+    normalized = normalize_sql(sql)
+    toks = _normalized_tokens(normalized)
+    return normalized, Counter(toks), len(toks), frozenset(t for t in toks if t in SQL_KEYWORDS)
+
+
+def _prf(common: np.ndarray, n_pred: np.ndarray, n_gold: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # precision / recall / F1 with token_f1's conventions: both empty -> 1,
+    # one empty -> 0
+    precision = common / np.maximum(1, n_pred)
+    recall = common / np.maximum(1, n_gold)
+    denom = precision + recall
+    f1 = np.divide(2 * precision * recall, denom, out=np.zeros_like(denom), where=denom > 0)
+    both_empty = (n_pred == 0) & (n_gold == 0)
+    for a in (precision, recall, f1):
+        a[both_empty] = 1.0
+    return precision, recall, f1
+
+
+def _edit_distances(preds: List[str], golds: List[str]) -> np.ndarray:
+    if _rf_cpdist is not None:
+        return np.asarray(_rf_cpdist(preds, golds, scorer=_rf_levenshtein.distance, workers=-1), dtype=float)
+    return np.array([levenshtein(p, g) for p, g in zip(preds, golds)], dtype=float)
+
+
+def batch_metrics(preds: Sequence, golds: Sequence, index: Optional[pd.Index] = None) -> pd.DataFrame:
+    """
+    sql_metrics for aligned sequences of predicted and gold SQL, one row per
+    pair, same columns and values. Tokenizes each distinct string once and
+    computes edit distance in C (rapidfuzz) when it is installed.
+    """
+    raw_p = [_as_sql(v) for v in preds]
+    raw_g = [_as_sql(v) for v in golds]
+    if len(raw_p) != len(raw_g):
+        raise ValueError(f"{len(raw_p)} predictions for {len(raw_g)} gold queries")
+    prep_p = [_prepared(v) for v in raw_p]
+    prep_g = [_prepared(v) for v in raw_g]
+
+    norm_p = [p[0] for p in prep_p]
+    norm_g = [g[0] for g in prep_g]
+    tok_common = np.array([sum((p[1] & g[1]).values()) for p, g in zip(prep_p, prep_g)], dtype=float)
+    kw_common = np.array([len(p[3] & g[3]) for p, g in zip(prep_p, prep_g)], dtype=float)
+    tok_p, tok_r, tok_f1 = _prf(
+        tok_common, np.array([p[2] for p in prep_p], dtype=float), np.array([g[2] for g in prep_g], dtype=float)
+    )
+    kw_p, kw_r, kw_f1 = _prf(
+        kw_common, np.array([len(p[3]) for p in prep_p], dtype=float), np.array([len(g[3]) for g in prep_g], dtype=float)
+    )
+
+    lengths = np.array([max(len(p), len(g)) for p, g in zip(norm_p, norm_g)], dtype=float)
+    edit_sim = 1.0 - _edit_distances(norm_p, norm_g) / np.maximum(1, lengths)
+    edit_sim[lengths == 0] = 1.0
+
+    return pd.DataFrame(
+        {
+            "exact_match": [p == g for p, g in zip(raw_p, raw_g)],
+            "normalized_exact_match": [p == g for p, g in zip(norm_p, norm_g)],
+            "token_precision": tok_p,
+            "token_recall": tok_r,
+            "token_f1": tok_f1,
+            "keyword_precision": kw_p,
+            "keyword_recall": kw_r,
+            "keyword_f1": kw_f1,
+            "edit_similarity": edit_sim,
+        },
+        index=index,
+    )
+
+
+def compare_columns(df: pd.DataFrame, gold_col: str, pred_cols: Sequence[str]) -> pd.DataFrame:
+    """
+    Score several prediction columns (model / prompt variants) against one
+    gold column. Returns a frame aligned with df, with (variant, metric)
+    column pairs; `.mean().unstack()` gives the variant x metric table.
+    """
+    golds = df[gold_col].tolist()
+    frames: Dict[str, pd.DataFrame] = {col: batch_metrics(df[col].tolist(), golds, index=df.index) for col in pred_cols}
+    return pd.concat(frames, axis=1, names=["variant", "metric"])
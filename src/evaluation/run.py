@@ -0,0 +1,636 @@
+"""
+Evaluate the running backend on data/*.csv: each question is sent to
+POST /query, the predicted SQL is scored against the gold SQL
+(evaluation.metrics) and, optionally, by the OpenAI judge.
+
+- API calls and judge calls run on separate bounded thread pools
+  (--workers / --judge-workers), so a slow judge doesn't hold up the API.
+- Predictions are cached on disk, keyed by (question, model, prompt hash);
+  the model and prompt hash come from the backend's GET /stats. Judge
+  verdicts are cached by the normalized (gold, predicted) SQL pair, so
+  re-running an unchanged system costs no API or judge calls and only new
+  or changed predictions are judged.
+- Uncached judge items are packed --judge-batch-size at a time into one
+  structured judge call.
+- With --execution, gold and predicted SQL are also run against the
+  database and their result sets compared (evaluation.execution); gold
+  results are cached, so only new predictions hit the database. Use
+  --db-host etc. to point at a local copy of AdventureWorks.
+- Finished rows are appended to results/checkpoints/<run-name>.jsonl; after
+  a crash, rerun with the same --run-name to continue where it stopped.
+- Writes the same results/eval_results_<ts>.csv and eval_summary_<ts>.json
+  as the notebook did.
+- With --accuracy-file, the run's accuracy is also stored per model
+  ("provider:model") for the backend's adaptive router (LLM_ROUTING
+  accuracy floor). Pin the backend to one model (LLM_ROUTE_PIN) for it.
+
+Run from src/ (with the backend running):
+    python -m evaluation.run
+    python -m evaluation.run --workers 8 --judge-workers 4 --run-name nightly
+    python -m evaluation.run --no-judge --limit 50
+    python -m evaluation.run --judge-batch-size 1     # one judge call per row
+    python -m evaluation.run --execution --db-host localhost --exec-workers 4
+    python -m evaluation.run --execution --accuracy-file   # backend pinned with LLM_ROUTE_PIN
+"""
+import argparse
+import glob
+import json
+import math
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+import requests
+
+from evaluation.execution import DB_HOST, DB_NAME, DB_PASSWORD, DB_PORT, DB_USER, EXEC_TIMEOUT_S, ExecutionScorer
+from evaluation.judge import (
+    JUDGE_BATCH_ITEM,
+    JUDGE_BATCH_PROMPT,
+    JUDGE_MODEL,
+    JUDGE_PROMPT,
+    call_openai_judge,
+    call_openai_judge_batch,
+)
+from evaluation.metrics import normalize_sql, sql_metrics
+from evaluation.store import Checkpoint, DiskCache, content_hash
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+DATASET_DIR = str(REPO_ROOT / "data")
+REPORTS_DIR = str(REPO_ROOT / "results")
+ACCURACY_PATH = str(REPO_ROOT / "results" / "model_accuracy.json")
+CACHE_PATH = str(REPO_ROOT / "results" / "cache" / "eval_cache.sqlite")
+
+API_URL = "http://localhost:8000/query"
+API_TIMEOUT_S = 120
+JUDGE_TIMEOUT_S = 60
+JUDGE_BATCH_SIZE = 10
+
+
+def load_all_csvs(dataset_dir: str) -> pd.DataFrame:
+    paths = sorted(glob.glob(os.path.join(dataset_dir, "*.csv")))
+    if not paths:
+        raise FileNotFoundError(f"No CSV files found in '{dataset_dir}/'")
+
+    dfs = []
+    for p in paths:
+        df = pd.read_csv(p)
+        if not {"user_query", "sql_query"}.issubset(df.columns):
+            raise ValueError(f"Missing required columns in {p}. Need: user_query, sql_query")
+        df = df[["user_query", "sql_query"]].copy()
+        df["source_file"] = os.path.basename(p)
+        dfs.append(df)
+
+    out = pd.concat(dfs, ignore_index=True)
+    out["row_id"] = range(len(out))
+    return out
+
+
+def call_sql_api(api_url: str, user_query: str, timeout_s: int = 30, pipeline_mode: Optional[str] = None) -> Dict[str, Any]:
+    payload = {"user_query": user_query}
+    if pipeline_mode:
+        payload["pipeline_mode"] = pipeline_mode
+    r = requests.post(api_url, json=payload, timeout=timeout_s)
+    r.raise_for_status()
+    return r.json()
+
+
+def system_identity(api_url: str, timeout_s: int = 10) -> Dict[str, Any]:
+    """
+    Model, per-stage routes and schema/prompt fingerprint of the backend
+    under test, from GET /stats. None if the backend doesn't report them.
+    """
+    stats_url = api_url.rsplit("/query", 1)[0] + "/stats"
+    try:
+        r = requests.get(stats_url, timeout=timeout_s)
+        r.raise_for_status()
+        stats = r.json()
+        llm = stats.get("llm") or {}
+        return {
+            "model": llm.get("model"),
+            "provider": llm.get("provider"),
+            "routes": llm.get("routes"),
+            "prompt_hash": (stats.get("cache") or {}).get("fingerprint"),
+        }
+    except Exception as e:
+        print(f"Could not read {stats_url} ({e}); predictions are cached per API URL only")
+        return {"model": None, "provider": None, "routes": None, "prompt_hash": None}
+
+
+class EvalRunner:
+    """
+    Runs prediction + scoring for dataset rows with bounded concurrency,
+    using the disk cache and checkpoint when given.
+    """
+
+    def __init__(
+        self,
+        api_url: str = API_URL,
+        api_timeout_s: int = API_TIMEOUT_S,
+        pipeline_mode: Optional[str] = None,
+        workers: int = 4,
+        judge_workers: int = 2,
+        use_judge: bool = True,
+        judge_model: str = JUDGE_MODEL,
+        judge_timeout_s: int = JUDGE_TIMEOUT_S,
+        judge_limit: Optional[int] = None,
+        judge_batch_size: int = JUDGE_BATCH_SIZE,
+        cache: Optional[DiskCache] = None,
+        checkpoint: Optional[Checkpoint] = None,
+        scorer: Optional[ExecutionScorer] = None,
+        exec_workers: int = 2,
+    ):
+        self.api_url = api_url
+        self.api_timeout_s = api_timeout_s
+        self.pipeline_mode = pipeline_mode
+        self.workers = workers
+        self.judge_workers = judge_workers
+        self.use_judge = use_judge
+        self.judge_model = judge_model
+        self.judge_timeout_s = judge_timeout_s
+        self.judge_limit = judge_limit
+        self.judge_batch_size = max(1, judge_batch_size)
+        self.cache = cache
+        self.checkpoint = checkpoint
+        self.scorer = scorer
+        # execution runs inside the API workers; this caps concurrent queries
+        self._exec_slots = threading.BoundedSemaphore(exec_workers)
+
+        self.identity = identity = system_identity(api_url)
+        # no model / prompt hash from the backend -> fall back to the URL
+        self.system_key = [identity["model"], identity["prompt_hash"], pipeline_mode]
+        if identity["model"] is None and identity["prompt_hash"] is None:
+            self.system_key.append(api_url)
+        if identity.get("routes"):
+            # per-stage routing: predictions depend on every stage's model
+            self.system_key.append(json.dumps(identity["routes"], sort_keys=True))
+        self.judge_prompt_hash = content_hash(JUDGE_PROMPT, JUDGE_BATCH_PROMPT, JUDGE_BATCH_ITEM)
+        self.counts = {
+            "api_calls": 0,
+            "judge_calls": 0,       # requests sent to the judge model
+            "judge_rows": 0,        # rows that got a verdict (or a failure)
+            "judge_cache_hits": 0,
+            "judge_time_s": 0.0,    # summed duration of judge calls
+            "judge_time_saved_s": 0.0,  # what the cached verdicts took to produce
+        }
+        self._counts_lock = threading.Lock()
+
+    def _count(self, name: str, amount=1) -> None:
+        with self._counts_lock:
+            self.counts[name] += amount
+
+    def predict(self, question: str) -> Dict[str, Any]:
+        """
+        {"sql", "relevant_tables", "columns", "latency_s", "cached"} for a
+        question, from the cache or the API. Raises on API errors (not
+        cached). A cached prediction keeps the latency of the call that
+        produced it, so it is flagged and left out of the latency stats.
+        """
+        key = content_hash(question, *self.system_key)
+        if self.cache is not None:
+            cached = self.cache.get("prediction", key)
+            if cached is not None:
+                return dict(cached, cached=True)
+
+        t0 = time.time()
+        self._count("api_calls")
+        resp = call_sql_api(self.api_url, question, timeout_s=self.api_timeout_s, pipeline_mode=self.pipeline_mode)
+        prediction = {
+            "sql": resp.get("sql", "") or "",
+            "relevant_tables": resp.get("relevant_tables", []) or [],
+            "columns": resp.get("columns", []) or [],
+            "latency_s": time.time() - t0,
+        }
+        if self.cache is not None:
+            self.cache.set("prediction", key, prediction)
+        return dict(prediction, cached=False)
+
+    def judge_key(self, result: Dict[str, Any]) -> str:
+        # formatting-only changes to either SQL keep the verdict
+        return content_hash(
+            normalize_sql(result["gold_sql"]), normalize_sql(result["pred_sql"]), self.judge_model, self.judge_prompt_hash
+        )
+
+    def cached_judgment(self, result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if self.cache is None:
+            return None
+        judgment = self.cache.get("judgment", self.judge_key(result))
+        if judgment is not None:
+            self._count("judge_rows")
+            self._count("judge_cache_hits")
+            self._count("judge_time_saved_s", judgment.get("cost_s", 0.0))
+        return judgment
+
+    def _judge_call(self, fn, *args) -> Any:
+        t0 = time.time()
+        self._count("judge_calls")
+        try:
+            return fn(*args, model=self.judge_model, timeout_s=self.judge_timeout_s)
+        finally:
+            self._count("judge_time_s", time.time() - t0)
+
+    def judge(self, items: List[Tuple[str, str, str]]) -> List[Dict[str, Any]]:
+        """
+        Verdicts for (question, gold, pred) triples: one batch call, then
+        single calls for items the batch reply missed. Each verdict gets
+        "cost_s", its share of the call time.
+        """
+        verdicts: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        if len(items) > 1:
+            t0 = time.time()
+            try:
+                verdicts = self._judge_call(call_openai_judge_batch, items)
+            except Exception as e:
+                print(f"Batch judge call failed ({e}); judging {len(items)} items one by one")
+            cost_s = (time.time() - t0) / len(items)
+            verdicts = [dict(v, cost_s=cost_s) if v is not None else None for v in verdicts]
+
+        for i, item in enumerate(items):
+            if verdicts[i] is not None:
+                continue
+            t0 = time.time()
+            try:
+                verdicts[i] = self._judge_call(call_openai_judge, *item)
+            except Exception as e:
+                verdicts[i] = {"equivalent": None, "score": None, "reason": f"Judge call failed: {e}"}
+            verdicts[i]["cost_s"] = time.time() - t0
+        return verdicts
+
+    def judge_rows(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Judge a batch of rows; rows with the same SQL pair share one item.
+        """
+        keys = [self.judge_key(r) for r in results]
+        unique: Dict[str, Dict[str, Any]] = {}
+        for key, r in zip(keys, results):
+            unique.setdefault(key, r)
+        items = [(r["user_query"], r["gold_sql"], r["pred_sql"]) for r in unique.values()]
+        judgments = dict(zip(unique, self.judge(items)))
+
+        for key, judgment in judgments.items():
+            # unparseable verdicts and failed calls are retried next run
+            if self.cache is not None and judgment.get("equivalent") is not None:
+                self.cache.set("judgment", key, judgment)
+        self._count("judge_rows", len(results))
+        for key, r in zip(keys, results):
+            self.apply_judgment(r, judgments[key])
+        return results
+
+    @staticmethod
+    def apply_judgment(result: Dict[str, Any], judgment: Dict[str, Any]) -> None:
+        result["judge_equivalent"] = judgment.get("equivalent")
+        result["judge_score_0_5"] = judgment.get("score")
+        result["judge_reason"] = judgment.get("reason")
+
+    def judge_stats(self) -> Dict[str, Any]:
+        """
+        Judge cost of this run: calls made, and calls / seconds saved by
+        the verdict cache and by batching.
+        """
+        c = self.counts
+        return {
+            "judge_calls": c["judge_calls"],
+            "judge_cache_hits": c["judge_cache_hits"],
+            # one call per judged row is what the unbatched, uncached judge made
+            "judge_calls_saved": max(0, c["judge_rows"] - c["judge_calls"]),
+            "judge_time_s": round(c["judge_time_s"], 2),
+            "judge_time_saved_s": round(c["judge_time_saved_s"], 2),
+        }
+
+    def predict_row(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        user_q = str(row["user_query"])
+        gold = str(row["sql_query"])
+
+        api_ok = True
+        api_err = None
+        prediction = {"sql": "", "relevant_tables": [], "columns": [], "latency_s": 0.0, "cached": False}
+        t0 = time.time()
+        try:
+            prediction = self.predict(user_q)
+        except Exception as e:
+            api_ok = False
+            api_err = str(e)
+            prediction["latency_s"] = time.time() - t0
+
+        pred = prediction["sql"]
+        execution = {}
+        if self.scorer is not None:
+            with self._exec_slots:
+                execution = self.scorer.score(gold, pred)
+        return {
+            "row_id": int(row["row_id"]),
+            "source_file": row["source_file"],
+            "user_query": user_q,
+            "gold_sql": gold,
+            "pred_sql": pred,
+            "api_ok": api_ok,
+            "api_error": api_err,
+            "latency_s": prediction["latency_s"],
+            "cached": prediction["cached"],
+            **sql_metrics(pred, gold),
+            **execution,
+            "judge_equivalent": None,
+            "judge_score_0_5": None,
+            "judge_reason": None,
+            "relevant_tables": json.dumps(prediction["relevant_tables"], ensure_ascii=False),
+            "returned_columns": json.dumps(prediction["columns"], ensure_ascii=False),
+        }
+
+    def needs_judge(self, result: Dict[str, Any]) -> bool:
+        if not self.use_judge or not result["api_ok"] or not result["pred_sql"].strip():
+            return False
+        return self.judge_limit is None or result["row_id"] < self.judge_limit
+
+    def run(self, df: pd.DataFrame) -> pd.DataFrame:
+        rows = df.to_dict("records")
+        done: Dict[int, Dict[str, Any]] = {}
+        if self.checkpoint is not None:
+            questions = {int(r["row_id"]): str(r["user_query"]) for r in rows}
+            for r in self.checkpoint.rows():
+                # only rows of the same dataset count as done
+                if questions.get(r.get("row_id")) != r.get("user_query"):
+                    continue
+                # resumed with --execution: redo rows checkpointed without it
+                # (their predictions come from the cache)
+                if self.scorer is not None and "exec_match" not in r:
+                    continue
+                done[r["row_id"]] = r
+        todo = [r for r in rows if int(r["row_id"]) not in done]
+        print(f"{len(rows)} rows: {len(done)} from checkpoint, {len(todo)} to evaluate")
+
+        def finish(result: Dict[str, Any]) -> None:
+            done[result["row_id"]] = result
+            if self.checkpoint is not None:
+                self.checkpoint.append(result)
+            if len(done) % 25 == 0:
+                print(f"Processed {len(done)}/{len(rows)}")
+
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="eval-api") as api_pool, \
+                ThreadPoolExecutor(self.judge_workers, thread_name_prefix="eval-judge") as judge_pool:
+            predicting = {api_pool.submit(self.predict_row, r) for r in todo}
+            judging = set()
+            pending: List[Dict[str, Any]] = []  # rows waiting for a judge batch
+            try:
+                while predicting or judging:
+                    finished, _ = wait(predicting | judging, return_when=FIRST_COMPLETED)
+                    for fut in finished:
+                        if fut in judging:
+                            judging.discard(fut)
+                            for result in fut.result():
+                                finish(result)
+                            continue
+
+                        predicting.discard(fut)
+                        result = fut.result()
+                        if self.needs_judge(result):
+                            judgment = self.cached_judgment(result)
+                            if judgment is None:
+                                pending.append(result)
+                                continue
+                            self.apply_judgment(result, judgment)
+                        finish(result)
+
+                    # full batches go out right away, the rest once predictions are done
+                    while len(pending) >= self.judge_batch_size or (pending and not predicting):
+                        batch, pending = pending[: self.judge_batch_size], pending[self.judge_batch_size :]
+                        judging.add(judge_pool.submit(self.judge_rows, batch))
+            except BaseException:
+                # Ctrl+C etc.: drop queued rows instead of draining them;
+                # the checkpoint has everything finished so far
+                for fut in predicting | judging:
+                    fut.cancel()
+                raise
+
+        return pd.DataFrame([done[k] for k in sorted(done)])
+
+
+def summarize(out: pd.DataFrame, use_judge: bool, use_execution: bool = False) -> Dict[str, Any]:
+    def safe_mean(x):
+        xs = [v for v in x if v is not None and not (isinstance(v, float) and math.isnan(v))]
+        return statistics.mean(xs) if xs else None
+
+    exec_match = out["exec_match"].tolist() if use_execution and "exec_match" in out else []
+    exec_match = [None if isinstance(v, float) and math.isnan(v) else v for v in exec_match]
+    # cached predictions carry an earlier run's latency (checkpoints written
+    # before the column existed count as fresh)
+    cached = out["cached"].fillna(False).astype(bool) if "cached" in out else pd.Series(False, index=out.index)
+    fresh_latency = out.loc[~cached, "latency_s"]
+
+    return {
+        "n": len(out),
+        "api_success_rate": float(out["api_ok"].mean()),
+        "cached_predictions": int(cached.sum()),
+        # measured on this run's API calls only
+        "latency_rows": len(fresh_latency),
+        "avg_latency_s": float(fresh_latency.mean()) if len(fresh_latency) else None,
+        "exact_match_rate": float(out["exact_match"].mean()),
+        "normalized_exact_match_rate": float(out["normalized_exact_match"].mean()),
+        "avg_token_f1": float(out["token_f1"].mean()),
+        "avg_keyword_f1": float(out["keyword_f1"].mean()),
+        "avg_edit_similarity": float(out["edit_similarity"].mean()),
+        "judge_used": use_judge,
+        "judge_rows": int(out["judge_score_0_5"].notna().sum()),
+        "avg_judge_score_0_5": safe_mean(out["judge_score_0_5"].tolist()),
+        "judge_equivalent_rate": (
+            safe_mean([1.0 if v is True else 0.0 if v is False else None for v in out["judge_equivalent"].tolist()])
+        ),
+        "execution_used": use_execution,
+        # rows whose gold query fails are left out; failing predictions count as misses
+        "exec_rows": sum(v is not None for v in exec_match),
+        "execution_accuracy": safe_mean([1.0 if v is True else 0.0 if v is False else None for v in exec_match]),
+    }
+
+
+def write_reports(out: pd.DataFrame, summary: Dict[str, Any], reports_dir: str) -> Tuple[str, str]:
+    os.makedirs(reports_dir, exist_ok=True)
+    ts = time.strftime("%Y%m%d_%H%M%S")
+    csv_path = os.path.join(reports_dir, f"eval_results_{ts}.csv")
+    json_path = os.path.join(reports_dir, f"eval_summary_{ts}.json")
+
+    out.to_csv(csv_path, index=False)
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+    return csv_path, json_path
+
+
+def record_model_accuracy(summary: Dict[str, Any], identity: Dict[str, Any], run_name: str, path: str) -> Optional[str]:
+    """
+    Store the run's accuracy under the backend's "provider:model" in `path`
+    (read by the backend's ModelRouter for its accuracy floor). Uses the
+    strongest metric the run has: execution accuracy, then the judge's
+    equivalence rate, then normalized exact match. Skipped when the backend
+    routes stages to different models, since the score then isn't one
+    model's. Returns the model written, if any.
+    """
+    routes = identity.get("routes")
+    if routes:
+        targets = set(routes.values())
+        if len(targets) != 1:
+            print(f"Model accuracy not recorded: stages use different models ({sorted(targets)}); pin one with LLM_ROUTE_PIN")
+            return None
+        target = targets.pop()
+    elif identity.get("provider") and identity.get("model"):
+        target = f"{identity['provider']}:{identity['model']}"
+    else:
+        print("Model accuracy not recorded: the backend doesn't report its model")
+        return None
+
+    for metric in ("execution_accuracy", "judge_equivalent_rate", "normalized_exact_match_rate"):
+        if summary.get(metric) is not None:
+            break
+    rows = {"execution_accuracy": summary["exec_rows"], "judge_equivalent_rate": summary["judge_rows"]}.get(metric, summary["n"])
+
+    data: Dict[str, Any] = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    data[target] = {
+        "accuracy": round(summary[metric], 4),
+        "metric": metric,
+        "n": rows,
+        "run": run_name,
+        "updated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    # atomic, so the backend never reads a half-written file
+    os.replace(tmp, path)
+    print(f"Model accuracy: {target} {metric}={data[target]['accuracy']} -> {path}")
+    return target
+
+
+def run_evaluation(
+    dataset_dir: str = DATASET_DIR,
+    reports_dir: str = REPORTS_DIR,
+    run_name: Optional[str] = None,
+    cache_path: Optional[str] = CACHE_PATH,
+    limit: Optional[int] = None,
+    execution: bool = False,
+    db: Optional[Dict[str, Any]] = None,
+    exec_timeout_s: int = EXEC_TIMEOUT_S,
+    accuracy_file: Optional[str] = None,
+    **runner_kwargs,
+) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Load the dataset, evaluate it and write the reports. runner_kwargs go
+    to EvalRunner (api_url, workers, judge_workers, use_judge, ...).
+    cache_path=None disables the disk cache. execution=True adds execution
+    accuracy, against `db` (host/port/user/password/database overrides).
+    accuracy_file: also record the accuracy per model there.
+    Returns (results DataFrame, summary dict), like the notebook's evaluate().
+    """
+    df = load_all_csvs(dataset_dir)
+    if limit is not None:
+        df = df.head(limit)
+
+    run_name = run_name or time.strftime("%Y%m%d_%H%M%S")
+    checkpoint = Checkpoint(os.path.join(reports_dir, "checkpoints", f"{run_name}.jsonl"))
+    cache = DiskCache(cache_path) if cache_path else None
+
+    scorer = ExecutionScorer(cache=cache, timeout_s=exec_timeout_s, **(db or {})) if execution else None
+
+    runner = EvalRunner(cache=cache, checkpoint=checkpoint, scorer=scorer, **runner_kwargs)
+    t0 = time.time()
+    try:
+        out = runner.run(df)
+    finally:
+        if scorer is not None:
+            scorer.close()
+        if cache is not None:
+            cache.close()
+    elapsed = time.time() - t0
+
+    summary = summarize(out, runner.use_judge, execution)
+    if runner.use_judge:
+        summary.update(runner.judge_stats())
+    csv_path, json_path = write_reports(out, summary, reports_dir)
+
+    print("\n=== SUMMARY ===")
+    print(json.dumps(summary, indent=2))
+    print(
+        f"\n{elapsed:.1f}s, {runner.counts['api_calls']} API calls, {runner.counts['judge_calls']} judge calls"
+        + (
+            f" ({summary['judge_calls_saved']} saved by batching and cache, ~{summary['judge_time_saved_s']}s saved by cache)"
+            if runner.use_judge
+            else ""
+        )
+        + (f", {scorer.counts['executions']} SQL executions" if scorer is not None else "")
+        + (f", cache {cache.stats()}" if cache is not None else "")
+    )
+    print(f"Checkpoint: {checkpoint.path} (rerun with --run-name {run_name} to resume)")
+    print(f"\nSaved:\n- {csv_path}\n- {json_path}")
+    if accuracy_file:
+        record_model_accuracy(summary, runner.identity, run_name, accuracy_file)
+    return out, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset-dir", default=DATASET_DIR)
+    parser.add_argument("--reports-dir", default=REPORTS_DIR)
+    parser.add_argument("--api-url", default=API_URL)
+    parser.add_argument("--api-timeout", type=int, default=API_TIMEOUT_S)
+    parser.add_argument("--pipeline-mode", help="sent as pipeline_mode (default: the backend's)")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent API calls")
+    parser.add_argument("--judge-workers", type=int, default=2, help="concurrent judge calls")
+    parser.add_argument("--no-judge", action="store_true")
+    parser.add_argument("--judge-model", default=JUDGE_MODEL)
+    parser.add_argument("--judge-limit", type=int, help="judge only the first N rows")
+    parser.add_argument("--judge-batch-size", type=int, default=JUDGE_BATCH_SIZE, help="rows per judge call")
+    parser.add_argument("--limit", type=int, help="evaluate only the first N rows")
+    parser.add_argument("--run-name", help="checkpoint name; reuse it to resume (default: timestamp)")
+    parser.add_argument("--cache-path", default=CACHE_PATH)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--execution", action="store_true", help="also score by running gold and predicted SQL")
+    parser.add_argument("--exec-workers", type=int, default=2, help="concurrent SQL executions")
+    parser.add_argument("--exec-timeout", type=int, default=EXEC_TIMEOUT_S, help="per-query limit in seconds")
+    parser.add_argument("--db-host", default=DB_HOST)
+    parser.add_argument("--db-port", type=int, default=DB_PORT)
+    parser.add_argument("--db-user", default=DB_USER)
+    parser.add_argument("--db-password", default=DB_PASSWORD)
+    parser.add_argument("--db-name", default=DB_NAME)
+    parser.add_argument(
+        "--accuracy-file",
+        nargs="?",
+        const=ACCURACY_PATH,
+        help=f"record accuracy per model for the backend's router (default path: {ACCURACY_PATH})",
+    )
+    args = parser.parse_args()
+
+    run_evaluation(
+        dataset_dir=args.dataset_dir,
+        reports_dir=args.reports_dir,
+        run_name=args.run_name,
+        cache_path=None if args.no_cache else args.cache_path,
+        limit=args.limit,
+        execution=args.execution,
+        db={
+            "host": args.db_host,
+            "port": args.db_port,
+            "user": args.db_user,
+            "password": args.db_password,
+            "database": args.db_name,
+        },
+        exec_timeout_s=args.exec_timeout,
+        accuracy_file=args.accuracy_file,
+        exec_workers=args.exec_workers,
+        api_url=args.api_url,
+        api_timeout_s=args.api_timeout,
+        pipeline_mode=args.pipeline_mode,
+        workers=args.workers,
+        judge_workers=args.judge_workers,
+        use_judge=not args.no_judge,
+        judge_model=args.judge_model,
+        judge_limit=args.judge_limit,
+        judge_batch_size=args.judge_batch_size,
+    )
+
+
+if __name__ == "__main__":
+    main()
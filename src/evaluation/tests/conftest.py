@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The evaluation runs from src/ as the `evaluation` package (and imports
+# backend.config from there), so tests import it the same way.
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+sys.path.insert(0, SRC_DIR)
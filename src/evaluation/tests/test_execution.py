@@ -0,0 +1,204 @@
+import datetime
+from decimal import Decimal
+
+import pymysql
+import pytest
+
+from evaluation import execution
+from evaluation.execution import ExecutionScorer, ResultFingerprint, has_top_level_order_by, is_read_only, normalize_value
+
+
+# ---------- normalize_value ----------
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        (1.5, Decimal("1.5000")),
+        (1.5, 1.50000001),
+        (2, Decimal("2.000")),
+        (2, 2.0),
+        (True, 1),
+        (datetime.datetime(2011, 5, 31, 0, 0), "2011-05-31 00:00:00"),
+        (datetime.date(2011, 5, 31), "2011-05-31"),
+    ],
+)
+def test_equal_values_normalize_alike(a, b):
+    assert normalize_value(a) == normalize_value(b)
+
+
+def test_null_differs_from_every_string():
+    assert normalize_value(None) not in (normalize_value(""), normalize_value("None"), normalize_value("NULL"))
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (1e25, "10000000000000000000000000"),
+        (Decimal("12345678901234567890123.5"), "12345678901234567890123.5"),
+        (Decimal("123456789012345678901234567890.1234567"), "123456789012345678901234567890.123457"),
+        (-1e30, "-1000000000000000000000000000000"),
+        (float("inf"), "Infinity"),
+    ],
+)
+def test_large_numbers_normalize_without_error(value, expected):
+    assert normalize_value(value) == expected
+
+
+def test_large_sum_matches_across_types():
+    # SUM over DECIMAL vs the same total as DOUBLE
+    assert normalize_value(Decimal("10000000000000000000000000.000")) == normalize_value(1e25)
+
+
+def test_other_values():
+    assert normalize_value(datetime.timedelta(hours=1, seconds=1.5)) == "3601.5"
+    assert normalize_value(b"\x01\xff") == "0x01ff"
+
+
+# ---------- has_top_level_order_by ----------
+
+
+@pytest.mark.parametrize(
+    "sql, expected",
+    [
+        ("SELECT Name FROM Product ORDER BY Name", True),
+        ("select Name from Product order  by Name desc limit 5", True),
+        ("SELECT Name FROM Product", False),
+        ("SELECT * FROM (SELECT Name FROM Product ORDER BY Name LIMIT 5) t", False),
+        ("SELECT ROW_NUMBER() OVER (ORDER BY ListPrice) AS rn FROM Product", False),
+        ("SELECT ROW_NUMBER() OVER (ORDER BY ListPrice) AS rn FROM Product ORDER BY rn", True),
+        ("SELECT 'order by' AS label FROM Product", False),
+        ("SELECT Name FROM Product -- ORDER BY Name", False),
+        ("SELECT Name FROM Product /* ORDER BY Name */", False),
+        ("(SELECT Name FROM Product) UNION (SELECT Name FROM Vendor) ORDER BY Name", True),
+        ("", False),
+    ],
+)
+def test_has_top_level_order_by(sql, expected):
+    assert has_top_level_order_by(sql) is expected
+
+
+@pytest.mark.parametrize(
+    "sql, expected",
+    [
+        ("SELECT 1", True),
+        ("WITH t AS (SELECT 1) SELECT * FROM t", True),
+        ("(SELECT 1) UNION (SELECT 2)", True),
+        ("SELECT 1; DELETE FROM Product", False),
+        ("DELETE FROM Product", False),
+        ("SELECT ';' AS semicolon", True),
+        ("", False),
+    ],
+)
+def test_is_read_only(sql, expected):
+    assert is_read_only(sql) is expected
+
+
+# ---------- ResultFingerprint ----------
+
+
+def _digest(rows, **kwargs):
+    fp = ResultFingerprint(**kwargs)
+    fp.update(rows)
+    return fp.hexdigest()
+
+
+def test_unordered_fingerprint_ignores_row_order_but_not_duplicates():
+    rows = [(1, "a"), (2, "b"), (2, "b")]
+    assert _digest(rows) == _digest(rows[::-1])
+    assert _digest(rows) != _digest(rows[:2])
+
+
+def test_ordered_fingerprint_depends_on_row_order():
+    rows = [(1, "a"), (2, "b")]
+    assert _digest(rows, ordered=True) != _digest(rows[::-1], ordered=True)
+
+
+def test_column_order_can_be_ignored():
+    assert _digest([(1, "a")]) != _digest([("a", 1)])
+    assert _digest([(1, "a")], ignore_column_order=True) == _digest([("a", 1)], ignore_column_order=True)
+
+
+# ---------- ExecutionScorer connections ----------
+
+
+def server_error(errno: int) -> pymysql.err.MySQLError:
+    # the exception pymysql raises for a server error packet with this errno
+    try:
+        pymysql.err.raise_mysql_exception(b"\xff" + errno.to_bytes(2, "little") + b"#42000error")
+    except pymysql.err.MySQLError as e:
+        return e
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = [("n",)]
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        if sql.startswith("SET SESSION"):
+            return
+        # scripted errors are for predictions; gold is always "SELECT 1"
+        if sql != "SELECT 1" and self.conn.errors:
+            raise self.conn.errors.pop(0)
+        self.rows = [(1,), (2,)]
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows, []
+        return rows
+
+
+class FakeConnection:
+    def __init__(self, errors):
+        self.errors = errors
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    made = []
+    errors = []
+
+    def connect(**kwargs):
+        made.append(FakeConnection(errors))
+        return made[-1]
+
+    monkeypatch.setattr(execution.pymysql, "connect", connect)
+    return made, errors
+
+
+@pytest.mark.parametrize("errno", [1054, 1052, 1055, 1242, 1064, 1146])
+def test_bad_prediction_keeps_the_connection(connections, errno):
+    made, errors = connections
+    scorer = ExecutionScorer()
+    errors.append(server_error(errno))
+    out = scorer.score("SELECT 1", "SELECT Bogus FROM Product")
+    assert out["exec_match"] is False and out["exec_error"].startswith("pred:")
+    assert scorer.score("SELECT 1", "SELECT 3")["exec_match"] is True
+    assert len(made) == 1 and not made[0].closed
+
+
+@pytest.mark.parametrize(
+    "error", [pymysql.err.OperationalError(2013, "lost connection"), pymysql.err.InterfaceError(0, "")]
+)
+def test_broken_connection_is_replaced(connections, error):
+    made, errors = connections
+    scorer = ExecutionScorer()
+    errors.append(error)
+    assert scorer.score("SELECT 1", "SELECT 2")["exec_match"] is False
+    assert made[0].closed
+    assert scorer.score("SELECT 1", "SELECT 3")["exec_match"] is True
+    assert len(made) == 2
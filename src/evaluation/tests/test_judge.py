@@ -0,0 +1,135 @@
+import json
+
+import pytest
+
+from evaluation import run
+from evaluation.judge import parse_judge_batch_output, parse_judge_output
+from evaluation.run import EvalRunner
+from evaluation.store import DiskCache
+
+
+def verdict(i, equivalent=True, score=5, reason="same"):
+    return {"id": i, "equivalent": equivalent, "score": score, "reason": reason}
+
+
+def reply(*verdicts):
+    return json.dumps({"verdicts": list(verdicts)})
+
+
+# ---------- parse_judge_output ----------
+
+
+def test_single_verdict_is_found_in_surrounding_text():
+    text = 'Sure:\n```json\n{"equivalent": false, "score": 1, "reason": "wrong filter"}\n```'
+    assert parse_judge_output(text) == {"equivalent": False, "score": 1, "reason": "wrong filter"}
+
+
+@pytest.mark.parametrize("text", ["", None, "no json here", '{"equivalent": true}', "{not json}"])
+def test_unusable_single_verdict(text):
+    out = parse_judge_output(text)
+    assert out["equivalent"] is None and out["score"] is None and out["reason"]
+
+
+# ---------- parse_judge_batch_output ----------
+
+
+def test_batch_verdicts_come_back_in_item_order():
+    out = parse_judge_batch_output(reply(verdict(2, False, 0), verdict(0), verdict(1, False, 3)), 3)
+    assert [v["score"] for v in out] == [5, 3, 0]
+    assert out[0] == {"equivalent": True, "score": 5, "reason": "same"}
+
+
+def test_missing_ids_are_none():
+    assert parse_judge_batch_output(reply(verdict(0), verdict(2)), 4) == [
+        {"equivalent": True, "score": 5, "reason": "same"}, None, {"equivalent": True, "score": 5, "reason": "same"}, None,
+    ]
+
+
+def test_duplicate_ids_are_judged_again():
+    out = parse_judge_batch_output(reply(verdict(0), verdict(1, True), verdict(1, False, 0), verdict(2)), 3)
+    assert out[1] is None
+    assert out[0] is not None and out[2] is not None
+
+
+@pytest.mark.parametrize("bad_id", [-1, 3, 99, "1", 1.0, True, None])
+def test_out_of_range_and_non_integer_ids_are_ignored(bad_id):
+    out = parse_judge_batch_output(reply(verdict(0), verdict(bad_id)), 3)
+    assert out[0] is not None
+    assert out[1:] == [None, None]
+
+
+def test_incomplete_verdicts_are_ignored():
+    partial = {"id": 1, "equivalent": True, "score": 4}
+    out = parse_judge_batch_output(reply(verdict(0), partial, "junk"), 2)
+    assert out[0] is not None and out[1] is None
+
+
+@pytest.mark.parametrize("text", ["", None, "sorry", '{"verdicts": "none"}', '{"verdicts": [}', "[]"])
+def test_unusable_batch_reply_has_no_verdicts(text):
+    assert parse_judge_batch_output(text, 2) == [None, None]
+
+
+def test_extra_keys_are_dropped():
+    out = parse_judge_batch_output(reply(dict(verdict(0), confidence=0.9)), 1)
+    assert out == [{"equivalent": True, "score": 5, "reason": "same"}]
+
+
+# ---------- Batched judging in the runner ----------
+
+
+@pytest.fixture
+def judge_calls(monkeypatch):
+    """
+    Fake judge: the batch call skips items whose question contains "skip";
+    single calls fail for questions containing "fail".
+    """
+    calls = {"batch": [], "single": []}
+
+    def batch(items, model, timeout_s):
+        calls["batch"].append([q for q, _, _ in items])
+        return [None if "skip" in q else {"equivalent": True, "score": 5, "reason": "batch"} for q, _, _ in items]
+
+    def single(question, gold, pred, model, timeout_s):
+        calls["single"].append(question)
+        if "fail" in question:
+            raise TimeoutError("judge timed out")
+        return {"equivalent": False, "score": 2, "reason": "single"}
+
+    identity = {"model": "m", "provider": "p", "routes": None, "prompt_hash": "h"}
+    monkeypatch.setattr(run, "system_identity", lambda api_url: identity)
+    monkeypatch.setattr(run, "call_openai_judge_batch", batch)
+    monkeypatch.setattr(run, "call_openai_judge", single)
+    return calls
+
+
+def row(question, gold="SELECT 1", pred="SELECT 2"):
+    return {"user_query": question, "gold_sql": gold, "pred_sql": pred}
+
+
+def test_items_missing_from_the_batch_reply_are_judged_alone(judge_calls):
+    runner = EvalRunner()
+    rows = runner.judge_rows([row("a", pred="SELECT a"), row("skip me", pred="SELECT b"), row("c", pred="SELECT c")])
+    assert judge_calls["batch"] == [["a", "skip me", "c"]]
+    assert judge_calls["single"] == ["skip me"]
+    assert [r["judge_reason"] for r in rows] == ["batch", "single", "batch"]
+    assert runner.judge_stats()["judge_calls"] == 2
+
+
+def test_rows_with_the_same_sql_pair_share_one_item(judge_calls):
+    runner = EvalRunner()
+    rows = runner.judge_rows([row("a"), row("b", gold="select 1;"), row("c", pred="SELECT 3")])
+    assert judge_calls["batch"] == [["a", "c"]]
+    assert rows[1]["judge_equivalent"] is True
+    assert runner.judge_stats()["judge_calls_saved"] == 2
+
+
+def test_only_usable_verdicts_are_cached(judge_calls, tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite"))
+    runner = EvalRunner(cache=cache)
+    rows = runner.judge_rows([row("a", pred="SELECT a"), row("skip and fail", pred="SELECT b")])
+    assert rows[1]["judge_equivalent"] is None
+    assert rows[1]["judge_reason"] == "Judge call failed: judge timed out"
+
+    again = EvalRunner(cache=cache)
+    assert again.cached_judgment(row("other question", pred="SELECT a"))["reason"] == "batch"
+    assert again.cached_judgment(row("skip and fail", pred="SELECT b")) is None
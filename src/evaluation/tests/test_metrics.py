@@ -0,0 +1,128 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from evaluation import metrics
+from evaluation.metrics import (
+    METRIC_COLUMNS,
+    batch_metrics,
+    compare_columns,
+    edit_similarity,
+    keyword_f1,
+    levenshtein,
+    normalize_sql,
+    sql_metrics,
+    token_f1,
+)
+
+GOLD = [
+    "SELECT Name FROM Product WHERE ListPrice > 100;",
+    "SELECT COUNT(*) FROM SalesOrderHeader",
+    "SELECT p.Name, SUM(d.LineTotal) FROM Product p JOIN SalesOrderDetail d ON p.ProductID = d.ProductID GROUP BY p.Name",
+    "SELECT Name FROM Product",
+    "",
+    "SELECT 1",
+    "SELECT Name FROM Product",
+    "SELECT `Name` FROM Vendor",
+]
+PRED = [
+    "select  name from product where listprice > 100",
+    "SELECT COUNT(*) FROM SalesOrderHeader",
+    "SELECT p.Name FROM Product p GROUP BY p.Name ORDER BY p.Name",
+    "",
+    "",
+    "UPDATE Product SET Name = 'x'",
+    float("nan"),
+    None,
+]
+
+
+def assert_rows_match(frame, preds, golds):
+    assert list(frame.columns) == METRIC_COLUMNS
+    for (_, got), pred, gold in zip(frame.iterrows(), preds, golds):
+        expected = sql_metrics(pred, gold)
+        for column in METRIC_COLUMNS:
+            assert got[column] == pytest.approx(expected[column]), (pred, gold, column)
+
+
+# ---------- Single-pair metrics ----------
+
+
+def test_normalize_sql():
+    assert normalize_sql("  SELECT\n  `Name`\tFROM Product ;") == "select name from product"
+    assert normalize_sql(None) == ""
+
+
+def test_token_and_keyword_f1():
+    assert token_f1("SELECT a FROM t", "SELECT a FROM t") == (1.0, 1.0, 1.0)
+    assert token_f1("", "") == (1.0, 1.0, 1.0)
+    assert token_f1("", "SELECT 1") == (0.0, 0.0, 0.0)
+    precision, recall, f1 = token_f1("SELECT a FROM t", "SELECT a, b FROM t")
+    assert (precision, recall) == (1.0, 4 / 6)
+    assert f1 == pytest.approx(0.8)
+    assert keyword_f1("SELECT a FROM t WHERE x", "SELECT a FROM t") == (2 / 3, 1.0, pytest.approx(0.8))
+
+
+@pytest.mark.parametrize("a, b, distance", [("", "", 0), ("", "abc", 3), ("kitten", "sitting", 3), ("flaw", "lawn", 2)])
+def test_levenshtein_with_and_without_rapidfuzz(monkeypatch, a, b, distance):
+    assert levenshtein(a, b) == distance
+    monkeypatch.setattr(metrics, "_rf_levenshtein", None)
+    assert levenshtein(a, b) == distance
+    assert levenshtein(b, a) == distance
+
+
+def test_edit_similarity():
+    assert edit_similarity("", "") == 1.0
+    assert edit_similarity("SELECT 1;", "select 1") == 1.0
+    assert edit_similarity("abcd", "abcx") == 0.75
+
+
+# ---------- batch_metrics ----------
+
+
+def test_batch_matches_sql_metrics_row_for_row():
+    assert_rows_match(batch_metrics(PRED, GOLD), PRED, GOLD)
+
+
+def test_batch_matches_without_rapidfuzz(monkeypatch):
+    monkeypatch.setattr(metrics, "_rf_levenshtein", None)
+    monkeypatch.setattr(metrics, "_rf_cpdist", None)
+    assert_rows_match(batch_metrics(PRED, GOLD), PRED, GOLD)
+
+
+def test_sql_metrics_scores_missing_sql_as_empty():
+    assert sql_metrics(float("nan"), "SELECT 1") == sql_metrics("", "SELECT 1")
+    assert sql_metrics(None, None) == sql_metrics("", "")
+
+
+def test_missing_predictions_score_as_empty_sql():
+    frame = batch_metrics([float("nan"), None, np.nan, pd.NA], ["SELECT 1", "SELECT 1", "", ""])
+    assert frame["exact_match"].tolist() == [False, False, True, True]
+    assert frame["token_f1"].tolist() == [0.0, 0.0, 1.0, 1.0]
+    assert frame["edit_similarity"].tolist() == [0.0, 0.0, 1.0, 1.0]
+    assert not frame.isna().any().any()
+
+
+def test_batch_keeps_the_index_and_checks_lengths():
+    index = pd.Index([10, 20], name="row_id")
+    frame = batch_metrics(["SELECT 1", "SELECT 2"], ["SELECT 1", "SELECT 1"], index=index)
+    assert frame.index.equals(index)
+    assert frame["exact_match"].tolist() == [True, False]
+    with pytest.raises(ValueError):
+        batch_metrics(["SELECT 1"], [])
+    assert len(batch_metrics([], [])) == 0
+
+
+def test_compare_columns():
+    df = pd.DataFrame({"gold": GOLD, "a": PRED, "b": GOLD}, index=range(100, 100 + len(GOLD)))
+    scores = compare_columns(df, "gold", ["a", "b"])
+    assert list(scores.columns.names) == ["variant", "metric"]
+    assert scores.index.equals(df.index)
+    assert_rows_match(scores["a"], PRED, GOLD)
+    assert scores["b"]["normalized_exact_match"].all()
+    table = scores.mean().unstack()
+    assert list(table.index) == ["a", "b"] and list(table.columns) == METRIC_COLUMNS
+    assert table.loc["b", "token_f1"] == 1.0
+    assert not math.isnan(table.loc["a", "edit_similarity"])
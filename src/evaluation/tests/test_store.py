@@ -0,0 +1,154 @@
+import json
+import threading
+
+import pandas as pd
+import pytest
+
+from evaluation import run
+from evaluation.run import EvalRunner
+from evaluation.store import Checkpoint, DiskCache, content_hash
+
+
+# ---------- content_hash ----------
+
+
+def test_content_hash_is_stable_and_order_sensitive():
+    assert content_hash("q", "gpt-4o", None) == content_hash("q", "gpt-4o", None)
+    assert content_hash("q", "gpt-4o") != content_hash("gpt-4o", "q")
+    assert content_hash({"a": 1, "b": 2}) == content_hash({"b": 2, "a": 1})
+    # part boundaries count: ("ab", "c") is not ("a", "bc")
+    assert content_hash("ab", "c") != content_hash("a", "bc")
+
+
+# ---------- DiskCache ----------
+
+
+def test_cache_survives_reopening(tmp_path):
+    path = str(tmp_path / "cache" / "eval.sqlite")
+    cache = DiskCache(path)
+    cache.set("prediction", "k", {"sql": "SELECT 1", "columns": ["ñ"]})
+    cache.close()
+
+    cache = DiskCache(path)
+    assert cache.get("prediction", "k") == {"sql": "SELECT 1", "columns": ["ñ"]}
+    assert cache.get("judgment", "k") is None  # namespaces are separate
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+
+def test_cache_set_replaces(tmp_path):
+    cache = DiskCache(str(tmp_path / "eval.sqlite"))
+    cache.set("judgment", "k", {"score": 1})
+    cache.set("judgment", "k", {"score": 5})
+    assert cache.get("judgment", "k") == {"score": 5}
+
+
+def test_cache_is_shared_by_threads(tmp_path):
+    cache = DiskCache(str(tmp_path / "eval.sqlite"))
+
+    def worker(n):
+        for i in range(20):
+            cache.set("prediction", f"{n}-{i}", i)
+            assert cache.get("prediction", f"{n}-{i}") == i
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert cache.stats()["hits"] == 80
+
+
+# ---------- Checkpoint ----------
+
+
+def test_checkpoint_rows_round_trip(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoints" / "run.jsonl"))
+    assert list(checkpoint.rows()) == []
+    checkpoint.append({"row_id": 0, "user_query": "¿cuántos?"})
+    checkpoint.append({"row_id": 1, "latency_s": pd.Timestamp("2024-01-01")})
+    assert list(Checkpoint(checkpoint.path).rows()) == [
+        {"row_id": 0, "user_query": "¿cuántos?"},
+        {"row_id": 1, "latency_s": "2024-01-01 00:00:00"},
+    ]
+
+
+def test_truncated_last_line_is_skipped(tmp_path):
+    path = tmp_path / "run.jsonl"
+    path.write_text('{"row_id": 0}\n\n{"row_id": 1}\n{"row_id": 2, "pred_s')
+    assert [r["row_id"] for r in Checkpoint(str(path)).rows()] == [0, 1]
+
+
+def test_append_after_a_truncated_line_keeps_the_new_row(tmp_path):
+    path = tmp_path / "run.jsonl"
+    path.write_text('{"row_id": 0}\n{"row_id": 1, "pred_s')
+    checkpoint = Checkpoint(str(path))
+    checkpoint.append({"row_id": 1})
+    checkpoint.append({"row_id": 2})
+    assert [r["row_id"] for r in Checkpoint(str(path)).rows()] == [0, 1, 2]
+
+
+# ---------- Resuming a run ----------
+
+
+DATASET = pd.DataFrame(
+    {
+        "user_query": ["q0", "q1", "q2"],
+        "sql_query": ["SELECT 0", "SELECT 1", "SELECT 2"],
+        "source_file": "test.csv",
+        "row_id": [0, 1, 2],
+    }
+)
+
+
+@pytest.fixture
+def api(monkeypatch):
+    calls = []
+
+    def call_sql_api(api_url, user_query, timeout_s=30, pipeline_mode=None):
+        calls.append(user_query)
+        return {"sql": "SELECT " + user_query[1:], "relevant_tables": [], "columns": ["n"]}
+
+    identity = {"model": "m", "provider": "p", "routes": None, "prompt_hash": "h"}
+    monkeypatch.setattr(run, "system_identity", lambda api_url: identity)
+    monkeypatch.setattr(run, "call_sql_api", call_sql_api)
+    return calls
+
+
+def evaluate(tmp_path):
+    runner = EvalRunner(
+        use_judge=False,
+        cache=DiskCache(str(tmp_path / "cache.sqlite")),
+        checkpoint=Checkpoint(str(tmp_path / "run.jsonl")),
+    )
+    return runner.run(DATASET)
+
+
+def test_resume_skips_checkpointed_rows_and_reuses_cached_predictions(tmp_path, api):
+    first = evaluate(tmp_path)
+    assert sorted(api) == ["q0", "q1", "q2"]
+    assert first["exact_match"].tolist() == [True, True, True]
+
+    # crash while row 2 was being written
+    path = tmp_path / "run.jsonl"
+    lines = path.read_text().splitlines()
+    path.write_text("\n".join(lines[:2]) + "\n" + lines[2][:10])
+
+    resumed = evaluate(tmp_path)
+    assert sorted(api) == ["q0", "q1", "q2"]  # row 2's prediction came from the cache
+    assert resumed["row_id"].tolist() == [0, 1, 2]
+    assert resumed["cached"].tolist() == [False, False, True]
+
+    # row 2 is now on disk: a third run has nothing to do
+    assert [r["row_id"] for r in Checkpoint(str(path)).rows()] == [0, 1, 2]
+    third = evaluate(tmp_path)
+    assert len(path.read_text().splitlines()) == 4
+    assert len(api) == 3
+    assert third.drop(columns="latency_s").equals(resumed.drop(columns="latency_s"))
+    # the cut-off line stays; the redone row follows on its own line
+    assert [json.loads(line)["row_id"] for line in path.read_text().splitlines()[3:]] == [2]
+
+
+def test_rows_of_another_dataset_are_not_resumed(tmp_path, api):
+    Checkpoint(str(tmp_path / "run.jsonl")).append({"row_id": 0, "user_query": "another question"})
+    evaluate(tmp_path)
+    assert sorted(api) == ["q0", "q1", "q2"]
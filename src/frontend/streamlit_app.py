@@ -4,8 +4,12 @@ from datetime import datetime
 
 import requests
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import streamlit as st
 
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
 # ---------------------------
 # Page Config
 # ---------------------------
@@ -77,6 +81,12 @@ api_url = st.sidebar.text_input(
     value="http://localhost:8000/query"
 )
 
+stream_results = st.sidebar.toggle(
+    "Stream results",
+    value=True,
+    help="Use <endpoint>/stream and show each pipeline stage as it finishes",
+)
+
 st.sidebar.markdown("---")
 st.sidebar.markdown(
     "- Ensure FastAPI is running\n"
@@ -121,11 +131,97 @@ with st.container():
 # ---------------------------
 # API Helper
 # ---------------------------
+def read_arrow(body: bytes):
+    """
+    Arrow IPC stream -> (table, DataFrame, schema metadata). ArrowDtype
+    columns wrap the Arrow buffers instead of copying them into NumPy or
+    Python objects, and keep DECIMAL / DATETIME types.
+    """
+    table = pa.ipc.open_stream(body).read_all()
+    meta = {k.decode(): v.decode() for k, v in (table.schema.metadata or {}).items()}
+    return table, table.to_pandas(types_mapper=pd.ArrowDtype), meta
+
+
 def call_api(api_url: str, user_query: str):
-    payload = {"user_query": user_query}
-    r = requests.post(api_url, json=payload, timeout=60)
+    """
+    Ask for Arrow (JSON if the backend cannot produce it). Arrow responses
+    come back with "table" and "df" instead of "rows".
+    """
+    payload = {"user_query": user_query, "include_timings": True}
+    headers = {"Accept": f"{ARROW_STREAM}, application/json;q=0.5"}
+    r = requests.post(api_url, json=payload, headers=headers, timeout=60)
     r.raise_for_status()
-    return r.json()
+    if not r.headers.get("content-type", "").startswith(ARROW_STREAM):
+        return r.json()
+
+    table, df, meta = read_arrow(r.content)
+    return {
+        "sql": meta.get("sql", ""),
+        "relevant_tables": json.loads(meta.get("relevant_tables", "[]")),
+        "columns": table.column_names,
+        "next_page_token": meta.get("next_page_token") or None,
+        "timings": json.loads(meta["timings"]) if meta.get("timings") else None,
+        "table": table,
+        "df": df,
+    }
+
+
+def parquet_bytes(table: pa.Table) -> bytes:
+    sink = pa.BufferOutputStream()
+    pq.write_table(table, sink)
+    return sink.getvalue().to_pybytes()
+
+def stream_api(api_url: str, user_query: str):
+    """
+    Yield {"event", "data"} dicts from the NDJSON /query/stream endpoint.
+    """
+    payload = {"user_query": user_query}
+    with requests.post(api_url.rstrip("/") + "/stream", json=payload, stream=True, timeout=60) as r:
+        r.raise_for_status()
+        for line in r.iter_lines():
+            if line:
+                yield json.loads(line)
+
+
+def call_api_streaming(api_url: str, user_query: str):
+    """
+    Render each stage as it arrives, then return the same payload shape as
+    call_api so the final rendering is shared.
+    """
+    data = {"sql": "", "relevant_tables": [], "columns": [], "rows": []}
+    live = st.container()
+    with live:
+        rewrite_ph = st.empty()
+        tables_ph = st.empty()
+        sql_ph = st.empty()
+        rows_ph = st.empty()
+
+    sql_draft = ""
+    for event in stream_api(api_url, user_query):
+        kind, value = event.get("event"), event.get("data")
+        if kind == "rewritten_query":
+            rewrite_ph.info(f"**Rewritten question:** {value}")
+        elif kind == "relevant_tables":
+            data["relevant_tables"] = value
+            tables_ph.markdown("**Tables:** " + (", ".join(value) if value else "—"))
+        elif kind == "sql_delta":
+            sql_draft += value
+            sql_ph.code(sql_draft, language="sql")
+        elif kind == "sql":
+            data["sql"] = value
+            sql_ph.code(value, language="sql")
+        elif kind == "columns":
+            data["columns"] = value
+        elif kind == "rows":
+            data["rows"].extend(value)
+            rows_ph.dataframe(pd.DataFrame(data["rows"]), height=300, use_container_width=True)
+        elif kind == "error":
+            raise RuntimeError(value)
+
+    # the full results are rendered below, like a non-streamed response
+    for ph in (rewrite_ph, tables_ph, sql_ph, rows_ph):
+        ph.empty()
+    return data
 
 # ---------------------------
 # Run Query
@@ -137,7 +233,10 @@ if run_button:
         with st.spinner("Generating SQL and querying database..."):
             try:
                 start = time.time()
-                data = call_api(api_url, user_query.strip())
+                if stream_results:
+                    data = call_api_streaming(api_url, user_query.strip())
+                else:
+                    data = call_api(api_url, user_query.strip())
                 latency_ms = (time.time() - start) * 1000
 
                 sql = data.get("sql", "")
@@ -145,7 +244,13 @@ if run_button:
                 rows = data.get("rows", [])
                 columns = data.get("columns", [])
 
-                df = pd.DataFrame(rows) if rows else pd.DataFrame(columns=columns)
+                table = data.pop("table", None)
+                df = data.pop("df", None)
+                if df is None:
+                    df = pd.DataFrame(rows) if rows else pd.DataFrame(columns=columns)
+                    table = pa.Table.from_pandas(df, preserve_index=False)
+                else:
+                    rows = table.to_pylist()
 
                 # Save history
                 st.session_state.history.insert(
@@ -170,7 +275,7 @@ if run_button:
                 st.subheader(f"Results ({len(df)} rows)")
                 st.dataframe(df, height=450, use_container_width=True)
 
-                c1, c2 = st.columns(2)
+                c1, c2, c3 = st.columns(3)
                 with c1:
                     st.download_button(
                         "⬇️ Download CSV",
@@ -181,10 +286,17 @@ if run_button:
                 with c2:
                     st.download_button(
                         "⬇️ Download JSON",
-                        json.dumps(rows, indent=2).encode("utf-8"),
+                        json.dumps(rows, indent=2, default=str).encode("utf-8"),
                         "query_results.json",
                         "application/json",
                     )
+                with c3:
+                    st.download_button(
+                        "⬇️ Download Parquet",
+                        parquet_bytes(table),
+                        "query_results.parquet",
+                        "application/vnd.apache.parquet",
+                    )
 
                 if show_details:
                     st.markdown("### Technical Details")
@@ -195,8 +307,18 @@ if run_button:
                     with st.expander("Relevant Tables"):
                         st.write(", ".join(tables) if tables else "—")
 
+                    timings = data.get("timings")
+                    if timings:
+                        with st.expander(f"Timing breakdown ({timings['total_ms']:.0f} ms server-side)"):
+                            st.dataframe(
+                                pd.DataFrame(timings["spans"]),
+                                use_container_width=True,
+                            )
+
                     with st.expander("Raw API Payload"):
                         st.code(json.dumps(data, indent=2), language="json")
+                        if "rows" not in data:
+                            st.code(str(table.schema), language="text")
 
             except Exception as e:
                 st.error(str(e))